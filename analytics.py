@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import logger
+
+# 获取日志记录器
+log = logger.get_logger('analytics')
+
+# 成交数据的标准列
+FILL_COLUMNS = ['id', 'account', 'symbol', 'timestamp', 'side', 'price', 'amount', 'fee']
+
+# 每个 (账户, 交易对) 的持仓状态列
+STATE_COLUMNS = ['position', 'cost', 'realized', 'fees', 'turnover', 'volume', 'trades', 'last_price',
+                 'last_timestamp']
+
+# 分块扫描的块大小，块内用闭式解向量化计算，块之间顺序传递
+BLOCK_SIZE = 32
+# 减仓比例低于该值时强制开始新块，避免块内累乘溢出
+MIN_BLOCK_RATIO = 1e-6
+# 持仓数量的零值容差
+EPSILON = 1e-12
+
+
+def fills_from_trades(trades, account):
+    """
+    把 fetch_my_trades 返回的成交转换为标准成交表。
+    手续费统一折算为计价货币，以基础货币收取的手续费按成交价折算。
+
+    参数:
+        trades (list): ccxt 成交列表。
+        account (str): 账户标识，例如 binance/main。
+
+    返回:
+        pandas.DataFrame: 标准成交表。
+    """
+    rows = []
+    for trade in trades:
+        fee = 0.0
+        fee_info = trade.get('fee') or {}
+        if fee_info.get('cost'):
+            fee = float(fee_info['cost'])
+            base = trade['symbol'].split('/')[0]
+            if fee_info.get('currency') == base:
+                fee *= float(trade['price'])
+        rows.append((str(trade['id']), account, trade['symbol'], int(trade['timestamp']), trade['side'],
+                     float(trade['price']), float(trade['amount']), fee))
+    return pd.DataFrame.from_records(rows, columns=FILL_COLUMNS)
+
+
+def fills_from_order_csv(path):
+    """
+    从 save_order_to_csv 生成的下单记录读取成交表，每条下单记录视为一笔全部成交。
+
+    参数:
+        path (str): 下单记录CSV文件路径。
+
+    返回:
+        pandas.DataFrame: 标准成交表。
+    """
+    df = pd.read_csv(path, dtype={'order_id': str, 'api_key': str})
+    fills = pd.DataFrame({
+        'id': df['order_id'].astype(str),
+        'account': df['exchange'].astype(str) + '/' + df['api_key'].astype(str),
+        'symbol': df['symbol'],
+        'timestamp': (pd.to_datetime(df['timestamp']) - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1),
+        'side': df['side'],
+        'price': df['price'].astype(float),
+        'amount': df['amount'].astype(float),
+        'fee': df['fee'].astype(float) if 'fee' in df.columns else 0.0,
+    })
+    return fills[FILL_COLUMNS]
+
+
+def _group_cumsum(values, keys):
+    """按分组键计算组内累计和"""
+    return pd.Series(values).groupby(keys, sort=False).cumsum().to_numpy()
+
+
+def compute_fills(fills, carry_position, carry_cost):
+    """
+    按平均成本法逐笔计算持仓、成本和已实现盈亏，全部使用向量化运算。
+
+    成本 C 满足线性递推 C_i = a_i * C_{i-1} + b_i：
+    加仓时 a=1, b=q*p；减仓时 a=P_i/P_{i-1}, b=0；反手或从零开仓时 a=0, b=P_i*p。
+    块内用累乘的闭式解求解，块之间只需顺序传递一个数。
+
+    参数:
+        fills (pandas.DataFrame): 已按 (account, symbol, timestamp) 排序的成交，需含 group 列(分组编号)。
+        carry_position (numpy.ndarray): 每个分组此前的持仓。
+        carry_cost (numpy.ndarray): 每个分组此前的成本。
+
+    返回:
+        dict: 每笔成交之后的 position、cost，以及该笔的 realized 已实现盈亏。
+    """
+    n = len(fills)
+    group = fills['group'].to_numpy()
+    price = fills['price'].to_numpy(dtype=float)
+    q = np.where(fills['side'].to_numpy() == 'buy', 1.0, -1.0) * fills['amount'].to_numpy(dtype=float)
+
+    group_start = np.ones(n, dtype=bool)
+    group_start[1:] = group[1:] != group[:-1]
+
+    position = carry_position[group] + _group_cumsum(q, group)
+    prev_position = position - q
+    prev_flat = np.abs(prev_position) <= EPSILON
+    now_flat = np.abs(position) <= EPSILON
+    adding = prev_flat | (np.sign(q) == np.sign(prev_position))
+    flipping = ~adding & ~now_flat & (np.sign(position) != np.sign(prev_position))
+    reducing = ~adding & ~flipping
+
+    # 递推系数
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a = np.where(reducing, position / prev_position, 1.0)
+    a[flipping | prev_flat | (reducing & now_flat)] = 0.0
+    b = np.where(adding, q * price, 0.0)
+    b[flipping] = position[flipping] * price[flipping]
+    reset = a == 0.0
+
+    # 划分块: 分组起点、固定长度、以及极端减仓处都开始新块
+    idx_in_group = np.arange(n) - np.maximum.accumulate(np.where(group_start, np.arange(n), 0))
+    block_start = group_start | (idx_in_group % BLOCK_SIZE == 0) | (~reset & (a < MIN_BLOCK_RATIO))
+    block = np.cumsum(block_start) - 1
+
+    # 块内再按重置点划分子段，子段内 C 只依赖子段内的成交
+    sub = _group_cumsum(reset.astype(np.int64), block) - reset.astype(np.int64)
+    sub_start = block_start | reset
+    sub_key = np.cumsum(sub_start) - 1
+    log_a = np.where(reset, 0.0, np.log(np.where(reset, 1.0, a)))
+    log_prod = _group_cumsum(log_a, sub_key)
+    scale = np.exp(log_prod)
+    within = scale * _group_cumsum(b * np.exp(-log_prod), sub_key)
+    # 块首个子段没有遇到重置，需要乘上块起点之前的成本
+    inherit = np.where((sub == 0) & ~reset, scale, 0.0)
+    # 重置行本身的 C 就是 b，inherit 为0
+
+    # 块之间顺序传递成本
+    n_blocks = block[-1] + 1 if n else 0
+    block_first = np.flatnonzero(block_start)
+    block_last = np.append(block_first[1:] - 1, n - 1) if n else block_first
+    carry_in = np.empty(n_blocks)
+    last_inherit = inherit[block_last]
+    last_within = within[block_last]
+    first_is_group_start = group_start[block_first]
+    block_group = group[block_first]
+    c = 0.0
+    for k in range(n_blocks):
+        if first_is_group_start[k]:
+            c = carry_cost[block_group[k]]
+        carry_in[k] = c
+        c = last_inherit[k] * c + last_within[k]
+
+    cost = inherit * carry_in[block] + within
+    cost[now_flat] = 0.0
+
+    prev_cost = np.empty(n)
+    prev_cost[1:] = cost[:-1]
+    prev_cost[group_start] = carry_cost[group[group_start]]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        prev_avg = np.where(prev_flat, 0.0, prev_cost / prev_position)
+    closed = np.where(adding, 0.0, np.sign(prev_position) * np.minimum(np.abs(q), np.abs(prev_position)))
+    realized = closed * (price - prev_avg)
+    return {'position': position, 'cost': cost, 'realized': realized}
+
+
+class PositionAnalytics:
+    """
+    按 (账户, 交易对) 汇总的持仓分析。
+    每次 update 只处理新的成交，在已有状态的基础上继续计算。
+    """
+
+    def __init__(self):
+        self.state = pd.DataFrame(columns=STATE_COLUMNS,
+                                  index=pd.MultiIndex.from_tuples([], names=['account', 'symbol']), dtype=float)
+        self.seen_ids = set()
+
+    def update(self, fills):
+        """
+        合并新成交。已处理过的成交ID会被跳过。
+
+        参数:
+            fills (pandas.DataFrame): 标准成交表。
+
+        返回:
+            int: 实际处理的新成交数量。
+        """
+        if fills.empty:
+            return 0
+        ids = fills['id'].astype(str).to_numpy(dtype=object)
+        seen = self.seen_ids
+        is_new = np.fromiter((i not in seen for i in ids), dtype=bool, count=len(ids))
+        # 同一批内的重复ID只保留第一条
+        is_new &= ~pd.Series(ids).duplicated().to_numpy()
+        fills = fills.loc[is_new]
+        if fills.empty:
+            return 0
+        new_ids = ids[is_new]
+
+        fills = fills.sort_values(['account', 'symbol', 'timestamp'], kind='stable').reset_index(drop=True)
+        # 已排序，按出现顺序编号即与排序一致
+        fills['group'] = fills.groupby(['account', 'symbol'], sort=False).ngroup()
+        first_rows = fills.groupby('group', sort=True).head(1)
+        group_index = pd.MultiIndex.from_frame(first_rows[['account', 'symbol']])
+
+        previous = self.state.reindex(group_index)
+        stale = previous['last_timestamp'].to_numpy() > first_rows['timestamp'].to_numpy()
+        if stale.any():
+            log.warning(f"{int(stale.sum())} 个交易对收到早于已处理成交的新成交，按到达顺序继续计算")
+        carry_position = previous['position'].fillna(0.0).to_numpy()
+        carry_cost = previous['cost'].fillna(0.0).to_numpy()
+
+        result = compute_fills(fills, carry_position, carry_cost)
+        notional = fills['price'].to_numpy() * fills['amount'].to_numpy()
+        fills['realized'] = result['realized']
+        fills['notional'] = notional
+
+        grouped = fills.groupby('group', sort=True)
+        last_rows = grouped.tail(1).index.to_numpy()
+        sums = grouped[['realized', 'fee', 'notional', 'amount']].sum()
+        counts = grouped.size().to_numpy()
+
+        updated = pd.DataFrame({
+            'position': result['position'][last_rows],
+            'cost': result['cost'][last_rows],
+            'realized': previous['realized'].fillna(0.0).to_numpy() + sums['realized'].to_numpy(),
+            'fees': previous['fees'].fillna(0.0).to_numpy() + sums['fee'].to_numpy(),
+            'turnover': previous['turnover'].fillna(0.0).to_numpy() + sums['notional'].to_numpy(),
+            'volume': previous['volume'].fillna(0.0).to_numpy() + sums['amount'].to_numpy(),
+            'trades': previous['trades'].fillna(0.0).to_numpy() + counts,
+            'last_price': fills['price'].to_numpy()[last_rows],
+            'last_timestamp': np.maximum(previous['last_timestamp'].fillna(0).to_numpy(),
+                                         fills['timestamp'].to_numpy()[last_rows]),
+        }, index=group_index)
+
+        untouched = self.state.loc[~self.state.index.isin(group_index)]
+        self.state = pd.concat([untouched, updated]) if len(untouched) else updated
+        self.seen_ids.update(new_ids.tolist())
+        return len(fills)
+
+    def summary(self, marks=None):
+        """
+        生成持仓汇总。
+
+        参数:
+            marks (dict, optional): {symbol: 标记价格}，缺省时使用该交易对最后成交价。
+
+        返回:
+            pandas.DataFrame: 含持仓、均价、已实现/未实现盈亏、手续费和成交额的汇总表。
+        """
+        summary = self.state.copy()
+        mark = summary['last_price']
+        if marks:
+            symbols = summary.index.get_level_values('symbol')
+            mark = pd.Series(symbols.map(lambda s: marks.get(s, np.nan)), index=summary.index,
+                             dtype=float).fillna(mark)
+        position = summary['position']
+        summary['mark'] = mark
+        summary['avg_entry'] = (summary['cost'] / position.where(position.abs() > EPSILON)).astype(float)
+        summary['unrealized'] = position * mark - summary['cost']
+        summary['net_pnl'] = summary['realized'] + summary['unrealized'] - summary['fees']
+        return summary[['position', 'avg_entry', 'mark', 'realized', 'unrealized', 'fees', 'net_pnl',
+                        'turnover', 'volume', 'trades']]
+
+
+def synthetic_fills(n, accounts=4, symbols=50, seed=0):
+    """生成 n 笔随机成交，用于基准测试"""
+    rng = np.random.default_rng(seed)
+    account = rng.integers(0, accounts, n)
+    symbol = rng.integers(0, symbols, n)
+    base_price = 10.0 ** rng.uniform(-2, 4, symbols)
+    drift = np.exp(rng.normal(0, 0.01, n))
+    return pd.DataFrame({
+        'id': np.arange(n).astype(str),
+        'account': np.char.add('acct', account.astype(str)),
+        'symbol': np.char.add(np.char.add('SYM', symbol.astype(str)), '/USDT'),
+        'timestamp': np.arange(n, dtype=np.int64) * 10,
+        'side': np.where(rng.random(n) < 0.5, 'buy', 'sell'),
+        'price': base_price[symbol] * drift,
+        'amount': np.round(rng.exponential(1.0, n), 4) + 0.0001,
+        'fee': 0.0,
+    })
+
+
+def naive_positions(fills):
+    """逐笔循环计算的平均成本法结果，用于校验向量化实现"""
+    state = {}
+    for row in fills.sort_values(['account', 'symbol', 'timestamp'], kind='stable').itertuples():
+        key = (row.account, row.symbol)
+        position, cost, realized = state.get(key, (0.0, 0.0, 0.0))
+        q = row.amount if row.side == 'buy' else -row.amount
+        if abs(position) <= EPSILON or np.sign(q) == np.sign(position):
+            position, cost = position + q, cost + q * row.price
+        else:
+            avg = cost / position
+            closed = np.sign(position) * min(abs(q), abs(position))
+            realized += closed * (row.price - avg)
+            new_position = position + q
+            if abs(new_position) <= EPSILON:
+                cost = 0.0
+            elif np.sign(new_position) != np.sign(position):
+                cost = new_position * row.price
+            else:
+                cost = cost * new_position / position
+            position = new_position
+        state[key] = (position, cost, realized)
+    return state
+
+
+def benchmark(rows, incremental, verify_rows):
+    """在合成成交上测试全量计算、增量更新的耗时，并与逐笔循环的结果对比"""
+    fills = synthetic_fills(rows + incremental)
+    initial, extra = fills.iloc[:rows], fills.iloc[rows:]
+
+    analytics = PositionAnalytics()
+    started = time.perf_counter()
+    analytics.update(initial)
+    full_time = time.perf_counter() - started
+    print(f"全量计算 {rows:,} 笔成交: {full_time * 1000:.1f} ms ({rows / full_time:,.0f} 笔/秒)")
+
+    started = time.perf_counter()
+    analytics.update(extra)
+    inc_time = time.perf_counter() - started
+    print(f"增量更新 {incremental:,} 笔成交: {inc_time * 1000:.1f} ms")
+
+    started = time.perf_counter()
+    analytics.summary()
+    print(f"生成汇总 {len(analytics.state):,} 个持仓: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    if verify_rows:
+        sample = fills.iloc[:verify_rows]
+        check = PositionAnalytics()
+        half = verify_rows // 2
+        check.update(sample.iloc[:half])
+        check.update(sample.iloc[half:])
+        expected = naive_positions(sample)
+        worst = 0.0
+        for key, (position, cost, realized) in expected.items():
+            got = check.state.loc[key]
+            for value, target in ((got['position'], position), (got['cost'], cost), (got['realized'], realized)):
+                worst = max(worst, abs(value - target) / max(1.0, abs(target)))
+        print(f"与逐笔循环对比 {verify_rows:,} 笔成交, 最大相对误差: {worst:.2e}")
+        return worst < 1e-6
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="持仓分析模块基准测试")
+    parser.add_argument('--bench', type=int, default=1000000, help="全量计算的成交笔数，默认100万")
+    parser.add_argument('--incremental', type=int, default=10000, help="增量更新的成交笔数")
+    parser.add_argument('--verify', type=int, default=20000, help="与逐笔循环对比的成交笔数，0表示不校验")
+    args = parser.parse_args(argv)
+    return 0 if benchmark(args.bench, args.incremental, args.verify) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
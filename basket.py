@@ -0,0 +1,399 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from batch_order import read_orders, validate_order, ORDER_FIELDS
+from lazy_import import lazy_import
+import exchange_worker
+import logger
+
+# 获取日志记录器
+log = logger.get_logger('basket')
+
+ccxt = lazy_import('ccxt')
+
+# 默认参数，可通过配置 basket 覆盖
+DEFAULT_BASKET_CONFIG = {
+    # 有腿下单失败时撤销其他已下单的腿
+    'cancel_on_failure': True,
+    # 每条腿下单和撤单的截止时间(秒)
+    'timeout': 10.0,
+    # 下单超时的腿在挂单中查找的次数和间隔(秒)，请求可能仍在途中，稍后才出现在交易所
+    'resolve_attempts': 3,
+    'resolve_interval': 1.0,
+}
+
+STATUS_LABELS = {'pending': '待下单', 'invalid': '校验失败', 'placed': '已下单', 'failed': '下单失败',
+                 'unknown': '状态未知', 'canceled': '已撤销', 'cancel_failed': '撤单失败'}
+
+
+class Leg:
+    """组合单中的一条腿"""
+
+    __slots__ = ('exchange', 'account', 'symbol', 'side', 'price', 'amount',
+                 'status', 'order', 'latency', 'cancel_latency', 'message')
+
+    def __init__(self, exchange, account, symbol, side, price, amount):
+        self.exchange = exchange
+        self.account = account
+        self.symbol = symbol
+        self.side = side
+        self.price = price
+        self.amount = amount
+        self.reset()
+
+    def reset(self):
+        self.status = 'pending'
+        self.order = None
+        self.latency = None
+        self.cancel_latency = None
+        self.message = ''
+
+    @classmethod
+    def from_dict(cls, data):
+        missing = [field for field in ORDER_FIELDS if data.get(field) in (None, '')]
+        if missing:
+            raise ValueError(f"缺少字段 {missing}")
+        return cls(data['exchange'], data['account'], data['symbol'], str(data['side']).lower(),
+                   data['price'], data['amount'])
+
+    def describe(self):
+        return f"{self.exchange}/{self.account} {self.symbol} {self.side} {self.amount} @ {self.price}"
+
+
+def load_legs(source, fmt=None):
+    """从CSV或JSONL文件读取组合单的腿，字段与批量下单相同"""
+    legs = []
+    for line_no, data in read_orders(source, fmt):
+        if data is None:
+            raise ValueError(f"第 {line_no} 行无法解析")
+        try:
+            legs.append(Leg.from_dict(data))
+        except ValueError as e:
+            raise ValueError(f"第 {line_no} 行: {str(e)}")
+    return legs
+
+
+class BasketRunner:
+    """
+    多交易所、多账户的组合单。
+    下单前用各交易所缓存的市场信息校验全部腿，有任何一条不合格则一条都不发；
+    校验通过后每条腿一个线程，在屏障处同时放行，经各账户的调用器并发下单，记录每条腿从放行到确认的延迟。
+    启用失败撤单时，有腿下单失败后并发撤销其他已下单的腿(已成交的部分无法撤回，只能尽力而为)。
+    下单超时或网络错误的腿可能已经在交易所挂出，先在挂单中按方向、价格和数量查找，
+    找到的按已下单处理(失败时同样撤销)，找不到的标记为状态未知，需要人工确认。
+    """
+
+    def __init__(self, exchanges, callers, config=None):
+        self.exchanges = exchanges
+        self.callers = callers
+        self.config = dict(DEFAULT_BASKET_CONFIG, **(config or {}))
+        self.markets = {}
+        self.lock = threading.Lock()
+
+    def _markets(self, exchange_id, key_id):
+        """交易所的市场信息，每个交易所只加载一次"""
+        with self.lock:
+            markets = self.markets.get(exchange_id)
+        if markets is None:
+            markets = self.callers.get(exchange_id, key_id).call('load_markets')
+            with self.lock:
+                self.markets[exchange_id] = markets
+        return markets
+
+    def validate(self, legs):
+        """
+        按市场精度和限额校验并规整每条腿的价格和数量，返回校验失败的腿数。
+        各交易所的市场信息并行加载，已加载过的直接使用缓存。
+        """
+        accounts = {}
+        for leg in legs:
+            if leg.account not in self.exchanges.get(leg.exchange, {}):
+                leg.status, leg.message = 'invalid', "账户不在配置中"
+            else:
+                accounts.setdefault(leg.exchange, leg.account)
+        markets = {}
+        with ThreadPoolExecutor(max_workers=max(1, len(accounts)), thread_name_prefix='basket-markets') as pool:
+            futures = {exchange_id: pool.submit(self._markets, exchange_id, key_id)
+                       for exchange_id, key_id in accounts.items()}
+            for exchange_id, future in futures.items():
+                try:
+                    markets[exchange_id] = future.result()
+                except Exception as e:
+                    log.warning(f"加载 {exchange_id} 市场信息失败: {type(e).__name__}: {str(e)}")
+                    markets[exchange_id] = e
+
+        invalid = 0
+        for leg in legs:
+            if leg.status == 'invalid':
+                invalid += 1
+                continue
+            exchange_markets = markets[leg.exchange]
+            if isinstance(exchange_markets, Exception):
+                leg.status, leg.message = 'invalid', f"加载市场信息失败: {str(exchange_markets)}"
+                invalid += 1
+                continue
+            if self.check(leg, exchange_markets.get(leg.symbol)):
+                invalid += 1
+        return invalid
+
+    def check(self, leg, market):
+        """
+        用给定的市场信息校验一条腿，通过时按精度规整价格和数量，返回错误信息，通过时返回 None。
+        """
+        if market is None:
+            error = "交易对不存在"
+        else:
+            exchange = self.exchanges[leg.exchange][leg.account]
+            normalized, error = validate_order({'side': leg.side, 'price': leg.price, 'amount': leg.amount},
+                                               exchange, market)
+        if error:
+            leg.status, leg.message = 'invalid', error
+            return error
+        leg.side, leg.price, leg.amount = normalized['side'], normalized['price'], normalized['amount']
+        leg.status, leg.message = 'pending', ''
+        return None
+
+    def execute(self, legs, cancel_on_failure=None):
+        """
+        校验后同时提交全部腿，阻塞到全部完成(包括失败后的撤单)。
+
+        参数:
+            legs (list): Leg 列表，执行结果写回每条腿。
+            cancel_on_failure (bool, optional): 默认读取配置 cancel_on_failure。
+
+        返回:
+            dict: ok(全部下单成功)、invalid、placed、failed、unknown(超时后仍未找到)、canceled、skew(各腿放行时间的最大差)、
+                  elapsed(从放行到最后一条腿确认)。
+        """
+        if cancel_on_failure is None:
+            cancel_on_failure = self.config['cancel_on_failure']
+        for leg in legs:
+            leg.reset()
+        invalid = self.validate(legs)
+        if invalid or not legs:
+            log.warning(f"组合单有 {invalid} 条腿校验失败，全部不下单")
+            return {'ok': False, 'invalid': invalid, 'placed': 0, 'failed': 0, 'unknown': 0, 'canceled': 0,
+                    'skew': 0.0, 'elapsed': 0.0}
+
+        timeout = self.config['timeout']
+        barrier = threading.Barrier(len(legs))
+        fired_at = [0.0] * len(legs)
+
+        def place(i, leg):
+            caller = self.callers.get(leg.exchange, leg.account)
+            barrier.wait()
+            fired_at[i] = started = time.perf_counter()
+            try:
+                leg.order = caller.call('create_limit_order', symbol=leg.symbol, side=leg.side,
+                                        amount=leg.amount, price=leg.price, timeout=timeout)
+                leg.status = 'placed'
+            except (exchange_worker.DeadlineExceeded, ccxt.NetworkError) as e:
+                # 请求可能已经到达交易所，结果未知
+                leg.status, leg.message = 'unknown', f"{type(e).__name__}: {str(e)}"
+            except Exception as e:
+                leg.status, leg.message = 'failed', f"{type(e).__name__}: {str(e)}"
+            leg.latency = time.perf_counter() - started
+            return time.perf_counter()
+
+        log.info(f"提交组合单 {len(legs)} 条腿: " + "; ".join(leg.describe() for leg in legs))
+        submitted_at = time.time()
+        with ThreadPoolExecutor(max_workers=len(legs), thread_name_prefix='basket') as pool:
+            finished = list(pool.map(place, range(len(legs)), legs))
+        unknown = [leg for leg in legs if leg.status == 'unknown']
+        if unknown:
+            self._resolve(unknown, legs, submitted_at, timeout)
+        placed = [leg for leg in legs if leg.status == 'placed']
+        failed = len(legs) - len(placed)
+        result = {'ok': not failed, 'invalid': 0, 'placed': len(placed), 'failed': failed,
+                  'unknown': sum(1 for leg in legs if leg.status == 'unknown'), 'canceled': 0,
+                  'skew': max(fired_at) - min(fired_at), 'elapsed': max(finished) - min(fired_at)}
+        for leg in legs:
+            context = {'exchange': leg.exchange, 'account': leg.account, 'symbol': leg.symbol}
+            if leg.status == 'unknown':
+                log.error(f"组合单腿状态未知，请在交易所确认: {leg.describe()}: {leg.message}", extra=context)
+            elif leg.status == 'failed':
+                log.error(f"组合单腿下单失败: {leg.describe()}: {leg.message}", extra=context)
+            else:
+                log.info(f"组合单腿下单成功: {leg.describe()} 订单ID={leg.order['id']} {leg.latency * 1000:.0f}ms",
+                         extra=dict(context, order_id=leg.order['id']))
+
+        if failed and placed and cancel_on_failure:
+            result['canceled'] = self._cancel(placed, timeout)
+        return result
+
+    def _resolve(self, unknown, legs, submitted_at, timeout):
+        """
+        在各账户的挂单中查找下单超时的腿: 同方向、同价格、同数量、下单时间不早于提交时间，
+        且不是其他腿已确认的订单。找到的腿改为已下单，多次查找仍找不到的保持状态未知。
+        """
+        known = {(leg.exchange, leg.account, leg.order['id']) for leg in legs if leg.order}
+        pending = list(unknown)
+        for attempt in range(max(1, self.config['resolve_attempts'])):
+            if attempt:
+                time.sleep(self.config['resolve_interval'])
+            for leg in list(pending):
+                try:
+                    orders = self.callers.get(leg.exchange, leg.account).call('fetch_open_orders', leg.symbol,
+                                                                              timeout=timeout)
+                except Exception as e:
+                    log.warning(f"查询 {leg.describe()} 的挂单失败: {type(e).__name__}: {str(e)}")
+                    continue
+                for order in orders:
+                    key = (leg.exchange, leg.account, order['id'])
+                    if key not in known and _same_order(leg, order, submitted_at):
+                        known.add(key)
+                        leg.order, leg.status = order, 'placed'
+                        leg.message = f"下单超时，已在挂单中找到 {order['id']}"
+                        pending.remove(leg)
+                        break
+            if not pending:
+                break
+        for leg in pending:
+            leg.message += "；未在挂单中找到，可能未下单或已全部成交"
+
+    def _cancel(self, legs, timeout):
+        """并发撤销已下单的腿，返回撤销成功的数量"""
+        def cancel(leg):
+            started = time.perf_counter()
+            try:
+                self.callers.get(leg.exchange, leg.account).call('cancel_order', leg.order['id'], leg.symbol,
+                                                                 timeout=timeout)
+                leg.status = 'canceled'
+            except Exception as e:
+                leg.status, leg.message = 'cancel_failed', f"{type(e).__name__}: {str(e)}"
+                log.error(f"组合单撤销 {leg.describe()} 失败: {leg.message}")
+            leg.cancel_latency = time.perf_counter() - started
+
+        log.warning(f"组合单有腿下单失败，撤销其他 {len(legs)} 条已下单的腿")
+        with ThreadPoolExecutor(max_workers=len(legs), thread_name_prefix='basket-cancel') as pool:
+            list(pool.map(cancel, legs))
+        return sum(1 for leg in legs if leg.status == 'canceled')
+
+
+def _same_order(leg, order, submitted_at):
+    """挂单是否与腿的方向、价格和数量一致，且在提交组合单之后创建"""
+    def close(a, b):
+        return a is not None and abs(float(a) - float(b)) <= 1e-9 * max(1.0, abs(float(b)))
+
+    timestamp = order.get('timestamp')
+    return (order.get('side') == leg.side and close(order.get('price'), leg.price)
+            and close(order.get('amount'), leg.amount)
+            and (timestamp is None or timestamp >= (submitted_at - 5) * 1000))
+
+
+def format_leg(leg):
+    """一行文字描述一条腿的状态和延迟"""
+    text = f"{leg.describe()} | {STATUS_LABELS.get(leg.status, leg.status)}"
+    if leg.order:
+        text += f" {leg.order['id']}"
+    if leg.latency is not None:
+        text += f" {leg.latency * 1000:.0f}ms"
+    if leg.cancel_latency is not None:
+        text += f" 撤单 {leg.cancel_latency * 1000:.0f}ms"
+    if leg.message:
+        text += f" {leg.message}"
+    return text
+
+
+def format_result(result):
+    if result['invalid']:
+        return f"{result['invalid']} 条腿校验失败，未下单"
+    text = (f"下单成功 {result['placed']} 条，失败 {result['failed']} 条"
+            f" | 放行差 {result['skew'] * 1000:.2f}ms 总耗时 {result['elapsed'] * 1000:.0f}ms")
+    if result.get('unknown'):
+        text += f" | {result['unknown']} 条状态未知，请在交易所确认"
+    if result['canceled']:
+        text += f" | 已撤销 {result['canceled']} 条"
+    return text
+
+
+def demo(fail_leg=None):
+    """在三个有不同网络延迟的模拟交易所上提交组合单，可以指定一条腿下单失败演示撤单"""
+    import ccxt
+    from sim_exchange import SimExchange
+    from exchange_worker import WorkerPool
+    from resilience import ResilientPool
+
+    class FailingExchange(SimExchange):
+        def create_limit_order(self, *args, **kwargs):
+            self._sleep()
+            raise ccxt.InsufficientFunds("模拟余额不足")
+
+    exchanges = {}
+    for i, latency in enumerate((0.03, 0.08, 0.15)):
+        exchange_class = FailingExchange if fail_leg == i else SimExchange
+        exchanges[f"sim{i}"] = {'demo': exchange_class(f"sim{i}", latency=latency, seed=i)}
+    workers = WorkerPool(exchanges, threads=2, timeout=30)
+    callers = ResilientPool(workers, {'hedge': False})
+    legs = [Leg('sim0', 'demo', 'BTC/USDT', 'buy', 99.5, 0.1),
+            Leg('sim1', 'demo', 'BTC/USDT', 'sell', 100.5, 0.1),
+            Leg('sim2', 'demo', 'BTC/USDT', 'buy', 99.8, 0.06)]
+    try:
+        result = BasketRunner(exchanges, callers).execute(legs)
+    finally:
+        workers.stop()
+    for leg in legs:
+        print(f"  {format_leg(leg)}")
+    print(format_result(result))
+    return 0 if result['ok'] else 1
+
+
+def run_file(path, fmt, cancel_on_failure, dry_run):
+    """按配置中的交易所账户提交文件中定义的组合单"""
+    from config import load_config
+    from exchange_factory import create_exchanges
+    from exchange_worker import WorkerPool
+    from resilience import ResilientPool
+
+    config = load_config()
+    if not config:
+        print("错误: 无法加载配置文件!", file=sys.stderr)
+        return 2
+    try:
+        legs = load_legs(path, fmt)
+    except (OSError, ValueError) as e:
+        print(f"错误: 读取组合单失败: {str(e)}", file=sys.stderr)
+        return 2
+    exchanges = create_exchanges(config)
+    workers = WorkerPool(exchanges)
+    callers = ResilientPool(workers, config.get('resilience'))
+    runner = BasketRunner(exchanges, callers, config.get('basket'))
+    try:
+        if dry_run:
+            invalid = runner.validate(legs)
+            for leg in legs:
+                print(f"  {format_leg(leg)}")
+            print(f"校验完成，{invalid} 条腿不合格")
+            return 1 if invalid else 0
+        result = runner.execute(legs, cancel_on_failure)
+    finally:
+        workers.stop()
+    for leg in legs:
+        print(f"  {format_leg(leg)}")
+    print(format_result(result))
+    return 0 if result['ok'] else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="同时提交跨交易所、跨账户的组合单")
+    parser.add_argument('file', nargs='?', help="CSV/JSONL 文件，字段与批量下单相同，'-' 表示标准输入")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="文件格式，默认按扩展名或内容判断")
+    parser.add_argument('--no-cancel', action='store_true', help="有腿失败时不撤销其他腿")
+    parser.add_argument('--dry-run', action='store_true', help="只校验不下单")
+    parser.add_argument('--demo', action='store_true', help="在模拟交易所上演示")
+    parser.add_argument('--fail-leg', type=int, help="演示时让第几条腿(从0开始)下单失败")
+    args = parser.parse_args(argv)
+    if args.demo:
+        return demo(args.fail_leg)
+    if not args.file:
+        parser.error("需要组合单文件，或使用 --demo")
+    return run_file(args.file, args.format, False if args.no_cancel else None, args.dry_run)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import csv
+import json
+import queue
+import sys
+import threading
+import time
+from exchange_worker import guard_rate_limit
+import logger
+
+# 获取日志记录器
+log = logger.get_logger('batch_order')
+
+# 订单文件必须包含的字段
+ORDER_FIELDS = ['exchange', 'account', 'symbol', 'side', 'price', 'amount']
+
+# 每个交易所默认的并发下单数
+DEFAULT_CONCURRENCY = 4
+# 每个交易所最多积压的待下单订单数，超过后读取端才等待该交易所
+DEFAULT_MAX_PENDING = 1000
+
+
+def _open_source(source):
+    """打开订单来源，'-' 表示标准输入"""
+    if source == '-':
+        return sys.stdin
+    return open(source, 'r', encoding='utf-8', newline='')
+
+
+def _detect_format(source, first_line):
+    """根据文件扩展名或首行内容判断订单格式"""
+    lowered = source.lower()
+    if lowered.endswith('.csv'):
+        return 'csv'
+    if lowered.endswith('.jsonl') or lowered.endswith('.json'):
+        return 'jsonl'
+    return 'jsonl' if first_line.lstrip().startswith('{') else 'csv'
+
+
+def read_orders(source, fmt=None):
+    """
+    逐行读取订单，支持CSV和JSONL两种格式，以流的方式返回，不会一次性读入内存。
+
+    参数:
+        source (str): 订单文件路径，'-' 表示从标准输入读取。
+        fmt (str, optional): 'csv' 或 'jsonl'，为None时自动判断。
+
+    返回:
+        generator: 依次产生 (行号, 订单字典) 元组；无法解析的行产生 (行号, None)。
+    """
+    f = _open_source(source)
+    try:
+        first_line = f.readline()
+        while first_line and not first_line.strip():
+            first_line = f.readline()
+        if not first_line:
+            return
+        fmt = fmt or _detect_format(source, first_line)
+
+        if fmt == 'csv':
+            # 把已读取的首行拼回去，交给csv模块统一解析
+            reader = csv.DictReader(_chain_lines(first_line, f))
+            for line_no, row in enumerate(reader, start=2):
+                yield line_no, {k.strip(): (v.strip() if isinstance(v, str) else v)
+                                for k, v in row.items() if k}
+        else:
+            for line_no, line in enumerate(_chain_lines(first_line, f), start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_no, json.loads(line)
+                except json.JSONDecodeError as e:
+                    log.warning(f"第 {line_no} 行JSON解析失败: {e}")
+                    yield line_no, None
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def _chain_lines(first_line, f):
+    """先返回已读取的首行，再返回文件剩余的行"""
+    yield first_line
+    for line in f:
+        yield line
+
+
+class MarketCache:
+    """
+    按交易所缓存市场信息，每个交易所只调用一次 load_markets，
+    同一交易所的其他账户通过 set_markets 复用，避免重复的网络请求。
+    """
+
+    def __init__(self, exchanges):
+        self.exchanges = exchanges
+        self.markets = {}
+        self.lock = threading.Lock()
+        self.exchange_locks = {}
+
+    def _exchange_lock(self, exchange_id):
+        with self.lock:
+            if exchange_id not in self.exchange_locks:
+                self.exchange_locks[exchange_id] = threading.Lock()
+            return self.exchange_locks[exchange_id]
+
+    def get_market(self, exchange_id, key_id, symbol):
+        """
+        获取指定交易对的市场信息。
+
+        返回:
+            dict: 市场信息；交易对不存在时返回None。
+        """
+        exchange = self.exchanges[exchange_id][key_id]
+        with self._exchange_lock(exchange_id):
+            if exchange_id not in self.markets:
+                log.info(f"加载 {exchange_id} 的市场信息")
+                self.markets[exchange_id] = exchange.load_markets()
+            elif not exchange.markets:
+                exchange.set_markets(list(self.markets[exchange_id].values()))
+        return self.markets[exchange_id].get(symbol)
+
+
+def validate_order(order, exchange, market):
+    """
+    根据市场精度和限额校验并规整一个订单。
+
+    参数:
+        order (dict): 原始订单，价格和数量可以是字符串。
+        exchange (ccxt.Exchange): 交易所实例，用于按精度规整价格和数量。
+        market (dict): 交易对的市场信息。
+
+    返回:
+        tuple: (规整后的订单字典, 错误信息)；校验通过时错误信息为None。
+    """
+    side = str(order.get('side', '')).lower()
+    if side not in ('buy', 'sell'):
+        return None, f"无效的交易方向: {order.get('side')}"
+
+    try:
+        price = float(order['price'])
+        amount = float(order['amount'])
+    except (TypeError, ValueError):
+        return None, "价格或数量不是有效数字"
+    if price <= 0 or amount <= 0:
+        return None, "价格和数量必须大于0"
+
+    symbol = market['symbol']
+    try:
+        price = float(exchange.price_to_precision(symbol, price))
+        amount = float(exchange.amount_to_precision(symbol, amount))
+    except Exception as e:
+        return None, f"按精度规整失败: {str(e)}"
+    if price <= 0 or amount <= 0:
+        return None, "按精度规整后价格或数量为0"
+
+    limits = market.get('limits') or {}
+    checks = [
+        ('amount', amount, '数量'),
+        ('price', price, '价格'),
+        ('cost', price * amount, '金额'),
+    ]
+    for limit_key, value, label in checks:
+        limit = limits.get(limit_key) or {}
+        if limit.get('min') is not None and value < limit['min']:
+            return None, f"{label} {value} 小于最小限额 {limit['min']}"
+        if limit.get('max') is not None and value > limit['max']:
+            return None, f"{label} {value} 大于最大限额 {limit['max']}"
+
+    return {'symbol': symbol, 'side': side, 'price': price, 'amount': amount}, None
+
+
+class BatchOrderRunner:
+    """
+    无界面的批量下单执行器。
+    每个交易所一个订单队列，由该交易所自己的下单线程消费，结果以JSONL格式逐条输出。
+    一个交易所变慢只会让它的队列积压，不影响读取端向其他交易所分发订单。
+    """
+
+    def __init__(self, exchanges, concurrency=None, dry_run=False, output=None, max_pending=DEFAULT_MAX_PENDING):
+        """
+        参数:
+            exchanges (dict): {exchange_id: {key_id: exchange}} 形式的交易所实例字典。
+            concurrency (int or dict, optional): 每个交易所的下单线程数，或按交易所ID配置的字典。
+            dry_run (bool): 为True时只校验不下单。
+            output (file, optional): 结果输出流，默认为标准输出。
+            max_pending (int): 每个交易所最多积压的订单数。
+        """
+        self.exchanges = exchanges
+        # 同一账户的下单线程共用一个实例，限频和nonce需要串行
+        for keys in exchanges.values():
+            for exchange in keys.values():
+                guard_rate_limit(exchange)
+        self.concurrency = concurrency if concurrency is not None else DEFAULT_CONCURRENCY
+        self.dry_run = dry_run
+        self.output = output or sys.stdout
+        self.max_pending = max(1, max_pending)
+        self.markets = MarketCache(exchanges)
+        self.output_lock = threading.Lock()
+        self.queues = {}
+        self.threads = []
+        self.stats = {'ok': 0, 'rejected': 0, 'error': 0}
+
+    def _limit_for(self, exchange_id):
+        if isinstance(self.concurrency, dict):
+            return int(self.concurrency.get(exchange_id, DEFAULT_CONCURRENCY))
+        return int(self.concurrency)
+
+    def _queue(self, exchange_id):
+        """返回交易所的订单队列，第一次使用时启动该交易所的下单线程"""
+        if exchange_id not in self.queues:
+            self.queues[exchange_id] = orders = queue.Queue(maxsize=self.max_pending)
+            for i in range(max(1, self._limit_for(exchange_id))):
+                thread = threading.Thread(target=self._consume, args=(orders,), name=f"batch-{exchange_id}-{i}",
+                                          daemon=True)
+                thread.start()
+                self.threads.append((orders, thread))
+        return self.queues[exchange_id]
+
+    def _consume(self, orders):
+        while True:
+            item = orders.get()
+            if item is None:
+                break
+            try:
+                self._execute(*item)
+            except Exception as e:
+                log.error(f"批量下单线程异常: 第 {item[0]} 行, {str(e)}", exc_info=True)
+
+    def _emit(self, result):
+        """输出一条结果并更新统计"""
+        with self.output_lock:
+            self.stats[result['status']] += 1
+            self.output.write(json.dumps(result, ensure_ascii=False) + '\n')
+            self.output.flush()
+
+    def _result(self, line_no, order, status, **extra):
+        result = {'line': line_no, 'status': status}
+        if isinstance(order, dict):
+            for field in ORDER_FIELDS:
+                if field in order:
+                    result[field] = order[field]
+        result.update(extra)
+        return result
+
+    def _check(self, line_no, order):
+        """检查订单字段和账户是否存在，返回错误信息或None"""
+        if not isinstance(order, dict):
+            return "无法解析的订单行"
+        missing = [field for field in ORDER_FIELDS if order.get(field) in (None, '')]
+        if missing:
+            return f"缺少字段: {', '.join(missing)}"
+        if order['exchange'] not in self.exchanges or order['account'] not in self.exchanges[order['exchange']]:
+            return f"未配置的交易所账户: {order['exchange']} - {order['account']}"
+        return None
+
+    def _execute(self, line_no, order):
+        """在交易所的下单线程中校验并提交一个订单"""
+        exchange_id, key_id = order['exchange'], order['account']
+        exchange = self.exchanges[exchange_id][key_id]
+        try:
+            market = self.markets.get_market(exchange_id, key_id, order['symbol'])
+        except Exception as e:
+            log.error(f"加载 {exchange_id} 市场信息失败: {str(e)}", exc_info=True)
+            self._emit(self._result(line_no, order, 'error', error=f"加载市场信息失败: {str(e)}"))
+            return
+        if market is None:
+            self._emit(self._result(line_no, order, 'rejected', error=f"交易对不存在: {order['symbol']}"))
+            return
+
+        normalized, error = validate_order(order, exchange, market)
+        if error:
+            self._emit(self._result(line_no, order, 'rejected', error=error))
+            return
+
+        if self.dry_run:
+            self._emit(self._result(line_no, order, 'ok', dry_run=True, **normalized))
+            return
+
+        started = time.perf_counter()
+        try:
+            created = exchange.create_limit_order(
+                symbol=normalized['symbol'],
+                side=normalized['side'],
+                amount=normalized['amount'],
+                price=normalized['price']
+            )
+            latency_ms = round((time.perf_counter() - started) * 1000, 2)
+            log.info(f"批量下单成功: 第 {line_no} 行, 订单ID={created['id']}",
+                     extra={'exchange': exchange_id, 'account': key_id, 'symbol': normalized['symbol'],
+                            'order_id': created['id']})
+            self._emit(self._result(line_no, order, 'ok', order_id=created['id'],
+                                    order_status=created.get('status'), latency_ms=latency_ms, **normalized))
+        except Exception as e:
+            latency_ms = round((time.perf_counter() - started) * 1000, 2)
+            log.error(f"批量下单失败: 第 {line_no} 行, {str(e)}", exc_info=True)
+            self._emit(self._result(line_no, order, 'error', error=str(e), latency_ms=latency_ms, **normalized))
+
+    def run(self, orders):
+        """
+        执行所有订单。读取端把订单分发到各交易所的队列，只有某个交易所积压超过 max_pending 时
+        才等待该交易所，因此可以处理任意长度的输入流。
+
+        参数:
+            orders (iterable): (行号, 订单字典) 元组序列，通常来自 read_orders。
+
+        返回:
+            dict: 按状态统计的结果数量。
+        """
+        log.info(f"开始批量下单, dry_run={self.dry_run}")
+        try:
+            for line_no, order in orders:
+                error = self._check(line_no, order)
+                if error:
+                    self._emit(self._result(line_no, order, 'rejected', error=error))
+                    continue
+                self._queue(order['exchange']).put((line_no, order))
+        finally:
+            for pending, _ in self.threads:
+                pending.put(None)
+            for _, thread in self.threads:
+                thread.join()
+
+        log.info(f"批量下单结束: {self.stats}")
+        return self.stats
+
+
+def run_batch(exchanges, config, source, fmt=None, concurrency=None, dry_run=False, output_path=None):
+    """
+    批量下单模式入口。
+
+    参数:
+        exchanges (dict): 交易所实例字典。
+        config (dict): 完整配置，读取 batch_concurrency 作为默认并发数。
+        source (str): 订单文件路径，'-' 表示标准输入。
+        fmt (str, optional): 订单格式。
+        concurrency (int, optional): 命令行指定的每交易所并发数，优先于配置。
+        dry_run (bool): 只校验不下单。
+        output_path (str, optional): 结果输出文件，默认为标准输出。
+
+    返回:
+        int: 退出码，全部成功为0，否则为1。
+    """
+    if concurrency is None:
+        concurrency = config.get('batch_concurrency', DEFAULT_CONCURRENCY)
+
+    output = open(output_path, 'w', encoding='utf-8') if output_path else sys.stdout
+    try:
+        runner = BatchOrderRunner(exchanges, concurrency=concurrency, dry_run=dry_run, output=output)
+        stats = runner.run(read_orders(source, fmt))
+    finally:
+        output.flush()
+        if output_path:
+            output.close()
+
+    print(f"完成: 成功 {stats['ok']}, 拒绝 {stats['rejected']}, 失败 {stats['error']}", file=sys.stderr)
+    return 0 if stats['rejected'] == 0 and stats['error'] == 0 else 1
@@ -2,10 +2,33 @@
 # -*- coding: utf-8 -*-
 
 import os
-import ccxt
+import sys
+import time
+import socket
+import argparse
+import threading
+from urllib.parse import urlsplit
 from config import load_config, add_exchange_api, remove_exchange_api
+from exchange_factory import exchange_ids, create_exchange
+from lazy_import import lazy_import
 import logger
 
+# 只有实例化交易所时才需要ccxt，菜单和交易所列表使用缓存，不导入ccxt
+ccxt = lazy_import('ccxt')
+
+# 批量测试时每个账户的默认超时(秒)
+DEFAULT_PROBE_TIMEOUT = 10.0
+# 允许的最大时钟偏差(毫秒)，超过时签名请求可能被交易所拒绝
+DEFAULT_MAX_SKEW_MS = 1000
+# 报告的排序字段
+SORT_KEYS = {
+    'name': lambda r: (r['exchange'], r['account']),
+    'dns': lambda r: r['dns_ms'],
+    'connect': lambda r: r['connect_ms'],
+    'request': lambda r: r['request_ms'],
+    'skew': lambda r: abs(r['skew_ms']) if r['skew_ms'] is not None else None,
+}
+
 # 获取日志记录器
 log = logger.get_logger('config_manager')
 
@@ -26,7 +49,7 @@ def print_header():
 def list_exchanges():
     """列出所有支持的交易所"""
     print("支持的交易所:")
-    exchanges = ccxt.exchanges
+    exchanges = exchange_ids()
     for i, exchange in enumerate(exchanges):
         print(f"{i + 1}. {exchange}")
     print()
@@ -65,7 +88,7 @@ def add_api_key():
 
     # 获取用户输入并进行验证
     exchange_id = input("请输入交易所ID (例如: binance): ").strip().lower()
-    if not exchange_id or exchange_id not in ccxt.exchanges:
+    if not exchange_id or exchange_id not in exchange_ids():
         log.warning(f"用户尝试添加不支持的交易所 '{exchange_id}'")
         print(f"错误: 不支持的交易所 '{exchange_id}'")
         input("按任意键继续...")
@@ -247,6 +270,213 @@ def test_api_connection():
     input("\n按键继续...")
 
 
+def _api_url(urls):
+    """从交易所的 urls['api'] 中取出第一个接口地址，可能是字符串或嵌套字典"""
+    if isinstance(urls, str):
+        return urls if urls.startswith('http') else None
+    if isinstance(urls, dict):
+        for value in urls.values():
+            url = _api_url(value)
+            if url:
+                return url
+    return None
+
+
+def _probe_target(exchange):
+    """
+    返回测量DNS和建立连接时使用的主机和端口。
+    配置了代理时实际连接的是代理服务器，因此测量代理。
+    """
+    proxy = (exchange.proxies or {}).get('https') or (exchange.proxies or {}).get('http')
+    url = urlsplit(proxy if proxy else _api_url(exchange.urls.get('api')) or '')
+    if not url.hostname:
+        return None, None, bool(proxy)
+    return url.hostname, url.port or (443 if url.scheme == 'https' else 80), bool(proxy)
+
+
+def _resolve(host, port, timeout):
+    """getaddrinfo 没有超时参数，在守护线程中解析，超时后不再等待"""
+    outcome = {}
+
+    def run():
+        try:
+            outcome['addresses'] = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=run, name=f"dns-{host}", daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise socket.timeout(f"DNS解析 {host} 超过 {timeout:.1f}s")
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['addresses']
+
+
+def _probe_result(exchange_id, key_id):
+    return {'exchange': exchange_id, 'account': key_id, 'status': 'ok', 'via_proxy': False,
+            'dns_ms': None, 'connect_ms': None, 'request_ms': None, 'skew_ms': None, 'error': ''}
+
+
+def probe_account(exchange_id, key_id, key_data, config, timeout=DEFAULT_PROBE_TIMEOUT,
+                  max_skew_ms=DEFAULT_MAX_SKEW_MS, result=None):
+    """
+    测试单个账户: 依次测量DNS解析、TCP连接、带签名的 fetch_balance 请求耗时，
+    如果交易所支持 fetch_time，再按请求往返中点估算本地时钟相对交易所的偏差。
+    timeout 是全部测量共用的截止时间，每一步只能使用剩余的时间。
+
+    参数:
+        result (dict, optional): 逐步写入测量结果的字典，超时放弃等待时调用方仍能拿到已完成的部分。
+
+    返回:
+        dict: exchange, account, status(ok/skew/timeout/error), via_proxy, dns_ms, connect_ms,
+              request_ms, skew_ms, error。
+    """
+    if result is None:
+        result = _probe_result(exchange_id, key_id)
+    deadline = time.monotonic() + timeout
+
+    def remaining():
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise socket.timeout(f"超过 {timeout:.0f}s 未完成")
+        return left
+
+    try:
+        exchange = create_exchange(exchange_id, key_data, config)
+
+        host, port, result['via_proxy'] = _probe_target(exchange)
+        if host:
+            started = time.perf_counter()
+            addresses = _resolve(host, port, remaining())
+            result['dns_ms'] = (time.perf_counter() - started) * 1000
+
+            family, socktype, proto, _, address = addresses[0]
+            started = time.perf_counter()
+            with socket.socket(family, socktype, proto) as sock:
+                sock.settimeout(remaining())
+                sock.connect(address)
+            result['connect_ms'] = (time.perf_counter() - started) * 1000
+
+        exchange.timeout = int(remaining() * 1000)
+        started = time.perf_counter()
+        exchange.fetch_balance()
+        result['request_ms'] = (time.perf_counter() - started) * 1000
+
+        if exchange.has.get('fetchTime'):
+            exchange.timeout = int(remaining() * 1000)
+            sent = time.time() * 1000
+            server_time = exchange.fetch_time()
+            received = time.time() * 1000
+            if server_time:
+                result['skew_ms'] = (sent + received) / 2 - server_time
+                if abs(result['skew_ms']) > max_skew_ms:
+                    result['status'] = 'skew'
+                    result['error'] = f"本地时钟偏差 {result['skew_ms']:+.0f}ms 超过 {max_skew_ms}ms"
+    except Exception as e:
+        result['status'] = 'timeout' if isinstance(e, (socket.timeout, ccxt.RequestTimeout)) else 'error'
+        result['error'] = f"{type(e).__name__}: {str(e)}"[:200]
+    return result
+
+
+def test_all_accounts(config, timeout=DEFAULT_PROBE_TIMEOUT, max_skew_ms=DEFAULT_MAX_SKEW_MS):
+    """
+    并发测试配置中的全部账户，每个账户有独立的超时，一个账户卡住不影响其他账户的结果。
+    函数在超时后一定返回: 测量在守护线程中进行，卡住的线程不会在退出时被等待。
+
+    返回:
+        list: 每个账户的 probe_account 结果，超时的账户状态为 timeout，保留已完成的测量。
+    """
+    accounts = [(exchange_id, key_id, key_data)
+                for exchange_id, keys in config.get('exchanges', {}).items()
+                for key_id, key_data in keys.items()]
+    if not accounts:
+        return []
+
+    # 全部账户同时开始，超时即为每个账户完成全部测量的截止时间
+    deadline = time.monotonic() + timeout
+    probes = []
+    for exchange_id, key_id, key_data in accounts:
+        result = _probe_result(exchange_id, key_id)
+        thread = threading.Thread(target=probe_account, args=(exchange_id, key_id, key_data, config, timeout,
+                                                              max_skew_ms, result),
+                                  name=f"probe-{exchange_id}-{key_id}", daemon=True)
+        thread.start()
+        probes.append((thread, result))
+
+    results = []
+    for thread, result in probes:
+        thread.join(max(0.0, deadline - time.monotonic()))
+        if thread.is_alive():
+            result = dict(result, status='timeout', error=f"超过 {timeout:.0f}s 未完成")
+        results.append(result)
+    for result in results:
+        log.info(f"账户检查 {result['exchange']}/{result['account']}: {result['status']} "
+                 f"dns={result['dns_ms']} connect={result['connect_ms']} request={result['request_ms']} "
+                 f"skew={result['skew_ms']} {result['error']}")
+    return results
+
+
+def format_probe_report(results, sort='request'):
+    """按指定字段排序，生成延迟报告。没有数据的账户排在最后"""
+    key = SORT_KEYS[sort]
+    rows = sorted(results, key=lambda r: (key(r) is None, key(r) if key(r) is not None else 0))
+    labels = {'ok': '正常', 'skew': '时钟偏差', 'error': '失败', 'timeout': '超时'}
+
+    def ms(value):
+        return f"{value:.0f}" if value is not None else '-'
+
+    lines = [f"{'交易所':<12}{'账户':<16}{'状态':<8}{'DNS(ms)':>9}{'连接(ms)':>9}{'请求(ms)':>9}{'时钟偏差(ms)':>12}  错误"]
+    for r in rows:
+        status = labels.get(r['status'], r['status']) + ('*' if r['via_proxy'] else '')
+        lines.append(f"{r['exchange']:<12}{r['account']:<16}{status:<8}{ms(r['dns_ms']):>9}"
+                     f"{ms(r['connect_ms']):>9}{ms(r['request_ms']):>9}{ms(r['skew_ms']):>12}  {r['error']}")
+    if any(r['via_proxy'] for r in rows):
+        lines.append("* DNS和连接耗时为到代理服务器的测量值")
+    ok = sum(1 for r in rows if r['status'] == 'ok')
+    lines.append(f"共 {len(rows)} 个账户, 正常 {ok}, 异常 {len(rows) - ok}")
+    return '\n'.join(lines)
+
+
+def test_all_connections():
+    """菜单项: 并发测试全部账户并显示延迟报告"""
+    clear_screen()
+    print_header()
+
+    print("测试全部账户连接")
+    print("-" * 30)
+
+    config = load_config()
+    if not config or not config.get('exchanges'):
+        print("尚未配置任何交易所API密钥")
+        input("\n按键继续...")
+        return
+
+    sort = input(f"排序字段 ({'/'.join(SORT_KEYS)}, 默认 request): ").strip() or 'request'
+    if sort not in SORT_KEYS:
+        sort = 'request'
+    print("\n正在并发测试全部账户...")
+    print(format_probe_report(test_all_accounts(config), sort))
+    input("\n按键继续...")
+
+
+def run_health_check(timeout=DEFAULT_PROBE_TIMEOUT, sort='request', max_skew_ms=DEFAULT_MAX_SKEW_MS):
+    """
+    非交互的账户检查，可作为开盘前检查脚本使用。
+
+    返回:
+        int: 0 全部正常，1 有账户异常，2 配置错误或没有配置账户。
+    """
+    config = load_config()
+    if not config or not config.get('exchanges'):
+        print("错误: 无法加载配置文件或没有配置任何账户!", file=sys.stderr)
+        return 2
+    results = test_all_accounts(config, timeout=timeout, max_skew_ms=max_skew_ms)
+    print(format_probe_report(results, sort))
+    return 0 if all(r['status'] == 'ok' for r in results) else 1
+
+
 def main_menu():
     """
     API密钥管理工具的主菜单，负责显示菜单选项并根据用户选择调用相应的功能。
@@ -263,9 +493,10 @@ def main_menu():
         print("1. 添加新的API密钥")
         print("2. 删除现有API密钥")
         print("3. 测试API连接")
-        print("4. 退出")
+        print("4. 测试全部账户连接")
+        print("5. 退出")
 
-        choice = input("\n请选择操作 (1-4): ").strip()
+        choice = input("\n请选择操作 (1-5): ").strip()
 
         if choice == '1':
             log.info("用户选择：添加新的API密钥")
@@ -289,6 +520,13 @@ def main_menu():
                 log.error(f"测试API连接时发生错误: {e}")
                 print("\n测试API连接时发生错误，请重试!")
         elif choice == '4':
+            log.info("用户选择：测试全部账户连接")
+            try:
+                test_all_connections()
+            except Exception as e:
+                log.error(f"测试全部账户连接时发生错误: {e}")
+                print("\n测试全部账户连接时发生错误，请重试!")
+        elif choice == '5':
             log.info("用户选择退出API密钥管理工具")
             print("\n感谢使用! 再见!")
             break
@@ -298,5 +536,20 @@ def main_menu():
             continue  # 直接返回菜单，无需等待用户按键
 
 
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="交易所API密钥管理工具")
+    parser.add_argument('--test-all', action='store_true',
+                        help="不进入菜单，并发测试全部账户并输出延迟报告，退出码 0 正常/1 有异常/2 配置错误")
+    parser.add_argument('--timeout', type=float, default=DEFAULT_PROBE_TIMEOUT, help="每个账户的超时秒数")
+    parser.add_argument('--sort', choices=list(SORT_KEYS), default='request', help="报告排序字段")
+    parser.add_argument('--max-skew', type=float, default=DEFAULT_MAX_SKEW_MS,
+                        help="允许的最大时钟偏差(毫秒)，超过视为异常")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.test_all:
+        sys.exit(run_health_check(args.timeout, args.sort, args.max_skew))
     main_menu()
@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from event_bus import TICKER, BALANCE, ORDER, FILL
+import logger
+
+# 获取日志记录器
+log = logger.get_logger('data_poller')
+
+# 各类数据的默认轮询间隔(秒)，可通过配置 events.intervals 覆盖
+DEFAULT_INTERVALS = {TICKER: 5.0, BALANCE: 10.0, ORDER: 10.0, FILL: 30.0}
+# 记住的成交ID数量，用于去重
+SEEN_FILLS = 10000
+# 离开挂单列表、查询不到最终状态的订单发布的状态: 可能已成交、已撤销或过期
+ORDER_GONE = 'gone'
+# 每次轮询最多为离开挂单列表的订单查询几次最终状态，其余直接发布 ORDER_GONE
+MAX_FINAL_LOOKUPS = 10
+
+# 自适应轮询参数，可通过配置 events.adaptive 覆盖
+DEFAULT_ADAPTIVE_CONFIG = {
+    'enabled': True,
+    # 行情在动或有订单在执行时，轮询间隔乘以 fast；空闲时乘以 slow
+    'fast': 0.4,
+    'slow': 3.0,
+    # 加快后的间隔下限(秒)，避免触发交易所限频
+    'min_interval': 1.0,
+    # 最新价相对上一次的变动超过该比例视为行情在动
+    'move_threshold': 0.001,
+    # 行情变动或订单结束后保持快速轮询的秒数
+    'hot_period': 30.0,
+    # 超过该秒数行情不动且没有订单时转为空闲
+    'idle_after': 120.0,
+}
+
+FAST = 'fast'
+NORMAL = 'normal'
+IDLE = 'idle'
+CADENCE_LABELS = {FAST: '快速', NORMAL: '正常', IDLE: '空闲'}
+
+
+class DataPoller:
+    """
+    当前账户和交易对的数据生产者。
+    后台线程按间隔轮询行情、余额、挂单和成交，每份数据只获取一次并发布到事件总线；
+    挂单与上一次结果比较后发布订单更新，成交去重后逐条发布。
+    界面需要立即得到最新数据时调用 refresh，同样会发布给其他订阅者。
+    轮询间隔随状态调整: 行情在动或有订单在执行时加快，长时间没有变化时放慢，与界面按键无关。
+    """
+
+    def __init__(self, bus, callers, intervals=None, adaptive=None):
+        self.bus = bus
+        self.callers = callers
+        self.intervals = dict(DEFAULT_INTERVALS, **(intervals or {}))
+        self.adaptive = dict(DEFAULT_ADAPTIVE_CONFIG, **(adaptive or {}))
+        # 最近一次行情变动和有订单执行的时间，用于判断轮询节奏
+        self.last_price = None
+        self.last_move = time.monotonic()
+        self.last_active = self.last_move
+        self.activity = None
+        self.cadence_mode = NORMAL
+        self.target = None
+        self.next_due = {}
+        self.open_orders = {}
+        self.fill_since = None
+        self.seen_fills = set()
+        self.seen_order = deque()
+        self.lock = threading.Lock()
+        self.kind_locks = {kind: threading.Lock() for kind in DEFAULT_INTERVALS}
+        # 当前交易对以外也需要行情的交易对，例如等待触发的条件单
+        self.watch = None
+        self.watch_due = 0
+        # 其他进程发布的行情(共享行情段)，命中时不请求交易所
+        self.ticker_source = None
+        self.source_interval = None
+        self.wake = threading.Event()
+        self.stopped = False
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='data-poller', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped = True
+        self.wake.set()
+
+    def set_target(self, exchange_id, key_id, symbol):
+        """切换轮询的账户和交易对，切换后立即轮询全部数据"""
+        with self.lock:
+            target = (exchange_id, key_id, symbol)
+            if target == self.target:
+                return
+            log.info(f"数据轮询目标切换为 {exchange_id}/{key_id} {symbol}")
+            account_changed = self.target is None or self.target[:2] != target[:2]
+            self.target = target
+            self.open_orders = {}
+            self.fill_since = None
+            if account_changed:
+                self.seen_fills.clear()
+                self.seen_order.clear()
+            self.next_due = {kind: 0 for kind in self.intervals}
+            # 新的交易对先按快速节奏轮询，确认行情不动后再放慢
+            self.last_price = None
+            self.last_move = time.monotonic()
+        self.wake.set()
+
+    def set_watch(self, source):
+        """
+        设置额外获取行情的交易对来源。source() 返回 (exchange, account, symbol) 集合，
+        每个行情间隔调用一次，这些交易对的行情同样发布到事件总线。
+        """
+        with self.lock:
+            self.watch = source
+            self.watch_due = 0
+        self.wake.set()
+
+    def set_activity(self, source):
+        """
+        设置本地订单活动的来源。source() 返回 True 表示有算法单、组合单等在执行，
+        此时与有挂单一样按快速节奏轮询。
+        """
+        with self.lock:
+            self.activity = source
+        self.wake.set()
+
+    def cadence(self):
+        """
+        当前的轮询节奏: 有挂单或本地订单在执行、或最近行情变动过为 FAST，
+        行情和订单都空闲超过 idle_after 秒为 IDLE，其他为 NORMAL。
+        """
+        if not self.adaptive['enabled']:
+            return NORMAL
+        working = False
+        if self.activity is not None:
+            try:
+                working = bool(self.activity())
+            except Exception as e:
+                log.warning(f"读取订单活动状态失败: {str(e)}")
+        now = time.monotonic()
+        with self.lock:
+            if working or self.open_orders:
+                self.last_active = now
+            quiet = now - max(self.last_move, self.last_active)
+            if quiet < self.adaptive['hot_period']:
+                mode = FAST
+            elif quiet >= self.adaptive['idle_after']:
+                mode = IDLE
+            else:
+                mode = NORMAL
+            changed, self.cadence_mode = mode != self.cadence_mode, mode
+            if changed and mode == FAST:
+                # 转为快速时把已经排得较远的轮询提前
+                for kind, when in self.next_due.items():
+                    self.next_due[kind] = min(when, now + self.interval(kind, FAST))
+        if changed:
+            log.info(f"数据轮询节奏切换为 {CADENCE_LABELS[mode]}")
+        return mode
+
+    def interval(self, kind, mode=None):
+        """按当前节奏调整后的轮询间隔，加快时不低于 min_interval，也不会比配置的间隔更慢"""
+        base = self.intervals[kind]
+        mode = mode or self.cadence()
+        if mode == FAST:
+            return min(base, max(self.adaptive['min_interval'], base * self.adaptive['fast']))
+        if mode == IDLE:
+            return base * self.adaptive['slow']
+        return base
+
+    def _track_move(self, ticker):
+        """最新价变动超过阈值时记录时间"""
+        price = ticker.get('last') if isinstance(ticker, dict) else None
+        if not price:
+            return
+        with self.lock:
+            previous, self.last_price = self.last_price, price
+            if previous and abs(price / previous - 1) >= self.adaptive['move_threshold']:
+                self.last_move = time.monotonic()
+
+    def set_ticker_source(self, source, interval):
+        """
+        设置行情的本地来源。source(exchange, account, symbol) 返回行情或 None，
+        返回行情时不请求交易所，并按 interval 再次读取；返回 None 时照常请求交易所。
+        """
+        with self.lock:
+            self.ticker_source = source
+            self.source_interval = interval
+            self.next_due[TICKER] = 0
+        self.wake.set()
+
+    def _fetch_ticker(self, exchange_id, key_id, symbol):
+        """获取行情，优先使用本地来源，返回 (行情, 是否来自本地来源)"""
+        if self.ticker_source is not None:
+            try:
+                ticker = self.ticker_source(exchange_id, key_id, symbol)
+            except Exception as e:
+                log.warning(f"读取 {exchange_id} {symbol} 的共享行情失败: {str(e)}")
+                ticker = None
+            if ticker is not None:
+                return ticker, True
+        return self.callers.get(exchange_id, key_id).call('fetch_ticker', symbol), False
+
+    def _poll_watched(self):
+        """获取额外交易对的行情并发布，当前交易对已由常规轮询获取"""
+        try:
+            keys = self.watch()
+        except Exception as e:
+            log.warning(f"获取额外行情交易对失败: {str(e)}")
+            keys = ()
+        for exchange_id, key_id, symbol in sorted(keys):
+            if self.stopped:
+                break
+            if (exchange_id, key_id, symbol) == self.target:
+                continue
+            try:
+                ticker, _ = self._fetch_ticker(exchange_id, key_id, symbol)
+                self.bus.publish(TICKER, exchange_id, key_id, symbol, ticker)
+            except Exception as e:
+                log.warning(f"获取 {exchange_id}/{key_id} {symbol} 行情失败: {type(e).__name__}: {str(e)}")
+        with self.lock:
+            self.watch_due = time.monotonic() + self.intervals[TICKER]
+
+    def request(self, *kinds):
+        """让后台线程尽快轮询指定类型的数据，例如下单后刷新余额和挂单"""
+        with self.lock:
+            for kind in kinds:
+                self.next_due[kind] = 0
+        self.wake.set()
+
+    def refresh(self, kind):
+        """
+        立即获取一种数据并发布，返回获取到的数据。
+
+        返回:
+            TICKER 返回行情，BALANCE 返回余额，ORDER 返回当前挂单列表，FILL 返回新成交列表。
+        """
+        with self.lock:
+            target = self.target
+        if target is None:
+            raise RuntimeError("尚未选择交易账户和交易对")
+        exchange_id, key_id, symbol = target
+        caller = self.callers.get(exchange_id, key_id)
+
+        shared = False
+        with self.kind_locks[kind]:
+            if kind == TICKER:
+                ticker, shared = self._fetch_ticker(exchange_id, key_id, symbol)
+                self.bus.publish(TICKER, exchange_id, key_id, symbol, ticker)
+                self._track_move(ticker)
+                result = ticker
+            elif kind == BALANCE:
+                balance = caller.call('fetch_balance')
+                self.bus.publish(BALANCE, exchange_id, key_id, None, balance)
+                result = balance
+            elif kind == ORDER:
+                orders = caller.call('fetch_open_orders', symbol)
+                self._diff_orders(target, orders, caller)
+                result = orders
+            elif kind == FILL:
+                since = self.fill_since or int((datetime.now() - timedelta(days=1)).timestamp() * 1000)
+                trades = caller.call('fetch_my_trades', symbol=symbol, since=since)
+                result = self._new_fills(target, trades)
+            else:
+                raise ValueError(f"未知的数据类型: {kind}")
+
+        # 共享行情只读本地内存，按其自身间隔读取，不受节奏影响
+        interval = self.source_interval if shared else self.interval(kind)
+        with self.lock:
+            if target == self.target:
+                self.next_due[kind] = time.monotonic() + interval
+        return result
+
+    def open_order_list(self):
+        """最近一次轮询和本地操作合并后的挂单列表"""
+        with self.lock:
+            return list(self.open_orders.values())
+
+    def publish_order(self, order):
+        """
+        发布本地下单或撤单产生的订单更新，同时更新挂单状态，
+        避免下一次轮询把本地已撤销的订单误报为已成交。
+        """
+        with self.lock:
+            if self.target is None:
+                return
+            exchange_id, key_id, symbol = self.target
+            if order.get('status') in ('open', None):
+                self.open_orders[order['id']] = order
+            else:
+                self.open_orders.pop(order['id'], None)
+        self.bus.publish(ORDER, exchange_id, key_id, order.get('symbol', symbol), order)
+
+    def _diff_orders(self, target, orders, caller=None):
+        """
+        与上一次挂单比较，发布新增、部分成交和已不在挂单中的订单。
+        不在挂单中的订单用 fetch_order 查询最终状态(成交、撤销、过期)，查询失败时发布 ORDER_GONE。
+        """
+        exchange_id, key_id, symbol = target
+        current = {order['id']: order for order in orders}
+        with self.lock:
+            if target != self.target:
+                return
+            previous, self.open_orders = self.open_orders, current
+        for order_id, order in current.items():
+            old = previous.get(order_id)
+            if old is None or old.get('filled') != order.get('filled') or old.get('status') != order.get('status'):
+                self.bus.publish(ORDER, exchange_id, key_id, order.get('symbol', symbol), order)
+        gone = [order for order_id, order in previous.items() if order_id not in current]
+        for i, order in enumerate(gone):
+            final = None
+            if caller is not None and i < MAX_FINAL_LOOKUPS:
+                final = self._final_order(caller, order, symbol)
+            # 成交明细由成交事件给出
+            self.bus.publish(ORDER, exchange_id, key_id, order.get('symbol', symbol),
+                             final or dict(order, status=ORDER_GONE))
+
+    def _final_order(self, caller, order, symbol):
+        """查询离开挂单列表的订单的最终状态，查不到或仍显示为挂单时返回 None"""
+        try:
+            final = caller.call('fetch_order', order['id'], order.get('symbol', symbol))
+        except Exception as e:
+            log.debug(f"查询订单 {order['id']} 的最终状态失败: {type(e).__name__}: {str(e)}")
+            return None
+        if not isinstance(final, dict) or final.get('status') in ('open', None):
+            return None
+        return final
+
+    def _new_fills(self, target, trades):
+        """成交按ID去重后逐条发布，返回新成交"""
+        exchange_id, key_id, symbol = target
+        new = []
+        with self.lock:
+            if target != self.target:
+                return new
+            for trade in trades:
+                trade_id = str(trade['id'])
+                if trade_id in self.seen_fills:
+                    continue
+                self.seen_fills.add(trade_id)
+                self.seen_order.append(trade_id)
+                if len(self.seen_order) > SEEN_FILLS:
+                    self.seen_fills.discard(self.seen_order.popleft())
+                new.append(trade)
+            if trades:
+                # 同一毫秒可能有多笔成交，起点不加1，重复的由ID去重
+                self.fill_since = max(int(t['timestamp']) for t in trades)
+        for trade in new:
+            self.bus.publish(FILL, exchange_id, key_id, trade.get('symbol', symbol), trade)
+        return new
+
+    def _run(self):
+        log.info("数据轮询线程启动")
+        while not self.stopped:
+            if self.adaptive['enabled']:
+                self.cadence()
+            with self.lock:
+                target = self.target
+                now = time.monotonic()
+                due = [kind for kind, when in self.next_due.items() if when <= now]
+                deadlines = list(self.next_due.values()) + ([self.watch_due] if self.watch else [])
+                wait = min(deadlines) - now if deadlines else None
+                watch_due = self.watch is not None and self.watch_due <= now
+            if watch_due:
+                self._poll_watched()
+                continue
+            if target is None or not due:
+                # 自适应时至少每 min_interval 秒检查一次节奏，订单开始执行后能及时加快
+                if self.adaptive['enabled'] and target is not None:
+                    wait = min(wait, self.adaptive['min_interval']) if wait is not None else self.adaptive['min_interval']
+                self.wake.wait(timeout=None if wait is None else max(0.05, wait))
+                self.wake.clear()
+                continue
+            for kind in due:
+                if self.stopped:
+                    break
+                try:
+                    self.refresh(kind)
+                except Exception as e:
+                    log.warning(f"轮询 {kind} 失败: {type(e).__name__}: {str(e)}")
+                    # 失败后按配置的间隔重试，不因行情在动而加快
+                    with self.lock:
+                        if target == self.target:
+                            self.next_due[kind] = time.monotonic() + self.intervals[kind]
+        log.info("数据轮询线程已停止")
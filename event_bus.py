@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import itertools
+import threading
+from collections import OrderedDict, deque
+import logger
+
+# 获取日志记录器
+log = logger.get_logger('event_bus')
+
+# 事件类型
+TICKER = 'ticker'
+BALANCE = 'balance'
+ORDER = 'order'
+FILL = 'fill'
+EVENT_KINDS = (TICKER, BALANCE, ORDER, FILL)
+
+# 只关心最新值的事件类型: 同一账户和交易对的新事件覆盖队列中尚未消费的旧事件
+CONFLATED_KINDS = {TICKER, BALANCE}
+
+# 每个订阅者非合并事件的默认队列长度
+DEFAULT_MAXSIZE = 10000
+
+
+class Event:
+    """一条总线事件"""
+
+    __slots__ = ('seq', 'kind', 'exchange', 'account', 'symbol', 'data', 'timestamp')
+
+    def __init__(self, seq, kind, exchange, account, symbol, data, timestamp=None):
+        self.seq = seq
+        self.kind = kind
+        self.exchange = exchange
+        self.account = account
+        self.symbol = symbol
+        self.data = data
+        self.timestamp = time.time() if timestamp is None else timestamp
+
+    @property
+    def key(self):
+        """合并和缓存最新值使用的键"""
+        return self.kind, self.exchange, self.account, self.symbol
+
+    def age(self):
+        return time.time() - self.timestamp
+
+    def __repr__(self):
+        return f"Event({self.seq}, {self.kind}, {self.exchange}/{self.account}, {self.symbol})"
+
+
+class Subscription:
+    """
+    单个订阅者的有界队列。
+    行情和余额按键合并，只保留最新一条，消费慢的订阅者也不会积压过期行情；
+    订单更新和成交按顺序排队，超过 maxsize 时丢弃最旧的事件并计数。
+    """
+
+    def __init__(self, bus, name, kinds, maxsize=DEFAULT_MAXSIZE):
+        self.bus = bus
+        self.name = name
+        self.kinds = set(kinds)
+        self.conflated = OrderedDict()
+        self.queue = deque()
+        self.maxsize = maxsize
+        self.condition = threading.Condition()
+        self.delivered = 0
+        self.conflated_count = 0
+        self.dropped = 0
+
+    def put(self, event):
+        with self.condition:
+            if event.kind in CONFLATED_KINDS:
+                if event.key in self.conflated:
+                    self.conflated_count += 1
+                    del self.conflated[event.key]
+                self.conflated[event.key] = event
+            else:
+                if len(self.queue) >= self.maxsize:
+                    self.queue.popleft()
+                    self.dropped += 1
+                    if self.dropped == 1 or self.dropped % 1000 == 0:
+                        log.warning(f"订阅者 {self.name} 消费过慢，已丢弃 {self.dropped} 条事件")
+                self.queue.append(event)
+            self.condition.notify()
+
+    def poll(self, max_items=None):
+        """
+        不阻塞地取出待处理事件，按发布顺序返回。
+
+        参数:
+            max_items (int, optional): 最多取出的条数，默认全部。
+        """
+        with self.condition:
+            events = list(self.conflated.values()) + list(self.queue)
+            self.conflated.clear()
+            self.queue.clear()
+        events.sort(key=lambda e: e.seq)
+        if max_items is not None and len(events) > max_items:
+            # 剩余的事件放回队列，保持顺序
+            with self.condition:
+                for event in reversed(events[max_items:]):
+                    if event.kind in CONFLATED_KINDS:
+                        self.conflated.setdefault(event.key, event)
+                    else:
+                        self.queue.appendleft(event)
+            events = events[:max_items]
+        self.delivered += len(events)
+        return events
+
+    def get(self, timeout=None):
+        """阻塞等待事件，超时返回空列表"""
+        with self.condition:
+            if not self.conflated and not self.queue:
+                self.condition.wait(timeout)
+        return self.poll()
+
+    def pending(self):
+        with self.condition:
+            return len(self.conflated) + len(self.queue)
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+    def stats(self):
+        return {'name': self.name, 'pending': self.pending(), 'delivered': self.delivered,
+                'conflated': self.conflated_count, 'dropped': self.dropped}
+
+
+class EventBus:
+    """
+    进程内的发布/订阅事件总线。
+    数据来源只获取和发布一次，界面、记录和分析模块各自订阅需要的事件类型，
+    同时保留每个键最新一条事件，供新打开的界面直接读取当前状态。
+    """
+
+    def __init__(self):
+        self.subscriptions = []
+        self.last = {}
+        self.seq = itertools.count(1)
+        self.lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, name, kinds=EVENT_KINDS, maxsize=DEFAULT_MAXSIZE):
+        """
+        订阅事件。
+
+        参数:
+            name (str): 订阅者名称，用于统计和日志。
+            kinds (iterable): 订阅的事件类型。
+            maxsize (int): 非合并事件的队列长度。
+
+        返回:
+            Subscription: 订阅者队列。
+        """
+        subscription = Subscription(self, name, kinds, maxsize)
+        with self.lock:
+            self.subscriptions.append(subscription)
+        log.info(f"订阅者 {name} 订阅事件: {sorted(subscription.kinds)}")
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+
+    def publish(self, kind, exchange, account, symbol, data, timestamp=None):
+        """
+        发布一条事件，投递给所有订阅了该类型的订阅者，立即返回。
+        timestamp 用于发布从缓存恢复的旧数据，使 age() 反映数据的实际时间。
+        """
+        with self.lock:
+            event = Event(next(self.seq), kind, exchange, account, symbol, data, timestamp)
+            self.last[event.key] = event
+            self.published += 1
+            subscriptions = [s for s in self.subscriptions if kind in s.kinds]
+        for subscription in subscriptions:
+            subscription.put(event)
+        return event
+
+    def latest(self, kind, exchange, account, symbol=None):
+        """返回某个键最新的一条事件，没有时返回 None"""
+        with self.lock:
+            return self.last.get((kind, exchange, account, symbol))
+
+    def stats(self):
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        return {'published': self.published, 'subscriptions': [s.stats() for s in subscriptions]}
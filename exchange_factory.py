@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import threading
+from importlib import metadata
+from lazy_import import lazy_import
+from exchange_worker import guard_rate_limit
+import logger
+
+# ccxt 导入时会加载全部交易所类，耗时较长，延迟到真正创建交易所实例时再导入
+ccxt = lazy_import('ccxt')
+
+# 获取日志记录器
+log = logger.get_logger('exchange_factory')
+
+# 交易所ID列表缓存文件，按ccxt版本失效
+EXCHANGE_IDS_CACHE = os.path.join('data', 'exchange_ids.json')
+
+
+def _ccxt_version():
+    """读取已安装的ccxt版本，不导入ccxt"""
+    try:
+        return metadata.version('ccxt')
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def exchange_ids(cache_file=EXCHANGE_IDS_CACHE):
+    """
+    返回ccxt支持的交易所ID列表。
+    列表缓存在本地文件中，ccxt版本不变时直接读取缓存，不需要导入ccxt。
+
+    返回:
+        list: 交易所ID列表。
+    """
+    version = _ccxt_version()
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if version is not None and cached.get('ccxt_version') == version:
+            return cached['exchanges']
+    except (OSError, ValueError, KeyError, AttributeError):
+        pass
+
+    ids = list(ccxt.exchanges)
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp_file = f"{cache_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({'ccxt_version': version or ccxt.__version__, 'exchanges': ids}, f)
+        os.replace(tmp_file, cache_file)
+        log.info(f"已缓存 {len(ids)} 个交易所ID到 {cache_file}")
+    except OSError as e:
+        log.warning(f"写入交易所ID缓存失败: {str(e)}")
+    return ids
+
+
+def create_exchange(exchange_id, key_data, config):
+    """
+    根据配置创建单个交易所实例，并设置测试网模式和代理。
+
+    参数:
+        exchange_id (str): 交易所ID，例如 binance。
+        key_data (dict): 账户密钥信息，包含 apiKey、secret，可选 password。
+        config (dict): 完整配置，用于读取 sandbox_mode 和 proxies。
+
+    返回:
+        ccxt.Exchange: 初始化好的交易所实例。
+    """
+    exchange_class = getattr(ccxt, exchange_id)
+    exchange = exchange_class({
+        'apiKey': key_data['apiKey'],
+        'secret': key_data['secret'],
+        'password': key_data.get('password', ''),
+        'enableRateLimit': True,
+    })
+
+    # 从配置中读取测试网模式和代理
+    exchange.set_sandbox_mode(config.get('sandbox_mode', False))
+    exchange.proxies = config.get('proxies', {})
+    return exchange
+
+
+class DeferredExchange:
+    """
+    延迟创建的交易所实例代理。
+    第一次访问属性时才导入 ccxt 并创建实例，通常发生在账户的工作线程里，
+    恢复工作区时界面可以先用缓存数据显示出来。创建失败的异常在每次访问时重新抛出。
+    """
+
+    def __init__(self, exchange_id, key_id, key_data, config):
+        self.__dict__.update(id=exchange_id, _key_id=key_id, _key_data=key_data, _config=config,
+                             _exchange=None, _error=None, _lock=threading.Lock())
+
+    def _load(self):
+        exchange = self.__dict__['_exchange']
+        if exchange is not None:
+            return exchange
+        with self._lock:
+            if self._exchange is None:
+                if self._error is not None:
+                    raise self._error
+                try:
+                    exchange = create_exchange(self.id, self._key_data, self._config)
+                except Exception as e:
+                    log.error(f"初始化{self.id}交易所账户 {self._key_id} 失败: {str(e)}", exc_info=True)
+                    self.__dict__['_error'] = e
+                    raise
+                # 代理背后的实例同样由多个工作线程共用
+                self.__dict__['_exchange'] = guard_rate_limit(exchange)
+                log.info(f"成功初始化交易所 {self.id} 账户 {self._key_id}")
+            return self._exchange
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __str__(self):
+        exchange = self.__dict__['_exchange']
+        return str(exchange) if exchange is not None else self.id
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_exchange'] is not None else 'deferred'
+        return f"<DeferredExchange {self.id} ({state})>"
+
+
+def create_exchanges(config, deferred=False):
+    """
+    遍历配置中的所有交易所和账户，创建交易所实例。
+    单个账户初始化失败只记录日志，不影响其他账户。
+
+    参数:
+        config (dict): 完整配置。
+        deferred (bool): 为 True 时返回 DeferredExchange 代理，第一次使用时才创建实例。
+
+    返回:
+        dict: {exchange_id: {key_id: exchange}} 形式的交易所实例字典。
+    """
+    exchanges = {}
+    for exchange_id, keys in config['exchanges'].items():
+        for key_id, key_data in keys.items():
+            if deferred:
+                exchanges.setdefault(exchange_id, {})[key_id] = DeferredExchange(exchange_id, key_id, key_data, config)
+                continue
+            try:
+                log.debug(f"正在初始化交易所 {exchange_id} 账户 {key_id}")
+                exchange = create_exchange(exchange_id, key_data, config)
+                if exchange_id not in exchanges:
+                    exchanges[exchange_id] = {}
+                exchanges[exchange_id][key_id] = exchange
+                log.info(f"成功初始化交易所 {exchange_id} 账户 {key_id}")
+            except ccxt.NetworkError as e:
+                log.error(f"网络错误导致初始化{exchange_id}交易所失败: {str(e)}", exc_info=True)
+            except ccxt.AuthenticationError as e:
+                log.error(f"API密钥错误导致初始化{exchange_id}交易所失败: {str(e)}", exc_info=True)
+            except Exception as e:
+                log.error(f"初始化{exchange_id}交易所失败: {str(e)}", exc_info=True)
+    return exchanges
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import queue
+import itertools
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from lazy_import import lazy_import, lazy_attributes
+import logger
+
+# 获取日志记录器
+log = logger.get_logger('exchange_worker')
+
+ccxt = lazy_import('ccxt')
+
+# 每个账户的默认工作线程数
+DEFAULT_THREADS = 2
+# 默认的请求截止时间(秒)
+DEFAULT_TIMEOUT = 10.0
+# 延迟统计的指数平滑系数
+EWMA_ALPHA = 0.2
+
+
+def _deadline_exceeded_class():
+    class DeadlineExceeded(ccxt.RequestTimeout):
+        """请求在截止时间内没有完成"""
+
+    DeadlineExceeded.__module__ = __name__
+    return DeadlineExceeded
+
+
+# DeadlineExceeded 继承 ccxt 的异常，第一次使用时才创建，导入本模块不会导入 ccxt
+__getattr__ = lazy_attributes(__name__, {'DeadlineExceeded': _deadline_exceeded_class})
+_this = sys.modules[__name__]
+
+
+def guard_rate_limit(exchange):
+    """
+    让多个线程可以安全地共用一个ccxt实例。
+    ccxt 同步版的限频只是比较上次请求时间后 sleep，并发调用会同时通过检查；
+    nonce 默认取当前时间，同一时刻签名的请求会拿到相同的 nonce。
+    这里在实例上加锁: 限频时原子地预留下一个请求时间，nonce 严格递增。
+    网络请求本身仍然并发执行。模拟、回放和远程实例自带锁，不需要处理。
+    """
+    if not isinstance(exchange, ccxt.Exchange) or getattr(exchange, '_worker_lock', None):
+        return exchange
+    lock = threading.Lock()
+    nonce = exchange.nonce
+    state = {'nonce': None}
+
+    def throttle(cost=None):
+        with lock:
+            now = float(exchange.milliseconds())
+            cost = 1 if cost is None else cost
+            due = max(now, exchange.lastRestRequestTimestamp + exchange.rateLimit * cost)
+            # 预留本次请求的时间，后来的线程按这个时间排队，等待在锁外进行
+            exchange.lastRestRequestTimestamp = due
+        if now < due:
+            time.sleep((due - now) / 1000.0)
+
+    def set_last_rest_request_timestamp():
+        with lock:
+            # 不回退其他线程已经预留的时间
+            exchange.lastRestRequestTimestamp = max(exchange.lastRestRequestTimestamp, exchange.milliseconds())
+
+    def next_nonce():
+        with lock:
+            value = nonce()
+            if state['nonce'] is not None and value <= state['nonce']:
+                value = state['nonce'] + 1
+            state['nonce'] = value
+            return value
+
+    exchange.throttle = throttle
+    exchange.set_last_rest_request_timestamp = set_last_rest_request_timestamp
+    exchange.nonce = next_nonce
+    exchange._worker_lock = lock
+    return exchange
+
+
+class WorkerRequest:
+    """投递给工作线程的一条请求消息"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, method, args, kwargs, deadline):
+        self.id = next(self._ids)
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.deadline = deadline
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.future = Future()
+
+
+class ExchangeWorker:
+    """
+    单个交易所账户的工作线程组。
+    界面线程把请求放入队列，由工作线程执行ccxt调用，通过Future返回结果，
+    因此一个交易所卡住不会阻塞界面和其他交易所。
+    多个线程共用同一个实例，限频和 nonce 由 guard_rate_limit 串行化；
+    要求请求按 nonce 顺序到达的交易所应配置为单线程。
+    """
+
+    def __init__(self, exchange_id, key_id, exchange, threads=DEFAULT_THREADS, timeout=DEFAULT_TIMEOUT):
+        self.exchange_id = exchange_id
+        self.key_id = key_id
+        self.exchange = guard_rate_limit(exchange)
+        self.timeout = timeout
+        self.requests = queue.Queue()
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.stopped = False
+        self.queue_latency = 0.0
+        self.call_latency = 0.0
+        self.completed = 0
+        self.failed = 0
+        self.expired = 0
+        self.last_ok = None
+        self.last_error = None
+        self.threads = []
+        for i in range(max(1, threads)):
+            thread = threading.Thread(target=self._loop, name=f"worker-{exchange_id}-{key_id}-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, method, *args, timeout=None, **kwargs):
+        """
+        提交一个异步请求。
+
+        参数:
+            method (str): 交易所实例的方法名，例如 fetch_ticker。
+            timeout (float, optional): 截止时间(秒)，默认使用工作线程的配置。
+
+        返回:
+            Future: 请求结果。在开始执行前调用 cancel() 可以取消请求。
+        """
+        timeout = self.timeout if timeout is None else timeout
+        request = WorkerRequest(method, args, kwargs, time.monotonic() + timeout)
+        if self.stopped:
+            request.future.set_exception(ccxt.ExchangeNotAvailable(f"{self.exchange_id} 工作线程已停止"))
+            return request.future
+        self.requests.put(request)
+        return request.future
+
+    def call(self, method, *args, timeout=None, **kwargs):
+        """
+        同步调用，最多等待到截止时间。超时后取消尚未开始的请求并抛出 DeadlineExceeded。
+        """
+        timeout = self.timeout if timeout is None else timeout
+        future = self.submit(method, *args, timeout=timeout, **kwargs)
+        return wait_result(future, timeout, f"{self.exchange_id}.{method}")
+
+    def _loop(self):
+        # 工作线程只服务一个账户，结构化日志都带上账户
+        logger.bind(exchange=self.exchange_id, account=self.key_id)
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            if not request.future.set_running_or_notify_cancel():
+                continue
+
+            now = time.monotonic()
+            self._update_latency('queue_latency', now - request.enqueued_at)
+            if now > request.deadline:
+                # 排队期间已经超过截止时间，调用方不再需要结果，直接丢弃
+                with self.lock:
+                    self.expired += 1
+                request.future.set_exception(_this.DeadlineExceeded(
+                    f"{self.exchange_id}.{request.method} 排队超过截止时间"))
+                continue
+
+            request.started_at = now
+            with self.lock:
+                self.inflight[request.id] = request
+            try:
+                result = getattr(self.exchange, request.method)(*request.args, **request.kwargs)
+                with self.lock:
+                    self.completed += 1
+                    self.last_ok = time.time()
+                request.future.set_result(result)
+            except Exception as e:
+                with self.lock:
+                    self.failed += 1
+                    self.last_error = str(e)
+                log.debug(f"{self.exchange_id} {self.key_id} 调用 {request.method} 失败: {str(e)}")
+                request.future.set_exception(e)
+            finally:
+                self._update_latency('call_latency', time.monotonic() - request.started_at)
+                with self.lock:
+                    self.inflight.pop(request.id, None)
+
+    def _update_latency(self, name, value):
+        with self.lock:
+            current = getattr(self, name)
+            setattr(self, name, value if current == 0 else current + EWMA_ALPHA * (value - current))
+
+    def health(self):
+        """
+        返回工作线程的健康状态。
+
+        返回:
+            dict: status 为 ok / busy / stalled / stopped，另含队列长度、排队与调用延迟(毫秒)等。
+        """
+        now = time.monotonic()
+        with self.lock:
+            oldest = min((r.started_at for r in self.inflight.values()), default=None)
+            status = 'ok'
+            if self.stopped:
+                status = 'stopped'
+            elif oldest is not None and now - oldest > self.timeout:
+                status = 'stalled'
+            elif len(self.inflight) >= len(self.threads) and self.requests.qsize():
+                status = 'busy'
+            return {
+                'exchange': self.exchange_id,
+                'account': self.key_id,
+                'status': status,
+                'queue_size': self.requests.qsize(),
+                'inflight': len(self.inflight),
+                'queue_latency_ms': self.queue_latency * 1000,
+                'call_latency_ms': self.call_latency * 1000,
+                'completed': self.completed,
+                'failed': self.failed,
+                'expired': self.expired,
+                'last_ok': self.last_ok,
+                'last_error': self.last_error,
+            }
+
+    def stop(self):
+        """停止工作线程，正在执行的调用不会被中断"""
+        self.stopped = True
+        for _ in self.threads:
+            self.requests.put(None)
+
+
+class WorkerPool:
+    """按交易所账户管理工作线程组"""
+
+    def __init__(self, exchanges, threads=DEFAULT_THREADS, timeout=DEFAULT_TIMEOUT):
+        self.workers = {}
+        for exchange_id, keys in exchanges.items():
+            for key_id, exchange in keys.items():
+                self.workers[(exchange_id, key_id)] = ExchangeWorker(
+                    exchange_id, key_id, exchange, threads=threads, timeout=timeout)
+
+    def get(self, exchange_id, key_id):
+        return self.workers[(exchange_id, key_id)]
+
+    def health(self):
+        return [worker.health() for worker in self.workers.values()]
+
+    def stop(self):
+        for worker in self.workers.values():
+            worker.stop()
+
+
+def wait_result(future, timeout, label):
+    """等待Future结果，超时则尝试取消并抛出 DeadlineExceeded"""
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        future.cancel()
+        raise _this.DeadlineExceeded(f"{label} 超过截止时间 {timeout:.1f}s")
+
+
+def format_health(health):
+    """把健康状态格式化为界面显示的一行文字"""
+    labels = {'ok': '正常', 'busy': '繁忙', 'stalled': '卡住', 'stopped': '已停止'}
+    return (f"通道 {health['exchange']}/{health['account']}: {labels.get(health['status'], health['status'])}"
+            f" | 队列 {health['queue_size']} | 执行中 {health['inflight']}"
+            f" | 排队 {health['queue_latency_ms']:.1f}ms | 调用 {health['call_latency_ms']:.0f}ms")
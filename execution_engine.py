@@ -0,0 +1,553 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import abc
+import sys
+import math
+import time
+import argparse
+import itertools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from lazy_import import lazy_import
+from batch_order import validate_order
+import logger
+
+# 获取日志记录器
+log = logger.get_logger('execution_engine')
+
+ccxt = lazy_import('ccxt')
+
+# 默认参数，可通过配置 execution 覆盖
+DEFAULT_EXECUTION_CONFIG = {
+    # 时间轮刻度(秒)
+    'tick': 0.1,
+    # 母单检查子单成交和响应撤销的最长间隔(秒)
+    'poll_interval': 2.0,
+    # TWAP 总时长(秒)和分片数
+    'twap_duration': 300.0,
+    'twap_slices': 10,
+    # 冰山单每次显示的数量占总量的比例
+    'iceberg_visible': 0.1,
+    # 追价单最多改价次数
+    'chase_max_reprices': 100,
+    # 每个账户执行母单步骤的线程数
+    'threads_per_account': 2,
+}
+
+STATUS_LABELS = {'running': '执行中', 'done': '已完成', 'canceled': '已撤销', 'failed': '失败'}
+
+
+class TimerWheel:
+    """
+    哈希时间轮。定时任务按到期刻度放入对应槽位，
+    调度是O(1)，每次推进只检查经过的槽位，大量母单同时运行时开销也很小。
+    """
+
+    def __init__(self, tick=0.1, slots=512):
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]
+        self.start = time.monotonic()
+        self.current = 0
+
+    def schedule(self, delay, item):
+        due = self.current + max(1, math.ceil(delay / self.tick))
+        self.slots[due % len(self.slots)].append((due, item))
+
+    def advance(self, now=None):
+        """推进到当前时间，返回到期的任务"""
+        target = int(((now or time.monotonic()) - self.start) / self.tick)
+        expired = []
+        while self.current < target:
+            self.current += 1
+            index = self.current % len(self.slots)
+            slot = self.slots[index]
+            if slot:
+                # 超过一圈的任务留在槽位中等待下一圈
+                self.slots[index] = [entry for entry in slot if entry[0] > self.current]
+                expired.extend(item for due, item in slot if due <= self.current)
+        return expired
+
+
+def size_child(exchange, market, amount, price, remaining):
+    """
+    计算子单数量: 按数量精度规整，不低于最小数量和最小金额；
+    剩余部分不够再下一单时并入本单。剩余量本身低于最小限额时返回0。
+    """
+    symbol = market['symbol']
+    step = market['precision']['amount']
+    limits = market.get('limits') or {}
+    minimum = max((limits.get('amount') or {}).get('min') or 0,
+                  ((limits.get('cost') or {}).get('min') or 0) / price)
+    minimum = math.ceil(minimum / step - 1e-9) * step
+    remaining = float(exchange.amount_to_precision(symbol, remaining))
+    if remaining <= 0 or remaining < minimum:
+        return 0.0
+    quantity = float(exchange.amount_to_precision(symbol, max(min(amount, remaining), minimum)))
+    if remaining - quantity < minimum:
+        quantity = remaining
+    return quantity
+
+
+class ParentOrder(abc.ABC):
+    """
+    母单。由执行引擎按时间轮周期性调用 step，step 在账户的执行线程中运行，
+    同一母单的步骤不会并发执行。子单成交通过 fetch_order 跟踪。
+    子类实现 run，完成一步算法并返回下一步的延迟秒数，结束时返回 None。
+    """
+
+    kind = None
+
+    def __init__(self, parent_id, exchange_id, key_id, symbol, side, amount, price, config):
+        self.id = parent_id
+        self.exchange_id = exchange_id
+        self.key_id = key_id
+        self.symbol = symbol
+        self.side = side
+        self.amount = float(amount)
+        self.price = float(price) if price else None
+        self.config = config
+        self.status = 'running'
+        self.message = ''
+        self.children = OrderedDict()
+        self.active = None
+        self.cancel_requested = False
+        # 同一母单的步骤和停止时的撤单互斥
+        self.lock = threading.Lock()
+        self.created = time.time()
+        self.updated = self.created
+
+    @property
+    def filled(self):
+        return sum(child['filled'] for child in self.children.values())
+
+    @property
+    def remaining(self):
+        # 去掉浮点累加误差，避免把 1e-16 级别的差额当作未成交
+        return max(0.0, round(self.amount - self.filled, 10))
+
+    @property
+    def average(self):
+        filled = self.filled
+        if not filled:
+            return None
+        return sum(child['filled'] * child['price'] for child in self.children.values()) / filled
+
+    def _sync_active(self, caller):
+        """查询活动子单的成交，子单结束后清除"""
+        if self.active is None:
+            return
+        child = self.children[self.active]
+        order = caller.call('fetch_order', child['id'], self.symbol)
+        child['filled'] = float(order.get('filled') or 0)
+        child['status'] = order.get('status') or child['status']
+        if child['status'] != 'open':
+            self.active = None
+
+    def _cancel_active(self, caller):
+        """撤销活动子单，然后读取最终成交数量"""
+        if self.active is None:
+            return
+        child = self.children[self.active]
+        try:
+            caller.call('cancel_order', child['id'], self.symbol)
+        except ccxt.OrderNotFound:
+            # 子单已经成交或被撤销
+            pass
+        self._sync_active(caller)
+        if self.active is not None:
+            # 撤单后仍是挂单状态时按已撤销处理，避免重复下单
+            child['status'] = 'canceled'
+            self.active = None
+
+    def _place(self, caller, exchange, quantity, price, params=None):
+        """校验并下一个子单"""
+        market = exchange.market(self.symbol)
+        order, error = validate_order({'side': self.side, 'price': price, 'amount': quantity}, exchange, market)
+        if error:
+            raise ccxt.InvalidOrder(f"子单校验失败: {error}")
+        args = (self.symbol, self.side, order['amount'], order['price'])
+        result = caller.call('create_limit_order', *args, params) if params else \
+            caller.call('create_limit_order', *args)
+        child = {'id': result['id'], 'price': order['price'], 'amount': order['amount'],
+                 'filled': float(result.get('filled') or 0), 'status': result.get('status') or 'open'}
+        self.children[child['id']] = child
+        self.active = child['id'] if child['status'] == 'open' else None
+        log.info(f"母单 {self.id} 下子单 {child['id']}: {self.side} {order['amount']} @ {order['price']}",
+                 extra={'order_id': child['id']})
+        return child
+
+    def _child_size(self, exchange, amount, price):
+        return size_child(exchange, exchange.market(self.symbol), amount, price, self.remaining)
+
+    def _finish(self, status, message=''):
+        self.status = status
+        self.message = message
+        log.info(f"母单 {self.id} {STATUS_LABELS[status]}: 成交 {self.filled}/{self.amount} {message}")
+
+    def step(self, caller, exchange, now):
+        """
+        执行一步。
+
+        返回:
+            float: 距离下一步的秒数；母单结束时返回 None。
+        """
+        self._sync_active(caller)
+        if self.cancel_requested:
+            self._cancel_active(caller)
+            self._finish('canceled')
+            return None
+        if self.remaining <= 0:
+            self._cancel_active(caller)
+            self._finish('done')
+            return None
+        return self.run(caller, exchange, now)
+
+    def _finish_residual(self):
+        """剩余数量低于最小下单量，无法继续拆单"""
+        self._finish('done', f"剩余 {self.remaining:g} 低于最小下单量")
+
+    @abc.abstractmethod
+    def run(self, caller, exchange, now):
+        """执行一步算法，返回下一步的延迟秒数，母单结束时返回 None"""
+
+    def describe(self):
+        return self.kind
+
+    def snapshot(self):
+        return {'id': self.id, 'kind': self.kind, 'description': self.describe(), 'exchange': self.exchange_id,
+                'account': self.key_id, 'symbol': self.symbol, 'side': self.side, 'amount': self.amount,
+                'price': self.price, 'filled': self.filled, 'average': self.average, 'status': self.status,
+                'children': len(self.children), 'message': self.message}
+
+
+class TwapOrder(ParentOrder):
+    """
+    TWAP: 在 duration 秒内均匀分成 slices 片，每片下一个以对手价成交、不超过限价的子单；
+    下一片开始时撤销上一片未成交的部分，剩余数量平均分到后面的分片。
+    """
+
+    kind = 'twap'
+
+    def __init__(self, *args, duration=None, slices=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.duration = float(duration or self.config['twap_duration'])
+        self.slices = int(slices or self.config['twap_slices'])
+        self.slice_index = 0
+        self.next_slice = None
+
+    def describe(self):
+        return f"TWAP {self.slice_index}/{self.slices}片 {self.duration:.0f}s"
+
+    def run(self, caller, exchange, now):
+        if self.next_slice is None:
+            self.next_slice = now
+        poll = self.config['poll_interval']
+        if now < self.next_slice:
+            return min(poll, self.next_slice - now)
+
+        self._cancel_active(caller)
+        if self.slice_index >= self.slices:
+            self._finish('done', f"时间结束，未成交 {self.remaining:g}" if self.remaining > 0 else '')
+            return None
+
+        ticker = caller.call('fetch_ticker', self.symbol)
+        if self.side == 'buy':
+            price = ticker['ask'] or ticker['last']
+            price = min(price, self.price) if self.price else price
+        else:
+            price = ticker['bid'] or ticker['last']
+            price = max(price, self.price) if self.price else price
+        slices_left = self.slices - self.slice_index
+        quantity = self._child_size(exchange, self.remaining / slices_left, price)
+        if quantity <= 0:
+            self._finish_residual()
+            return None
+        self.slice_index += 1
+        self.next_slice += self.duration / self.slices
+        self._place(caller, exchange, quantity, price)
+        return min(poll, max(0.0, self.next_slice - now))
+
+
+class IcebergOrder(ParentOrder):
+    """冰山单: 按限价每次只挂出 visible 数量，上一笔完全成交后再挂下一笔"""
+
+    kind = 'iceberg'
+
+    def __init__(self, *args, visible=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.visible = float(visible or self.amount * self.config['iceberg_visible'])
+
+    def describe(self):
+        return f"冰山 显示{self.visible:g}"
+
+    def run(self, caller, exchange, now):
+        if self.price is None:
+            raise ccxt.InvalidOrder("冰山单需要限价")
+        if self.active is None:
+            quantity = self._child_size(exchange, self.visible, self.price)
+            if quantity <= 0:
+                self._finish_residual()
+                return None
+            self._place(caller, exchange, quantity, self.price)
+        return self.config['poll_interval']
+
+
+class ChaseOrder(ParentOrder):
+    """
+    只做Maker的追价单: 以 postOnly 挂在己方最优价，最优价变化时撤单并按新价格重挂，
+    买单不高于限价、卖单不低于限价。下单会立即成交而被拒绝时等下一步重试。
+    """
+
+    kind = 'chase'
+
+    def __init__(self, *args, interval=None, max_reprices=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.interval = float(interval or self.config['poll_interval'])
+        self.max_reprices = int(max_reprices or self.config['chase_max_reprices'])
+        self.reprices = 0
+
+    def describe(self):
+        return f"追价 改价{self.reprices}次"
+
+    def run(self, caller, exchange, now):
+        ticker = caller.call('fetch_ticker', self.symbol)
+        if self.side == 'buy':
+            best = ticker['bid'] or ticker['last']
+            best = min(best, self.price) if self.price else best
+        else:
+            best = ticker['ask'] or ticker['last']
+            best = max(best, self.price) if self.price else best
+        best = float(exchange.price_to_precision(self.symbol, best))
+
+        if self.active is not None:
+            if self.children[self.active]['price'] == best:
+                return self.interval
+            if self.reprices >= self.max_reprices:
+                self._cancel_active(caller)
+                self._finish('done', f"达到最大改价次数，未成交 {self.remaining:g}")
+                return None
+            self._cancel_active(caller)
+            self.reprices += 1
+            if self.remaining <= 0:
+                return 0
+
+        quantity = self._child_size(exchange, self.remaining, best)
+        if quantity <= 0:
+            self._finish_residual()
+            return None
+        try:
+            self._place(caller, exchange, quantity, best, {'postOnly': True})
+        except ccxt.OrderImmediatelyFillable:
+            log.info(f"母单 {self.id} 子单 postOnly 被拒绝，价格 {best} 会立即成交，稍后重试")
+        return self.interval
+
+
+ALGORITHMS = {cls.kind: cls for cls in (TwapOrder, IcebergOrder, ChaseOrder)}
+
+
+class ExecutionEngine:
+    """
+    客户端算法单执行引擎。
+    一个调度线程推进时间轮，到期的母单步骤提交到所属账户的执行线程池，
+    步骤中的交易所调用通过账户的 ResilientCaller 发出；界面只提交和查询，不会被阻塞。
+    """
+
+    def __init__(self, exchanges, callers, config=None, on_update=None):
+        """
+        参数:
+            exchanges (dict): {exchange_id: {key_id: exchange}}，用于读取市场精度。
+            callers (ResilientPool): 账户调用池。
+            config (dict, optional): 覆盖 DEFAULT_EXECUTION_CONFIG。
+            on_update (callable, optional): 母单状态变化时调用，参数为母单。
+        """
+        self.exchanges = exchanges
+        self.callers = callers
+        self.config = dict(DEFAULT_EXECUTION_CONFIG, **(config or {}))
+        self.on_update = on_update
+        self.wheel = TimerWheel(self.config['tick'])
+        self.parents = OrderedDict()
+        self.executors = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.stopped = False
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='execution-engine', daemon=True)
+        self.thread.start()
+
+    def stop(self, cancel=True):
+        """停止引擎。cancel 为 True 时撤销所有运行中母单的活动子单，避免留下无人管理的挂单"""
+        self.stopped = True
+        running = [p for p in self.orders() if p.status == 'running']
+        if cancel:
+            for parent in running:
+                try:
+                    with parent.lock:
+                        parent._cancel_active(self.callers.get(parent.exchange_id, parent.key_id))
+                        parent._finish('canceled', '引擎停止')
+                except Exception as e:
+                    log.error(f"停止时撤销母单 {parent.id} 的子单失败: {str(e)}")
+        for executor in self.executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, kind, exchange_id, key_id, symbol, side, amount, price=None, **options):
+        """
+        提交一个母单，立即返回。
+
+        参数:
+            kind (str): twap / iceberg / chase。
+            price (float, optional): 限价，TWAP和追价单作为价格上限(买)或下限(卖)。
+            options: 算法参数，例如 duration、slices、visible、interval。
+
+        返回:
+            ParentOrder: 母单对象。
+        """
+        if kind not in ALGORITHMS:
+            raise ValueError(f"未知的算法: {kind}")
+        if side not in ('buy', 'sell'):
+            raise ValueError(f"无效的交易方向: {side}")
+        parent = ALGORITHMS[kind](f"A{next(self.ids)}", exchange_id, key_id, symbol, side, amount, price,
+                                  self.config, **options)
+        with self.lock:
+            self.parents[parent.id] = parent
+            self.wheel.schedule(0, parent)
+        log.info(f"提交母单 {parent.id}: {parent.describe()} {exchange_id}/{key_id} {symbol} {side} {amount} 限价 {price}",
+                 extra={'exchange': exchange_id, 'account': key_id, 'symbol': symbol, 'parent_id': parent.id})
+        self._notify(parent)
+        return parent
+
+    def cancel(self, parent_id):
+        """请求撤销母单，在下一步中撤销子单并结束"""
+        parent = self.parents.get(parent_id)
+        if parent is not None and parent.status == 'running':
+            parent.cancel_requested = True
+        return parent
+
+    def orders(self):
+        with self.lock:
+            return list(self.parents.values())
+
+    def _executor(self, parent):
+        key = (parent.exchange_id, parent.key_id)
+        if key not in self.executors:
+            self.executors[key] = ThreadPoolExecutor(max_workers=self.config['threads_per_account'],
+                                                     thread_name_prefix=f"algo-{key[0]}-{key[1]}")
+        return self.executors[key]
+
+    def _notify(self, parent):
+        if self.on_update is not None:
+            try:
+                self.on_update(parent)
+            except Exception as e:
+                log.error(f"母单回调失败: {str(e)}", exc_info=True)
+
+    def _run(self):
+        log.info("执行引擎启动")
+        while not self.stopped:
+            time.sleep(self.config['tick'])
+            with self.lock:
+                due = self.wheel.advance()
+            for parent in due:
+                if not self.stopped:
+                    self._executor(parent).submit(self._step, parent)
+        log.info("执行引擎已停止")
+
+    def _step(self, parent):
+        with logger.bound(exchange=parent.exchange_id, account=parent.key_id, symbol=parent.symbol,
+                          parent_id=parent.id):
+            self._step_parent(parent)
+
+    def _step_parent(self, parent):
+        caller = self.callers.get(parent.exchange_id, parent.key_id)
+        exchange = self.exchanges[parent.exchange_id][parent.key_id]
+        with parent.lock:
+            if parent.status != 'running' or self.stopped:
+                return
+            before = (parent.status, parent.filled, len(parent.children))
+            try:
+                delay = parent.step(caller, exchange, time.monotonic())
+            except ccxt.NetworkError as e:
+                # 网络错误不终止母单，下一步重试
+                log.warning(f"母单 {parent.id} 步骤失败，稍后重试: {type(e).__name__}: {str(e)}")
+                delay = self.config['poll_interval']
+            except Exception as e:
+                log.error(f"母单 {parent.id} 执行失败: {str(e)}", exc_info=True)
+                parent._finish('failed', str(e))
+                delay = None
+            parent.updated = time.time()
+        if delay is not None and parent.status == 'running':
+            with self.lock:
+                self.wheel.schedule(delay, parent)
+        if (parent.status, parent.filled, len(parent.children)) != before:
+            self._notify(parent)
+
+
+def format_parent(snapshot):
+    """把母单状态格式化为一行文字"""
+    average = f"{snapshot['average']:.8g}" if snapshot['average'] else '-'
+    return (f"{snapshot['id']} {snapshot['description']} {snapshot['symbol']} {snapshot['side']} "
+            f"{snapshot['filled']:g}/{snapshot['amount']:g} 均价 {average} "
+            f"{STATUS_LABELS.get(snapshot['status'], snapshot['status'])} {snapshot['message']}")
+
+
+def demo(parents, duration, seed=None):
+    """在模拟交易所上同时运行多个母单，输出执行结果"""
+    from sim_exchange import SimExchange
+    from exchange_worker import WorkerPool
+    from resilience import ResilientPool
+
+    exchange = SimExchange(symbols=('BTC/USDT', 'ETH/USDT'), latency=0.002, seed=seed)
+    exchanges = {'sim': {'demo': exchange}}
+    workers = WorkerPool(exchanges, threads=4, timeout=5)
+    callers = ResilientPool(workers, {'hedge': False})
+    engine = ExecutionEngine(exchanges, callers, {'poll_interval': 0.2, 'tick': 0.02, 'threads_per_account': 8})
+    engine.start()
+
+    started = time.monotonic()
+    kinds = list(ALGORITHMS)
+    for i in range(parents):
+        kind = kinds[i % len(kinds)]
+        side = 'buy' if i % 2 == 0 else 'sell'
+        symbol = 'BTC/USDT' if i % 4 < 2 else 'ETH/USDT'
+        price = exchange.fetch_ticker(symbol)['last'] * (1.002 if side == 'buy' else 0.998)
+        options = {'duration': duration, 'slices': 10} if kind == 'twap' else \
+            {'interval': 0.2, 'max_reprices': 1000} if kind == 'chase' else {}
+        engine.submit(kind, 'sim', 'demo', symbol, side, 2.0, price, **options)
+
+    deadline = started + duration * 3
+    while time.monotonic() < deadline and any(p.status == 'running' for p in engine.orders()):
+        time.sleep(0.1)
+    elapsed = time.monotonic() - started
+    engine.stop()
+    workers.stop()
+
+    results = {}
+    for parent in engine.orders():
+        stats = results.setdefault(parent.kind, {'count': 0, 'filled': 0.0, 'amount': 0.0, 'children': 0})
+        stats['count'] += 1
+        stats['filled'] += parent.filled
+        stats['amount'] += parent.amount
+        stats['children'] += len(parent.children)
+    print(f"模拟交易所上运行 {parents} 个母单，耗时 {elapsed:.1f}s")
+    for kind, stats in results.items():
+        print(f"  {kind:<8} 母单 {stats['count']:>4} | 子单 {stats['children']:>5}"
+              f" | 成交 {stats['filled']:.3f}/{stats['amount']:.3f}")
+    for parent in engine.orders()[:6]:
+        print(f"  {format_parent(parent.snapshot())}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="在模拟交易所上演示 TWAP、冰山和追价算法单")
+    parser.add_argument('--parents', type=int, default=30, help="同时运行的母单数量")
+    parser.add_argument('--duration', type=float, default=5.0, help="TWAP 时长(秒)")
+    parser.add_argument('--seed', type=int, help="随机种子")
+    args = parser.parse_args(argv)
+    return demo(args.parents, args.duration, args.seed)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
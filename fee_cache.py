@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import logger
+
+# 获取日志记录器
+log = logger.get_logger('fee_cache')
+
+FEES_FILE = os.path.join('data', 'fees.json')
+
+# 默认参数，可通过配置 fees 覆盖
+DEFAULT_FEE_CONFIG = {
+    # 费率缓存的有效期(秒)，过期后在后台重新获取
+    'ttl': 86400.0,
+    # 交易所和市场信息都没有费率时使用
+    'default_maker': 0.001,
+    'default_taker': 0.001,
+}
+
+
+class FeeCache:
+    """
+    按账户缓存的交易费率，保存在本地文件中，重启后直接使用。
+    支持 fetchTradingFees 的交易所获取账户实际的分交易对费率，其他交易所使用市场信息中的挂单/吃单费率；
+    获取在后台线程进行，界面查询费率只读内存，没有缓存时先用当前交易对市场信息里的费率。
+    """
+
+    def __init__(self, exchanges, callers, config=None, path=FEES_FILE):
+        self.exchanges = exchanges
+        self.callers = callers
+        self.config = dict(DEFAULT_FEE_CONFIG, **(config or {}))
+        self.path = path
+        self.accounts = {}
+        self.loading = set()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='fee-cache')
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.accounts = json.load(f)
+            log.info(f"已读取 {len(self.accounts)} 个账户的费率缓存")
+        except FileNotFoundError:
+            self.accounts = {}
+        except (OSError, ValueError) as e:
+            log.warning(f"读取费率缓存 {self.path} 失败: {str(e)}")
+            self.accounts = {}
+
+    def save(self):
+        with self.lock:
+            data = json.dumps(self.accounts, ensure_ascii=False)
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                tmp_file = f"{self.path}.tmp"
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                os.replace(tmp_file, self.path)
+            except OSError as e:
+                log.error(f"保存费率缓存失败: {str(e)}")
+
+    def ensure(self, exchange_id, key_id):
+        """账户没有缓存或缓存过期时在后台获取费率，不阻塞调用方"""
+        account = f"{exchange_id}/{key_id}"
+        with self.lock:
+            entry = self.accounts.get(account)
+            fresh = entry is not None and time.time() - entry.get('fetched_at', 0) < self.config['ttl']
+            if fresh or account in self.loading:
+                return
+            self.loading.add(account)
+        self.executor.submit(self._fetch, exchange_id, key_id)
+
+    def _fetch(self, exchange_id, key_id):
+        account = f"{exchange_id}/{key_id}"
+        try:
+            caller = self.callers.get(exchange_id, key_id)
+            exchange = self.exchanges[exchange_id][key_id]
+            if getattr(exchange, 'has', {}).get('fetchTradingFees'):
+                source = 'fetch_trading_fees'
+                fees = caller.call('fetch_trading_fees')
+            else:
+                source = 'markets'
+                fees = caller.call('load_markets')
+            rates = {symbol: {'maker': fee.get('maker'), 'taker': fee.get('taker')}
+                     for symbol, fee in fees.items()
+                     if isinstance(fee, dict) and (fee.get('maker') is not None or fee.get('taker') is not None)}
+            with self.lock:
+                self.accounts[account] = {'fetched_at': time.time(), 'source': source, 'fees': rates}
+            log.info(f"已获取 {account} 的费率: {len(rates)} 个交易对，来源 {source}")
+            self.save()
+        except Exception as e:
+            log.warning(f"获取 {account} 的费率失败: {type(e).__name__}: {str(e)}")
+        finally:
+            with self.lock:
+                self.loading.discard(account)
+
+    def rates(self, exchange_id, key_id, symbol, market=None):
+        """
+        交易对的挂单和吃单费率，只读内存。
+
+        返回:
+            tuple: (maker, taker, 来源)，来源为 fetch_trading_fees、markets、market 或 default。
+        """
+        with self.lock:
+            entry = self.accounts.get(f"{exchange_id}/{key_id}")
+            fee = entry['fees'].get(symbol) if entry else None
+            source = entry['source'] if fee else None
+        if fee is None and market is not None and (market.get('maker') is not None or market.get('taker') is not None):
+            fee, source = market, 'market'
+        if fee is None:
+            return self.config['default_maker'], self.config['default_taker'], 'default'
+        maker = fee.get('maker') if fee.get('maker') is not None else fee.get('taker')
+        taker = fee.get('taker') if fee.get('taker') is not None else maker
+        return maker, taker, source
+
+    def stop(self):
+        self.executor.shutdown(wait=False)
+
+
+def estimate_order(side, price, amount, maker, taker, ticker=None, base_free=0.0, quote_free=0.0):
+    """
+    估算限价单全部成交后的金额、手续费和余额。
+    价格穿越对手价(买入不低于卖一、卖出不高于买一)时按吃单费率，否则按挂单费率；
+    手续费按计价货币估算。
+
+    返回:
+        dict: cost、fee、rate、taker(是否吃单)、base_after、quote_after、sufficient(可用余额是否足够)。
+    """
+    ticker = ticker or {}
+    if side == 'buy':
+        crossing = ticker.get('ask') is not None and price >= ticker['ask']
+    else:
+        crossing = ticker.get('bid') is not None and price <= ticker['bid']
+    rate = taker if crossing else maker
+    cost = price * amount
+    fee = cost * rate
+    if side == 'buy':
+        base_after = base_free + amount
+        quote_after = quote_free - cost - fee
+        sufficient = quote_after >= 0
+    else:
+        base_after = base_free - amount
+        quote_after = quote_free + cost - fee
+        sufficient = base_after >= 0
+    return {'cost': cost, 'fee': fee, 'rate': rate, 'taker': crossing, 'base_after': base_after,
+            'quote_after': quote_after, 'sufficient': sufficient}
+
+
+def format_estimate(estimate, base, quote):
+    """交易界面显示的一行预估"""
+    liquidity = '吃单' if estimate['taker'] else '挂单'
+    text = (f"预计金额: {estimate['cost']:.8g} {quote} | 手续费: {estimate['fee']:.8g} {quote}"
+            f" ({liquidity} {estimate['rate'] * 100:.3f}%) | 成交后: {base} {estimate['base_after']:.8f}"
+            f" {quote} {estimate['quote_after']:.8f}")
+    if not estimate['sufficient']:
+        text += " | 余额不足"
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="查看缓存的账户交易费率")
+    parser.add_argument('--account', help="只显示该账户，格式 exchange/account")
+    parser.add_argument('--symbol', help="只显示该交易对")
+    args = parser.parse_args(argv)
+    try:
+        with open(FEES_FILE, 'r', encoding='utf-8') as f:
+            accounts = json.load(f)
+    except FileNotFoundError:
+        print("没有费率缓存")
+        return 0
+    for account, entry in sorted(accounts.items()):
+        if args.account and account != args.account:
+            continue
+        fetched = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry.get('fetched_at', 0)))
+        print(f"{account}: {len(entry['fees'])} 个交易对，来源 {entry.get('source')}，获取于 {fetched}")
+        for symbol, fee in sorted(entry['fees'].items()):
+            if args.symbol and symbol != args.symbol:
+                continue
+            if args.symbol or len(entry['fees']) <= 20:
+                print(f"  {symbol:<20} 挂单 {fee.get('maker')} 吃单 {fee.get('taker')}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
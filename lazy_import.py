@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import types
+import importlib
+import startup_profiler
+
+
+class LazyModule(types.ModuleType):
+    """
+    延迟导入的模块代理。
+    第一次访问属性时才真正导入模块，导入耗时记录到启动分析中，
+    之后的属性访问直接转发给真实模块。
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            loaded = self.__name__ in sys.modules
+            started = time.perf_counter()
+            module = importlib.import_module(self.__name__)
+            if not loaded:
+                startup_profiler.record(f"导入 {self.__name__}", time.perf_counter() - started, started)
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_module'] is not None else 'deferred'
+        return f"<LazyModule {self.__name__} ({state})>"
+
+
+def lazy_import(name):
+    """
+    返回延迟导入的模块，已经导入过的模块直接返回。
+
+    参数:
+        name (str): 模块名，例如 ccxt、pandas。
+
+    返回:
+        module: 真实模块或 LazyModule 代理。
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
+
+
+def lazy_attributes(module_name, factories):
+    """
+    为模块提供第一次访问时才创建的属性(PEP 562)，例如继承 ccxt 异常的异常类，
+    导入模块本身不需要导入 ccxt。创建后的值写回模块，之后按普通属性访问。
+
+    参数:
+        module_name (str): 模块名，一般传 __name__。
+        factories (dict): {属性名: 无参数的创建函数}。
+
+    返回:
+        function: 模块的 __getattr__。
+    """
+    def __getattr__(name):
+        factory = factories.get(name)
+        if factory is None:
+            raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+        value = factory()
+        setattr(sys.modules[module_name], name, value)
+        return value
+    return __getattr__
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import curses
+import logger
+
+# 获取日志记录器
+log = logger.get_logger('list_view')
+
+# 每帧用于过滤的时间预算(秒)，数据量大时过滤分多帧完成，界面不卡顿
+FILTER_BUDGET = 0.01
+# 选中行距离已加载数据末尾少于该行数时加载下一页
+PREFETCH_ROWS = 20
+
+
+class ListSource:
+    """已经完整获取到内存中的数据"""
+
+    exhausted = True
+
+    def __init__(self, items):
+        self.items = items
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+    def load_more(self):
+        return 0
+
+
+class PagedSource:
+    """
+    按页懒加载的数据源。
+    loader(page) 返回第 page 页(从0开始)的行列表，返回 None 表示没有更多数据；
+    列表只在滚动到已加载数据的末尾时才请求下一页。
+    """
+
+    def __init__(self, loader, max_pages=None):
+        self.loader = loader
+        self.max_pages = max_pages
+        self.rows = []
+        self.pages = 0
+        self.exhausted = False
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        return self.rows[index]
+
+    def load_more(self):
+        """加载下一页，返回新增的行数"""
+        if self.exhausted:
+            return 0
+        page = self.loader(self.pages)
+        self.pages += 1
+        if page is None or (self.max_pages is not None and self.pages >= self.max_pages):
+            self.exhausted = True
+        if not page:
+            return 0
+        self.rows.extend(page)
+        return len(page)
+
+
+class ListView:
+    """
+    虚拟滚动列表。
+    每帧只格式化和绘制可见窗口内的行，选择、滚动、跳转的开销与数据量无关；
+    过滤按时间预算增量扫描，扫描结果是匹配行的索引列表，扫描完成后同样只绘制可见窗口。
+
+    columns 为 (列位置, 标题, 格式化函数) 列表，格式化函数接收一行数据返回显示文本。
+    """
+
+    def __init__(self, source, columns, search=None, empty_text="暂无数据"):
+        self.columns = columns
+        self.empty_text = empty_text
+        self.search = search or (lambda row: ' '.join(fmt(row) for _, _, fmt in columns))
+        self.filter_text = ''
+        self.editing = False
+        self.selected = 0
+        self.offset = 0
+        self.height = 1
+        # 按 End 后逐帧加载分页数据源，加载完再跳到末尾
+        self.seeking_end = False
+        self.set_source(source)
+
+    def set_source(self, source):
+        """替换数据源(例如刷新后)，保留过滤条件和大致的选中位置"""
+        self.source = source
+        self._reset_filter()
+
+    def _reset_filter(self):
+        # 没有过滤条件时直接使用数据源的索引，不需要扫描
+        self.matches = [] if self.filter_text else None
+        self.scanned = 0
+
+    @property
+    def filtering(self):
+        """过滤扫描是否尚未完成"""
+        return self.matches is not None and self.scanned < len(self.source)
+
+    @property
+    def busy(self):
+        """是否还有需要后续帧完成的工作，调用方可据此缩短按键等待时间"""
+        return self.filtering or self.seeking_end
+
+    def __len__(self):
+        return len(self.source) if self.matches is None else len(self.matches)
+
+    def source_index(self, position):
+        return position if self.matches is None else self.matches[position]
+
+    def selected_row(self):
+        """当前选中行的数据，没有数据时返回 None"""
+        if len(self) == 0:
+            return None
+        return self.source[self.source_index(min(self.selected, len(self) - 1))]
+
+    def set_filter(self, text):
+        self.filter_text = text
+        self.selected = 0
+        self.offset = 0
+        self._reset_filter()
+
+    def _advance_filter(self):
+        """在时间预算内继续扫描过滤"""
+        deadline = time.perf_counter() + FILTER_BUDGET
+        needle = self.filter_text.lower()
+        total = len(self.source)
+        while self.scanned < total and time.perf_counter() < deadline:
+            stop = min(total, self.scanned + 500)
+            for index in range(self.scanned, stop):
+                if needle in self.search(self.source[index]).lower():
+                    self.matches.append(index)
+            self.scanned = stop
+
+    def _load_page(self):
+        """从分页数据源加载一页，加载失败时停止继续加载"""
+        try:
+            if self.source.load_more() and self.matches is not None:
+                self._advance_filter()
+        except Exception as e:
+            log.error(f"加载列表数据失败: {str(e)}", exc_info=True)
+            self.source.exhausted = True
+
+    def handle_key(self, key):
+        """
+        处理列表相关的按键，返回 True 表示按键已被列表处理。
+        上下键移动，PgUp/PgDn 翻页，Home/End 或 g/G 跳到首尾，/ 输入过滤，Esc 清除过滤。
+        """
+        if self.editing:
+            if key in (ord('\n'), curses.KEY_ENTER):
+                self.editing = False
+            elif key == 27:
+                self.editing = False
+                self.set_filter('')
+            elif key in (127, 8, curses.KEY_BACKSPACE):
+                self.set_filter(self.filter_text[:-1])
+            elif 32 <= key <= 126:
+                self.set_filter(self.filter_text + chr(key))
+            return True
+
+        page = max(1, self.height - 1)
+        # 任何按键都取消正在进行的跳到末尾
+        self.seeking_end = False
+        if key == curses.KEY_UP:
+            self.selected -= 1
+        elif key in (curses.KEY_DOWN, curses.KEY_NPAGE):
+            self.selected += 1 if key == curses.KEY_DOWN else page
+            # 已经到达已加载数据的末尾时加载下一页
+            if self.selected >= len(self) and not self.source.exhausted and not self.filtering:
+                self._load_page()
+        elif key == curses.KEY_PPAGE:
+            self.selected -= page
+        elif key in (curses.KEY_HOME, ord('g')):
+            self.selected = 0
+        elif key in (curses.KEY_END, ord('G')):
+            # 跳到末尾需要知道最后一行: 分页数据源每帧加载一页，界面在页与页之间仍能响应按键
+            self.seeking_end = True
+            self._seek_end()
+        elif key == ord('/'):
+            self.editing = True
+        elif key == 27 and self.filter_text:
+            self.set_filter('')
+        else:
+            return False
+        self.selected = max(0, min(self.selected, len(self) - 1))
+        return True
+
+    def _seek_end(self):
+        """跳到末尾的一步: 加载一页或继续过滤扫描，全部完成后选中最后一行"""
+        if not self.source.exhausted:
+            self._load_page()
+            self.selected = len(self) - 1
+        elif self.filtering:
+            self._advance_filter()
+        else:
+            self.seeking_end = False
+            self.selected = len(self) - 1
+
+    def draw(self, stdscr, top, height):
+        """
+        在 top 行开始的 height 行内绘制表头、可见行和状态行。
+        """
+        width = stdscr.getmaxyx()[1]
+        self.height = max(1, height - 2)
+
+        if self.seeking_end:
+            self._seek_end()
+        elif self.matches is not None:
+            self._advance_filter()
+        # 列表已占满屏幕且选中行接近已加载数据的末尾时预取下一页，每帧最多一页
+        if (not self.source.exhausted and not self.filtering and len(self) >= self.height
+                and self.selected + PREFETCH_ROWS >= len(self)):
+            self._load_page()
+
+        count = len(self)
+        self.selected = max(0, min(self.selected, count - 1))
+        if self.selected < self.offset:
+            self.offset = self.selected
+        elif self.selected >= self.offset + self.height:
+            self.offset = self.selected - self.height + 1
+        self.offset = max(0, min(self.offset, max(0, count - self.height)))
+
+        for x, title, _ in self.columns:
+            if x < width - 1:
+                stdscr.addstr(top, x, title[:width - 1 - x], curses.A_UNDERLINE)
+
+        if count == 0 and not self.filtering:
+            stdscr.addstr(top + 1, 0, self.empty_text if not self.filter_text else "没有匹配的记录", curses.A_NORMAL)
+        for row in range(min(self.height, count - self.offset)):
+            position = self.offset + row
+            item = self.source[self.source_index(position)]
+            attr = curses.A_REVERSE if position == self.selected else curses.A_NORMAL
+            for i, (x, _, fmt) in enumerate(self.columns):
+                if x >= width - 1:
+                    break
+                limit = (self.columns[i + 1][0] if i + 1 < len(self.columns) else width) - x - 1
+                stdscr.addstr(top + 1 + row, x, fmt(item)[:max(0, min(limit, width - 1 - x))], attr)
+
+        status = f"第 {min(self.selected + 1, count)}/{count} 条"
+        if self.seeking_end:
+            status += " (正在加载到末尾，按任意键取消)"
+        elif not self.source.exhausted:
+            status += " (还有更多，向下滚动继续加载)"
+        if self.filter_text or self.editing:
+            status += f" | 过滤: {self.filter_text}{'_' if self.editing else ''}"
+            if self.filtering:
+                status += f" (扫描 {self.scanned}/{len(self.source)})"
+        stdscr.addstr(top + height - 1, 0, status[:width - 1], curses.A_NORMAL)
@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import shutil
+import random
+import logging
+import argparse
+import tempfile
+from datetime import datetime
+import logger
+from logger import (LOG_DIR, JSON_SUFFIX, ARCHIVE_SUFFIX, INDEX_SUFFIX, INDEX_VERSION, JsonFormatter,
+                    compress_segment, segment_stem)
+
+# 相对时间，例如 30m、2h、7d
+RELATIVE_TIME = re.compile(r'^(\d+(?:\.\d+)?)([smhd])$')
+RELATIVE_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40, 'CRITICAL': 50}
+
+
+def parse_time(text):
+    """解析 YYYY-MM-DD[ HH:MM[:SS]]、Unix 时间戳或相对现在的 30m、2h、7d，返回 Unix 时间戳"""
+    if text is None:
+        return None
+    match = RELATIVE_TIME.match(text)
+    if match:
+        return time.time() - float(match.group(1)) * RELATIVE_UNITS[match.group(2)]
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(text, fmt).timestamp()
+        except ValueError:
+            continue
+    raise ValueError(f"无法解析时间: {text}")
+
+
+def list_segments(log_dir=LOG_DIR):
+    """
+    列出目录中的日志分段。
+
+    返回:
+        tuple: (已压缩分段的 [(压缩文件, 索引)] 列表，尚未压缩的分段文件列表)
+    """
+    archived, live = [], []
+    try:
+        names = os.listdir(log_dir)
+    except FileNotFoundError:
+        return archived, live
+    indexed = set()
+    for name in names:
+        if not name.endswith(INDEX_SUFFIX):
+            continue
+        path = os.path.join(log_dir, name)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if index.get('version') != INDEX_VERSION:
+            continue
+        stem = segment_stem(path)
+        indexed.add(stem)
+        archived.append((stem + ARCHIVE_SUFFIX, index))
+    # 压缩完成前原文件和压缩文件可能同时存在，以压缩文件为准
+    live = [os.path.join(log_dir, name) for name in names
+            if name.endswith(JSON_SUFFIX) and segment_stem(os.path.join(log_dir, name)) not in indexed]
+    return archived, live
+
+
+def _line_time(line):
+    """不解析整行，从行首的 ts 字段取时间"""
+    start = line.find(b'"ts": ')
+    if start < 0:
+        return None
+    start += 6
+    end = line.find(b',', start)
+    try:
+        return float(line[start:end])
+    except ValueError:
+        return None
+
+
+class LogQuery:
+    """
+    按订单ID、时间范围和上下文字段查询结构化日志。
+    已压缩的分段先用索引排除不相关的分段和块，只解压命中的块；
+    尚未压缩的分段逐行扫描，先用子串和行首时间过滤，命中的行才解析 JSON。
+    """
+
+    def __init__(self, order_id=None, since=None, until=None, exchange=None, account=None, symbol=None,
+                 level=None, text=None):
+        self.order_id = str(order_id) if order_id is not None else None
+        self.since = since
+        self.until = until
+        self.fields = {name: value for name, value in
+                       (('exchange', exchange), ('account', account), ('symbol', symbol)) if value is not None}
+        self.level = LEVELS[level.upper()] if level else None
+        self.text = text
+        # 子串预过滤，行中不含这些字节的一定不匹配
+        self.needles = [json.dumps(value, ensure_ascii=False).encode('utf-8')
+                        for value in ([self.order_id] if self.order_id else []) + list(self.fields.values())]
+        self.stats = {'segments': 0, 'skipped_segments': 0, 'blocks': 0, 'skipped_blocks': 0,
+                      'live_segments': 0, 'lines': 0}
+
+    def _overlaps(self, first, last):
+        if first is None or last is None:
+            return True
+        if self.since is not None and last < self.since:
+            return False
+        if self.until is not None and first > self.until:
+            return False
+        return True
+
+    def _blocks(self, index):
+        """索引中可能包含匹配行的块序号"""
+        candidates = None
+        if self.order_id:
+            keys = index['keys']
+            candidates = set(keys.get('order_id', {}).get(self.order_id, ())) | \
+                set(keys.get('parent_id', {}).get(self.order_id, ()))
+        if 'symbol' in self.fields:
+            blocks = set(index['keys'].get('symbol', {}).get(self.fields['symbol'], ()))
+            candidates = blocks if candidates is None else candidates & blocks
+        if candidates is None:
+            candidates = range(len(index['blocks']))
+        return [i for i in sorted(candidates)
+                if self._overlaps(index['blocks'][i]['first'], index['blocks'][i]['last'])]
+
+    def _match_line(self, line):
+        if any(needle not in line for needle in self.needles):
+            return None
+        if self.since is not None or self.until is not None:
+            ts = _line_time(line)
+            if ts is not None and not self._overlaps(ts, ts):
+                return None
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return None
+        self.stats['lines'] += 1
+        if self.order_id and self.order_id not in (entry.get('order_id'), entry.get('parent_id')):
+            return None
+        if any(entry.get(name) != value for name, value in self.fields.items()):
+            return None
+        if self.level is not None and LEVELS.get(entry.get('level'), 0) < self.level:
+            return None
+        if self.text and self.text not in entry.get('msg', ''):
+            return None
+        return entry
+
+    def _search_archive(self, path, index):
+        blocks = self._blocks(index)
+        self.stats['skipped_blocks'] += len(index['blocks']) - len(blocks)
+        if not blocks:
+            self.stats['skipped_segments'] += 1
+            return
+        self.stats['segments'] += 1
+        with open(path, 'rb') as f:
+            for i in blocks:
+                block = index['blocks'][i]
+                f.seek(block['offset'])
+                data = zlib.decompress(f.read(block['length']), wbits=31)
+                self.stats['blocks'] += 1
+                for line in data.splitlines():
+                    entry = self._match_line(line)
+                    if entry is not None:
+                        yield entry
+
+    def _search_live(self, path):
+        self.stats['live_segments'] += 1
+        try:
+            with open(path, 'rb') as f:
+                for line in f:
+                    entry = self._match_line(line)
+                    if entry is not None:
+                        yield entry
+        except FileNotFoundError:
+            # 查询期间被压缩，压缩文件不在这次的列表里，结果可能缺少这个分段
+            return
+
+    def run(self, log_dir=LOG_DIR, limit=None):
+        """返回按时间排序的匹配日志"""
+        archived, live = list_segments(log_dir)
+        results = []
+        for path, index in archived:
+            if not self._overlaps(index.get('first'), index.get('last')):
+                self.stats['skipped_segments'] += 1
+                self.stats['skipped_blocks'] += len(index['blocks'])
+                continue
+            results.extend(self._search_archive(path, index))
+        for path in live:
+            results.extend(self._search_live(path))
+        results.sort(key=lambda entry: entry.get('ts', 0))
+        return results[-limit:] if limit else results
+
+
+def format_entry(entry):
+    context = ' '.join(f"{name}={entry[name]}" for name in ('exchange', 'account', 'symbol', 'order_id', 'parent_id')
+                       if name in entry)
+    text = f"[{entry.get('time')}] [{entry.get('level')}] [{entry.get('file')}:{entry.get('line')}]"
+    if context:
+        text += f" [{context}]"
+    text += f" - {entry.get('msg')}"
+    if entry.get('exc'):
+        text += '\n' + entry['exc']
+    return text
+
+
+def bench(days, per_hour, segment_bytes, order_lookups):
+    """
+    生成若干天的模拟结构化日志(按 segment_bytes 分段压缩)，
+    测量按订单ID和按时间范围查询的耗时。
+    """
+    log_dir = tempfile.mkdtemp(prefix='log_query_bench_')
+    try:
+        formatter = JsonFormatter()
+        rng = random.Random(1)
+        start = time.time() - days * 86400
+        orders = []
+        lines = []
+        size = 0
+        segments = 0
+        total = days * 24 * per_hour
+        started = time.perf_counter()
+        for i in range(total):
+            created = start + i * 3600 / per_hour
+            fields = {'exchange': 'binance', 'account': rng.choice(('main', 'sub1')),
+                      'symbol': rng.choice(('BTC/USDT', 'ETH/USDT', 'SOL/USDT'))}
+            if i % 50 == 0:
+                orders.append(f"{rng.randrange(10 ** 12):012d}")
+                fields['order_id'] = orders[-1]
+                message = f"下单成功: 订单ID={orders[-1]}"
+            elif i % 50 == 25:
+                fields['order_id'] = rng.choice(orders)
+                message = f"订单 {fields['order_id']} 部分成交"
+            else:
+                message = f"轮询 ticker 完成 last={rng.uniform(100, 200):.2f}"
+            record = logging.LogRecord('bench', logging.INFO, 'simple_trade.py', 1, message, None, None)
+            record.created = created
+            record.__dict__.update(fields)
+            line = formatter.format(record) + '\n'
+            lines.append(line)
+            size += len(line.encode('utf-8'))
+            if size >= segment_bytes or i == total - 1:
+                path = os.path.join(log_dir, f"trade_bench_{segments:05d}.0001{JSON_SUFFIX}")
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.writelines(lines)
+                compress_segment(path)
+                lines, size, segments = [], 0, segments + 1
+        raw = sum(os.path.getsize(os.path.join(log_dir, n)) for n in os.listdir(log_dir))
+        print(f"生成 {days} 天 {total:,} 行日志, {segments} 个分段, 磁盘占用 {raw / 1e6:.1f}MB,"
+              f" 耗时 {time.perf_counter() - started:.1f}s")
+
+        timings = []
+        for order_id in rng.sample(orders, min(order_lookups, len(orders))):
+            started = time.perf_counter()
+            query = LogQuery(order_id=order_id)
+            found = query.run(log_dir)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        print(f"按订单ID查询 {len(timings)} 次: p50 {timings[len(timings) // 2] * 1000:.1f}ms"
+              f" max {timings[-1] * 1000:.1f}ms, 最后一次 {len(found)} 条,"
+              f" 解压 {query.stats['blocks']} 块 跳过 {query.stats['skipped_blocks']} 块")
+
+        since = start + days * 86400 / 2
+        started = time.perf_counter()
+        query = LogQuery(since=since, until=since + 3600)
+        found = query.run(log_dir)
+        print(f"按一小时时间范围查询: {(time.perf_counter() - started) * 1000:.1f}ms, {len(found)} 条,"
+              f" 解压 {query.stats['blocks']} 块 跳过 {query.stats['skipped_blocks']} 块")
+    finally:
+        shutil.rmtree(log_dir, ignore_errors=True)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="查询结构化日志(配置 logging.format 为 json 或 both 时写入)")
+    parser.add_argument('--dir', default=LOG_DIR, help="日志目录")
+    sub = parser.add_subparsers(dest='command', required=True)
+    query_parser = sub.add_parser('query', help="按订单ID、时间范围和字段查询")
+    query_parser.add_argument('--order', help="订单ID，同时匹配母单ID")
+    query_parser.add_argument('--since', help="开始时间，YYYY-MM-DD[ HH:MM[:SS]]、时间戳或 30m/2h/7d")
+    query_parser.add_argument('--until', help="结束时间，格式同 --since")
+    query_parser.add_argument('--exchange', help="交易所")
+    query_parser.add_argument('--account', help="账户")
+    query_parser.add_argument('--symbol', help="交易对")
+    query_parser.add_argument('--level', choices=sorted(LEVELS, key=LEVELS.get), help="最低日志级别")
+    query_parser.add_argument('--grep', help="消息中包含的文本")
+    query_parser.add_argument('--limit', type=int, help="只显示最后 N 条")
+    query_parser.add_argument('--json', action='store_true', help="按原始 JSON 行输出")
+    query_parser.add_argument('--stats', action='store_true', help="显示扫描的分段和块数")
+    sub.add_parser('compress', help="立即压缩没有在写入的分段并建立索引")
+    bench_parser = sub.add_parser('bench', help="生成模拟日志并测量查询耗时")
+    bench_parser.add_argument('--days', type=int, default=14, help="模拟的天数")
+    bench_parser.add_argument('--per-hour', type=int, default=3000, help="每小时的日志行数")
+    bench_parser.add_argument('--segment-mb', type=float, default=10, help="分段大小(MB)")
+    bench_parser.add_argument('--lookups', type=int, default=20, help="按订单ID查询的次数")
+    args = parser.parse_args(argv)
+
+    if args.command == 'bench':
+        return bench(args.days, args.per_hour, int(args.segment_mb * 1024 * 1024), args.lookups)
+    if args.command == 'compress':
+        logger.sweep_segments(args.dir, retention_days=0)
+        archived, live = list_segments(args.dir)
+        print(f"已压缩分段 {len(archived)} 个, 正在写入的分段 {len(live)} 个")
+        return 0
+
+    try:
+        query = LogQuery(order_id=args.order, since=parse_time(args.since), until=parse_time(args.until),
+                         exchange=args.exchange, account=args.account, symbol=args.symbol,
+                         level=args.level, text=args.grep)
+    except ValueError as e:
+        print(str(e))
+        return 1
+    started = time.perf_counter()
+    results = query.run(args.dir, limit=args.limit)
+    elapsed = time.perf_counter() - started
+    for entry in results:
+        print(json.dumps(entry, ensure_ascii=False) if args.json else format_entry(entry))
+    if args.stats:
+        stats = query.stats
+        print(f"{len(results)} 条, 耗时 {elapsed * 1000:.1f}ms | 压缩分段: 扫描 {stats['segments']} 跳过"
+              f" {stats['skipped_segments']} | 块: 解压 {stats['blocks']} 跳过 {stats['skipped_blocks']}"
+              f" | 未压缩分段 {stats['live_segments']} | 解析 {stats['lines']} 行", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,9 +2,15 @@
 # -*- coding: utf-8 -*-
 
 import os
+import json
+import gzip
+import time
+import fcntl
 import logging
 from logging.handlers import RotatingFileHandler
 from datetime import datetime
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import threading
 
 # 创建日志目录
@@ -19,6 +25,32 @@ except OSError as e:
 # 日志文件路径
 LOG_FILE_LOCK = threading.Lock()
 
+# 结构化日志参数，可通过配置 logging 覆盖
+DEFAULT_LOG_CONFIG = {
+    # text: 原有的文本日志; json: 只写结构化日志; both: 两种都写
+    'format': 'text',
+    # 结构化日志单个分段的大小，写满后在后台压缩并建立索引
+    'max_bytes': 10 * 1024 * 1024,
+    # 压缩后的分段保留天数，0 表示不删除
+    'retention_days': 30,
+}
+JSON_SUFFIX = '.jsonl'
+ARCHIVE_SUFFIX = '.jsonl.gz'
+INDEX_SUFFIX = '.idx.json'
+INDEX_VERSION = 1
+# 压缩时每个 gzip 成员包含的原始字节数，查询时只解压命中的块
+BLOCK_BYTES = 256 * 1024
+# 从日志调用的 extra 参数或线程上下文取出的字段
+CONTEXT_FIELDS = ('exchange', 'account', 'symbol', 'order_id', 'parent_id')
+# 压缩时建立索引的字段
+INDEXED_FIELDS = ('order_id', 'parent_id', 'symbol')
+
+# 是否写原有的文本日志，结构化日志模式为 json 时关闭
+text_logging = True
+# 启用结构化日志后的处理程序
+json_handler = None
+_context = threading.local()
+
 
 def get_log_file():
     with LOG_FILE_LOCK:
@@ -55,12 +87,18 @@ def setup_logger(logger_name=None, log_level=logging.INFO, max_bytes=10 * 1024 *
     # 设置日志级别
     logger.setLevel(log_level)
 
+    # 只写结构化日志时，命名的日志记录器直接交给根日志记录器的结构化处理程序
+    if not text_logging:
+        return logger
+
     # 创建文件处理程序 (RotatingFileHandler，限制文件大小并自动轮换)
     file_handler = RotatingFileHandler(
         LOG_FILE,
         maxBytes=max_bytes,  # 可配置的文件大小
         backupCount=backup_count,  # 可配置的备份文件数量
-        encoding='utf-8'
+        encoding='utf-8',
+        # 第一次写入时才创建文件，只写结构化日志的进程不会留下空的文本日志
+        delay=True
     )
 
     # 设置格式化器
@@ -97,6 +135,279 @@ def get_logger(name=None):
     return logger
 
 
+def bind(**fields):
+    """
+    设置当前线程之后日志的上下文字段(exchange、account、symbol、order_id、parent_id)，
+    值为 None 时移除该字段。只影响结构化日志。
+    """
+    current = dict(getattr(_context, 'fields', {}))
+    for name, value in fields.items():
+        if value is None:
+            current.pop(name, None)
+        else:
+            current[name] = value
+    _context.fields = current
+
+
+@contextmanager
+def bound(**fields):
+    """在 with 块内临时设置上下文字段，退出时恢复"""
+    previous = getattr(_context, 'fields', {})
+    bind(**fields)
+    try:
+        yield
+    finally:
+        _context.fields = previous
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    每条日志格式化为一行 JSON。ts 放在最前面，查询时不解析整行也能按时间过滤；
+    上下文字段优先取日志调用的 extra 参数，其次取当前线程 bind 的值。
+    """
+
+    def format(self, record):
+        entry = {'ts': round(record.created, 3), 'time': self.formatTime(record, '%Y-%m-%d %H:%M:%S'),
+                 'level': record.levelname, 'logger': record.name, 'file': record.filename,
+                 'line': record.lineno, 'thread': record.threadName}
+        fields = getattr(_context, 'fields', None)
+        for name in CONTEXT_FIELDS:
+            value = getattr(record, name, None)
+            if value is None and fields:
+                value = fields.get(name)
+            if value is not None:
+                entry[name] = str(value)
+        entry['msg'] = record.getMessage()
+        if record.exc_info and record.exc_info[0] is not None:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class JsonLogHandler(logging.Handler):
+    """
+    把日志逐行写成 JSON 分段文件，写满 max_bytes 后换新分段，写完的分段在后台线程压缩并建立索引。
+    正在写的分段持有文件锁，其他进程清理遗留分段时会跳过。
+    """
+
+    def __init__(self, log_dir=LOG_DIR, max_bytes=DEFAULT_LOG_CONFIG['max_bytes'],
+                 retention_days=DEFAULT_LOG_CONFIG['retention_days']):
+        super().__init__()
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes
+        self.prefix = f"trade_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+        self.sequence = 0
+        self.stream = None
+        self.path = None
+        self.size = 0
+        self.setFormatter(JsonFormatter())
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='log-compress')
+        self._open()
+        # 上次退出时没有压缩的分段和过期的分段在后台处理
+        self.executor.submit(sweep_segments, log_dir, retention_days)
+
+    def _open(self):
+        self.sequence += 1
+        self.path = os.path.join(self.log_dir, f"{self.prefix}.{self.sequence:04d}{JSON_SUFFIX}")
+        self.stream = open(self.path, 'a', encoding='utf-8')
+        fcntl.flock(self.stream, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self.size = self.stream.tell()
+
+    def emit(self, record):
+        try:
+            line = self.format(record) + '\n'
+            if self.stream is None:
+                return
+            self.stream.write(line)
+            self.stream.flush()
+            self.size += len(line.encode('utf-8'))
+            if self.size >= self.max_bytes:
+                self.rotate()
+        except Exception:
+            self.handleError(record)
+
+    def rotate(self):
+        """关闭当前分段(释放文件锁)，打开下一个分段，并在后台压缩关闭的分段"""
+        path = self.path
+        self.stream.close()
+        self._open()
+        self.executor.submit(compress_segment, path)
+
+    def close(self):
+        self.acquire()
+        try:
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+                # 没有写入内容的分段直接删除，写了内容的下次启动时压缩
+                if self.size == 0:
+                    _remove(self.path)
+        finally:
+            self.release()
+        self.executor.shutdown(wait=False)
+        super().close()
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _write_json(path, data):
+    tmp_file = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_file, path)
+
+
+def segment_stem(path):
+    """分段文件去掉后缀的部分，压缩文件和索引文件共用"""
+    for suffix in (ARCHIVE_SUFFIX, INDEX_SUFFIX, JSON_SUFFIX):
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path
+
+
+def compress_segment(path):
+    """
+    把写完的分段压缩成多个独立的 gzip 成员(每块约 BLOCK_BYTES)，同时写出索引:
+    每块在压缩文件中的偏移、长度和时间范围，以及 order_id、parent_id、symbol 出现在哪些块。
+    压缩文件整体仍是合法的 gzip 文件，可以直接用 zcat 查看。完成后删除原文件。
+
+    返回:
+        str: 索引文件路径；分段仍在写入(文件锁被占用)或已不存在时返回 None。
+    """
+    stem = segment_stem(path)
+    index_path = stem + INDEX_SUFFIX
+    try:
+        source = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    with source:
+        try:
+            fcntl.flock(source, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return None
+        if os.path.exists(index_path):
+            # 其他进程已经压缩完成
+            _remove(path)
+            return index_path
+
+        started = time.perf_counter()
+        index = {'version': INDEX_VERSION, 'segment': os.path.basename(stem), 'first': None, 'last': None,
+                 'lines': 0, 'blocks': [], 'keys': {name: {} for name in INDEXED_FIELDS}}
+        archive_tmp = f"{stem}{ARCHIVE_SUFFIX}.{os.getpid()}.tmp"
+        with open(archive_tmp, 'wb') as out:
+            block = {'lines': [], 'size': 0, 'first': None, 'last': None}
+
+            def flush_block():
+                if not block['lines']:
+                    return
+                data = gzip.compress(b''.join(block['lines']), compresslevel=6)
+                index['blocks'].append({'offset': out.tell(), 'length': len(data), 'first': block['first'],
+                                        'last': block['last'], 'lines': len(block['lines'])})
+                out.write(data)
+                block.update(lines=[], size=0, first=None, last=None)
+
+            for line in source:
+                if block['size'] + len(line) > BLOCK_BYTES:
+                    flush_block()
+                block['lines'].append(line)
+                block['size'] += len(line)
+                index['lines'] += 1
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 进程异常退出时最后一行可能不完整，保留原文但不建立索引
+                    continue
+                ts = entry.get('ts')
+                if ts is not None:
+                    block['first'] = ts if block['first'] is None else min(block['first'], ts)
+                    block['last'] = ts if block['last'] is None else max(block['last'], ts)
+                for name in INDEXED_FIELDS:
+                    value = entry.get(name)
+                    if value is not None:
+                        blocks = index['keys'][name].setdefault(value, [])
+                        if not blocks or blocks[-1] != len(index['blocks']):
+                            blocks.append(len(index['blocks']))
+            flush_block()
+        if not index['blocks']:
+            _remove(archive_tmp)
+            _remove(path)
+            return None
+        times = [b['first'] for b in index['blocks'] if b['first'] is not None]
+        index['first'] = min(times) if times else None
+        index['last'] = max((b['last'] for b in index['blocks'] if b['last'] is not None), default=None)
+        os.replace(archive_tmp, stem + ARCHIVE_SUFFIX)
+        _write_json(index_path, index)
+        _remove(path)
+    logging.getLogger('logger').debug(
+        f"压缩日志分段 {os.path.basename(path)}: {index['lines']} 行 {len(index['blocks'])} 块,"
+        f" 耗时 {time.perf_counter() - started:.2f}s")
+    return index_path
+
+
+def sweep_segments(log_dir=LOG_DIR, retention_days=DEFAULT_LOG_CONFIG['retention_days']):
+    """压缩目录中没有在写入的遗留分段，删除超过保留天数的压缩分段"""
+    try:
+        names = os.listdir(log_dir)
+    except OSError:
+        return
+    for name in sorted(names):
+        if name.startswith('trade_') and name.endswith(JSON_SUFFIX):
+            try:
+                compress_segment(os.path.join(log_dir, name))
+            except OSError as e:
+                logging.getLogger('logger').warning(f"压缩日志分段 {name} 失败: {str(e)}")
+    if not retention_days:
+        return
+    cutoff = time.time() - retention_days * 86400
+    for name in names:
+        if not name.endswith(INDEX_SUFFIX):
+            continue
+        index_path = os.path.join(log_dir, name)
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                last = json.load(f).get('last')
+        except (OSError, ValueError):
+            continue
+        if last is not None and last < cutoff:
+            stem = segment_stem(index_path)
+            _remove(stem + ARCHIVE_SUFFIX)
+            _remove(index_path)
+
+
+def configure(config=None):
+    """
+    按配置启用结构化日志，读取配置后调用一次。
+    format 为 json 时同时移除文本日志处理程序，之后创建的日志记录器也不再写文本日志。
+
+    返回:
+        JsonLogHandler: 结构化日志处理程序，format 为 text 时返回 None。
+    """
+    global json_handler, text_logging
+    config = dict(DEFAULT_LOG_CONFIG, **(config or {}))
+    if config['format'] not in ('text', 'json', 'both'):
+        raise ValueError(f"未知的日志格式: {config['format']}")
+    if config['format'] == 'text' or json_handler is not None:
+        return json_handler
+    json_handler = JsonLogHandler(LOG_DIR, config['max_bytes'], config['retention_days'])
+    logger.addHandler(json_handler)
+    if config['format'] == 'json':
+        text_logging = False
+        loggers = [logger] + [item for item in logging.Logger.manager.loggerDict.values()
+                              if isinstance(item, logging.Logger)]
+        for item in loggers:
+            for handler in list(item.handlers):
+                if isinstance(handler, RotatingFileHandler):
+                    item.removeHandler(handler)
+                    handler.close()
+        if os.path.exists(LOG_FILE) and os.path.getsize(LOG_FILE) == 0:
+            _remove(LOG_FILE)
+    return json_handler
+
+
 # 简便的日志记录函数
 def debug(msg, *args, **kwargs):
     logger.debug(msg, *args, **kwargs)
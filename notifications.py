@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+from collections import deque
+from datetime import datetime
+
+# 默认消息显示时长(秒)
+DEFAULT_TTL = {'info': 4.0, 'success': 4.0, 'warning': 6.0, 'error': 8.0}
+# 保留的历史消息条数
+MAX_HISTORY = 500
+
+LEVEL_LABELS = {'info': '信息', 'success': '成功', 'warning': '警告', 'error': '错误'}
+
+
+class Notification:
+    """一条状态消息"""
+
+    def __init__(self, text, level, ttl):
+        self.text = text
+        self.level = level
+        self.created = time.time()
+        self.expires = time.monotonic() + ttl
+
+    def expired(self, now=None):
+        return (now or time.monotonic()) >= self.expires
+
+    def format(self):
+        stamp = datetime.fromtimestamp(self.created).strftime('%H:%M:%S')
+        return f"{stamp} [{LEVEL_LABELS.get(self.level, self.level)}] {self.text}"
+
+
+class NotificationCenter:
+    """
+    非阻塞的消息中心。
+    任何线程都可以投递消息，界面在每次重绘时取出未过期的消息显示在底部状态栏，
+    过期的消息自动消失，全部消息保留在可滚动的历史记录中。
+    """
+
+    def __init__(self, max_history=MAX_HISTORY, ttl=None):
+        self.ttl = dict(DEFAULT_TTL, **(ttl or {}))
+        self.history = deque(maxlen=max_history)
+        self.lock = threading.Lock()
+
+    def post(self, text, level='info', ttl=None):
+        """
+        投递一条消息，立即返回。
+
+        参数:
+            text (str): 消息内容。
+            level (str): info / success / warning / error。
+            ttl (float, optional): 显示时长(秒)，默认按级别配置。
+        """
+        notification = Notification(text, level, self.ttl.get(level, DEFAULT_TTL['info']) if ttl is None else ttl)
+        with self.lock:
+            self.history.append(notification)
+        return notification
+
+    def active(self, limit=2):
+        """返回最新的 limit 条未过期消息，从旧到新排列"""
+        now = time.monotonic()
+        with self.lock:
+            result = []
+            for notification in reversed(self.history):
+                if notification.expired(now):
+                    # 历史按时间顺序排列，但不同级别的显示时长不同，需要继续向前查找
+                    continue
+                result.append(notification)
+                if len(result) >= limit:
+                    break
+        return list(reversed(result))
+
+    def has_active(self):
+        return bool(self.active(limit=1))
+
+    def snapshot(self):
+        """返回全部历史消息，从新到旧排列"""
+        with self.lock:
+            return list(reversed(self.history))
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import numpy as np
+import logger
+
+# 获取日志记录器
+log = logger.get_logger('ohlcv_store')
+
+# K线数据存储目录
+OHLCV_DIR = os.path.join('data', 'ohlcv')
+
+# 每根K线的定长记录格式，文件就是这些记录的顺序排列，可以直接内存映射
+CANDLE_DTYPE = np.dtype([
+    ('timestamp', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+])
+
+# 迷你走势图使用的字符，从低到高
+SPARK_CHARS = '▁▂▃▄▅▆▇█'
+
+
+def _safe_name(value):
+    """把交易对等名称转换为可用作文件名的形式"""
+    return re.sub(r'[^A-Za-z0-9_.-]', '-', value)
+
+
+class OhlcvStore:
+    """
+    单个交易所、交易对和周期的K线存储。
+    数据以定长二进制记录追加写入磁盘，读取时通过 numpy.memmap 映射，不需要反序列化；
+    补数据时只从最后一根已存储的K线开始获取。
+    """
+
+    def __init__(self, exchange_id, symbol, timeframe, data_dir=OHLCV_DIR):
+        self.exchange_id = exchange_id
+        self.symbol = symbol
+        self.timeframe = timeframe
+        os.makedirs(data_dir, exist_ok=True)
+        self.path = os.path.join(data_dir, f"{_safe_name(exchange_id)}_{_safe_name(symbol)}_{timeframe}.bin")
+        self._candles = None
+
+    def candles(self):
+        """
+        返回所有已存储的K线(只读的结构化数组)。映射结果会被缓存，直到下一次写入。
+        """
+        if self._candles is None:
+            size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            # 忽略异常中断时写了一半的尾部记录
+            count = size // CANDLE_DTYPE.itemsize
+            if count == 0:
+                self._candles = np.empty(0, dtype=CANDLE_DTYPE)
+            else:
+                self._candles = np.memmap(self.path, dtype=CANDLE_DTYPE, mode='r', shape=(count,))
+        return self._candles
+
+    def last_timestamp(self):
+        """最后一根已存储K线的时间戳(毫秒)，没有数据时返回None"""
+        candles = self.candles()
+        return int(candles['timestamp'][-1]) if len(candles) else None
+
+    def merge(self, rows):
+        """
+        合并 fetch_ohlcv 返回的K线。
+        与最后一根已存储K线时间相同的记录会覆盖它(未收盘的K线会持续变化)，更早的记录被忽略，更新的追加到文件末尾。
+
+        参数:
+            rows (list): [[timestamp, open, high, low, close, volume], ...]
+
+        返回:
+            int: 新追加的K线数量。
+        """
+        if not rows:
+            return 0
+        incoming = np.array([tuple(row[:6]) for row in rows], dtype=CANDLE_DTYPE)
+        incoming = incoming[np.argsort(incoming['timestamp'], kind='stable')]
+        candles = self.candles()
+        count = len(candles)
+        last = int(candles['timestamp'][-1]) if count else None
+
+        overwrite = None
+        if last is not None:
+            same = incoming[incoming['timestamp'] == last]
+            if len(same):
+                overwrite = same[-1:]
+            incoming = incoming[incoming['timestamp'] > last]
+
+        # 同一时间戳只保留最后一条
+        if len(incoming):
+            keep = np.append(incoming['timestamp'][1:] != incoming['timestamp'][:-1], True)
+            incoming = incoming[keep]
+
+        # 先释放只读映射，再修改文件
+        self._candles = None
+        del candles
+        if overwrite is not None:
+            with open(self.path, 'r+b') as f:
+                f.seek((count - 1) * CANDLE_DTYPE.itemsize)
+                f.write(overwrite.tobytes())
+        if len(incoming):
+            with open(self.path, 'r+b' if os.path.exists(self.path) else 'wb') as f:
+                # 从最后一条完整记录之后写入，覆盖可能存在的残缺尾部
+                f.seek(count * CANDLE_DTYPE.itemsize)
+                f.write(incoming.tobytes())
+                f.truncate()
+        return len(incoming)
+
+    def fetch_params(self, limit):
+        """
+        返回下一次补数据时 fetch_ohlcv 的参数。
+        有数据时从最后一根K线开始(包含它，以便更新未收盘的K线)，否则只取最近的 limit 根。
+        """
+        return {'symbol': self.symbol, 'timeframe': self.timeframe, 'since': self.last_timestamp(), 'limit': limit}
+
+    def top_up(self, exchange, limit=500, max_pages=20):
+        """
+        同步补齐到最新的K线，每页 limit 根，直到返回数量不足一页。
+
+        返回:
+            int: 新追加的K线数量。
+        """
+        added = 0
+        for _ in range(max_pages):
+            rows = exchange.fetch_ohlcv(**self.fetch_params(limit))
+            new = self.merge(rows)
+            added += new
+            if len(rows) < limit or new == 0:
+                break
+        log.info(f"{self.exchange_id} {self.symbol} {self.timeframe} 补充 {added} 根K线")
+        return added
+
+
+def returns(candles):
+    """按收盘价计算的逐根收益率，长度比输入少1"""
+    close = candles['close']
+    return close[1:] / close[:-1] - 1.0
+
+
+def vwap(candles, window=None):
+    """
+    成交量加权平均价，使用典型价格 (high + low + close) / 3。
+
+    参数:
+        window (int, optional): 滚动窗口长度；为None时计算从第一根开始的累计VWAP。
+
+    返回:
+        numpy.ndarray: 与输入等长的VWAP序列，成交量为0的位置为NaN。
+    """
+    typical = (candles['high'] + candles['low'] + candles['close']) / 3.0
+    volume = candles['volume']
+    pv = np.cumsum(typical * volume)
+    vol = np.cumsum(volume)
+    if window:
+        pv[window:] = pv[window:] - pv[:-window]
+        vol[window:] = vol[window:] - vol[:-window]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(vol > 0, pv / vol, np.nan)
+
+
+def true_range(candles):
+    """真实波幅，第一根K线没有前收盘价，使用 high - low"""
+    high, low, close = candles['high'], candles['low'], candles['close']
+    prev_close = np.concatenate((close[:1], close[:-1]))
+    return np.maximum(high - low, np.maximum(np.abs(high - prev_close), np.abs(low - prev_close)))
+
+
+def atr(candles, period=14):
+    """
+    平均真实波幅，取真实波幅的简单移动平均。
+
+    返回:
+        numpy.ndarray: 与输入等长的ATR序列，前 period-1 个位置为NaN。
+    """
+    tr = true_range(candles)
+    result = np.full(len(tr), np.nan)
+    if len(tr) >= period:
+        csum = np.cumsum(np.insert(tr, 0, 0.0))
+        result[period - 1:] = (csum[period:] - csum[:-period]) / period
+    return result
+
+
+def _format_value(value):
+    """指标数值，K线不足(NaN)时显示 -"""
+    return '-' if np.isnan(value) else f"{value:.8g}"
+
+
+def format_stats(candles, timeframe):
+    """K线面板的一行区间统计: 最高、最低、涨跌、VWAP 和 ATR"""
+    close = candles['close']
+    change = (close[-1] / candles['open'][0] - 1) * 100 if candles['open'][0] else 0
+    return (f"K线({timeframe}) 最近{len(candles)}根: 最高 {candles['high'].max():.8g}"
+            f" | 最低 {candles['low'].min():.8g} | 涨跌 {change:+.2f}%"
+            f" | VWAP {_format_value(vwap(candles)[-1])} | ATR {_format_value(atr(candles)[-1])}")
+
+
+def sparkline(values, width):
+    """
+    把数值序列压缩为指定宽度的迷你走势图字符串，每个字符取对应区间的最后一个值。
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if len(values) == 0 or width <= 0:
+        return ''
+    if len(values) > width:
+        edges = np.linspace(0, len(values), width + 1).astype(int)
+        values = values[edges[1:] - 1]
+    low, high = values.min(), values.max()
+    if high == low:
+        return SPARK_CHARS[len(SPARK_CHARS) // 2] * len(values)
+    levels = ((values - low) / (high - low) * (len(SPARK_CHARS) - 1)).round().astype(int)
+    return ''.join(SPARK_CHARS[i] for i in levels)
@@ -0,0 +1,393 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import random
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
+from lazy_import import lazy_import, lazy_attributes
+import exchange_worker
+from exchange_worker import wait_result
+import logger
+
+# 获取日志记录器
+log = logger.get_logger('resilience')
+
+ccxt = lazy_import('ccxt')
+
+# 可以安全重试和对冲的只读接口
+IDEMPOTENT_METHODS = {
+    'load_markets', 'fetch_markets', 'fetch_time', 'fetch_ticker', 'fetch_tickers', 'fetch_order_book',
+    'fetch_ohlcv', 'fetch_balance', 'fetch_order', 'fetch_open_orders', 'fetch_my_trades', 'fetch_trades',
+    'fetch_trading_fees', 'fetch_trading_fee',
+}
+
+# 默认参数，可通过配置 resilience 覆盖
+DEFAULT_RESILIENCE_CONFIG = {
+    # 按接口的截止时间(秒)，default 用于未列出的接口
+    'deadlines': {'default': 10.0, 'load_markets': 30.0, 'fetch_ticker': 5.0, 'fetch_tickers': 15.0,
+                  'fetch_balance': 8.0,
+                  'create_limit_order': 10.0, 'cancel_order': 10.0},
+    # 只读接口的最大重试次数
+    'retries': 2,
+    # 退避基数和上限(秒)，实际等待时间在 [0, min(上限, 基数 * 2^n)] 内随机
+    'backoff_base': 0.2,
+    'backoff_max': 2.0,
+    # 是否对只读接口启用对冲请求，以及启用前需要的延迟样本数
+    'hedge': True,
+    'hedge_min_samples': 20,
+    # 连续失败多少次后熔断，熔断多少秒后进入半开状态试探
+    'failure_threshold': 5,
+    'reset_timeout': 30.0,
+}
+
+# 每个接口保留的延迟样本数
+LATENCY_SAMPLES = 200
+
+
+def _circuit_open_error_class():
+    class CircuitOpenError(ccxt.ExchangeNotAvailable):
+        """账户处于熔断状态，请求被直接拒绝"""
+
+    CircuitOpenError.__module__ = __name__
+    return CircuitOpenError
+
+
+# CircuitOpenError 继承 ccxt 的异常，第一次使用时才创建，导入本模块不会导入 ccxt
+__getattr__ = lazy_attributes(__name__, {'CircuitOpenError': _circuit_open_error_class})
+_this = sys.modules[__name__]
+
+
+class CircuitBreaker:
+    """
+    单个账户的熔断器。
+    closed: 正常放行；连续网络失败达到阈值后转为 open，直接拒绝请求；
+    open 超过 reset_timeout 后转为 half_open，只放行一个试探请求，成功则恢复 closed，失败则重新 open。
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_running = False
+        self.trips = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def _transition(self, state):
+        if state != self.state:
+            log.warning(f"熔断器 {self.name} 状态变化: {self.state} -> {state}")
+            self.state = state
+
+    def allow(self):
+        """判断是否放行一个请求"""
+        with self.lock:
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._transition('half_open')
+                self.trial_running = False
+            if self.state == 'closed':
+                return True
+            if self.state == 'half_open' and not self.trial_running:
+                self.trial_running = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.trial_running = False
+            self._transition('closed')
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.trips += 1
+                self.opened_at = time.monotonic()
+                self._transition('open')
+
+    def snapshot(self):
+        with self.lock:
+            remaining = 0.0
+            if self.state == 'open':
+                remaining = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+            return {'state': self.state, 'failures': self.failures, 'trips': self.trips,
+                    'rejected': self.rejected, 'retry_in': remaining}
+
+
+class ResilientCaller:
+    """
+    为单个账户的交易所调用加上按接口的截止时间、只读接口的抖动退避重试、
+    慢请求的对冲重复读取，以及账户级熔断。
+
+    submit 为提交请求的函数，签名与 ExchangeWorker.submit 相同，返回 Future。
+    """
+
+    def __init__(self, name, submit, config=None):
+        self.name = name
+        self.submit = submit
+        self.config = dict(DEFAULT_RESILIENCE_CONFIG)
+        if config:
+            self.config.update({k: v for k, v in config.items() if k != 'deadlines'})
+            self.config['deadlines'] = dict(DEFAULT_RESILIENCE_CONFIG['deadlines'], **config.get('deadlines', {}))
+        self.breaker = CircuitBreaker(name, self.config['failure_threshold'], self.config['reset_timeout'])
+        self.latencies = {}
+        self.counters = {'calls': 0, 'retries': 0, 'hedges': 0, 'hedge_wins': 0, 'failures': 0}
+        self.lock = threading.Lock()
+        # 调用前检查、调用成功后观察结果和调用失败的钩子，例如下单前风控
+        self.guard = None
+
+    def deadline_for(self, method):
+        deadlines = self.config['deadlines']
+        return float(deadlines.get(method, deadlines['default']))
+
+    def _record_latency(self, method, seconds):
+        with self.lock:
+            samples = self.latencies.setdefault(method, deque(maxlen=LATENCY_SAMPLES))
+            samples.append(seconds)
+
+    def p95(self, method):
+        """该接口最近延迟的95分位数(秒)，样本不足时返回None"""
+        with self.lock:
+            samples = self.latencies.get(method)
+            if not samples or len(samples) < self.config['hedge_min_samples']:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def call(self, method, *args, timeout=None, **kwargs):
+        """
+        执行一次带保护的调用。
+
+        参数:
+            method (str): 交易所实例的方法名。
+            timeout (float, optional): 整体截止时间(秒)，默认按接口配置。
+
+        返回:
+            交易所接口的返回值。熔断时抛出 CircuitOpenError，超时抛出 DeadlineExceeded。
+        """
+        self._count('calls')
+        started_at = time.time()
+        if self.guard is None:
+            return self._call(method, args, kwargs, timeout)
+        reservation = self.guard.before(method, args, kwargs)
+        try:
+            result = self._call(method, args, kwargs, timeout)
+        except Exception as e:
+            self.guard.failed(method, reservation, e)
+            raise
+        self.guard.after(method, args, kwargs, result, started_at, reservation)
+        return result
+
+    def _call(self, method, args, kwargs, timeout):
+        budget = self.deadline_for(method) if timeout is None else timeout
+        deadline = time.monotonic() + budget
+        idempotent = method in IDEMPOTENT_METHODS
+        attempts = 1 + (int(self.config['retries']) if idempotent else 0)
+        last_error = None
+
+        for attempt in range(attempts):
+            # 先检查截止时间再申请放行，半开状态的试探名额不会被一个不发出的请求占住
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not self.breaker.allow():
+                snapshot = self.breaker.snapshot()
+                raise _this.CircuitOpenError(f"{self.name} 已熔断，{snapshot['retry_in']:.0f}s 后重试")
+            started = time.monotonic()
+            try:
+                result = self._attempt(method, args, kwargs, remaining, idempotent and self.config['hedge'])
+                self._record_latency(method, time.monotonic() - started)
+                self.breaker.record_success()
+                return result
+            except ccxt.NetworkError as e:
+                # 网络类错误(含超时、限频、交易所不可用)计入熔断，只读接口可以重试
+                self.breaker.record_failure()
+                self._count('failures')
+                last_error = e
+                if attempt + 1 >= attempts:
+                    break
+                backoff = random.uniform(0, min(self.config['backoff_max'],
+                                                self.config['backoff_base'] * (2 ** attempt)))
+                if time.monotonic() + backoff >= deadline:
+                    break
+                log.info(f"{self.name} {method} 第 {attempt + 1} 次失败({type(e).__name__})，{backoff:.2f}s 后重试")
+                self._count('retries')
+                time.sleep(backoff)
+            except Exception:
+                # 业务错误说明交易所可达，不计入熔断
+                self.breaker.record_success()
+                raise
+
+        if last_error is not None:
+            raise last_error
+        raise exchange_worker.DeadlineExceeded(f"{self.name}.{method} 超过截止时间 {budget:.1f}s")
+
+    def _attempt(self, method, args, kwargs, remaining, hedge):
+        """执行一次尝试；启用对冲时，主请求超过p95仍未返回则再发一个相同请求，取先成功的结果"""
+        primary = self.submit(method, *args, timeout=remaining, **kwargs)
+        threshold = self.p95(method) if hedge else None
+        if threshold is None or threshold >= remaining:
+            return wait_result(primary, remaining, f"{self.name}.{method}")
+
+        started = time.monotonic()
+        done, _ = wait([primary], timeout=threshold)
+        if done:
+            return primary.result()
+
+        self._count('hedges')
+        left = remaining - (time.monotonic() - started)
+        secondary = self.submit(method, *args, timeout=left, **kwargs)
+        pending = {primary, secondary}
+        error = None
+        while pending:
+            left = remaining - (time.monotonic() - started)
+            if left <= 0:
+                break
+            done, pending = wait(pending, timeout=left, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    if future is secondary:
+                        self._count('hedge_wins')
+                    return future.result()
+                error = future.exception()
+        for future in pending:
+            future.cancel()
+        if error is not None:
+            raise error
+        raise exchange_worker.DeadlineExceeded(f"{self.name}.{method} 超过截止时间 {remaining:.1f}s")
+
+    def snapshot(self):
+        """返回熔断器状态、计数器和各接口p95延迟(毫秒)，用于界面显示和统计"""
+        with self.lock:
+            counters = dict(self.counters)
+            methods = list(self.latencies)
+        p95 = {}
+        for method in methods:
+            value = self.p95(method)
+            if value is not None:
+                p95[method] = value * 1000
+        return dict(counters, breaker=self.breaker.snapshot(), p95_ms=p95)
+
+
+class ResilientPool:
+    """按交易所账户管理 ResilientCaller，与 WorkerPool 一一对应"""
+
+    def __init__(self, workers, config=None):
+        self.callers = {}
+        for key, worker in workers.workers.items():
+            self.callers[key] = ResilientCaller(f"{key[0]}/{key[1]}", worker.submit, config)
+
+    def get(self, exchange_id, key_id):
+        return self.callers[(exchange_id, key_id)]
+
+    def set_guard(self, factory):
+        """为每个账户设置钩子，factory(exchange_id, key_id) 返回带 before/after/failed 方法的对象。
+        before 的返回值(例如风控预留)原样交给之后的 after 或 failed。"""
+        for (exchange_id, key_id), caller in self.callers.items():
+            caller.guard = factory(exchange_id, key_id)
+
+    def metrics(self):
+        """所有账户的统计数据"""
+        return {name: caller.snapshot() for name, caller in
+                ((f"{k[0]}/{k[1]}", c) for k, c in self.callers.items())}
+
+
+def format_breaker(snapshot):
+    """把熔断器状态格式化为界面显示的一行文字"""
+    labels = {'closed': '正常', 'open': '熔断', 'half_open': '试探'}
+    breaker = snapshot['breaker']
+    text = (f"熔断器: {labels.get(breaker['state'], breaker['state'])} | 连续失败 {breaker['failures']}"
+            f" | 重试 {snapshot['retries']} | 对冲 {snapshot['hedges']}/{snapshot['hedge_wins']}")
+    if breaker['state'] == 'open':
+        text += f" | {breaker['retry_in']:.0f}s 后试探"
+    return text
+
+
+class FaultyExchange:
+    """
+    注入故障的模拟交易所，用于演示和验证重试、对冲和熔断逻辑。
+    每次调用按概率抛出网络错误或额外延迟，outage 为True时全部失败。
+    """
+
+    def __init__(self, error_rate=0.1, slow_rate=0.05, latency=0.02, slow_latency=0.5, seed=None):
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.latency = latency
+        self.slow_latency = slow_latency
+        self.outage = False
+        self.random = random.Random(seed)
+
+    def fetch_ticker(self, symbol):
+        if self.outage:
+            raise ccxt.ExchangeNotAvailable("模拟交易所宕机")
+        roll = self.random.random()
+        if roll < self.error_rate:
+            raise ccxt.NetworkError("模拟网络错误")
+        time.sleep(self.slow_latency if roll < self.error_rate + self.slow_rate else self.latency)
+        return {'symbol': symbol, 'last': 100.0}
+
+
+def demo(calls):
+    """在注入故障的模拟交易所上运行，打印重试、对冲和熔断的效果"""
+    from exchange_worker import ExchangeWorker
+
+    exchange = FaultyExchange(seed=1)
+    worker = ExchangeWorker('faulty', 'demo', exchange, threads=4)
+    caller = ResilientCaller('faulty/demo', worker.submit, {'failure_threshold': 5, 'reset_timeout': 1.0})
+
+    failed = 0
+    started = time.monotonic()
+    for _ in range(calls):
+        try:
+            caller.call('fetch_ticker', 'BTC/USDT')
+        except ccxt.NetworkError:
+            failed += 1
+    print(f"正常阶段 {calls} 次调用, 失败 {failed}, 耗时 {time.monotonic() - started:.2f}s")
+    print(format_breaker(caller.snapshot()))
+
+    exchange.outage = True
+    rejected = 0
+    started = time.monotonic()
+    for _ in range(20):
+        try:
+            caller.call('fetch_ticker', 'BTC/USDT')
+        except _this.CircuitOpenError:
+            rejected += 1
+        except ccxt.NetworkError:
+            pass
+    print(f"宕机阶段 20 次调用, 熔断直接拒绝 {rejected}, 耗时 {time.monotonic() - started:.2f}s")
+    print(format_breaker(caller.snapshot()))
+
+    exchange.outage = False
+    time.sleep(1.1)
+    caller.call('fetch_ticker', 'BTC/USDT')
+    print(f"恢复阶段: {format_breaker(caller.snapshot())}")
+    worker.stop()
+    return caller.breaker.state == 'closed' and rejected > 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="交易所调用保护演示(注入故障的模拟交易所)")
+    parser.add_argument('--calls', type=int, default=200, help="正常阶段的调用次数")
+    args = parser.parse_args(argv)
+    return 0 if demo(args.calls) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
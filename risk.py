@@ -0,0 +1,414 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import argparse
+import itertools
+import threading
+from collections import defaultdict, deque
+from lazy_import import lazy_import
+import resilience
+import logger
+
+# 获取日志记录器
+log = logger.get_logger('risk')
+
+ccxt = lazy_import('ccxt')
+
+# 默认参数，可通过配置 risk 覆盖，accounts 中可按 "交易所/账户" 单独覆盖限额
+DEFAULT_RISK_CONFIG = {
+    'enabled': True,
+    # 买入需要的计价货币和卖出需要的基础货币不能超过模型中的可用余额
+    'check_balance': True,
+    # 可用余额预留的比例，用于手续费和价格误差
+    'balance_buffer': 0.002,
+    # 单笔订单最大金额(计价货币)，None 表示不限制
+    'max_order_notional': None,
+    # 账户所有挂单的最大总金额(计价货币)
+    'max_open_notional': None,
+    # 每种基础货币买入后的最大持仓数量，例如 {"BTC": 1.0}
+    'max_position': {},
+    # 与交易所对账的间隔(秒)，只对有下单记录的账户对账
+    'reconcile_interval': 60.0,
+    # 模型与交易所余额的差异超过该比例时记录警告
+    'drift_tolerance': 0.001,
+    'accounts': {},
+}
+
+# 订单结束的状态
+FINAL_STATUSES = {'closed', 'canceled', 'cancelled', 'expired', 'rejected'}
+
+
+class RiskRejected(Exception):
+    """下单前风控检查未通过"""
+
+
+def _order_args(args, kwargs):
+    values = dict(zip(('symbol', 'side', 'amount', 'price', 'params'), args))
+    values.update(kwargs)
+    return values
+
+
+class AccountExposure:
+    """
+    单个账户的敞口模型。
+    以最近一次余额快照为基础，叠加之后本程序下单的冻结、成交和撤单释放，得到可用余额、持仓和挂单金额；
+    每次余额快照(轮询、对账)都会重新对齐，快照请求发出之后的变动继续保留。
+    """
+
+    def __init__(self, exchange_id, key_id, limits):
+        self.exchange_id = exchange_id
+        self.key_id = key_id
+        self.limits = limits
+        self.free = {}
+        self.total = {}
+        self.snapshot_time = None
+        # 快照之后的变动 (时间, 货币, 可用变化, 总量变化)，以及按货币的累计
+        self.journal = deque()
+        self.delta_free = defaultdict(float)
+        self.delta_total = defaultdict(float)
+        self.orders = {}
+        self.open_notional = 0.0
+        self.active = False
+        self.needs_reconcile = False
+        self.lock = threading.Lock()
+        self.symbols = {}
+        self.reservations = itertools.count(1)
+
+    def _currencies(self, symbol):
+        currencies = self.symbols.get(symbol)
+        if currencies is None:
+            base, _, quote = symbol.partition('/')
+            currencies = self.symbols[symbol] = (base, quote.split(':')[0])
+        return currencies
+
+    def _apply(self, currency, free=0.0, total=0.0):
+        self.journal.append((time.time(), currency, free, total))
+        self.delta_free[currency] += free
+        self.delta_total[currency] += total
+
+    def available(self, currency):
+        return self.free.get(currency, 0.0) + self.delta_free[currency]
+
+    def position(self, currency):
+        return self.total.get(currency, 0.0) + self.delta_total[currency]
+
+    def check(self, symbol, side, amount, price):
+        """
+        检查一笔限价单，返回拒绝原因，通过时返回 None。只做字典查找和算术，不访问交易所。
+        """
+        if not self.limits['enabled']:
+            return None
+        with self.lock:
+            return self._reject_reason(symbol, side, float(amount), float(price))
+
+    def _reject_reason(self, symbol, side, amount, price):
+        # 调用方持有 self.lock
+        limits = self.limits
+        notional = amount * price
+        base, quote = self._currencies(symbol)
+        max_order = limits['max_order_notional']
+        if max_order is not None and notional > max_order:
+            return f"订单金额 {notional:.8g} {quote} 超过单笔上限 {max_order:g}"
+        max_open = limits['max_open_notional']
+        if max_open is not None and self.open_notional + notional > max_open:
+            return f"挂单总金额 {self.open_notional + notional:.8g} 将超过上限 {max_open:g}"
+        max_position = limits['max_position'].get(base)
+        if side == 'buy' and max_position is not None and self.position(base) + amount > max_position:
+            return f"{base} 持仓 {self.position(base) + amount:.8g} 将超过上限 {max_position:g}"
+        if limits['check_balance'] and self.snapshot_time is not None:
+            buffer = 1 + limits['balance_buffer']
+            if side == 'buy' and notional * buffer > self.available(quote):
+                return f"{quote} 可用余额 {self.available(quote):.8g} 不足，需要 {notional * buffer:.8g}"
+            if side == 'sell' and amount > self.available(base):
+                return f"{base} 可用余额 {self.available(base):.8g} 不足，需要 {amount:.8g}"
+        return None
+
+    def _track(self, key, symbol, side, amount, price, placed, pending=False):
+        # 调用方持有 self.lock
+        base, quote = self._currencies(symbol)
+        self.active = True
+        self.orders[key] = {'symbol': symbol, 'side': side, 'amount': amount, 'price': price,
+                            'filled': 0.0, 'placed': placed, 'pending': pending}
+        self.open_notional += amount * price
+        if side == 'buy':
+            self._apply(quote, free=-amount * price)
+        else:
+            self._apply(base, free=-amount)
+
+    def reserve(self, symbol, side, amount, price):
+        """
+        检查一笔限价单，通过时在同一把锁内立即冻结余额和挂单额度，
+        并发下单时后来的订单能看到前面的占用。返回 (拒绝原因, 预留编号)，未启用时都为 None。
+        """
+        if not self.limits['enabled']:
+            return None, None
+        amount = float(amount)
+        price = float(price)
+        with self.lock:
+            reason = self._reject_reason(symbol, side, amount, price)
+            if reason:
+                return reason, None
+            key = f"reserved-{next(self.reservations)}"
+            self._track(key, symbol, side, amount, price, time.time(), pending=True)
+        return None, key
+
+    def confirm(self, key, order):
+        """下单成功，把预留转为按订单ID跟踪"""
+        with self.lock:
+            tracked = self.orders.pop(key, None)
+            if tracked is None:
+                return
+            tracked['pending'] = False
+            self.orders[order['id']] = tracked
+        self.update_order(order)
+
+    def release(self, key, unknown=False):
+        """
+        下单失败时释放预留。结果未知(超时、网络错误)时订单可能已经挂出，保留冻结，
+        之后的挂单查询中找不到时按已结束处理，并尽快与交易所对账。
+        """
+        with self.lock:
+            tracked = self.orders.get(key)
+            if tracked is None:
+                return
+            if unknown:
+                tracked['pending'] = False
+                tracked['placed'] = time.time()
+                self.needs_reconcile = True
+                return
+            del self.orders[key]
+            base, quote = self._currencies(tracked['symbol'])
+            self.open_notional -= tracked['amount'] * tracked['price']
+            if tracked['side'] == 'buy':
+                self._apply(quote, free=tracked['amount'] * tracked['price'])
+            else:
+                self._apply(base, free=tracked['amount'])
+            if abs(self.open_notional) < 1e-9:
+                self.open_notional = 0.0
+
+    def record_order(self, order, symbol, side, amount, price, placed):
+        """记录本程序下的订单，冻结对应的余额"""
+        with self.lock:
+            self._track(order['id'], symbol, side, float(amount), float(price), placed)
+        self.update_order(order)
+
+    def update_order(self, order):
+        """根据订单的最新状态计入新的成交，订单结束时释放未成交部分的冻结"""
+        with self.lock:
+            tracked = self.orders.get(order.get('id'))
+            if tracked is None:
+                return
+            base, quote = self._currencies(tracked['symbol'])
+            price = tracked['price']
+            filled = min(tracked['amount'], float(order.get('filled') or 0))
+            new = filled - tracked['filled']
+            if new > 0:
+                tracked['filled'] = filled
+                self.open_notional -= new * price
+                fill_price = float(order.get('average') or price)
+                if tracked['side'] == 'buy':
+                    # 计价货币在下单时已冻结，成交后基础货币可用
+                    self._apply(base, free=new, total=new)
+                    self._apply(quote, total=-new * fill_price)
+                else:
+                    self._apply(quote, free=new * fill_price, total=new * fill_price)
+                    self._apply(base, total=-new)
+            if order.get('status') in FINAL_STATUSES:
+                remaining = tracked['amount'] - tracked['filled']
+                self.open_notional -= remaining * price
+                if tracked['side'] == 'buy':
+                    self._apply(quote, free=remaining * price)
+                else:
+                    self._apply(base, free=remaining)
+                del self.orders[order['id']]
+            if abs(self.open_notional) < 1e-9:
+                self.open_notional = 0.0
+
+    def update_open_orders(self, orders, symbol, started):
+        """
+        用挂单列表更新订单。请求发出前已下、但不在列表中的订单已经结束，
+        无法区分成交和撤销，按成交处理(不释放冻结，也不计入基础货币)，并尽快对账。
+        """
+        current = {order['id'] for order in orders}
+        for order in orders:
+            self.update_order(order)
+        with self.lock:
+            for order_id, tracked in list(self.orders.items()):
+                # 仍在下单中的预留还没有订单ID，不能按已结束处理
+                if order_id in current or tracked['placed'] >= started or tracked['pending']:
+                    continue
+                if symbol is not None and tracked['symbol'] != symbol:
+                    continue
+                self.open_notional -= (tracked['amount'] - tracked['filled']) * tracked['price']
+                del self.orders[order_id]
+                self.needs_reconcile = True
+
+    def apply_balance(self, balance, started):
+        """用余额快照对齐模型，快照请求发出之后的变动保留"""
+        free = {c: float(v or 0) for c, v in (balance.get('free') or {}).items()}
+        total = {c: float(v or 0) for c, v in (balance.get('total') or {}).items()}
+        with self.lock:
+            if self.snapshot_time is not None:
+                tolerance = self.limits['drift_tolerance']
+                for currency in set(free) | set(self.free):
+                    model = self.available(currency)
+                    actual = free.get(currency, 0.0)
+                    if abs(model - actual) > tolerance * max(abs(actual), 1.0):
+                        log.info(f"{self.exchange_id}/{self.key_id} {currency} 可用余额偏差: "
+                                 f"模型 {model:.8g} 交易所 {actual:.8g}")
+            self.free = free
+            self.total = total
+            self.snapshot_time = time.time()
+            while self.journal and self.journal[0][0] < started:
+                self.journal.popleft()
+            self.delta_free = defaultdict(float)
+            self.delta_total = defaultdict(float)
+            for _, currency, free_change, total_change in self.journal:
+                self.delta_free[currency] += free_change
+                self.delta_total[currency] += total_change
+            self.needs_reconcile = False
+
+    def snapshot(self):
+        with self.lock:
+            return {'account': f"{self.exchange_id}/{self.key_id}", 'open_orders': len(self.orders),
+                    'open_notional': self.open_notional, 'snapshot_age': time.time() - self.snapshot_time
+                    if self.snapshot_time else None}
+
+
+class RiskGuard:
+    """
+    交给账户调用器的钩子: 下单前检查并预留额度，调用成功后用返回结果更新敞口模型，失败时释放预留。
+    界面、算法单、条件单和组合单都经过账户调用器，因此都会被检查；
+    批量下单模式直接使用交易所实例，不经过风控。
+    """
+
+    def __init__(self, exposure):
+        self.exposure = exposure
+
+    def before(self, method, args, kwargs):
+        """下单前检查，返回预留编号，由调用器交回 after 或 failed"""
+        if method == 'create_limit_order':
+            values = _order_args(args, kwargs)
+            reason, reservation = self.exposure.reserve(values['symbol'], values['side'], values['amount'],
+                                                        values['price'])
+            if reason:
+                log.warning(f"风控拒绝 {self.exposure.exchange_id}/{self.exposure.key_id}: {reason}")
+                raise RiskRejected(f"风控拒绝: {reason}")
+            return reservation
+        return None
+
+    def failed(self, method, reservation, error):
+        """调用失败。网络错误和超时时订单可能已经到达交易所，保留预留等待对账"""
+        if reservation is not None:
+            unknown = isinstance(error, ccxt.NetworkError) and not isinstance(error, resilience.CircuitOpenError)
+            self.exposure.release(reservation, unknown=unknown)
+
+    def after(self, method, args, kwargs, result, started, reservation=None):
+        try:
+            if method == 'create_limit_order':
+                if reservation is not None:
+                    self.exposure.confirm(reservation, result)
+                else:
+                    values = _order_args(args, kwargs)
+                    self.exposure.record_order(result, values['symbol'], values['side'], values['amount'],
+                                               values['price'], started)
+            elif method in ('fetch_order', 'cancel_order') and isinstance(result, dict):
+                self.exposure.update_order(result)
+            elif method == 'fetch_open_orders':
+                symbol = args[0] if args else kwargs.get('symbol')
+                self.exposure.update_open_orders(result, symbol, started)
+            elif method == 'fetch_balance':
+                self.exposure.apply_balance(result, started)
+        except Exception as e:
+            # 模型更新失败不影响调用结果，下次对账时纠正
+            log.error(f"更新敞口模型失败 {method}: {str(e)}", exc_info=True)
+
+
+class RiskManager:
+    """
+    按账户维护敞口模型，并定期对有下单记录的账户获取余额对账，纠正模型与交易所的偏差。
+    """
+
+    def __init__(self, callers, config=None):
+        self.callers = callers
+        self.config = dict(DEFAULT_RISK_CONFIG, **(config or {}))
+        self.accounts = {}
+        for (exchange_id, key_id) in callers.callers:
+            limits = dict(self.config, **self.config['accounts'].get(f"{exchange_id}/{key_id}", {}))
+            self.accounts[(exchange_id, key_id)] = AccountExposure(exchange_id, key_id, limits)
+        callers.set_guard(lambda exchange_id, key_id: RiskGuard(self.accounts[(exchange_id, key_id)]))
+        self.wake = threading.Event()
+        self.stopped = False
+        self.thread = None
+
+    def get(self, exchange_id, key_id):
+        return self.accounts[(exchange_id, key_id)]
+
+    def check(self, exchange_id, key_id, symbol, side, amount, price):
+        """返回拒绝原因，通过时返回 None，例如提交算法母单前检查总量"""
+        return self.accounts[(exchange_id, key_id)].check(symbol, side, amount, price)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='risk-reconcile', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped = True
+        self.wake.set()
+
+    def reconcile(self, force=False):
+        """对有下单记录且快照过期(或需要尽快对账)的账户获取余额"""
+        interval = self.config['reconcile_interval']
+        now = time.time()
+        for exposure in self.accounts.values():
+            if self.stopped:
+                break
+            stale = exposure.snapshot_time is None or now - exposure.snapshot_time >= interval
+            if not (force or exposure.needs_reconcile or (exposure.active and stale)):
+                continue
+            try:
+                # 结果经过调用器钩子写入模型
+                self.callers.get(exposure.exchange_id, exposure.key_id).call('fetch_balance')
+            except Exception as e:
+                log.warning(f"{exposure.exchange_id}/{exposure.key_id} 对账失败: {type(e).__name__}: {str(e)}")
+
+    def _run(self):
+        log.info("风控对账线程启动")
+        while not self.stopped:
+            # 有需要尽快对账的账户时缩短等待
+            urgent = any(exposure.needs_reconcile for exposure in self.accounts.values())
+            self.wake.wait(2.0 if urgent else min(self.config['reconcile_interval'], 10.0))
+            if self.stopped:
+                break
+            self.reconcile()
+        log.info("风控对账线程已停止")
+
+
+def bench(checks):
+    """测量一次下单前检查的耗时"""
+    exposure = AccountExposure('bench', 'main', dict(DEFAULT_RISK_CONFIG, max_order_notional=1e6,
+                                                     max_open_notional=1e7, max_position={'BTC': 100.0}))
+    exposure.apply_balance({'free': {'BTC': 10.0, 'USDT': 1e6}, 'total': {'BTC': 10.0, 'USDT': 1e6}}, time.time())
+    for i in range(1000):
+        exposure.record_order({'id': str(i), 'status': 'open', 'filled': 0}, 'BTC/USDT', 'buy', 0.01, 100.0,
+                              time.time())
+    started = time.perf_counter()
+    for i in range(checks):
+        exposure.check('BTC/USDT', 'buy' if i % 2 else 'sell', 0.01, 100.0)
+    elapsed = time.perf_counter() - started
+    print(f"{checks} 次检查，平均每次 {elapsed / checks * 1e6:.2f}us")
+    print(f"模型: {exposure.snapshot()} 可用 USDT {exposure.available('USDT'):.2f}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="测量下单前风控检查的耗时")
+    parser.add_argument('--checks', type=int, default=100000, help="检查次数")
+    args = parser.parse_args(argv)
+    return bench(args.checks)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,538 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import fcntl
+import signal
+import argparse
+import tempfile
+import threading
+import numpy as np
+from event_bus import TICKER
+import logger
+
+# 获取日志记录器
+log = logger.get_logger('shm_feed')
+
+# 共享行情段的默认位置，Linux 上放在内存文件系统中
+DEFAULT_FEED_PATH = '/dev/shm/simple_trade_feed' if os.path.isdir('/dev/shm') else os.path.join('data', 'market_feed.shm')
+
+# 默认参数，可通过配置 shm_feed 覆盖
+DEFAULT_FEED_CONFIG = {
+    'enabled': False,
+    'path': DEFAULT_FEED_PATH,
+    # 新建共享段时的交易对槽位数
+    'slots': 1024,
+    # 发布进程获取行情的间隔(秒)，也是读取端从共享段取行情的间隔
+    'interval': 1.0,
+    # 共享段中的行情超过该时间(秒)没有更新时，读取端自己向交易所请求
+    'max_age': 5.0,
+}
+
+MAGIC = b'STFEED01'
+# 版本 2 把 wanted 时间从槽位移到单独的区域
+FEED_VERSION = 2
+# 发布进程心跳超过该时间(秒)没有更新视为已退出
+HEARTBEAT_TIMEOUT = 5.0
+# 读取端超过该时间(秒)没有读取的交易对，发布进程不再获取
+WANT_TTL = 30.0
+# 读取时 wanted 时间早于该时间(秒)才重新写入，多个读取端读取同一交易对时大部分读取不产生写入
+WANT_REFRESH = 1.0
+# 超过该时间(秒)没有读取的槽位可以分配给新的交易对
+RECLAIM_AFTER = 600.0
+# 读取时连续遇到写入中的次数上限，超过视为发布进程在写入中途退出
+MAX_READ_RETRIES = 10000
+# 连续遇到写入中超过该次数后让出CPU，写入进程被抢占时不空转
+SPIN_BEFORE_YIELD = 64
+
+# 每个槽位保存的行情字段，与 ccxt 行情的字段名相同
+FIELDS = ('timestamp', 'last', 'bid', 'ask', 'bidVolume', 'askVolume', 'high', 'low', 'open',
+          'baseVolume', 'quoteVolume', 'percentage')
+
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<u4'),
+    ('slots', '<u4'),
+    ('heartbeat', '<f8'),
+    ('publisher', '<u4'),
+    ('pad', 'u1', (36,)),
+])
+
+# 每个槽位 192 字节(64字节的整数倍)，不同交易对的写入不会落在同一缓存行。
+# 槽位只由发布进程写入(键只在分配时写入)，读取端只读
+SLOT_DTYPE = np.dtype([
+    ('seq', '<u8'),
+    ('updated', '<f8'),
+    ('key', 'S40'),
+    ('values', '<f8', (len(FIELDS),)),
+    ('pad', 'u1', (40,)),
+])
+# 读取端写入的 wanted 时间放在槽位之后的单独区域，每个槽位独占一个64字节缓存行，
+# 读取端的写入不会让发布进程和其他读取端正在访问的序号所在缓存行失效
+WANT_DTYPE = np.dtype([
+    ('wanted', '<f8'),
+    ('pad', 'u1', (56,)),
+])
+# 槽位内各字段相对序号的字偏移
+UPDATED_WORD = SLOT_DTYPE.fields['updated'][1] // 8
+KEY_OFFSET = SLOT_DTYPE.fields['key'][1]
+KEY_SIZE = SLOT_DTYPE['key'].itemsize
+HEARTBEAT_WORD = HEADER_DTYPE.fields['heartbeat'][1] // 8
+VALUES_WORD = SLOT_DTYPE.fields['values'][1] // 8
+
+
+def feed_key(exchange_id, symbol):
+    """槽位的键，行情是公开数据，不区分账户"""
+    key = f"{exchange_id}|{symbol}".encode('utf-8')
+    if len(key) > KEY_SIZE:
+        raise ValueError(f"交易对名称过长，无法放入共享行情段: {exchange_id} {symbol}")
+    return key
+
+
+class SharedFeed:
+    """
+    内存映射的共享行情段，同一台机器上的多个交易界面共用一个行情来源。
+    文件由定长的头部和交易对槽位组成，每个槽位用序号锁(seqlock)保护:
+    发布进程写入前把序号加一(奇数表示写入中)，写完再加一；读取端在读取前后比较序号，
+    不一致或为奇数时重试。读取只访问映射的内存，没有系统调用和反序列化。
+
+    槽位由读取端按需分配(加文件锁，只在第一次读取某个交易对时发生)，
+    读取时在槽位之外的区域写入 wanted 时间，发布进程只获取最近有人读取的交易对。
+    序号锁依赖 x86-64 的存储顺序，只有一个发布进程写入。
+    """
+
+    def __init__(self, path=DEFAULT_FEED_PATH, slots=DEFAULT_FEED_CONFIG['slots']):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._file = open(path, 'a+b')
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+            if size >= HEADER_DTYPE.itemsize and self._stale_version():
+                log.info(f"共享行情段 {path} 是旧版本且没有发布进程，重新创建")
+                self._file.truncate(0)
+                size = 0
+            if size < HEADER_DTYPE.itemsize:
+                self._file.truncate(HEADER_DTYPE.itemsize + slots * (SLOT_DTYPE.itemsize + WANT_DTYPE.itemsize))
+                header = np.memmap(path, dtype=HEADER_DTYPE, mode='r+', shape=(1,))
+                header['magic'], header['version'], header['slots'] = MAGIC, FEED_VERSION, slots
+                header.flush()
+                del header
+                log.info(f"已创建共享行情段 {path}，{slots} 个槽位")
+            self._map()
+        finally:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self.index = {}
+
+    def _stale_version(self):
+        """文件是其他版本的共享行情段且发布进程已退出，可以按当前版本重新创建"""
+        header = np.memmap(self.path, dtype=HEADER_DTYPE, mode='r', shape=(1,))
+        try:
+            return (header['magic'][0] == MAGIC and header['version'][0] != FEED_VERSION
+                    and time.time() - float(header['heartbeat'][0]) >= HEARTBEAT_TIMEOUT)
+        finally:
+            del header
+
+    def _map(self):
+        raw = np.memmap(self.path, dtype=np.uint8, mode='r+')
+        self.header = raw[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)
+        if self.header['magic'][0] != MAGIC or self.header['version'][0] != FEED_VERSION:
+            raise ValueError(f"{self.path} 不是可识别的共享行情段")
+        count = int(self.header['slots'][0])
+        slots_end = HEADER_DTYPE.itemsize + count * SLOT_DTYPE.itemsize
+        end = slots_end + count * WANT_DTYPE.itemsize
+        if len(raw) < end:
+            raise ValueError(f"共享行情段 {self.path} 长度不足")
+        self.raw = raw
+        self.slots = raw[HEADER_DTYPE.itemsize:slots_end].view(SLOT_DTYPE)
+        self.updated = self.slots['updated']
+        self.wanted_at = raw[slots_end:end].view(WANT_DTYPE)['wanted']
+        self._wanted_base = slots_end // 8
+        self.keys = self.slots['key']
+        # 热路径按8字节字直接读写映射的内存，numpy 标量索引的开销比读取本身大一个数量级
+        self.bytes = memoryview(raw).cast('B')
+        self.words = self.bytes.cast('Q')
+        self.doubles = self.bytes.cast('d')
+
+    @staticmethod
+    def _word(index):
+        """槽位序号所在的字下标，行情字段紧随其后"""
+        return (HEADER_DTYPE.itemsize + index * SLOT_DTYPE.itemsize) // 8
+
+    def _wanted_word(self, index):
+        """槽位 wanted 时间所在的字下标"""
+        return self._wanted_base + index * (WANT_DTYPE.itemsize // 8)
+
+    def close(self):
+        self._file.close()
+
+    # ---- 槽位分配 ----
+
+    def find(self, key):
+        """已分配给 key 的槽位，没有时返回 None"""
+        index = self.index.get(key)
+        if index is not None:
+            # 槽位可能已被回收给其他交易对，确认键没有变化
+            offset = self._word(index) * 8 + KEY_OFFSET
+            if self.bytes[offset:offset + KEY_SIZE] == key.ljust(KEY_SIZE, b'\0'):
+                return index
+        matches = np.flatnonzero(self.keys == key)
+        if len(matches) == 0:
+            self.index.pop(key, None)
+            return None
+        self.index[key] = index = int(matches[0])
+        return index
+
+    def claim(self, key):
+        """返回 key 的槽位，没有时分配一个空闲或长期无人读取的槽位，槽位用完时返回 None"""
+        index = self.find(key)
+        if index is not None:
+            return index
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        try:
+            matches = np.flatnonzero(self.keys == key)
+            if len(matches):
+                index = int(matches[0])
+            else:
+                free = np.flatnonzero(self.keys == b'')
+                if len(free) == 0:
+                    free = np.flatnonzero(self.wanted_at < time.time() - RECLAIM_AFTER)
+                if len(free) == 0:
+                    log.warning(f"共享行情段 {self.path} 的槽位已用完")
+                    return None
+                index = int(free[0])
+                # 先清空旧数据再写入新键，读取端看到新键时不会读到其他交易对的行情
+                self.updated[index] = 0
+                self.wanted_at[index] = time.time()
+                self.keys[index] = key
+        finally:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self.index[key] = index
+        return index
+
+    # ---- 发布端 ----
+
+    def heartbeat(self):
+        self.header['heartbeat'] = time.time()
+        self.header['publisher'] = os.getpid()
+
+    def publisher_alive(self, now=None):
+        return (now or time.time()) - self.doubles[HEARTBEAT_WORD] < HEARTBEAT_TIMEOUT
+
+    def write(self, index, values, now=None):
+        """按序号锁写入一个槽位，只能由发布进程调用"""
+        word = self._word(index)
+        start = word + VALUES_WORD
+        words = self.words
+        words[word] += 1
+        self.doubles[start:start + len(FIELDS)] = memoryview(values)
+        self.doubles[word + UPDATED_WORD] = now or time.time()
+        words[word] += 1
+
+    def publish(self, exchange_id, symbol, ticker, now=None):
+        """把一条 ccxt 行情写入对应槽位，槽位不存在时分配；now 为行情获取的时间，默认当前时间"""
+        index = self.claim(feed_key(exchange_id, symbol))
+        if index is None:
+            return False
+        self.write(index, np.array([ticker.get(field) for field in FIELDS], dtype=float), now)
+        return True
+
+    def wanted(self, now=None):
+        """最近有读取端读取的 (交易所, 交易对) 集合"""
+        now = now or time.time()
+        active = np.flatnonzero((self.keys != b'') & (self.wanted_at > now - WANT_TTL))
+        result = set()
+        for index in active:
+            exchange_id, _, symbol = self.keys[index].decode('utf-8').partition('|')
+            result.add((exchange_id, symbol))
+        return result
+
+    # ---- 读取端 ----
+
+    def read_into(self, index, out):
+        """
+        按序号锁把槽位的行情字段复制到 out(长度为 len(FIELDS) 的 float64 memoryview)，返回读到的序号；
+        发布进程在写入中途退出导致一直无法读到一致的数据时返回 None。
+        """
+        word = self._word(index)
+        start = word + VALUES_WORD
+        words = self.words
+        doubles = self.doubles
+        for attempt in range(MAX_READ_RETRIES):
+            before = words[word]
+            if not before & 1:
+                out[:] = doubles[start:start + len(FIELDS)]
+                if words[word] == before:
+                    return before
+            if attempt >= SPIN_BEFORE_YIELD:
+                os.sched_yield()
+        return None
+
+    def ticker(self, exchange_id, symbol, max_age=DEFAULT_FEED_CONFIG['max_age']):
+        """
+        读取一个交易对的行情，返回 ccxt 格式的字典。
+        没有发布进程、槽位中还没有数据或数据超过 max_age 秒时返回 None，由调用方自己请求交易所；
+        无论是否返回行情都会标记该交易对有人读取，发布进程随后开始获取。
+        """
+        try:
+            index = self.claim(feed_key(exchange_id, symbol))
+        except ValueError:
+            return None
+        if index is None:
+            return None
+        now = time.time()
+        word = self._word(index)
+        doubles = self.doubles
+        wanted = self._wanted_word(index)
+        # 先读后写，缓存行保持共享状态，只有 wanted 时间过期时才写入
+        if now - doubles[wanted] > WANT_REFRESH:
+            doubles[wanted] = now
+        if not self.publisher_alive(now) or now - doubles[word + UPDATED_WORD] > max_age:
+            return None
+        out = np.empty(len(FIELDS))
+        if self.read_into(index, memoryview(out)) is None:
+            return None
+        ticker = {field: (None if value != value else value) for field, value in zip(FIELDS, out.tolist())}
+        if ticker['timestamp'] is not None:
+            ticker['timestamp'] = int(ticker['timestamp'])
+        ticker['symbol'] = symbol
+        ticker['close'] = ticker['last']
+        return ticker
+
+    def status(self):
+        """已分配槽位的状态，用于命令行查看"""
+        now = time.time()
+        rows = []
+        for index in np.flatnonzero(self.keys != b''):
+            out = np.empty(len(FIELDS))
+            seq = self.read_into(index, memoryview(out))
+            rows.append({'key': self.keys[index].decode('utf-8'), 'seq': seq,
+                         'age': now - float(self.updated[index]), 'wanted': now - float(self.wanted_at[index]),
+                         'last': float(out[FIELDS.index('last')])})
+        return rows
+
+
+class FeedPublisher:
+    """
+    共享行情段的发布端。
+    读取端标记需要的交易对由数据轮询线程作为额外行情获取(每个交易所使用第一个账户)，
+    获取到的行情经事件总线写入共享段，同时定期更新心跳。
+    槽位的更新时间取事件的时间，超过 max_age 秒的旧行情不写入，其他读取端不会把旧行情当作实时行情。
+    """
+
+    def __init__(self, feed, bus, poller, accounts, interval=DEFAULT_FEED_CONFIG['interval'],
+                 max_age=DEFAULT_FEED_CONFIG['max_age']):
+        self.feed = feed
+        self.bus = bus
+        self.poller = poller
+        self.accounts = accounts
+        self.interval = interval
+        self.max_age = max_age
+        self.published = 0
+        self.stopped = threading.Event()
+        self.thread = None
+        self.subscription = None
+
+    def watched(self):
+        """数据轮询线程的额外行情来源"""
+        return {(exchange_id, self.accounts[exchange_id], symbol)
+                for exchange_id, symbol in self.feed.wanted() if exchange_id in self.accounts}
+
+    def start(self):
+        self.subscription = self.bus.subscribe('shm_feed', (TICKER,))
+        self.poller.set_watch(self.watched)
+        self.feed.heartbeat()
+        self.thread = threading.Thread(target=self._run, name='shm-feed', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+        if self.subscription is not None:
+            self.subscription.close()
+
+    def _run(self):
+        log.info(f"共享行情发布启动: {self.feed.path}")
+        while not self.stopped.is_set():
+            for event in self.subscription.get(timeout=1.0):
+                if event.age() > self.max_age:
+                    continue
+                try:
+                    if self.feed.publish(event.exchange, event.symbol, event.data, now=event.timestamp):
+                        self.published += 1
+                except (ValueError, TypeError) as e:
+                    log.warning(f"写入共享行情 {event.exchange} {event.symbol} 失败: {str(e)}")
+            self.feed.heartbeat()
+        log.info(f"共享行情发布已停止，共写入 {self.published} 条")
+
+
+def publish(path, interval, slots):
+    """作为独立进程运行发布端，按配置中的交易所获取读取端需要的行情，直到 Ctrl+C"""
+    from config import load_config
+    from exchange_factory import create_exchanges
+    from exchange_worker import WorkerPool
+    from resilience import ResilientPool
+    from event_bus import EventBus
+    from data_poller import DataPoller
+
+    config = load_config()
+    if not config:
+        print("错误: 无法加载配置文件!", file=sys.stderr)
+        return 2
+    # 同一个共享段只允许一个发布进程
+    lock_file = open(f"{path}.lock", 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        print(f"错误: 已有发布进程在写入 {path}", file=sys.stderr)
+        return 1
+
+    exchanges = create_exchanges(config)
+    accounts = {exchange_id: next(iter(keys)) for exchange_id, keys in exchanges.items() if keys}
+    workers = WorkerPool(exchanges)
+    callers = ResilientPool(workers, config.get('resilience'))
+    bus = EventBus()
+    poller = DataPoller(bus, callers, {TICKER: interval})
+    feed = SharedFeed(path, slots)
+    publisher = FeedPublisher(feed, bus, poller, accounts, interval)
+    signal.signal(signal.SIGTERM, lambda *_: publisher.stopped.set())
+    publisher.start()
+    poller.start()
+    print(f"正在向 {path} 发布行情，按 Ctrl+C 退出")
+    try:
+        while not publisher.stopped.wait(10):
+            log.info(f"共享行情: {len(publisher.watched())} 个交易对有人读取，已写入 {publisher.published} 条")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        poller.stop()
+        publisher.stop()
+        workers.stop()
+        feed.close()
+        lock_file.close()
+    return 0
+
+
+def _bench_writer(path, symbols, stop_at):
+    """基准测试的写入进程: 轮流更新所有槽位，每个槽位的所有字段写入同一个值，用于检查读到的数据是否一致"""
+    feed = SharedFeed(path)
+    indexes = [feed.claim(feed_key('bench', f"S{i}/USDT")) for i in range(symbols)]
+    row = np.empty(len(FIELDS))
+    writes = 0
+    while time.time() < stop_at:
+        for index in indexes:
+            writes += 1
+            row.fill(writes)
+            feed.write(index, row)
+        feed.heartbeat()
+    return writes
+
+
+def _bench_reader(path, symbols, stop_at, results, mode='read'):
+    """
+    基准测试的读取进程。mode 为 read 时只测序号锁读取，为 ticker 时测交易界面实际调用的 ticker()，
+    包括查找槽位、标记有人读取和转换为行情字典。
+    """
+    feed = SharedFeed(path)
+    names = [f"S{i}/USDT" for i in range(symbols)]
+    indexes = [feed.claim(feed_key('bench', name)) for name in names]
+    out = np.empty(len(FIELDS))
+    buffer = memoryview(out)
+    samples = np.empty(1 << 20, dtype=np.int64)
+    reads = torn = failed = 0
+    clock = time.perf_counter_ns
+    while time.time() < stop_at:
+        for index, name in zip(indexes, names):
+            started = clock()
+            if mode == 'ticker':
+                ticker = feed.ticker('bench', name)
+            else:
+                seq = feed.read_into(index, buffer)
+            elapsed = clock() - started
+            if (ticker is None) if mode == 'ticker' else (seq is None):
+                failed += 1
+                continue
+            if reads < len(samples):
+                samples[reads] = elapsed
+            reads += 1
+            values = [ticker[field] for field in FIELDS] if mode == 'ticker' else out
+            if min(values) != max(values):
+                torn += 1
+    samples = samples[:min(reads, len(samples))]
+    results.put({'reads': reads, 'torn': torn, 'failed': failed,
+                 'p50': float(np.percentile(samples, 50)) if reads else 0.0,
+                 'p99': float(np.percentile(samples, 99)) if reads else 0.0,
+                 'max': float(samples.max()) if reads else 0.0})
+
+
+def bench(readers, symbols, seconds, mode='read'):
+    """一个写入进程持续更新，多个读取进程同时读取，统计每次读取的耗时和是否读到不一致的数据"""
+    import multiprocessing
+
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else None
+    handle, path = tempfile.mkstemp(prefix='feed_bench_', dir=directory)
+    os.close(handle)
+    os.unlink(path)
+    try:
+        SharedFeed(path, slots=max(symbols, 16)).close()
+        stop_at = time.time() + seconds + 0.5
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=_bench_reader, args=(path, symbols, stop_at, results, mode))
+                     for _ in range(readers)]
+        writer = multiprocessing.Process(target=_bench_writer, args=(path, symbols, stop_at))
+        writer.start()
+        for process in processes:
+            process.start()
+        stats = [results.get() for _ in processes]
+        for process in processes + [writer]:
+            process.join()
+    finally:
+        os.unlink(path)
+
+    total = sum(s['reads'] for s in stats)
+    print(f"{readers} 个读取进程({'ticker()' if mode == 'ticker' else 'read_into()'}), {symbols} 个交易对,"
+          f" 写入进程持续更新, {seconds}s")
+    for i, s in enumerate(stats):
+        print(f"  读取进程{i}: {s['reads'] / seconds:,.0f} 次/秒 | p50 {s['p50']:.0f}ns p99 {s['p99']:.0f}ns"
+              f" max {s['max'] / 1000:.1f}µs | 不一致 {s['torn']} 失败 {s['failed']}")
+    print(f"合计 {total / seconds:,.0f} 次/秒, 不一致 {sum(s['torn'] for s in stats)}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="多个交易界面共用的共享内存行情段")
+    parser.add_argument('--path', default=DEFAULT_FEED_PATH, help="共享行情段文件")
+    sub = parser.add_subparsers(dest='command', required=True)
+    publish_parser = sub.add_parser('publish', help="运行发布进程")
+    publish_parser.add_argument('--interval', type=float, default=DEFAULT_FEED_CONFIG['interval'],
+                                help="获取行情的间隔(秒)")
+    publish_parser.add_argument('--slots', type=int, default=DEFAULT_FEED_CONFIG['slots'], help="新建时的槽位数")
+    sub.add_parser('status', help="查看共享段中的交易对")
+    bench_parser = sub.add_parser('bench', help="测量多个读取进程同时读取的延迟")
+    bench_parser.add_argument('--readers', type=int, default=8, help="读取进程数")
+    bench_parser.add_argument('--symbols', type=int, default=64, help="交易对数量")
+    bench_parser.add_argument('--seconds', type=float, default=3.0, help="测试时长")
+    bench_parser.add_argument('--mode', choices=['read', 'ticker'], default='read',
+                              help="read 只测序号锁读取，ticker 测完整的 ticker() 调用(含标记有人读取)")
+    args = parser.parse_args(argv)
+
+    if args.command == 'publish':
+        return publish(args.path, args.interval, args.slots)
+    if args.command == 'bench':
+        return bench(args.readers, args.symbols, args.seconds, args.mode)
+    if not os.path.exists(args.path):
+        print(f"{args.path} 不存在")
+        return 1
+    feed = SharedFeed(args.path)
+    print(f"发布进程: {'运行中' if feed.publisher_alive() else '未运行'}")
+    for row in feed.status():
+        quote = f"最新价 {row['last']:<14.8g} 更新于 {row['age']:.1f}s 前" if row['seq'] else "尚无行情"
+        print(f"  {row['key']:<40} {quote} | 读取于 {row['wanted']:.1f}s 前")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import math
+import time
+import random
+import itertools
+import threading
+from lazy_import import lazy_import
+import logger
+
+# 获取日志记录器
+log = logger.get_logger('sim_exchange')
+
+ccxt = lazy_import('ccxt')
+
+
+class SimExchange:
+    """
+    内存中的模拟交易所，接口与 SimpleTradeApp 和执行引擎用到的ccxt方法一致。
+    每次获取行情时价格随机游走一步，挂单在对手价穿越挂单价时按随机的可成交量部分或全部成交；
+    postOnly 订单会立即成交时按ccxt的约定抛出 OrderImmediatelyFillable。
+    用于离线演示和验证执行算法，不发起任何网络请求。
+    """
+
+    def __init__(self, exchange_id='sim', symbols=('BTC/USDT',), price=100.0, volatility=0.001,
+                 liquidity=5.0, latency=0.0, seed=None):
+        self.id = exchange_id
+        self.random = random.Random(seed)
+        self.volatility = volatility
+        self.liquidity = liquidity
+        self.latency = latency
+        self.has = {'fetchOHLCV': False, 'fetchTime': True, 'fetchTickers': True, 'fetchTrades': True,
+                    'fetchOrderBook': True, 'fetchOrder': True, 'fetchOpenOrders': True, 'fetchMyTrades': True}
+        # 精度按步长表示，与ccxt的 TICK_SIZE、NO_PADDING 取值一致
+        self.precisionMode = 4
+        self.paddingMode = 5
+        self.markets = {}
+        self.prices = {}
+        for symbol in symbols:
+            base, quote = symbol.split('/')
+            self.markets[symbol] = {
+                'symbol': symbol, 'base': base, 'quote': quote,
+                'precision': {'price': 0.01, 'amount': 0.001},
+                'limits': {'amount': {'min': 0.001}, 'price': {}, 'cost': {'min': 5.0}},
+                'taker': 0.001, 'maker': 0.001,
+            }
+            self.prices[symbol] = price
+        self.orders = {}
+        self.trades = []
+        self.public_trade_ids = itertools.count(1)
+        self.balance = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.RLock()
+
+    def __str__(self):
+        return f"SimExchange({self.id})"
+
+    def _sleep(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    # 市场信息和精度
+
+    def load_markets(self, reload=False):
+        return self.markets
+
+    def set_markets(self, markets):
+        self.markets = {m['symbol']: m for m in markets}
+
+    def market(self, symbol):
+        if symbol not in self.markets:
+            raise ccxt.BadSymbol(f"{self.id} 不存在交易对 {symbol}")
+        return self.markets[symbol]
+
+    def price_to_precision(self, symbol, price):
+        tick = self.market(symbol)['precision']['price']
+        return f"{round(price / tick) * tick:.10g}"
+
+    def amount_to_precision(self, symbol, amount):
+        # 与ccxt默认行为一致，数量按步长截断
+        step = self.market(symbol)['precision']['amount']
+        return f"{math.floor(amount / step + 1e-9) * step:.10g}"
+
+    # 行情和撮合
+
+    def _book(self, symbol):
+        tick = self.market(symbol)['precision']['price']
+        price = self.prices[symbol]
+        return round(price - tick, 10), round(price + tick, 10)
+
+    def advance(self, symbol):
+        """价格随机游走一步，并撮合挂单"""
+        with self.lock:
+            tick = self.market(symbol)['precision']['price']
+            price = self.prices[symbol] * math.exp(self.random.gauss(0, self.volatility))
+            self.prices[symbol] = max(tick * 2, round(price / tick) * tick)
+            self._match(symbol)
+
+    def _match(self, symbol):
+        bid, ask = self._book(symbol)
+        for order in list(self.orders.values()):
+            if order['symbol'] != symbol or order['status'] != 'open':
+                continue
+            crossed = order['price'] >= ask if order['side'] == 'buy' else order['price'] <= bid
+            if crossed:
+                self._fill(order, min(order['remaining'], self.random.uniform(0.2, 1.0) * self.liquidity))
+
+    def _fill(self, order, amount):
+        step = self.market(order['symbol'])['precision']['amount']
+        amount = min(order['remaining'], max(step, round(amount / step) * step))
+        if amount <= 0:
+            return
+        order['filled'] = round(order['filled'] + amount, 10)
+        order['remaining'] = round(order['amount'] - order['filled'], 10)
+        order['cost'] = order.get('cost', 0.0) + amount * order['price']
+        order['average'] = order['cost'] / order['filled']
+        if order['remaining'] <= step / 2:
+            order['remaining'] = 0.0
+            order['status'] = 'closed'
+        now = int(time.time() * 1000)
+        self.trades.append({
+            'id': f"t{len(self.trades) + 1}", 'order': order['id'], 'symbol': order['symbol'], 'side': order['side'],
+            'price': order['price'], 'amount': amount, 'cost': amount * order['price'], 'timestamp': now,
+            'fee': {'cost': amount * order['price'] * 0.001, 'currency': order['symbol'].split('/')[1]},
+        })
+        base, quote = order['symbol'].split('/')
+        sign = 1 if order['side'] == 'buy' else -1
+        self.balance[base] = self.balance.get(base, 0.0) + sign * amount
+        self.balance[quote] = self.balance.get(quote, 0.0) - sign * amount * order['price']
+
+    def fetch_ticker(self, symbol):
+        self._sleep()
+        self.advance(symbol)
+        with self.lock:
+            bid, ask = self._book(symbol)
+            return {'symbol': symbol, 'last': self.prices[symbol], 'bid': bid, 'ask': ask,
+                    'timestamp': int(time.time() * 1000)}
+
+    def fetch_tickers(self, symbols=None):
+        """全部(或指定)交易对的行情，每个交易对的价格各游走一步"""
+        return {symbol: self.fetch_ticker(symbol) for symbol in (symbols or list(self.markets))}
+
+    def fetch_order_book(self, symbol, limit=None):
+        """以当前买一、卖一为起点按最小价格单位排列的盘口，每档数量随机"""
+        self._sleep()
+        self.advance(symbol)
+        depth = limit or 20
+        with self.lock:
+            tick = self.market(symbol)['precision']['price']
+            bid, ask = self._book(symbol)
+            bids = [[round(bid - i * tick, 10), round(self.random.uniform(0.1, 1.0) * self.liquidity, 3)]
+                    for i in range(depth)]
+            asks = [[round(ask + i * tick, 10), round(self.random.uniform(0.1, 1.0) * self.liquidity, 3)]
+                    for i in range(depth)]
+        now = int(time.time() * 1000)
+        return {'symbol': symbol, 'bids': bids, 'asks': asks, 'timestamp': now, 'nonce': None}
+
+    def fetch_trades(self, symbol, since=None, limit=None):
+        """公开成交: 每次调用在当前价附近生成几笔新成交"""
+        self._sleep()
+        self.advance(symbol)
+        now = int(time.time() * 1000)
+        with self.lock:
+            price = self.prices[symbol]
+            trades = []
+            for _ in range(self.random.randint(1, 5)):
+                amount = round(self.random.uniform(0.001, 0.2) * self.liquidity, 3)
+                trades.append({'id': str(next(self.public_trade_ids)), 'symbol': symbol, 'timestamp': now,
+                               'side': self.random.choice(('buy', 'sell')), 'price': price, 'amount': amount,
+                               'cost': price * amount})
+        return trades[:limit] if limit else trades
+
+    def fetch_time(self):
+        return int(time.time() * 1000)
+
+    # 订单
+
+    def create_limit_order(self, symbol, side, amount, price, params=None):
+        self._sleep()
+        params = params or {}
+        market = self.market(symbol)
+        amount = float(self.amount_to_precision(symbol, amount))
+        price = float(self.price_to_precision(symbol, price))
+        if amount < market['limits']['amount']['min'] or amount * price < market['limits']['cost']['min']:
+            raise ccxt.InvalidOrder(f"订单数量 {amount} 或金额 {amount * price:.4f} 低于最小限额")
+        with self.lock:
+            bid, ask = self._book(symbol)
+            crossing = price >= ask if side == 'buy' else price <= bid
+            if crossing and params.get('postOnly'):
+                raise ccxt.OrderImmediatelyFillable(f"postOnly 订单 {side} {price} 会立即成交")
+            order = {'id': str(next(self.ids)), 'symbol': symbol, 'type': 'limit', 'side': side,
+                     'price': price, 'amount': amount, 'filled': 0.0, 'remaining': amount, 'cost': 0.0,
+                     'average': None, 'status': 'open', 'timestamp': int(time.time() * 1000),
+                     'postOnly': bool(params.get('postOnly'))}
+            self.orders[order['id']] = order
+            if crossing:
+                self._fill(order, self.liquidity)
+            return dict(order)
+
+    def fetch_order(self, id, symbol=None):
+        self._sleep()
+        with self.lock:
+            if id not in self.orders:
+                raise ccxt.OrderNotFound(f"订单 {id} 不存在")
+            return dict(self.orders[id])
+
+    def cancel_order(self, id, symbol=None):
+        self._sleep()
+        with self.lock:
+            order = self.orders.get(id)
+            if order is None or order['status'] != 'open':
+                raise ccxt.OrderNotFound(f"订单 {id} 不存在或已完成")
+            order['status'] = 'canceled'
+            return dict(order)
+
+    def fetch_open_orders(self, symbol=None):
+        with self.lock:
+            return [dict(o) for o in self.orders.values()
+                    if o['status'] == 'open' and (symbol is None or o['symbol'] == symbol)]
+
+    def fetch_my_trades(self, symbol=None, since=None, limit=None):
+        with self.lock:
+            trades = [dict(t) for t in self.trades
+                      if (symbol is None or t['symbol'] == symbol) and (since is None or t['timestamp'] >= since)]
+        return trades[:limit] if limit else trades
+
+    def fetch_balance(self):
+        with self.lock:
+            balance = {'free': dict(self.balance), 'used': {}, 'total': dict(self.balance)}
+            for currency, amount in self.balance.items():
+                balance[currency] = {'free': amount, 'used': 0.0, 'total': amount}
+            return balance
@@ -1,25 +1,99 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import math
-import os
-import sys
-import csv
-import time
-import json
-import ccxt
-import asyncio
-import curses
-from datetime import datetime, timedelta
-from config import load_config
-import logger
+import startup_profiler
+
+with startup_profiler.phase('导入模块'):
+    import math
+    import os
+    import sys
+    import csv
+    import time
+    import json
+    import threading
+    import argparse
+    import asyncio
+    import curses
+    from datetime import datetime, timedelta
+    from concurrent.futures import ThreadPoolExecutor
+    from config import load_config
+    from exchange_factory import create_exchanges
+    from batch_order import run_batch
+    from trade_client import create_remote_exchanges
+    from exchange_worker import WorkerPool, DEFAULT_THREADS, DEFAULT_TIMEOUT, format_health
+    from resilience import ResilientPool, format_breaker
+    from notifications import NotificationCenter
+    from list_view import ListView, ListSource, PagedSource
+    from event_bus import EventBus, TICKER, BALANCE, ORDER, FILL
+    from data_poller import DataPoller, CADENCE_LABELS
+    from execution_engine import ExecutionEngine, format_parent, STATUS_LABELS
+    from triggers import TriggerManager, format_trigger, ALERT, ABOVE, KIND_LABELS
+    from triggers import STATUS_LABELS as TRIGGER_STATUS_LABELS
+    from traffic_capture import TrafficRecorder, wrap_exchanges, create_replay_exchanges
+    from risk import RiskManager
+    from basket import BasketRunner, Leg, format_leg, format_result
+    from basket import STATUS_LABELS as LEG_STATUS_LABELS
+    from fee_cache import FeeCache, estimate_order, format_estimate
+    from workspace import load_workspace, save_workspace, remember_symbol, recent_symbols
+    from lazy_import import lazy_import
+    import logger
+
+# K线(numpy)和持仓分析(pandas)模块较重，第一次用到时才导入
+ohlcv_store = lazy_import('ohlcv_store')
+analytics = lazy_import('analytics')
+# 价差扫描同样依赖 numpy，打开扫描页面时才导入
+spread_scanner = lazy_import('spread_scanner')
+# 共享内存行情段同样依赖 numpy，只在启用时导入
+shm_feed = lazy_import('shm_feed')
 
 # 获取日志记录器
 log = logger.get_logger('simple_trade')
 
+# 等待按键的轮询间隔(毫秒)，超时后重绘界面以便消息自动过期
+UI_POLL_MS = 500
+# 没有按键时交易界面的数据刷新间隔(秒)，可通过配置 ui.refresh_interval 覆盖
+DEFAULT_REFRESH_INTERVAL = 5.0
+# 交易界面两次重绘的最短间隔(毫秒)，按住按键时这段时间内的调整合并处理，可通过配置 ui.frame_ms 覆盖
+DEFAULT_FRAME_MS = 50
+# 可以合并的调整按键: 按键 -> (调整项, 步数)
+ADJUST_KEYS = {curses.KEY_UP: ('price', 1), curses.KEY_DOWN: ('price', -1),
+               ord('a'): ('amount', 1), ord('z'): ('amount', -1)}
+# 空格键的执行方式，x 键循环切换
+EXECUTION_MODES = ['limit', 'twap', 'iceberg', 'chase']
+EXECUTION_MODE_LABELS = {'limit': '限价单', 'twap': 'TWAP', 'iceberg': '冰山单', 'chase': '追价(只做Maker)'}
+
+# 成交历史每页一天，最多向前加载的天数
+HISTORY_MAX_DAYS = 30
+# 获取一天成交时每次请求的条数，返回不足该条数时认为这一天已取完
+HISTORY_FETCH_LIMIT = 100
+
+# K线面板默认参数，可通过配置 ohlcv 覆盖
+DEFAULT_OHLCV_CONFIG = {'timeframe': '1m', 'refresh': 30, 'limit': 500}
+
 
 class SimpleTradeApp:
-    def __init__(self):
-        self.config = load_config()
+    def __init__(self, server_url=None, capture=None, replay=None, replay_speed=1.0, resume=True,
+                 shared_feed=False):
+        with startup_profiler.phase('加载配置'):
+            self.config = load_config()
+            logger.configure((self.config or {}).get('logging'))
+            # 上次退出时的工作区，启动后直接恢复交易界面
+            self.workspace = load_workspace() or {}
+        self.resume = resume
+        self.recent = self.workspace.get('recent', {})
+        self.current_market = None
+        # 交易界面显示的是恢复的缓存数据，收到实时行情后清除
+        self.showing_cache = False
+        # 恢复的缓存行情，只给交易界面显示，不发布到事件总线
+        self.cached_ticker = None
+        # 恢复工作区后市场信息尚未经过后台重新加载确认，以及重新加载失败的原因
+        self.market_pending = False
+        self.market_error = None
+        self.first_frame = False
+        self.server_url = server_url
+        self.replay = replay
+        self.replay_speed = replay_speed
+        # 录制模式下所有交易所调用经过录制器写入压缩日志
+        self.recorder = TrafficRecorder(capture) if capture else None
         self.exchanges = {}
         self.current_exchange = None
         self.current_api_key = None
@@ -28,10 +102,77 @@ class SimpleTradeApp:
         self.amount = 0
         self.stdscr = None
         log.info("初始化交易应用程序")
-        self.init_exchanges()
+        with startup_profiler.phase('初始化交易所'):
+            self.init_exchanges()
+        with startup_profiler.phase('启动工作线程'):
+            worker_config = self.config.get('worker', {})
+            self.workers = WorkerPool(self.exchanges,
+                                      threads=worker_config.get('threads', DEFAULT_THREADS),
+                                      timeout=worker_config.get('timeout', DEFAULT_TIMEOUT))
+            self.callers = ResilientPool(self.workers, self.config.get('resilience'))
+            # 下单前风控: 敞口模型由账户调用器的结果增量更新，检查不访问交易所
+            self.risk = RiskManager(self.callers, self.config.get('risk'))
+            # 行情、余额、挂单和成交由轮询线程统一获取后发布，各界面订阅使用
+            self.bus = EventBus()
+            intervals = dict({TICKER: self.config.get('ui', {}).get('refresh_interval', DEFAULT_REFRESH_INTERVAL)},
+                             **self.config.get('events', {}).get('intervals', {}))
+            self.poller = DataPoller(self.bus, self.callers, intervals,
+                                     adaptive=self.config.get('events', {}).get('adaptive'))
+            # 持仓分析订阅成交事件，页面打开前到达的成交在队列中等待合并
+            self.fill_events = self.bus.subscribe('analytics', (FILL,))
+        self.shared_feed = None
+        if (shared_feed or self.config.get('shm_feed', {}).get('enabled')) and not self.replay:
+            with startup_profiler.phase('连接共享行情段'):
+                self.attach_shared_feed()
         self.price_multiplier = 1
         self.amount_multiplier = 1
         self.trade_side = 'buy'  # 默认交易方向为买入
+        self.ohlcv_config = dict(DEFAULT_OHLCV_CONFIG, **self.config.get('ohlcv', {}))
+        self.ohlcv_store = None
+        self.ohlcv_future = None
+        self.ohlcv_next_refresh = 0
+        # 第一次进入持仓分析页面时创建
+        self.trade_analytics = None
+        # 第一次打开价差扫描页面时创建，之后保留数组，刷新只重算变化的交易对
+        self.spread_scanner = None
+        self.notifications = NotificationCenter(ttl=self.config.get('notifications', {}).get('ttl'))
+        self.refresh_interval = self.config.get('ui', {}).get('refresh_interval', DEFAULT_REFRESH_INTERVAL)
+        self.frame_interval = self.config.get('ui', {}).get('frame_ms', DEFAULT_FRAME_MS) / 1000
+        # 大单拆分执行，母单在后台运行，不阻塞界面
+        self.engine = ExecutionEngine(self.exchanges, self.callers, self.config.get('execution'),
+                                      on_update=self.on_algo_update)
+        self.execution_mode = 'limit'
+        # 止损、止盈和价格提醒保存在本地，按行情触发，等待触发的交易对由轮询线程额外获取行情
+        self.triggers = TriggerManager(self.bus, self.callers, self.config.get('triggers'),
+                                       on_fire=self.on_trigger_fired)
+        self.poller.set_watch(self.triggers.watched)
+        # 组合单: 在各账户界面逐条添加腿，最后同时提交
+        self.basket = []
+        self.basket_runner = BasketRunner(self.exchanges, self.callers, self.config.get('basket'))
+        self.basket_cancel_on_failure = self.basket_runner.config['cancel_on_failure']
+        self.basket_running = False
+        # 算法单或组合单在执行时数据轮询按快速节奏进行
+        self.poller.set_activity(
+            lambda: self.basket_running or any(p.status == 'running' for p in self.engine.orders()))
+        # 按账户缓存的交易费率，交易界面的金额和手续费预估只读本地缓存
+        self.fee_cache = FeeCache(self.exchanges, self.callers, self.config.get('fees'))
+
+    def attach_shared_feed(self):
+        """
+        连接同一台机器上的共享内存行情段。发布进程(python shm_feed.py publish)运行时，
+        行情直接从共享段读取，多个交易界面只消耗一份交易所行情请求；发布进程不在或数据过期时照常请求交易所。
+        """
+        config = dict(shm_feed.DEFAULT_FEED_CONFIG, **self.config.get('shm_feed', {}))
+        try:
+            feed = shm_feed.SharedFeed(config['path'], config['slots'])
+        except (OSError, ValueError) as e:
+            log.error(f"连接共享行情段 {config['path']} 失败: {str(e)}")
+            return
+        max_age = config['max_age']
+        self.shared_feed = feed
+        self.poller.set_ticker_source(lambda exchange_id, key_id, symbol: feed.ticker(exchange_id, symbol, max_age),
+                                      config['interval'])
+        log.info(f"已连接共享行情段 {config['path']}，发布进程{'运行中' if feed.publisher_alive() else '未运行'}")
 
     def init_exchanges(self):
         """
@@ -41,38 +182,47 @@ class SimpleTradeApp:
         最后检查是否成功初始化了任何交易所，并输出相应日志。
         """
         log.info("开始初始化交易所连接")
-        for exchange_id, keys in self.config['exchanges'].items():
-            for key_id, key_data in keys.items():
-                try:
-                    log.debug(f"正在初始化交易所 {exchange_id} 账户 {key_id}")
-                    exchange_class = getattr(ccxt, exchange_id)
-                    exchange = exchange_class({
-                        'apiKey': key_data['apiKey'],
-                        'secret': key_data['secret'],
-                        'password': key_data.get('password', ''),
-                        'enableRateLimit': True,
-                    })
-
-                    # 从配置中读取测试网模式和代理
-                    exchange.set_sandbox_mode(self.config.get('sandbox_mode', False))
-                    exchange.proxies = self.config.get('proxies', {})
-
-                    if not exchange_id in self.exchanges:
-                        self.exchanges[exchange_id] = {}
-                    self.exchanges[exchange_id][key_id] = exchange
-                    log.info(f"成功初始化交易所 {exchange_id} 账户 {key_id}")
-                except ccxt.NetworkError as e:
-                    log.error(f"网络错误导致初始化{exchange_id}交易所失败: {str(e)}", exc_info=True)
-                except ccxt.AuthenticationError as e:
-                    log.error(f"API密钥错误导致初始化{exchange_id}交易所失败: {str(e)}", exc_info=True)
-                except Exception as e:
-                    log.error(f"初始化{exchange_id}交易所失败: {str(e)}", exc_info=True)
+        if self.replay:
+            # 回放模式: 交易所调用由录制文件应答，不连接网络
+            try:
+                self.exchanges = create_replay_exchanges(self.replay, self.replay_speed)
+            except (OSError, ValueError) as e:
+                log.error(f"读取录制文件 {self.replay} 失败: {str(e)}", exc_info=True)
+                self.exchanges = {}
+        elif self.server_url:
+            # 作为交易守护进程的瘦客户端运行，交易所连接和缓存由守护进程统一持有
+            try:
+                tokens = (self.config or {}).get('server', {}).get('tokens')
+                self.exchanges = create_remote_exchanges(self.server_url, tokens)
+            except Exception as e:
+                log.error(f"连接交易守护进程 {self.server_url} 失败: {str(e)}", exc_info=True)
+                self.exchanges = {}
+        else:
+            # 恢复工作区时延迟创建交易所实例，ccxt 在工作线程里第一次请求时才导入，不拖慢首屏
+            resuming = self.resume and self.workspace.get('resumable', False)
+            self.exchanges = create_exchanges(self.config, deferred=resuming)
+        if self.recorder is not None:
+            self.exchanges = wrap_exchanges(self.exchanges, self.recorder)
 
         if not self.exchanges:
             log.warning("没有成功初始化任何交易所，请检查配置")
         else:
             log.info(f"成功初始化 {len(self.exchanges)} 个交易所")
 
+    def call(self, method, *args, timeout=None, **kwargs):
+        """
+        通过当前账户的工作线程调用交易所接口，带按接口的截止时间、只读接口重试和对冲，以及账户熔断。
+
+        参数:
+            method (str): 交易所实例的方法名。
+            timeout (float, optional): 截止时间(秒)，默认使用 resilience.deadlines 配置。
+
+        返回:
+            交易所接口的返回值；超时抛出 DeadlineExceeded，熔断时抛出 CircuitOpenError。
+        """
+        caller = self.callers.get(self.current_exchange, self.current_api_key)
+        return caller.call(method, *args, timeout=timeout, **kwargs)
+
     def select_exchange_and_key(self):
         """选择交易所和API密钥"""
         if not self.exchanges:
@@ -116,12 +266,14 @@ class SimpleTradeApp:
 
     def select_symbol(self):
         """选择交易产品"""
-        exchange = self.exchanges[self.current_exchange][self.current_api_key]
-
         try:
             log.info(f"正在加载 {self.current_exchange} 的交易产品列表")
-            markets = exchange.load_markets()
-            symbols = list(markets.keys())
+            markets = self.call('load_markets')
+            # 该账户最近使用的交易对排在最前面
+            recent = [s for s in recent_symbols(self.recent, self.current_exchange, self.current_api_key)
+                      if s in markets]
+            recent_set = set(recent)
+            symbols = recent + [s for s in markets.keys() if s not in recent_set]
             log.info(f"成功加载 {len(symbols)} 个交易产品")
 
             selected = 0
@@ -149,10 +301,11 @@ class SimpleTradeApp:
                     start_idx = max(0, selected - 10)
                     for i, symbol in enumerate(filtered_symbols[start_idx:start_idx + min(20, max_rows)]):
                         display_idx = start_idx + i
+                        label = f"{symbol} (最近)" if symbol in recent_set else symbol
                         if display_idx == selected:
-                            self.stdscr.addstr(i + display_offset, 0, f"* {symbol}", curses.A_REVERSE)
+                            self.stdscr.addstr(i + display_offset, 0, f"* {label}", curses.A_REVERSE)
                         else:
-                            self.stdscr.addstr(i + display_offset, 0, f"  {symbol}")
+                            self.stdscr.addstr(i + display_offset, 0, f"  {label}")
 
                 self.stdscr.refresh()
 
@@ -173,6 +326,11 @@ class SimpleTradeApp:
                         # 获取市场价格精度等信息
                         market = markets[self.current_symbol]
                         log.info(f"获取交易产品信息成功: {market}")
+                        self.current_market = market
+                        self.showing_cache = False
+                        self.market_pending = False
+                        remember_symbol(self.recent, self.current_exchange, self.current_api_key,
+                                        self.current_symbol)
                         self.min_price_precision = market['precision']['price']
                         self.price_precision = self.min_price_precision
                         self.min_amount_precision = market['precision']['amount']
@@ -183,8 +341,11 @@ class SimpleTradeApp:
                         log.debug(
                             f"交易产品信息: 价格精度={self.price_precision}, 数量精度={self.amount_precision}, 最小数额={self.min_value}")
 
-                        # 获取当前价格
-                        ticker = exchange.fetch_ticker(self.current_symbol)
+                        # 切换轮询目标并获取当前价格，行情同时发布给其他订阅者
+                        self.poller.set_target(self.current_exchange, self.current_api_key, self.current_symbol)
+                        logger.bind(exchange=self.current_exchange, account=self.current_api_key,
+                                    symbol=self.current_symbol)
+                        ticker = self.poller.refresh(TICKER)
                         self.price = ticker['last']
                         self.amount = self.amount_precision
                         if self.price is not None and self.price > 0 and self.min_value is not None and self.min_value > 0:
@@ -194,6 +355,7 @@ class SimpleTradeApp:
                             self.amount = self.min_amount
 
                         log.info(f"当前价格: {self.price}, 初始下单数量: {self.amount}")
+                        self.open_ohlcv_store()
 
                         return True
                 elif key == ord('q'):
@@ -211,35 +373,167 @@ class SimpleTradeApp:
             self.show_error(f"获取交易产品失败: {str(e)}")
             return False
 
+    def restore_workspace(self):
+        """
+        用上次保存的工作区直接恢复交易界面，不等待网络请求。
+        缓存的行情只交给交易界面显示，不发布到事件总线，条件单和共享行情等订阅者不会使用旧价格；
+        缓存的余额按保存时间发布到事件总线。实时数据、市场信息和K线在后台重新获取。
+
+        返回:
+            bool: 是否已恢复，未恢复时走正常的选择流程。
+        """
+        workspace = self.workspace
+        if not self.resume or not workspace.get('resumable'):
+            return False
+        exchange_id, key_id, symbol = workspace['exchange'], workspace['account'], workspace['symbol']
+        if key_id not in self.exchanges.get(exchange_id, {}):
+            log.info(f"工作区中的账户 {exchange_id}/{key_id} 已不在配置中，不恢复")
+            return False
+
+        self.current_exchange = exchange_id
+        self.current_api_key = key_id
+        self.current_symbol = symbol
+        self.current_market = workspace['market']
+        for field in ('price', 'amount', 'price_precision', 'min_price_precision', 'amount_precision',
+                      'min_amount_precision', 'min_amount'):
+            setattr(self, field, workspace[field])
+        self.min_value = workspace.get('min_value')
+        self.trade_side = workspace.get('trade_side', self.trade_side)
+        if workspace.get('execution_mode') in EXECUTION_MODES:
+            self.execution_mode = workspace['execution_mode']
+
+        saved_at = workspace.get('saved_at')
+        self.cached_ticker = workspace.get('ticker')
+        self.showing_cache = bool(self.cached_ticker)
+        self.market_pending = True
+        self.market_error = None
+        if workspace.get('balance'):
+            self.bus.publish(BALANCE, exchange_id, key_id, None, workspace['balance'], timestamp=saved_at)
+        # 切换轮询目标后轮询线程立即获取全部实时数据
+        self.poller.set_target(exchange_id, key_id, symbol)
+        logger.bind(exchange=exchange_id, account=key_id, symbol=symbol)
+        threading.Thread(target=self._revalidate_workspace, args=(exchange_id, key_id, symbol),
+                         name='workspace-revalidate', daemon=True).start()
+        log.info(f"已恢复工作区 {exchange_id}/{key_id} {symbol}")
+        return True
+
+    def _revalidate_workspace(self, exchange_id, key_id, symbol):
+        """后台重新加载市场信息，精度或限额变化时更新并提示，然后打开K线存储"""
+        try:
+            markets = self.callers.get(exchange_id, key_id).call('load_markets')
+        except Exception as e:
+            log.warning(f"后台加载市场信息失败: {str(e)}")
+            self.notifications.post(f"后台加载市场信息失败: {str(e)}，按 s 重新选择交易对后才能下单", 'warning')
+            self.market_error = str(e)
+            return
+        if (self.current_exchange, self.current_api_key, self.current_symbol) != (exchange_id, key_id, symbol):
+            return
+        market = markets.get(symbol)
+        if market is None:
+            self.notifications.post(f"交易对 {symbol} 已不存在，请按 s 重新选择", 'error')
+            return
+        old = self.current_market or {}
+        self.current_market = market
+        if market['precision'] != old.get('precision') or market.get('limits') != old.get('limits'):
+            log.info(f"{symbol} 市场信息已变化: {old.get('precision')} -> {market['precision']}")
+            self.min_price_precision = market['precision']['price']
+            self.price_precision = max(self.price_precision, self.min_price_precision)
+            self.min_amount_precision = market['precision']['amount']
+            self.amount_precision = max(self.amount_precision, self.min_amount_precision)
+            self.min_value = market.get('limits', {}).get('cost', {}).get('min', 0)
+            self.notifications.post(f"{symbol} 的精度或限额已变化，已更新", 'warning')
+        self.market_pending = False
+        # 第一次打开K线存储需要导入 numpy，放在首屏之后
+        try:
+            self.open_ohlcv_store()
+        except Exception as e:
+            log.warning(f"打开K线存储失败: {str(e)}")
+
+    def trading_blocked(self):
+        """恢复的缓存行情或市场信息尚未确认时返回原因，此时不能下单或添加条件单"""
+        if self.market_pending and self.market_error:
+            return f"重新加载市场信息失败({self.market_error})，请按 s 重新选择交易对"
+        if self.showing_cache:
+            return "正在等待实时行情，当前显示的是上次退出时的缓存，请稍候"
+        if self.market_pending:
+            return "正在重新加载市场信息，精度和限额尚未确认，请稍候"
+        return None
+
+    def save_current_workspace(self):
+        """保存当前的账户、交易对、交易参数、最近交易对和最新的行情余额，下次启动时恢复"""
+        if self.replay:
+            # 回放会话的账户来自录制文件，不覆盖真实的工作区
+            return
+        if self.current_symbol is None or self.current_market is None:
+            save_workspace({'recent': self.recent})
+            return
+        ticker = self.bus.latest(TICKER, self.current_exchange, self.current_api_key, self.current_symbol)
+        balance = self.bus.latest(BALANCE, self.current_exchange, self.current_api_key)
+        save_workspace({
+            'exchange': self.current_exchange, 'account': self.current_api_key, 'symbol': self.current_symbol,
+            'market': self.current_market, 'price': self.price, 'amount': self.amount,
+            'price_precision': self.price_precision, 'min_price_precision': self.min_price_precision,
+            'amount_precision': self.amount_precision, 'min_amount_precision': self.min_amount_precision,
+            'min_amount': self.min_amount, 'min_value': getattr(self, 'min_value', None),
+            'trade_side': self.trade_side, 'execution_mode': self.execution_mode,
+            # 交易所原始返回(info)只占空间，不保存
+            'ticker': ({k: v for k, v in ticker.data.items() if k != 'info'} if ticker
+                       else self.cached_ticker if self.showing_cache else None),
+            'balance': {k: v for k, v in balance.data.items() if k != 'info'} if balance else None,
+            'recent': self.recent,
+        })
+
     def main_trading_screen(self):
         """主交易界面"""
         exchange = self.exchanges[self.current_exchange][self.current_api_key]
         log.info(f"进入主交易界面 exchange {exchange}")
+        ticker = None
+        balances = None
+        # 行情和余额由轮询线程发布，界面每帧只取出最新的一条，不自己请求
+        events = self.bus.subscribe('trading_screen', (TICKER, BALANCE))
+        self.fee_cache.ensure(self.current_exchange, self.current_api_key)
         while True:
             try:
-                # 获取最新市场数据
-                ticker = exchange.fetch_ticker(self.current_symbol)
-                log.debug(f"获取最新市场数据成功: {ticker}")
-
-                balances = exchange.fetch_balance()
-                log.debug(f"获取账户余额成功: {balances}")
+                for event in events.poll():
+                    if (event.exchange, event.account) != (self.current_exchange, self.current_api_key):
+                        continue
+                    if event.kind == TICKER and event.symbol == self.current_symbol:
+                        ticker = event.data
+                        self.showing_cache = False
+                    elif event.kind == BALANCE:
+                        balances = event.data
+                # 刚进入界面或切换交易对时，先使用总线上的最新数据，没有则立即获取一次
+                if ticker is None or ticker.get('symbol', self.current_symbol) != self.current_symbol:
+                    latest = self.bus.latest(TICKER, self.current_exchange, self.current_api_key, self.current_symbol)
+                    if latest:
+                        ticker = latest.data
+                    elif self.showing_cache and self.cached_ticker:
+                        ticker = self.cached_ticker
+                    else:
+                        ticker = self.poller.refresh(TICKER)
+                if balances is None:
+                    latest = self.bus.latest(BALANCE, self.current_exchange, self.current_api_key)
+                    balances = latest.data if latest else self.poller.refresh(BALANCE)
 
-                # 解析交易对获取base和quote
-                market = exchange.market(self.current_symbol)
+                # 解析交易对获取base和quote，市场信息在选择交易对或恢复工作区时保存
+                market = self.current_market
                 base = market['base']
                 quote = market['quote']
 
                 base_balance = balances.get(base, {}).get('free', 0)
                 quote_balance = balances.get(quote, {}).get('free', 0)
 
-                # 显示交易界面
-                self.stdscr.clear()
+                # 显示交易界面，每帧都会重绘，使用 erase 只输出变化的部分
+                self.stdscr.erase()
                 self.stdscr.addstr(0, 0, f"交易界面 - {self.current_exchange}", curses.A_BOLD)
                 self.stdscr.addstr(0, 50, f"{base}余额: {base_balance:.8f}", curses.A_NORMAL)
                 self.stdscr.addstr(0, 80, f"{quote}余额: {quote_balance:.8f}", curses.A_NORMAL)
 
                 self.stdscr.addstr(2, 0, f"交易对: {self.current_symbol}", curses.A_NORMAL)
-                self.stdscr.addstr(3, 0, f"市场价格: {ticker['last']:.8f}", curses.A_NORMAL)
+                cache_note = " (上次退出时的缓存数据，正在刷新，暂不能下单)" if self.showing_cache else ""
+                if not cache_note and self.market_pending:
+                    cache_note = " (正在重新加载市场信息，暂不能下单)"
+                self.stdscr.addstr(3, 0, f"市场价格: {ticker['last']:.8f}{cache_note}", curses.A_NORMAL)
                 self.stdscr.addstr(4, 0,
                                    f"买入价: {ticker['bid'] if ticker['bid'] else 'None'} | 卖出价: {ticker['ask'] if ticker['ask'] else 'None'}",
                                    curses.A_NORMAL)
@@ -254,17 +548,44 @@ class SimpleTradeApp:
                 self.stdscr.addstr(8, 0, f"价格精度: {self.price_precision:.8f}", curses.A_NORMAL)
                 self.stdscr.addstr(9, 0, f"数量精度: {self.amount_precision:.8f}", curses.A_NORMAL)
                 self.stdscr.addstr(10, 0, f"最小下单量: {self.min_amount:.8f}", curses.A_NORMAL)
+                running = sum(1 for p in self.engine.orders() if p.status == 'running')
+                waiting = self.triggers.active_count(self.current_exchange, self.current_api_key)
+                self.stdscr.addstr(11, 0, f"执行方式: {EXECUTION_MODE_LABELS[self.execution_mode]}"
+                                          f" | 运行中的算法单: {running} | 等待触发的条件单: {waiting}"
+                                          f" | 数据刷新: {CADENCE_LABELS[self.poller.cadence_mode]}", curses.A_NORMAL)
+                self.draw_worker_health(12)
+                # 按当前价格和数量估算金额、手续费和成交后余额，只用本地数据
+                maker, taker, _ = self.fee_cache.rates(self.current_exchange, self.current_api_key,
+                                                       self.current_symbol, market)
+                estimate = estimate_order(self.trade_side, self.price, self.amount, maker, taker, ticker,
+                                          base_balance or 0.0, quote_balance or 0.0)
+                attr = curses.A_NORMAL if estimate['sufficient'] else curses.color_pair(1) | curses.A_BOLD
+                self.stdscr.addstr(14, 0, format_estimate(estimate, base, quote), attr)
+                self.refresh_ohlcv()
+                self.draw_ohlcv_panel(15)
 
                 # 操作说明
                 self.stdscr.addstr(20, 0, "操作说明:", curses.A_BOLD)
-                self.stdscr.addstr(21, 0, "s: 选择交易产品 | ↑/↓: 调整价格 | a/z: 调整数量 | 空格: 下单")
-                self.stdscr.addstr(22, 0, "r: 重置参数 | o: 查看挂单 | h: 查看历史成交 | b: 查看余额")
-                self.stdscr.addstr(23, 0, "w: 10x价格精度 | e: 0.1x价格精度 | t: 切换交易方向 | q: 退出")
-
+                self.stdscr.addstr(21, 0, "s: 选择交易产品 | ↑/↓: 调整价格 | a/z: 调整数量 | 空格: 下单"
+                                          " | x: 执行方式 | j: 算法单")
+                self.stdscr.addstr(22, 0, "r: 重置参数 | o: 查看挂单 | h: 查看历史成交 | b: 查看余额 | p: 持仓分析"
+                                          " | l: 条件单 | v: 价格提醒 | k: 条件单列表")
+                self.stdscr.addstr(23, 0, "w: 10x价格精度 | e: 0.1x价格精度 | t: 切换交易方向 | c: 跨所价差"
+                                          " | n: 消息记录 | q: 退出")
+
+                self.draw_notifications()
                 self.stdscr.refresh()
-
-                # 处理输入
-                key = self.stdscr.getch()
+                if not self.first_frame:
+                    self.first_frame = True
+                    elapsed = time.perf_counter() - startup_profiler.START
+                    startup_profiler.record('首个可用交易界面', elapsed, started=startup_profiler.START, depth=0)
+                    log.info(f"启动到首个可用交易界面耗时 {elapsed * 1000:.0f}ms")
+
+                # 处理输入: 连续的价格和数量调整合并成一次，超时返回-1时只重绘
+                steps, key = self.read_keys(time.monotonic())
+                self.apply_steps(steps)
+                if key == -1:
+                    continue
 
                 if key == ord('q'):
                     log.info("用户选择退出交易界面")
@@ -273,57 +594,47 @@ class SimpleTradeApp:
                     self.price_precision = max(self.price_precision * 10, self.min_price_precision)
                 elif key == ord('e'):
                     self.price_precision = max(self.price_precision / 10, self.min_price_precision)
-                elif key == curses.KEY_UP:
-                    # 价格上调
-                    old_price = self.price
-                    self.price += self.price_precision
-                    self.price = round(self.price / self.price_precision, 0) * self.price_precision
-                    log.debug(f"价格上调: {old_price} -> {self.price} precision {self.price_precision}")
-                elif key == curses.KEY_DOWN:
-                    # 价格下调
-                    old_price = self.price
-                    self.price -= self.price_precision
-                    self.price = max(self.price_precision,
-                                     round(self.price / self.price_precision, 0) * self.price_precision)
-                    log.debug(f"价格下调: {old_price} -> {self.price}")
-                elif key == ord('a'):
-                    # 数量上调
-                    old_amount = self.amount
-                    self.amount += (self.amount_precision * 10)
-                    self.amount = round(self.amount / self.amount_precision, 0) * self.amount_precision
-                    log.debug(f"数量上调: {old_amount} -> {self.amount}")
-                elif key == ord('z'):
-                    # 数量下调
-                    old_amount = self.amount
-                    self.amount -= (self.amount_precision * 10)
-                    self.amount = max(self.min_amount,
-                                      round(self.amount / self.amount_precision, 0) * self.amount_precision)
-                    log.debug(f"数量下调: {old_amount} -> {self.amount}")
+                elif key in (ord(' '), ord('l'), ord('v'), ord('u')) and self.trading_blocked():
+                    # 缓存的价格和精度可能已经过时，确认前不下单、不按缓存价格判断触发方向
+                    self.show_error(self.trading_blocked())
                 elif key == ord(' '):
                     # 下单
                     if self.amount < self.min_amount:
                         log.warning(f"下单数量 {self.amount} 小于最小数量 {self.min_amount}")
                         self.show_error(f"下单数量必须大于最小数量 {self.min_amount}")
+                    elif self.execution_mode != 'limit':
+                        # 算法单交给执行引擎，子单在后台按精度和最小金额拆分；提交前按母单总量检查风控
+                        reason = self.risk.check(self.current_exchange, self.current_api_key, self.current_symbol,
+                                                 self.trade_side, self.amount, self.price)
+                        if reason:
+                            self.show_error(f"风控拒绝: {reason}")
+                        else:
+                            parent = self.engine.submit(self.execution_mode, self.current_exchange,
+                                                        self.current_api_key, self.current_symbol,
+                                                        self.trade_side, self.amount, self.price)
+                            self.show_message(f"已提交算法单 {parent.id}: {parent.describe()}")
                     else:
                         try:
                             log.info(
                                 f"尝试下单: 交易对={self.current_symbol}, 方向={self.trade_side}, 数量={self.amount}")
-                            order = exchange.create_limit_order(
+                            order = self.call(
+                                'create_limit_order',
                                 symbol=self.current_symbol,
                                 side=self.trade_side,
                                 amount=self.amount,
                                 price=self.price
                             )
-                            log.info(f"下单成功: 订单ID={order['id']}")
+                            log.info(f"下单成功: 订单ID={order['id']}", extra={'order_id': order['id']})
                             self.show_message(f"下单成功: {order['id']}")
                             self.save_order_to_csv(order)
+                            self.poller.publish_order(order)
+                            self.poller.request(BALANCE, ORDER, FILL)
                         except Exception as e:
                             log.error(f"下单失败: {str(e)}", exc_info=True)
                             self.show_error(f"下单错误: {str(e)}")
                 elif key == ord('r'):
                     # 重置参数
                     log.info("用户重置交易参数")
-                    ticker = exchange.fetch_ticker(self.current_symbol)
                     self.price = ticker['last']
                     self.amount = self.min_amount
                     self.price_precision = self.min_price_precision
@@ -341,6 +652,10 @@ class SimpleTradeApp:
                     # 查看历史订单
                     log.info("用户查看成交历史")
                     self.view_trade_history()
+                elif key == ord('p'):
+                    # 查看持仓分析
+                    log.info("用户查看持仓分析")
+                    self.view_analytics()
                 elif key == ord('s'):
                     # 选择新的交易产品
                     log.info("用户选择新的交易产品")
@@ -350,248 +665,720 @@ class SimpleTradeApp:
                     # 切换交易方向
                     self.trade_side = 'sell' if self.trade_side == 'buy' else 'buy'
                     log.info(f"用户切换交易方向为: {self.trade_side}")
+                elif key == ord('x'):
+                    # 切换执行方式
+                    index = EXECUTION_MODES.index(self.execution_mode)
+                    self.execution_mode = EXECUTION_MODES[(index + 1) % len(EXECUTION_MODES)]
+                    log.info(f"用户切换执行方式为: {self.execution_mode}")
+                elif key == ord('j'):
+                    self.view_algo_orders()
+                elif key in (ord('l'), ord('v')):
+                    # 以当前价格为触发价，l 添加止损/止盈条件单(按方向和价格位置区分)，v 添加价格提醒
+                    try:
+                        if key == ord('l'):
+                            trigger = self.triggers.add('order', self.current_exchange, self.current_api_key,
+                                                        self.current_symbol, self.price, ticker['last'],
+                                                        side=self.trade_side, amount=self.amount)
+                        else:
+                            trigger = self.triggers.add(ALERT, self.current_exchange, self.current_api_key,
+                                                        self.current_symbol, self.price, ticker['last'])
+                        self.show_message(f"已添加{KIND_LABELS[trigger.kind]} #{trigger.id}: {trigger.describe()}")
+                    except ValueError as e:
+                        self.show_error(f"添加条件单失败: {str(e)}")
+                elif key == ord('k'):
+                    self.view_triggers()
+                elif key == ord('c'):
+                    self.view_spread_scanner()
+                elif key == ord('u'):
+                    # 当前订单加入组合单，按缓存的市场信息预先校验，不下单
+                    leg = Leg(self.current_exchange, self.current_api_key, self.current_symbol,
+                              self.trade_side, self.price, self.amount)
+                    error = self.basket_runner.check(leg, self.current_market)
+                    if error:
+                        self.show_error(f"不能加入组合单: {error}")
+                    else:
+                        self.basket.append(leg)
+                        self.show_message(f"已加入组合单(共 {len(self.basket)} 条): {leg.describe()}")
+                elif key == ord('m'):
+                    self.view_basket()
+                elif key == ord('n'):
+                    # 查看消息记录
+                    self.view_notifications()
 
             except Exception as e:
                 self.show_error(f"错误: {str(e)}")
-                time.sleep(2)
+                # 不再固定休眠，等待按键或轮询超时后重试
+                if self.stdscr.getch() == ord('q'):
+                    log.info("用户选择退出交易界面")
+                    break
+        events.close()
+
+    def read_keys(self, frame_start):
+        """
+        等待按键，并合并连续的价格和数量调整。
+        第一个按键到达后继续读取已缓冲的按键，以及距 frame_start 不到一帧时间内到达的按键，
+        遇到其他按键时停止，后面的按键留到下一帧处理。
+
+        返回:
+            tuple: ({'price': 价格净步数, 'amount': 数量净步数}, 停止时的按键，没有时为 -1)
+        """
+        steps = {'price': 0, 'amount': 0}
+        key = self.stdscr.getch()
+        try:
+            while key in ADJUST_KEYS:
+                field, step = ADJUST_KEYS[key]
+                steps[field] += step
+                remaining = frame_start + self.frame_interval - time.monotonic()
+                self.stdscr.timeout(max(0, int(remaining * 1000)))
+                key = self.stdscr.getch()
+        finally:
+            self.stdscr.timeout(UI_POLL_MS)
+        return steps, key
+
+    def apply_steps(self, steps):
+        """按净步数一次调整价格和数量，价格不低于一个价格精度，数量不低于最小下单量"""
+        if steps['price']:
+            old_price = self.price
+            self.price += steps['price'] * self.price_precision
+            self.price = max(self.price_precision, round(self.price / self.price_precision, 0) * self.price_precision)
+            log.debug(f"价格调整 {steps['price']:+d} 步: {old_price} -> {self.price} precision {self.price_precision}")
+        if steps['amount']:
+            old_amount = self.amount
+            self.amount += steps['amount'] * self.amount_precision * 10
+            self.amount = max(self.min_amount, round(self.amount / self.amount_precision, 0) * self.amount_precision)
+            log.debug(f"数量调整 {steps['amount']:+d} 步: {old_amount} -> {self.amount}")
+
+    def draw_worker_health(self, row):
+        """在指定行显示当前账户工作线程和熔断器的状态，以及其他异常账户"""
+        current = self.workers.get(self.current_exchange, self.current_api_key).health()
+        attr = curses.A_NORMAL if current['status'] == 'ok' else curses.color_pair(1) | curses.A_BOLD
+        self.stdscr.addstr(row, 0, format_health(current), attr)
+
+        metrics = self.callers.get(self.current_exchange, self.current_api_key).snapshot()
+        attr = curses.A_NORMAL if metrics['breaker']['state'] == 'closed' else curses.color_pair(1) | curses.A_BOLD
+        self.stdscr.addstr(row + 1, 0, format_breaker(metrics), attr)
+
+        abnormal = [h for h in self.workers.health() if h['status'] != 'ok'
+                    and (h['exchange'], h['account']) != (self.current_exchange, self.current_api_key)]
+        abnormal += [{'exchange': k[0], 'account': k[1]} for k, c in self.callers.callers.items()
+                     if c.breaker.state != 'closed' and k != (self.current_exchange, self.current_api_key)]
+        if abnormal:
+            names = ', '.join(sorted({f"{h['exchange']}/{h['account']}" for h in abnormal}))
+            self.stdscr.addstr(row + 2, 0, f"异常通道: {names}", curses.color_pair(1))
+
+    def open_ohlcv_store(self):
+        """打开当前交易对的K线存储，已有的历史数据直接从磁盘映射，不需要网络请求"""
+        self.ohlcv_store = ohlcv_store.OhlcvStore(self.current_exchange, self.current_symbol, self.ohlcv_config['timeframe'])
+        self.ohlcv_future = None
+        self.ohlcv_next_refresh = 0
+        log.info(f"打开K线存储 {self.ohlcv_store.path}, 已有 {len(self.ohlcv_store.candles())} 根K线")
+
+    def refresh_ohlcv(self):
+        """
+        在后台从最后一根已存储的K线开始补数据，不阻塞界面。
+        上一页取满时立即继续补，否则按配置的间隔刷新。
+        """
+        if self.ohlcv_store is None:
+            return
+        exchange = self.exchanges[self.current_exchange][self.current_api_key]
+        if not getattr(exchange, 'has', {}).get('fetchOHLCV'):
+            return
+
+        now = time.monotonic()
+        if self.ohlcv_future is not None:
+            if not self.ohlcv_future.done():
+                return
+            future, self.ohlcv_future = self.ohlcv_future, None
+            try:
+                rows = future.result()
+                added = self.ohlcv_store.merge(rows)
+                log.debug(f"补充 {added} 根K线")
+                full_page = len(rows) >= self.ohlcv_config['limit'] and added > 0
+                self.ohlcv_next_refresh = now if full_page else now + self.ohlcv_config['refresh']
+            except Exception as e:
+                log.warning(f"获取K线失败: {str(e)}")
+                self.ohlcv_next_refresh = now + self.ohlcv_config['refresh']
+            return
+
+        if now >= self.ohlcv_next_refresh:
+            # 账户熔断期间不发起后台请求
+            if self.callers.get(self.current_exchange, self.current_api_key).breaker.state == 'open':
+                return
+            worker = self.workers.get(self.current_exchange, self.current_api_key)
+            self.ohlcv_future = worker.submit('fetch_ohlcv', **self.ohlcv_store.fetch_params(self.ohlcv_config['limit']))
+
+    def draw_ohlcv_panel(self, row):
+        """在指定行显示K线区间统计和收盘价迷你走势图"""
+        width = min(60, self.stdscr.getmaxyx()[1] - 2)
+        candles = self.ohlcv_store.candles()[-width:] if self.ohlcv_store is not None else []
+        timeframe = self.ohlcv_config['timeframe']
+        if len(candles) == 0:
+            self.stdscr.addstr(row, 0, f"K线({timeframe}): 暂无数据", curses.A_NORMAL)
+            return
+
+        self.stdscr.addstr(row, 0, ohlcv_store.format_stats(candles, timeframe), curses.A_NORMAL)
+        color = curses.color_pair(2) if candles['close'][-1] >= candles['open'][0] else curses.color_pair(1)
+        self.stdscr.addstr(row + 1, 0, ohlcv_store.sparkline(candles['close'], width), color)
 
     def show_error(self, message):
-        """显示错误信息"""
+        """显示错误信息，投递到消息栏后立即返回"""
         log.error(f"错误: {message}", exc_info=True)
-        height, width = self.stdscr.getmaxyx()
-        self.stdscr.addstr(height - 2, 0, "下单失败", curses.A_BOLD | curses.COLOR_RED)
-        self.stdscr.addstr(height - 1, 0, f"下单错误: {message}", curses.A_BOLD | curses.COLOR_RED)
+        self.notifications.post(message, 'error')
+        self.draw_notifications()
         self.stdscr.refresh()
-        time.sleep(2)
 
     def show_message(self, message):
-        """显示消息"""
+        """显示消息，投递到消息栏后立即返回"""
         log.info(f"消息: {message}")
-        height, width = self.stdscr.getmaxyx()
-        self.stdscr.addstr(height - 2, 0, "下单成功", curses.A_BOLD)
-        self.stdscr.addstr(height - 1, 0, message, curses.A_NORMAL)
+        self.notifications.post(message, 'success')
+        self.draw_notifications()
         self.stdscr.refresh()
-        time.sleep(2)
+
+    def draw_notifications(self):
+        """在屏幕底部两行显示未过期的消息"""
+        height, width = self.stdscr.getmaxyx()
+        colors = {'error': curses.color_pair(1) | curses.A_BOLD, 'warning': curses.color_pair(1),
+                  'success': curses.color_pair(2)}
+        active = self.notifications.active(limit=2)
+        for i, notification in enumerate(active):
+            row = height - len(active) + i
+            self.stdscr.move(row, 0)
+            self.stdscr.clrtoeol()
+            self.stdscr.addstr(row, 0, notification.format()[:width - 1],
+                               colors.get(notification.level, curses.A_NORMAL))
+
+    def wait_key(self):
+        """阻塞等待一次按键，用于需要用户确认的场合"""
+        self.stdscr.timeout(-1)
+        try:
+            return self.stdscr.getch()
+        finally:
+            self.stdscr.timeout(UI_POLL_MS)
+
+    def view_notifications(self):
+        """消息记录页面，可上下滚动查看历史消息"""
+        log.info("用户查看消息记录")
+        offset = 0
+        while True:
+            history = self.notifications.snapshot()
+            height, width = self.stdscr.getmaxyx()
+            page = max(1, height - 3)
+            offset = max(0, min(offset, len(history) - page))
+
+            self.stdscr.clear()
+            self.stdscr.addstr(0, 0, f"消息记录 - 共 {len(history)} 条", curses.A_BOLD)
+            self.stdscr.addstr(1, 0, "上下键滚动, PgUp/PgDn翻页, q返回", curses.A_NORMAL)
+            if not history:
+                self.stdscr.addstr(3, 0, "暂无消息", curses.A_NORMAL)
+            for i, notification in enumerate(history[offset:offset + page]):
+                attr = curses.color_pair(1) if notification.level in ('error', 'warning') else curses.A_NORMAL
+                self.stdscr.addstr(i + 3, 0, notification.format()[:width - 1], attr)
+            self.stdscr.refresh()
+
+            key = self.stdscr.getch()
+            if key == ord('q'):
+                break
+            elif key == curses.KEY_UP:
+                offset -= 1
+            elif key == curses.KEY_DOWN:
+                offset += 1
+            elif key == curses.KEY_PPAGE:
+                offset -= page
+            elif key == curses.KEY_NPAGE:
+                offset += page
+
+    def run_list_view(self, view, title, help_text, on_key=None, on_frame=None):
+        """
+        列表页面的通用循环: 绘制标题、虚拟列表和消息栏。title 可以是返回标题的函数，每帧调用。
+        按键先交给列表处理(滚动、跳转、过滤)，其他按键交给 on_key，on_key 返回 False 或按 q 时退出。
+        on_frame 在每帧绘制前调用，用于合并订阅到的数据更新。
+        """
+        while True:
+            if on_frame is not None:
+                on_frame()
+            height = self.stdscr.getmaxyx()[0]
+            # 每帧都会重绘，使用 erase 避免过滤扫描期间闪烁
+            self.stdscr.erase()
+            self.stdscr.addstr(0, 0, title() if callable(title) else title, curses.A_BOLD)
+            self.stdscr.addstr(1, 0, f"{help_text}, PgUp/PgDn翻页, g/G首尾, /过滤, q返回", curses.A_NORMAL)
+            # 底部两行留给消息栏
+            view.draw(self.stdscr, 2, height - 4)
+            self.draw_notifications()
+            self.stdscr.refresh()
+
+            # 过滤扫描未完成时不等待按键，下一帧继续扫描
+            self.stdscr.timeout(0 if view.busy else UI_POLL_MS)
+            key = self.stdscr.getch()
+            self.stdscr.timeout(UI_POLL_MS)
+            if key == -1 or view.handle_key(key):
+                continue
+            if key == ord('q'):
+                return
+            if on_key is not None and on_key(key) is False:
+                return
 
     def view_open_orders(self):
         """查看挂单列表"""
-        exchange = self.exchanges[self.current_exchange][self.current_api_key]
-
+        order_events = self.bus.subscribe('open_orders', (ORDER,))
         try:
             log.info(f"获取 {self.current_exchange} 的挂单列表")
-            orders = exchange.fetch_open_orders(self.current_symbol)
+            orders = self.poller.refresh(ORDER)
             log.info(f"成功获取symbol {self.current_symbol} {len(orders)}  个挂单")
+            order_events.poll()
 
             # 按照时间倒序
             orders.sort(key=lambda x: x['timestamp'], reverse=True)
 
-            selected = 0  # 选中的订单索引
-
-            while True:  # 外层循环，用于刷新订单列表
-                self.stdscr.clear()
-                self.stdscr.addstr(0, 0, f"挂单列表 - {self.current_exchange}", curses.A_BOLD)
-                self.stdscr.addstr(1, 0, "上下键选择, 回车撤单, q返回", curses.A_NORMAL)
-
-                if not orders:
-                    self.stdscr.addstr(3, 0, "暂无挂单", curses.A_NORMAL)
-                else:
-                    self.stdscr.addstr(2, 0, "订单ID", curses.A_UNDERLINE)
-                    self.stdscr.addstr(2, 20, "交易对", curses.A_UNDERLINE)
-                    self.stdscr.addstr(2, 35, "类型", curses.A_UNDERLINE)
-                    self.stdscr.addstr(2, 45, "方向", curses.A_UNDERLINE)
-                    self.stdscr.addstr(2, 55, "价格", curses.A_UNDERLINE)
-                    self.stdscr.addstr(2, 70, "数量", curses.A_UNDERLINE)
-                    self.stdscr.addstr(2, 85, "时间", curses.A_UNDERLINE)
-
-                    display_count = min(15, len(orders))  # 限制显示条数
-
-                    # 防止选择索引越界
-                    selected = min(selected, display_count - 1) if display_count > 0 else 0
-
-                    for i in range(display_count):
-                        order = orders[i]
-                        date_str = datetime.fromtimestamp(order['timestamp'] / 1000).strftime('%Y-%m-%d %H:%M:%S')
-
-                        # 如果是选中的行，使用高亮显示
-                        attr = curses.A_REVERSE if i == selected else curses.A_NORMAL
-
-                        self.stdscr.addstr(i + 3, 0, str(order['id'])[:15], attr)
-                        self.stdscr.addstr(i + 3, 20, order['symbol'], attr)
-                        self.stdscr.addstr(i + 3, 35, order['type'], attr)
-                        self.stdscr.addstr(i + 3, 45, order['side'], attr)
-                        self.stdscr.addstr(i + 3, 55, str(order['price']), attr)
-                        self.stdscr.addstr(i + 3, 70, str(order['amount']), attr)
-                        self.stdscr.addstr(i + 3, 85, date_str, attr)
-
-                self.stdscr.refresh()
+            view = ListView(ListSource(orders), [
+                (0, "订单ID", lambda o: str(o['id'])),
+                (20, "交易对", lambda o: o['symbol']),
+                (35, "类型", lambda o: str(o['type'])),
+                (45, "方向", lambda o: o['side']),
+                (55, "价格", lambda o: str(o['price'])),
+                (70, "数量", lambda o: str(o['amount'])),
+                (85, "时间", lambda o: datetime.fromtimestamp(o['timestamp'] / 1000).strftime('%Y-%m-%d %H:%M:%S')),
+            ], empty_text="暂无挂单")
+
+            def on_key(key):
+                order_to_cancel = view.selected_row()
+                if key != ord('\n') or order_to_cancel is None:  # 回车键撤单
+                    return True
+                try:
+                    order_id = order_to_cancel['id']
+                    symbol = order_to_cancel['symbol']
+
+                    # 显示确认信息
+                    self.stdscr.move(1, 0)
+                    self.stdscr.clrtoeol()
+                    self.stdscr.addstr(1, 0, f"确认撤销订单 {order_id}? (y/n)", curses.A_BOLD)
+                    self.stdscr.refresh()
+
+                    # 等待确认
+                    confirm_key = self.wait_key()
+                    if confirm_key == ord('y'):
+                        log.info(f"用户确认撤销订单: {order_id}, 交易对: {symbol}", extra={'order_id': order_id})
+
+                        # 撤销订单
+                        result = self.call('cancel_order', order_id, symbol)
+                        log.info(f"撤单成功: {result}", extra={'order_id': order_id})
+
+                        # 显示成功信息，不等待
+                        self.notifications.post(f"撤单成功: {order_id}", 'success')
+                        self.poller.publish_order(dict(order_to_cancel, status='canceled'))
+
+                        # 重新获取订单列表，变化通过订单事件更新到列表
+                        self.poller.refresh(ORDER)
+                        self.poller.request(BALANCE)
+                    else:
+                        log.info("用户取消撤单操作")
+                except Exception as e:
+                    log.error(f"撤单失败: {str(e)}", exc_info=True)
+                    self.notifications.post(f"撤单失败: {str(e)}", 'error')
+                return True
 
-                # 处理键盘输入
-                key = self.stdscr.getch()
+            def on_frame():
+                # 轮询线程或本地操作发布了订单更新时重建列表
+                if order_events.poll():
+                    orders = sorted(self.poller.open_order_list(), key=lambda x: x['timestamp'], reverse=True)
+                    log.info(f"刷新订单列表，现有 {len(orders)} 个挂单")
+                    view.set_source(ListSource(orders))
 
-                if key == ord('q'):
-                    log.info("用户退出挂单列表页面")
-                    break
-                elif key == curses.KEY_UP and selected > 0:
-                    selected -= 1
-                elif key == curses.KEY_DOWN and selected < len(orders) - 1:
-                    selected += 1
-                elif key == ord('\n') and orders:  # 回车键撤单
-                    try:
-                        order_to_cancel = orders[selected]
-                        order_id = order_to_cancel['id']
-                        symbol = order_to_cancel['symbol']
-
-                        # 显示确认信息
-                        self.stdscr.addstr(20, 0, f"确认撤销订单 {order_id}? (y/n)", curses.A_BOLD)
-                        self.stdscr.refresh()
-
-                        # 等待确认
-                        confirm_key = self.stdscr.getch()
-                        if confirm_key == ord('y'):
-                            log.info(f"用户确认撤销订单: {order_id}, 交易对: {symbol}")
-
-                            # 撤销订单
-                            result = exchange.cancel_order(order_id, symbol)
-                            log.info(f"撤单成功: {result}")
-
-                            # 显示成功信息
-                            self.stdscr.addstr(21, 0, f"撤单成功: {order_id}", curses.A_NORMAL)
-                            self.stdscr.refresh()
-                            time.sleep(1)
-
-                            # 重新获取订单列表
-                            orders = exchange.fetch_open_orders(self.current_symbol)
-                            log.info(f"刷新订单列表，现有 {len(orders)} 个挂单")
-
-                            # 重置选择索引
-                            selected = 0 if selected >= len(orders) else selected
-                        else:
-                            log.info("用户取消撤单操作")
-                    except Exception as e:
-                        log.error(f"撤单失败: {str(e)}", exc_info=True)
-                        self.stdscr.addstr(21, 0, f"撤单失败: {str(e)}", curses.A_BOLD | curses.COLOR_RED)
-                        self.stdscr.refresh()
-                        time.sleep(2)
+            self.run_list_view(view, f"挂单列表 - {self.current_exchange}", "上下键选择, 回车撤单",
+                               on_key, on_frame)
+            log.info("用户退出挂单列表页面")
 
         except Exception as e:
             log.error(f"获取挂单失败: {str(e)}", exc_info=True)
             self.show_error(f"获取挂单失败: {str(e)}")
+        finally:
+            order_events.close()
 
     def view_balances(self):
         """查看余额页面"""
-        exchange = self.exchanges[self.current_exchange][self.current_api_key]
-
         try:
-            log.info(f"获取 {self.current_exchange} 的账户余额")
-            balances = exchange.fetch_balance()
-
-            # 计算有余额的币种数量
-            non_zero_balances = sum(1 for amount in balances['total'].values() if amount > 0)
-            log.info(f"成功获取余额，有 {non_zero_balances} 个币种有余额")
-
-            self.stdscr.clear()
-            self.stdscr.addstr(0, 0, f"余额列表 - {self.current_exchange}", curses.A_BOLD)
-            self.stdscr.addstr(1, 0, "按q返回", curses.A_NORMAL)
-
-            self.stdscr.addstr(2, 0, "币种", curses.A_UNDERLINE)
-            self.stdscr.addstr(2, 15, "可用", curses.A_UNDERLINE)
-            self.stdscr.addstr(2, 30, "冻结", curses.A_UNDERLINE)
-            self.stdscr.addstr(2, 45, "总量", curses.A_UNDERLINE)
-
-            row = 3
-            for currency, data in balances['total'].items():
-                if data > 0:  # 只显示有余额的币种
-                    free = balances['free'].get(currency, 0)
-                    used = balances['used'].get(currency, 0)
-
-                    self.stdscr.addstr(row, 0, currency, curses.A_NORMAL)
-                    self.stdscr.addstr(row, 15, f"{free:.8f}", curses.A_NORMAL)
-                    self.stdscr.addstr(row, 30, f"{used:.8f}", curses.A_NORMAL)
-                    self.stdscr.addstr(row, 45, f"{data:.8f}", curses.A_NORMAL)
-
-                    row += 1
-                    if row > 20:  # 限制显示条数
-                        break
-
-            self.stdscr.refresh()
-
-            # 等待按键返回
-            while True:
-                key = self.stdscr.getch()
-                if key == ord('q'):
-                    log.info("用户退出余额页面")
-                    break
+            # 轮询线程刚发布过的余额直接使用，否则立即获取一次
+            latest = self.bus.latest(BALANCE, self.current_exchange, self.current_api_key)
+            if latest is not None and latest.age() < self.refresh_interval:
+                balances = latest.data
+            else:
+                log.info(f"获取 {self.current_exchange} 的账户余额")
+                balances = self.poller.refresh(BALANCE)
+
+            # 只显示有余额的币种
+            rows = [(currency, balances['free'].get(currency, 0), balances['used'].get(currency, 0), total)
+                    for currency, total in balances['total'].items() if total > 0]
+            log.info(f"成功获取余额，有 {len(rows)} 个币种有余额")
+
+            view = ListView(ListSource(rows), [
+                (0, "币种", lambda r: r[0]),
+                (15, "可用", lambda r: f"{r[1] or 0:.8f}"),
+                (30, "冻结", lambda r: f"{r[2] or 0:.8f}"),
+                (45, "总量", lambda r: f"{r[3]:.8f}"),
+            ], search=lambda r: r[0], empty_text="暂无余额")
+            self.run_list_view(view, f"余额列表 - {self.current_exchange}", "上下键滚动")
+            log.info("用户退出余额页面")
 
         except Exception as e:
             log.error(f"获取余额失败: {str(e)}", exc_info=True)
             self.show_error(f"获取余额失败: {str(e)}")
 
     def view_trade_history(self):
-        """查看成交历史"""
-        exchange = self.exchanges[self.current_exchange][self.current_api_key]
+        """
+        查看成交历史，按时间倒序显示。
+        先获取过去一天的成交，向下滚动到末尾时再按天向前加载，最多回溯 HISTORY_MAX_DAYS 天。
+        """
+        try:
+            now = datetime.now()
+            symbol = self.current_symbol
+
+            def load_day(page):
+                # 第 page 页是 [now - (page+1)天, now - page天) 内的成交，第0页包括打开页面之后的成交
+                start = int((now - timedelta(days=page + 1)).timestamp() * 1000)
+                end = int((now - timedelta(days=page)).timestamp() * 1000) if page else None
+                log.info(f"获取 {symbol} 的成交历史，时间范围：{page}~{page + 1}天前")
+                trades = fetch_trades_between(self.call, symbol, start, end)
+                log.info(f"成功获取 {len(trades)} 条成交记录")
+                # 倒序处理
+                trades.reverse()
+                return trades
+
+            source = PagedSource(load_day, max_pages=HISTORY_MAX_DAYS)
+            source.load_more()
+
+            view = ListView(source, [
+                (0, "成交ID", lambda t: str(t['id'])),
+                (15, "订单ID", lambda t: str(t['order'])),
+                (30, "方向", lambda t: t['side']),
+                (40, "价格", lambda t: f"{t['price']:.8f}"),
+                (55, "数量", lambda t: f"{t['amount']:.8f}"),
+                (70, "时间", lambda t: datetime.fromtimestamp(t['timestamp'] / 1000).strftime('%Y-%m-%d %H:%M:%S')),
+            ], empty_text="暂无成交记录")
+            self.run_list_view(view, f"成交历史 - {symbol}", "上下键滚动")
+            log.info("用户退出成交历史页面")
+
+        except Exception as e:
+            log.error(f"获取成交历史失败: {str(e)}", exc_info=True)
+            self.show_error(f"获取成交历史失败: {str(e)}")
 
+    def on_algo_update(self, parent):
+        """执行引擎回调(在执行线程中调用): 子单成交后刷新账户数据，母单结束时投递消息"""
+        self.poller.request(BALANCE, ORDER, FILL)
+        if parent.status != 'running':
+            level = {'done': 'success', 'canceled': 'warning', 'failed': 'error'}[parent.status]
+            self.notifications.post(f"算法单{STATUS_LABELS[parent.status]}: {format_parent(parent.snapshot())}", level)
+
+    def view_algo_orders(self):
+        """算法单列表，显示每个母单的进度，回车撤销选中的母单"""
+        log.info("用户查看算法单列表")
+
+        def snapshots():
+            return [p.snapshot() for p in reversed(self.engine.orders())]
+
+        view = ListView(ListSource(snapshots()), [
+            (0, "编号", lambda s: s['id']),
+            (8, "算法", lambda s: s['description']),
+            (30, "交易对", lambda s: s['symbol']),
+            (45, "方向", lambda s: s['side']),
+            (52, "成交/总量", lambda s: f"{s['filled']:g}/{s['amount']:g}"),
+            (72, "均价", lambda s: f"{s['average']:.8g}" if s['average'] else '-'),
+            (86, "子单", lambda s: str(s['children'])),
+            (92, "状态", lambda s: f"{STATUS_LABELS.get(s['status'], s['status'])} {s['message']}"),
+        ], empty_text="暂无算法单")
+
+        def on_key(key):
+            selected = view.selected_row()
+            if key == ord('\n') and selected is not None and selected['status'] == 'running':
+                self.engine.cancel(selected['id'])
+                log.info(f"用户撤销算法单 {selected['id']}")
+                self.notifications.post(f"正在撤销算法单 {selected['id']}", 'info')
+            return True
+
+        def on_frame():
+            # 母单进度在后台变化，每帧重新取快照
+            view.set_source(ListSource(snapshots()))
+
+        self.run_list_view(view, "算法单", "上下键选择, 回车撤销", on_key, on_frame)
+
+    def on_trigger_fired(self, trigger):
+        """条件单回调(在条件单线程中调用): 投递消息，下单后刷新账户数据"""
+        if trigger.kind == ALERT:
+            self.notifications.post(f"价格提醒: {trigger.symbol} 最新价 {trigger.fired_price:.8g}"
+                                    f" 已穿越 {trigger.level:.8g}", 'warning')
+            return
+        if trigger.status == 'triggered':
+            self.notifications.post(f"{KIND_LABELS[trigger.kind]}已触发并下单: {format_trigger(trigger)}", 'success')
+        else:
+            self.notifications.post(f"{KIND_LABELS[trigger.kind]}下单失败: {format_trigger(trigger)}", 'error')
+        if (trigger.exchange, trigger.account) == (self.current_exchange, self.current_api_key):
+            self.poller.request(BALANCE, ORDER, FILL)
+
+    def view_triggers(self):
+        """条件单列表，回车撤销选中的等待触发的条件单"""
+        log.info("用户查看条件单列表")
+        view = ListView(ListSource(self.triggers.triggers()), [
+            (0, "编号", lambda t: t.id),
+            (8, "类型", lambda t: KIND_LABELS[t.kind]),
+            (18, "账户", lambda t: f"{t.exchange}/{t.account}"),
+            (38, "交易对", lambda t: t.symbol),
+            (53, "触发条件", lambda t: f"{'≥' if t.direction == ABOVE else '≤'} {t.level:.8g}"),
+            (70, "委托", lambda t: f"{t.side} {t.amount:g} @ {t.price:.8g}" if t.kind != ALERT else '-'),
+            (100, "状态", lambda t: f"{TRIGGER_STATUS_LABELS.get(t.status, t.status)}"
+                                    f" {t.order_id or ''} {t.message}"),
+        ], empty_text="暂无条件单")
+
+        def on_key(key):
+            selected = view.selected_row()
+            if key == ord('\n') and selected is not None and self.triggers.cancel(selected.id):
+                self.notifications.post(f"已撤销条件单 #{selected.id}", 'info')
+            return True
+
+        def on_frame():
+            # 条件单在后台触发，每帧重新取列表
+            view.set_source(ListSource(self.triggers.triggers()))
+
+        self.run_list_view(view, "条件单", "上下键选择, 回车撤销", on_key, on_frame)
+
+    def submit_basket(self, legs, cancel_on_failure):
+        """在后台线程同时提交组合单的全部腿，完成后投递消息"""
         try:
-            # 获取过去一天的成交
-            since = int((datetime.now() - timedelta(days=1)).timestamp() * 1000)
-            log.info(f"获取 {self.current_symbol} 的成交历史，时间范围：过去1天")
-            trades = exchange.fetch_my_trades(symbol=self.current_symbol, since=since)
-            log.info(f"成功获取 {len(trades)} 条成交记录")
-            # 倒序处理
-            trades.reverse()
+            result = self.basket_runner.execute(legs, cancel_on_failure)
+            level = 'success' if result['ok'] else 'error'
+            self.notifications.post(f"组合单: {format_result(result)}", level)
+            for leg in legs:
+                if leg.status not in ('placed', 'pending'):
+                    self.notifications.post(f"组合单腿 {format_leg(leg)}", 'warning')
+            if any((leg.exchange, leg.account) == (self.current_exchange, self.current_api_key) for leg in legs):
+                self.poller.request(BALANCE, ORDER, FILL)
+        except Exception as e:
+            log.error(f"提交组合单失败: {str(e)}", exc_info=True)
+            self.notifications.post(f"提交组合单失败: {str(e)}", 'error')
+        finally:
+            self.basket_running = False
 
-            self.stdscr.clear()
-            self.stdscr.addstr(0, 0, f"成交历史 - {self.current_symbol}", curses.A_BOLD)
-            self.stdscr.addstr(1, 0, "按q返回", curses.A_NORMAL)
+    def view_basket(self):
+        """
+        组合单页面: 列出在各账户界面用 u 添加的腿，回车确认后同时提交，
+        d 删除选中的腿，x 清空，f 切换有腿失败时是否撤销其他腿。
+        """
+        log.info("用户查看组合单")
+        view = ListView(ListSource(self.basket), [
+            (0, "账户", lambda leg: f"{leg.exchange}/{leg.account}"),
+            (24, "交易对", lambda leg: leg.symbol),
+            (40, "方向", lambda leg: leg.side),
+            (46, "数量", lambda leg: f"{leg.amount:g}"),
+            (60, "价格", lambda leg: f"{leg.price:.8g}"),
+            (76, "状态", lambda leg: f"{LEG_STATUS_LABELS.get(leg.status, leg.status)}"
+                                     f" {leg.order['id'] if leg.order else ''}"),
+            (100, "延迟", lambda leg: f"{leg.latency * 1000:.0f}ms" if leg.latency is not None else '-'),
+            (110, "说明", lambda leg: leg.message),
+        ], empty_text="组合单为空，在交易界面按 u 把当前订单加入组合单")
+
+        def on_key(key):
+            selected = view.selected_row()
+            if self.basket_running:
+                self.notifications.post("组合单正在提交，请稍候", 'warning')
+            elif key == ord('f'):
+                self.basket_cancel_on_failure = not self.basket_cancel_on_failure
+            elif key == ord('d') and selected is not None:
+                self.basket.remove(selected)
+                view.set_source(ListSource(self.basket))
+            elif key == ord('x'):
+                self.basket = []
+                view.set_source(ListSource(self.basket))
+            elif key == ord('\n') and self.basket:
+                self.stdscr.move(1, 0)
+                self.stdscr.clrtoeol()
+                self.stdscr.addstr(1, 0, f"确认同时提交 {len(self.basket)} 条腿? (y/n)", curses.A_BOLD)
+                self.stdscr.refresh()
+                if self.wait_key() == ord('y'):
+                    log.info(f"用户确认提交组合单 {len(self.basket)} 条腿")
+                    self.basket_running = True
+                    threading.Thread(target=self.submit_basket, name='basket-submit', daemon=True,
+                                     args=(list(self.basket), self.basket_cancel_on_failure)).start()
+            return True
 
-            if not trades:
-                self.stdscr.addstr(3, 0, "暂无成交记录", curses.A_NORMAL)
-            else:
-                self.stdscr.addstr(2, 0, "成交ID", curses.A_UNDERLINE)
-                self.stdscr.addstr(2, 15, "订单ID", curses.A_UNDERLINE)
-                self.stdscr.addstr(2, 30, "方向", curses.A_UNDERLINE)
-                self.stdscr.addstr(2, 40, "价格", curses.A_UNDERLINE)
-                self.stdscr.addstr(2, 55, "数量", curses.A_UNDERLINE)
-                self.stdscr.addstr(2, 70, "时间", curses.A_UNDERLINE)
-
-                for i, trade in enumerate(trades):
-                    if i > 30:  # 限制显示条数
-                        break
+        def title():
+            status = " 提交中..." if self.basket_running else ""
+            cancel = "失败时撤销其他腿" if self.basket_cancel_on_failure else "失败时保留其他腿"
+            return f"组合单 - {len(self.basket)} 条腿 | {cancel}{status}"
+
+        self.run_list_view(view, title, "回车提交, d删除, x清空, f切换失败撤单", on_key)
+
+    def view_spread_scanner(self):
+        """
+        跨交易所价差扫描页面，列出扣除手续费后收益最高的交易对。
+        刷新在后台线程进行，按 scanner.refresh 间隔自动刷新，r 立即刷新。
+        """
+        log.info("用户查看跨交易所价差")
+        if len(self.exchanges) < 2:
+            self.show_error("价差扫描至少需要配置两个交易所")
+            return
+        if self.spread_scanner is None:
+            self.spread_scanner = spread_scanner.SpreadScanner(self.exchanges, self.callers,
+                                                               self.config.get('scanner'))
+        scanner = self.spread_scanner
+        view = ListView(ListSource(scanner.top()), [
+            (0, "交易对", lambda r: r['symbol']),
+            (18, "买入交易所", lambda r: r['buy_exchange']),
+            (32, "卖一价", lambda r: f"{r['ask']:.8g}"),
+            (46, "卖出交易所", lambda r: r['sell_exchange']),
+            (60, "买一价", lambda r: f"{r['bid']:.8g}"),
+            (74, "价差", lambda r: f"{r['spread'] * 100:+.3f}%"),
+            (86, "扣费后", lambda r: f"{r['edge'] * 100:+.3f}%"),
+        ], empty_text="暂无数据，正在获取行情...")
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='spread-scanner')
+        state = {'future': None, 'next': 0}
+
+        def start_refresh():
+            if state['future'] is None:
+                state['future'] = executor.submit(scanner.refresh)
+
+        def on_key(key):
+            if key == ord('r'):
+                start_refresh()
+            return True
+
+        def on_frame():
+            future = state['future']
+            if future is not None and future.done():
+                state['future'] = None
+                state['next'] = time.monotonic() + scanner.config['refresh']
+                try:
+                    future.result()
+                    view.set_source(ListSource(scanner.top()))
+                except Exception as e:
+                    self.show_error(f"价差扫描失败: {str(e)}")
+                for exchange_id, error in scanner.errors.items():
+                    self.notifications.post(f"{exchange_id} 获取行情失败: {error}", 'warning')
+            if future is None and time.monotonic() >= state['next']:
+                start_refresh()
 
-                    date_str = datetime.fromtimestamp(trade['timestamp'] / 1000).strftime('%Y-%m-%d %H:%M:%S')
+        def title():
+            status = "刷新中..." if state['future'] is not None else ""
+            return f"跨交易所价差 - {spread_scanner.format_stats(scanner.stats)} {status}"
 
-                    self.stdscr.addstr(i + 3, 0, str(trade['id'])[:10], curses.A_NORMAL)
-                    self.stdscr.addstr(i + 3, 15, str(trade['order'])[:10], curses.A_NORMAL)
-                    self.stdscr.addstr(i + 3, 30, trade['side'], curses.A_NORMAL)
-                    self.stdscr.addstr(i + 3, 40, f"{trade['price']:.8f}", curses.A_NORMAL)
-                    self.stdscr.addstr(i + 3, 55, f"{trade['amount']:.8f}", curses.A_NORMAL)
-                    self.stdscr.addstr(i + 3, 70, date_str, curses.A_NORMAL)
+        try:
+            self.run_list_view(view, title, "上下键选择, r立即刷新", on_key, on_frame)
+        finally:
+            executor.shutdown(wait=False)
 
-            self.stdscr.refresh()
+    def order_fee(self, order):
+        """
+        订单的手续费(计价货币)。交易所返回了手续费时使用返回值，按基础货币收取的换算为计价货币；
+        否则按缓存的费率和下单时的行情估算。
+        """
+        fee = order.get('fee') or {}
+        if fee.get('cost') is not None:
+            cost = float(fee['cost'])
+            if fee.get('currency') == self.current_market.get('base'):
+                cost *= self.price
+            return cost
+        maker, taker, _ = self.fee_cache.rates(self.current_exchange, self.current_api_key, self.current_symbol,
+                                               self.current_market)
+        latest = self.bus.latest(TICKER, self.current_exchange, self.current_api_key, self.current_symbol)
+        return estimate_order(order['side'], self.price, self.amount, maker, taker,
+                              latest.data if latest else None)['fee']
+
+    def order_csv_filename(self):
+        """当前账户的下单记录CSV文件名"""
+        return f"order_{self.current_exchange}_{self.current_api_key}.csv"
+
+    def view_analytics(self):
+        """
+        持仓分析页面。
+        按平均成本法汇总持仓、均价、已实现/未实现盈亏、手续费和成交额，
+        数据来源可在交易所成交记录和本地下单CSV之间切换。
+        成交记录来自订阅的成交事件，每次刷新只合并上次之后发布的新成交。
+        """
+        account = f"{self.current_exchange}/{self.current_api_key}"
+        source = 'trades'
+        if self.trade_analytics is None:
+            self.trade_analytics = analytics.PositionAnalytics()
+        csv_analytics = analytics.PositionAnalytics()
 
-            # 等待按键返回
+        try:
             while True:
-                key = self.stdscr.getch()
+                ticker = self.poller.refresh(TICKER)
+                marks = {self.current_symbol: ticker['last']}
+
+                if source == 'trades':
+                    # 先拉取一次最新成交，轮询线程和本次获取的成交都通过成交事件到达
+                    self.poller.refresh(FILL)
+                    trades = {}
+                    for event in self.fill_events.poll():
+                        trades.setdefault(f"{event.exchange}/{event.account}", []).append(event.data)
+                    added = sum(self.trade_analytics.update(analytics.fills_from_trades(fills, name))
+                                for name, fills in trades.items())
+                    log.info(f"持仓分析合并 {added} 笔新成交")
+                    summary = self.trade_analytics.summary(marks)
+                    title = "交易所成交记录(过去1天起)"
+                else:
+                    filename = self.order_csv_filename()
+                    if os.path.isfile(filename):
+                        csv_analytics.update(analytics.fills_from_order_csv(filename))
+                    summary = csv_analytics.summary(marks)
+                    title = f"下单记录 {filename}"
+
+                if len(summary):
+                    summary = summary.loc[summary.index.get_level_values('account') == account]
+
+                self.stdscr.clear()
+                self.stdscr.addstr(0, 0, f"持仓分析 - {account}", curses.A_BOLD)
+                self.stdscr.addstr(1, 0, f"数据来源: {title} | c: 切换来源, r: 刷新, q返回", curses.A_NORMAL)
+
+                if len(summary) == 0:
+                    self.stdscr.addstr(3, 0, "暂无成交数据", curses.A_NORMAL)
+                else:
+                    headers = [(0, "交易对"), (16, "持仓"), (30, "均价"), (44, "标记价"), (58, "已实现"),
+                               (72, "未实现"), (86, "手续费"), (100, "成交额")]
+                    for col, text in headers:
+                        self.stdscr.addstr(2, col, text, curses.A_UNDERLINE)
+                    max_rows = self.stdscr.getmaxyx()[0] - 5
+                    for i, ((_, symbol), row) in enumerate(summary.iloc[:max_rows].iterrows()):
+                        values = [row['position'], row['avg_entry'], row['mark'], row['realized'],
+                                  row['unrealized'], row['fees'], row['turnover']]
+                        self.stdscr.addstr(i + 3, 0, symbol[:15], curses.A_NORMAL)
+                        for (col, _), value in zip(headers[1:], values):
+                            self.stdscr.addstr(i + 3, col, f"{value:.6g}", curses.A_NORMAL)
+                    total = summary[['realized', 'unrealized', 'fees', 'net_pnl']].sum()
+                    self.stdscr.addstr(min(len(summary), max_rows) + 4, 0,
+                                       f"合计: 已实现 {total['realized']:.6g} | 未实现 {total['unrealized']:.6g}"
+                                       f" | 手续费 {total['fees']:.6g} | 净盈亏 {total['net_pnl']:.6g}",
+                                       curses.A_BOLD)
+
+                self.draw_notifications()
+                self.stdscr.refresh()
+
+                # 只在按键后重新获取数据
+                key = self.wait_key()
                 if key == ord('q'):
-                    log.info("用户退出成交历史页面")
+                    log.info("用户退出持仓分析页面")
                     break
+                elif key == ord('c'):
+                    source = 'csv' if source == 'trades' else 'trades'
+                    log.info(f"持仓分析切换数据来源为: {source}")
 
         except Exception as e:
-            log.error(f"获取成交历史失败: {str(e)}", exc_info=True)
-            self.show_error(f"获取成交历史失败: {str(e)}")
+            log.error(f"持仓分析失败: {str(e)}", exc_info=True)
+            self.show_error(f"持仓分析失败: {str(e)}")
 
     def save_order_to_csv(self, order):
         """保存下单录到CSV文件"""
-        filename = f"order_{self.current_exchange}_{self.current_api_key}.csv"
+        filename = self.order_csv_filename()
 
         # 检查文件是否存在
         file_exists = os.path.isfile(filename)
 
         try:
             log.info(f"保存下单记录到文件 {filename}")
+            fieldnames = ['timestamp', 'exchange', 'api_key', 'symbol', 'order_id',
+                          'side', 'price', 'amount', 'cost', 'fee', 'status']
+            if file_exists:
+                # 沿用已有文件的列，旧文件没有 fee 列时不写手续费，避免列错位
+                with open(filename, 'r', newline='') as existing:
+                    fieldnames = next(csv.reader(existing), None) or fieldnames
             with open(filename, 'a', newline='') as csvfile:
-                fieldnames = ['timestamp', 'exchange', 'api_key', 'symbol', 'order_id',
-                              'side', 'price', 'amount', 'cost', 'status']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+                writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
 
                 if not file_exists:
                     writer.writeheader()
@@ -606,6 +1393,7 @@ class SimpleTradeApp:
                     'price': self.price,
                     'amount': self.amount,
                     'cost': self.price * self.amount,
+                    'fee': self.order_fee(order),
                     'status': order['status']
                 }
                 writer.writerow(record)
@@ -633,16 +1421,27 @@ class SimpleTradeApp:
             curses.init_pair(1, curses.COLOR_RED, curses.COLOR_BLACK)
             curses.init_pair(2, curses.COLOR_GREEN, curses.COLOR_BLACK)
 
+            # 等待按键设置超时，使消息栏能够自动过期
+            self.stdscr.timeout(UI_POLL_MS)
+
             log.info("终端界面初始化成功")
+            self.poller.start()
+            self.engine.start()
+            self.triggers.start()
+            self.risk.start()
+            # 有上次的工作区时直接进入交易界面，退出交易界面后回到正常的选择流程
+            resumed = self.restore_workspace()
             # 主循环
             while True:
-                if not self.select_exchange_and_key():
-                    log.info("用户退出程序")
-                    break
+                if not resumed:
+                    if not self.select_exchange_and_key():
+                        log.info("用户退出程序")
+                        break
 
-                if not self.select_symbol():
-                    log.info("用户取消选择交易产品，返回交易所选择")
-                    continue
+                    if not self.select_symbol():
+                        log.info("用户取消选择交易产品，返回交易所选择")
+                        continue
+                resumed = False
                 # 进入交易主界面
                 self.main_trading_screen()
 
@@ -655,6 +1454,19 @@ class SimpleTradeApp:
             log.error(f"程序发生错误: {str(e)}", exc_info=True)
             print(f"程序错误: {str(e)}")
         finally:
+            log.info(f"交易所调用统计: {self.callers.metrics()}")
+            log.info(f"事件总线统计: {self.bus.stats()}")
+            self.save_current_workspace()
+            self.engine.stop()
+            self.triggers.stop()
+            self.risk.stop()
+            self.fee_cache.stop()
+            self.poller.stop()
+            self.workers.stop()
+            if self.recorder is not None:
+                self.recorder.close()
+            if self.shared_feed is not None:
+                self.shared_feed.close()
             # 恢复终端设置
             if self.stdscr is not None:
                 self.stdscr.keypad(False)
@@ -664,12 +1476,122 @@ class SimpleTradeApp:
             log.info("交易应用程序已关闭")
 
 
-def main():
+def fetch_trades_between(call, symbol, start, end=None, limit=HISTORY_FETCH_LIMIT):
+    """
+    分页获取 [start, end) 内的成交，按时间升序返回。交易所每次最多返回 limit 条，
+    从上一批最后一条成交的时间继续请求(同一毫秒的成交按ID去重)，直到超过 end 或返回不足 limit 条。
+    end 为 None 时不限制结束时间。
+    """
+    trades = []
+    seen = set()
+    since = start
+    while True:
+        batch = call('fetch_my_trades', symbol=symbol, since=since, limit=limit)
+        for trade in batch:
+            if trade['id'] not in seen and (end is None or trade['timestamp'] < end):
+                seen.add(trade['id'])
+                trades.append(trade)
+        if len(batch) < limit:
+            break
+        last = max(trade['timestamp'] for trade in batch)
+        if end is not None and last >= end:
+            break
+        # 整批都在同一毫秒时只能跳过这一毫秒，避免重复请求同一页
+        since = last if last > since else last + 1
+    trades.sort(key=lambda trade: trade['timestamp'])
+    return trades
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="简易加密货币交易系统")
+    parser.add_argument('--server', metavar='URL',
+                        help="作为交易守护进程的瘦客户端运行，例如 http://127.0.0.1:8765")
+    parser.add_argument('--batch', metavar='FILE',
+                        help="无界面批量下单模式，从CSV/JSONL文件读取订单，'-' 表示标准输入")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="批量订单格式，默认按扩展名或内容判断")
+    parser.add_argument('--concurrency', type=int, help="批量模式下每个交易所的并发下单数")
+    parser.add_argument('--output', metavar='FILE', help="批量模式结果输出文件(JSONL)，默认为标准输出")
+    parser.add_argument('--dry-run', action='store_true', help="批量模式只校验订单，不实际下单")
+    parser.add_argument('--record-market', action='store_true',
+                        help="不进入界面，按配置 recorder 录制行情、成交和盘口到 Parquet 文件")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="不进入界面，输出各启动阶段的导入和初始化耗时")
+    parser.add_argument('--no-resume', action='store_true', help="不恢复上次退出时的交易界面，从选择交易所开始")
+    parser.add_argument('--shm-feed', action='store_true',
+                        help="从共享内存行情段读取行情(需要运行 python shm_feed.py publish)")
+    parser.add_argument('--capture', metavar='FILE',
+                        help="录制全部交易所调用(参数、返回值和耗时)到gzip压缩的JSONL文件")
+    parser.add_argument('--replay', metavar='FILE', help="不连接交易所，用录制文件应答交易所调用")
+    parser.add_argument('--replay-speed', type=float, default=1.0,
+                        help="回放时交易所调用的耗时倍速，1为原速，0为不等待")
+    return parser.parse_args(argv)
+
+
+def profile_startup(server_url=None):
+    """
+    执行与界面启动相同的初始化步骤但不进入终端界面，
+    然后加载延迟导入的模块，输出各阶段耗时。
+    """
+    app = SimpleTradeApp(server_url=server_url)
+    try:
+        # 以下模块在启动时不导入，单独统计第一次使用时的额外耗时
+        with startup_profiler.phase('首次显示K线面板'):
+            ohlcv_store.OhlcvStore
+        with startup_profiler.phase('首次进入持仓分析'):
+            analytics.PositionAnalytics()
+    finally:
+        app.workers.stop()
+    report = startup_profiler.report()
+    log.info(report)
+    print(report)
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
     log.info("==== 简易加密货币交易系统启动 ====")
-    app = SimpleTradeApp()
+    if args.batch:
+        config = load_config()
+        if not config:
+            print("错误: 无法加载配置文件!", file=sys.stderr)
+            return 2
+        logger.configure(config.get('logging'))
+        log.info(f"进入批量下单模式, 订单来源: {args.batch}")
+        exchanges = create_exchanges(config)
+        recorder = TrafficRecorder(args.capture) if args.capture else None
+        if recorder is not None:
+            exchanges = wrap_exchanges(exchanges, recorder)
+        try:
+            exit_code = run_batch(exchanges, config, args.batch, fmt=args.format,
+                                  concurrency=args.concurrency, dry_run=args.dry_run, output_path=args.output)
+        finally:
+            if recorder is not None:
+                recorder.close()
+        log.info("==== 简易加密货币交易系统关闭 ====")
+        return exit_code
+
+    if args.record_market:
+        config = load_config()
+        if not config:
+            print("错误: 无法加载配置文件!", file=sys.stderr)
+            return 2
+        logger.configure(config.get('logging'))
+        log.info("进入行情录制模式")
+        from market_recorder import record
+        exit_code = record(config)
+        log.info("==== 简易加密货币交易系统关闭 ====")
+        return exit_code
+
+    if args.profile_startup:
+        return profile_startup(args.server)
+
+    app = SimpleTradeApp(server_url=args.server, capture=args.capture, replay=args.replay,
+                         replay_speed=args.replay_speed, resume=not args.no_resume, shared_feed=args.shm_feed)
     app.run()
     log.info("==== 简易加密货币交易系统关闭 ====")
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import logger
+
+# 获取日志记录器
+log = logger.get_logger('spread_scanner')
+
+# 默认参数，可通过配置 scanner 覆盖
+DEFAULT_SCANNER_CONFIG = {
+    # 刷新间隔(秒)
+    'refresh': 10.0,
+    # 列出的机会数量
+    'top': 100,
+    # 市场信息中没有手续费时使用的吃单费率
+    'default_fee': 0.001,
+}
+
+
+class SpreadScanner:
+    """
+    跨交易所价差扫描。
+    在两个及以上交易所上市的交易对排成列，交易所排成行，买一、卖一和吃单费率保存为 (交易所 x 交易对) 的数组；
+    每次刷新每个交易所只调用一次 fetch_tickers，与上次相比有变化的列才重新计算，
+    在所有交易所中找出扣除手续费后最高的卖出价和最低的买入价，得到每个交易对的价差和扣费后收益。
+    每个交易所只使用第一个账户获取公开行情。
+    """
+
+    def __init__(self, exchanges, callers, config=None):
+        self.callers = callers
+        self.config = dict(DEFAULT_SCANNER_CONFIG, **(config or {}))
+        self.accounts = {exchange_id: next(iter(accounts)) for exchange_id, accounts in exchanges.items() if accounts}
+        self.exchange_ids = sorted(self.accounts)
+        self.symbols = []
+        self.column = {}
+        self.errors = {}
+        self.stats = {}
+        # 刷新在后台线程进行，界面同时读取排行
+        self.lock = threading.Lock()
+        self._allocate()
+
+    def _allocate(self):
+        shape = (len(self.exchange_ids), len(self.symbols))
+        self.bid = np.full(shape, np.nan)
+        self.ask = np.full(shape, np.nan)
+        self.fee = np.full(shape, self.config['default_fee'])
+        count = len(self.symbols)
+        self.buy_index = np.zeros(count, dtype=np.int64)
+        self.sell_index = np.zeros(count, dtype=np.int64)
+        self.spread = np.full(count, np.nan)
+        self.edge = np.full(count, np.nan)
+
+    def _call_all(self, method):
+        """并行调用每个交易所，返回 {exchange_id: 结果}，失败的记录到 errors"""
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(1, len(self.exchange_ids)), thread_name_prefix='scanner') as pool:
+            futures = {exchange_id: pool.submit(self.callers.get(exchange_id, key_id).call, method)
+                       for exchange_id, key_id in self.accounts.items()}
+            for exchange_id, future in futures.items():
+                try:
+                    results[exchange_id] = future.result()
+                    self.errors.pop(exchange_id, None)
+                except Exception as e:
+                    log.warning(f"{exchange_id} 调用 {method} 失败: {type(e).__name__}: {str(e)}")
+                    self.errors[exchange_id] = f"{type(e).__name__}: {str(e)}"
+        return results
+
+    def load_markets(self):
+        """加载各交易所的市场信息，确定至少在两个交易所上市的交易对"""
+        markets = self._call_all('load_markets')
+        listed = {}
+        for exchange_id, exchange_markets in markets.items():
+            for symbol, market in exchange_markets.items():
+                if market.get('active') is False or market.get('spot') is False:
+                    continue
+                listed.setdefault(symbol, []).append(exchange_id)
+        with self.lock:
+            self.symbols = sorted(symbol for symbol, exchange_ids in listed.items() if len(exchange_ids) >= 2)
+            self.column = {symbol: i for i, symbol in enumerate(self.symbols)}
+            self._allocate()
+            for row, exchange_id in enumerate(self.exchange_ids):
+                for symbol, market in markets.get(exchange_id, {}).items():
+                    column = self.column.get(symbol)
+                    if column is not None and market.get('taker') is not None:
+                        self.fee[row, column] = market['taker']
+        log.info(f"{len(self.exchange_ids)} 个交易所中有 {len(self.symbols)} 个交易对在两个及以上交易所上市")
+        return len(self.symbols)
+
+    def update(self, exchange_id, tickers):
+        """
+        用一个交易所的行情快照更新数组，返回买一或卖一有变化的列。
+        快照替换整行: 快照中没有的交易对(下架、暂停或获取失败)置为 NaN，不再沿用旧报价。
+        """
+        row = self.exchange_ids.index(exchange_id)
+        columns, bids, asks = [], [], []
+        for symbol, ticker in tickers.items():
+            column = self.column.get(symbol)
+            if column is not None:
+                columns.append(column)
+                bids.append(ticker.get('bid'))
+                asks.append(ticker.get('ask'))
+        new_bids = np.full(len(self.symbols), np.nan)
+        new_asks = np.full(len(self.symbols), np.nan)
+        if columns:
+            columns = np.asarray(columns, dtype=np.int64)
+            # None 转换为 NaN
+            new_bids[columns] = np.asarray(bids, dtype=float)
+            new_asks[columns] = np.asarray(asks, dtype=float)
+        old_bids = self.bid[row]
+        old_asks = self.ask[row]
+        changed = ~(((old_bids == new_bids) | (np.isnan(old_bids) & np.isnan(new_bids)))
+                    & ((old_asks == new_asks) | (np.isnan(old_asks) & np.isnan(new_asks))))
+        self.bid[row] = new_bids
+        self.ask[row] = new_asks
+        return np.flatnonzero(changed)
+
+    def recompute(self, columns=None):
+        """
+        重新计算指定列(默认全部)的最优买卖交易所、价差和扣费后收益，向量化一次完成。
+        价差 = 最高买一 / 最低卖一 - 1；扣费后收益 = 最高买一 x (1 - 卖出费率) / (最低卖一 x (1 + 买入费率)) - 1。
+        """
+        if columns is None:
+            columns = np.arange(len(self.symbols))
+        if len(columns) == 0 or not self.exchange_ids:
+            return
+        bid = self.bid[:, columns]
+        ask = self.ask[:, columns]
+        fee = self.fee[:, columns]
+        net_bid = np.where(np.isnan(bid), -np.inf, bid * (1 - fee))
+        net_ask = np.where(np.isnan(ask), np.inf, ask * (1 + fee))
+        sell = np.argmax(net_bid, axis=0)
+        buy = np.argmin(net_ask, axis=0)
+        span = np.arange(len(columns))
+        best_bid = net_bid[sell, span]
+        best_ask = net_ask[buy, span]
+        # 缺少报价或最优买卖在同一交易所时没有跨所机会
+        valid = np.isfinite(best_bid) & np.isfinite(best_ask) & (best_ask > 0) & (sell != buy)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            edge = np.where(valid, best_bid / best_ask - 1, np.nan)
+            spread = np.where(valid, bid[sell, span] / ask[buy, span] - 1, np.nan)
+        self.buy_index[columns] = buy
+        self.sell_index[columns] = sell
+        self.edge[columns] = edge
+        self.spread[columns] = spread
+
+    def refresh(self):
+        """获取各交易所的行情快照并只重算变化的列，返回本次刷新的统计"""
+        if not self.symbols:
+            self.load_markets()
+        started = time.perf_counter()
+        snapshots = self._call_all('fetch_tickers')
+        fetched = time.perf_counter()
+        with self.lock:
+            # 获取失败的交易所按空快照处理，清除它的旧报价
+            changed = [self.update(exchange_id, snapshots.get(exchange_id, {})) for exchange_id in self.exchange_ids]
+            columns = np.unique(np.concatenate(changed)) if changed else np.zeros(0, dtype=np.int64)
+            self.recompute(columns)
+        finished = time.perf_counter()
+        self.stats = {'symbols': len(self.symbols), 'exchanges': len(snapshots), 'changed': len(columns),
+                      'fetch': fetched - started, 'compute': finished - fetched, 'time': time.time()}
+        log.debug(f"价差扫描刷新: {self.stats}")
+        return self.stats
+
+    def top(self, count=None):
+        """扣费后收益最高的 count 个交易对，从高到低排列"""
+        count = count or self.config['top']
+        with self.lock:
+            return self._top(count)
+
+    def _top(self, count):
+        valid = np.flatnonzero(~np.isnan(self.edge))
+        if len(valid) > count:
+            valid = valid[np.argpartition(-self.edge[valid], count - 1)[:count]]
+        order = valid[np.argsort(-self.edge[valid])]
+        return [{
+            'symbol': self.symbols[column],
+            'buy_exchange': self.exchange_ids[self.buy_index[column]],
+            'ask': float(self.ask[self.buy_index[column], column]),
+            'sell_exchange': self.exchange_ids[self.sell_index[column]],
+            'bid': float(self.bid[self.sell_index[column], column]),
+            'spread': float(self.spread[column]),
+            'edge': float(self.edge[column]),
+        } for column in order]
+
+
+def format_stats(stats):
+    if not stats:
+        return "尚未刷新"
+    return (f"{stats['exchanges']} 个交易所 {stats['symbols']} 个交易对 | 本次变化 {stats['changed']} 个"
+            f" | 获取 {stats['fetch']:.2f}s 计算 {stats['compute'] * 1000:.1f}ms"
+            f" | {time.strftime('%H:%M:%S', time.localtime(stats['time']))}")
+
+
+def demo(exchanges, symbols, rounds, seed=None):
+    """在多个模拟交易所上扫描，输出每轮的计算耗时和最好的机会"""
+    from sim_exchange import SimExchange
+    from exchange_worker import WorkerPool
+    from resilience import ResilientPool
+
+    names = [f"S{i}/USDT" for i in range(symbols)]
+    instances = {}
+    for i in range(exchanges):
+        # 各交易所价格略有偏差，且只上市部分交易对
+        listed = names[i % 3:]
+        instances[f"sim{i}"] = {'demo': SimExchange(f"sim{i}", symbols=listed, price=100.0 * (1 + 0.002 * i),
+                                                     volatility=0.002, seed=None if seed is None else seed + i)}
+    workers = WorkerPool(instances, threads=2, timeout=30)
+    callers = ResilientPool(workers, {'hedge': False})
+    scanner = SpreadScanner(instances, callers)
+    try:
+        for _ in range(rounds):
+            print(format_stats(scanner.refresh()))
+        # 全量重算一次，作为增量计算的对照
+        started = time.perf_counter()
+        scanner.recompute()
+        print(f"全量重算 {len(scanner.symbols)} 列 x {len(scanner.exchange_ids)} 个交易所:"
+              f" {(time.perf_counter() - started) * 1000:.2f}ms")
+        for row in scanner.top(5):
+            print(f"  {row['symbol']:<12} {row['buy_exchange']} 买 {row['ask']:.4f} -> {row['sell_exchange']}"
+                  f" 卖 {row['bid']:.4f} | 价差 {row['spread'] * 100:.3f}% 扣费后 {row['edge'] * 100:.3f}%")
+    finally:
+        workers.stop()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="在模拟交易所上演示跨交易所价差扫描")
+    parser.add_argument('--exchanges', type=int, default=5, help="模拟交易所数量")
+    parser.add_argument('--symbols', type=int, default=2000, help="每个交易所的交易对数量")
+    parser.add_argument('--rounds', type=int, default=3, help="刷新次数")
+    parser.add_argument('--seed', type=int, help="随机种子")
+    args = parser.parse_args(argv)
+    return demo(args.exchanges, args.symbols, args.rounds, args.seed)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
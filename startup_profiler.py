@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+import unicodedata
+from contextlib import contextmanager
+
+# 启动计时的起点，本模块应当最先被导入
+START = time.perf_counter()
+
+_lock = threading.Lock()
+_local = threading.local()
+# 已记录的阶段: (开始时间, 嵌套层级, 名称, 耗时秒)
+_phases = []
+
+
+def record(name, seconds, started=None, depth=None):
+    """记录一个已完成阶段的耗时"""
+    if started is None:
+        started = time.perf_counter() - seconds
+    if depth is None:
+        depth = getattr(_local, 'depth', 0)
+    with _lock:
+        _phases.append((started, depth, name, seconds))
+
+
+@contextmanager
+def phase(name):
+    """
+    记录一个启动阶段的耗时，可以嵌套，嵌套阶段在报告中缩进显示。
+    计时开销很小，始终开启，只有 --profile-startup 时才输出报告。
+    """
+    depth = getattr(_local, 'depth', 0)
+    _local.depth = depth + 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _local.depth = depth
+        record(name, time.perf_counter() - started, started, depth)
+
+
+def _width(text):
+    """终端显示宽度，中文字符占两列"""
+    return sum(2 if unicodedata.east_asian_width(c) in 'WF' else 1 for c in text)
+
+
+def _ljust(text, width):
+    return text + ' ' * max(0, width - _width(text))
+
+
+def _rjust(text, width):
+    return ' ' * max(0, width - _width(text)) + text
+
+
+def phases():
+    """按开始时间返回已记录的阶段"""
+    with _lock:
+        return sorted(_phases)
+
+
+def report():
+    """生成按阶段排列的启动耗时报告"""
+    lines = ["启动耗时分析:", f"{_ljust('阶段', 40)}{_rjust('起始(ms)', 10)}{_rjust('耗时(ms)', 10)}"]
+    for started, depth, name, seconds in phases():
+        label = _ljust('  ' * depth + name, 40)
+        lines.append(f"{label}{(started - START) * 1000:>10.1f}{seconds * 1000:>10.1f}")
+    lines.append(f"{_ljust('合计', 40)}{'':>10}{(time.perf_counter() - START) * 1000:>10.1f}")
+    return '\n'.join(lines)
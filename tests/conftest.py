@@ -0,0 +1,97 @@
+import os
+import sys
+import asyncio
+import threading
+
+import time
+
+import ccxt
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exchange_worker import WorkerPool  # noqa: E402
+from resilience import ResilientPool  # noqa: E402
+from sim_exchange import SimExchange  # noqa: E402
+from trade_server import TradeServer  # noqa: E402
+
+
+class SlowExchange(SimExchange):
+    """下单请求 delay 秒后才在交易所生效"""
+
+    def __init__(self, *args, delay=0.2, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delay = delay
+
+    def create_limit_order(self, symbol, side, amount, price, params=None):
+        time.sleep(self.delay)
+        return super().create_limit_order(symbol, side, amount, price, params)
+
+
+class RejectingExchange(SimExchange):
+    """下单总是因余额不足被拒绝"""
+
+    def create_limit_order(self, symbol, side, amount, price, params=None):
+        raise ccxt.InsufficientFunds("余额不足")
+
+
+@pytest.fixture
+def make_exchange():
+    """创建有余额的模拟交易所，cls 可以是 SlowExchange 或 RejectingExchange"""
+    def make(cls=SimExchange, seed=1, **kwargs):
+        exchange = cls(symbols=('BTC/USDT',), seed=seed, **kwargs)
+        exchange.balance = {'BTC': 10.0, 'USDT': 100000.0}
+        return exchange
+    return make
+
+
+@pytest.fixture
+def make_callers():
+    """为 {exchange_id: {key_id: exchange}} 启动工作线程并返回调用器，测试结束时停止工作线程"""
+    pools = []
+
+    def make(exchanges, threads=1, timeout=5, resilience=None):
+        workers = WorkerPool(exchanges, threads=threads, timeout=timeout)
+        pools.append(workers)
+        return ResilientPool(workers, dict({'hedge': False}, **(resilience or {})))
+
+    yield make
+    for workers in pools:
+        workers.stop()
+
+
+@pytest.fixture
+def sim(make_exchange):
+    return make_exchange()
+
+
+@pytest.fixture
+def remote_server(sim):
+    """在后台线程运行以 SimExchange 为账户的交易守护进程，返回 (地址, 守护进程)"""
+    server = TradeServer({'exchanges': {}, 'server': {'tokens': {'sim/demo': 'secret'}}})
+    server.exchanges = {'sim': {'demo': sim}}
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    state = {}
+
+    async def serve():
+        state['server'] = await asyncio.start_server(server.handle_connection, '127.0.0.1', 0)
+        state['port'] = state['server'].sockets[0].getsockname()[1]
+        started.set()
+
+    thread = threading.Thread(target=lambda: (loop.run_until_complete(serve()), loop.run_forever()), daemon=True)
+    thread.start()
+    started.wait(5)
+    yield f"http://127.0.0.1:{state['port']}", server
+
+    async def shutdown():
+        state['server'].close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run_coroutine_threadsafe(shutdown(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
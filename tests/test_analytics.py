@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from analytics import BLOCK_SIZE, FILL_COLUMNS, PositionAnalytics, naive_positions, synthetic_fills
+
+
+def fills(*rows):
+    return pd.DataFrame([(str(i), 'sim/demo', 'BTC/USDT', i, side, price, amount, 0.0)
+                         for i, (side, price, amount) in enumerate(rows)], columns=FILL_COLUMNS)
+
+
+def test_partial_close_and_flip():
+    analytics = PositionAnalytics()
+    analytics.update(fills(('buy', 100.0, 2.0), ('sell', 110.0, 1.0), ('sell', 120.0, 3.0)))
+    state = analytics.state.loc[('sim/demo', 'BTC/USDT')]
+    # 部分平仓盈利 10，反手时平掉剩余 1 盈利 20，新空头 2 的成本按反手价
+    assert (state['position'], state['cost'], state['realized']) == (-2.0, -240.0, 30.0)
+
+    analytics.update(fills(('buy', 100.0, 2.0)).assign(id='close', timestamp=10))
+    state = analytics.state.loc[('sim/demo', 'BTC/USDT')]
+    assert (state['position'], state['cost'], state['realized']) == (0.0, 0.0, 70.0)
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_vectorized_matches_naive_loop_on_random_fills(seed):
+    # 交易对少，每组成交远多于一个块，买卖随机，包含大量部分平仓和反手
+    sample = synthetic_fills(3000, accounts=2, symbols=3, seed=seed)
+    expected = naive_positions(sample)
+
+    analytics = PositionAnalytics()
+    for chunk in np.array_split(np.arange(len(sample)), 4):
+        analytics.update(sample.iloc[chunk])
+    assert len(analytics.state) == len(expected)
+    for key, (position, cost, realized) in expected.items():
+        got = analytics.state.loc[key]
+        assert got['position'] == pytest.approx(position, rel=1e-9, abs=1e-9)
+        assert got['cost'] == pytest.approx(cost, rel=1e-6, abs=1e-6)
+        assert got['realized'] == pytest.approx(realized, rel=1e-6, abs=1e-6)
+
+    q = np.where(sample['side'] == 'buy', 1.0, -1.0) * sample['amount']
+    position = q.groupby([sample['account'], sample['symbol']]).cumsum()
+    previous = position - q
+    flips = (np.sign(position) * np.sign(previous) < 0).sum()
+    partial = ((np.sign(q) != np.sign(previous)) & (np.sign(position) == np.sign(previous))).sum()
+    assert flips > 20 and partial > 20 and len(sample) / len(expected) > 10 * BLOCK_SIZE
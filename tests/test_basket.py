@@ -0,0 +1,29 @@
+import time
+
+from basket import BasketRunner, Leg
+from conftest import RejectingExchange, SlowExchange
+
+
+def test_timed_out_leg_is_found_and_canceled(make_exchange, make_callers):
+    slow = make_exchange(SlowExchange, seed=1, delay=0.5)
+    exchanges = {'sim': {'slow': slow, 'bad': make_exchange(RejectingExchange, seed=2)}}
+    callers = make_callers(exchanges, resilience={'retries': 0})
+    runner = BasketRunner(exchanges, callers, {'timeout': 0.2, 'resolve_interval': 0.3})
+    legs = [Leg('sim', 'slow', 'BTC/USDT', 'buy', 90.0, 0.1), Leg('sim', 'bad', 'BTC/USDT', 'sell', 110.0, 0.1)]
+    result = runner.execute(legs)
+    assert not result['ok']
+    assert result['unknown'] == 0 and result['canceled'] == 1
+    assert legs[0].status == 'canceled' and legs[1].status == 'failed'
+    assert slow.fetch_open_orders('BTC/USDT') == []
+
+
+def test_timed_out_leg_not_found_stays_unknown(make_exchange, make_callers):
+    exchanges = {'sim': {'slow': make_exchange(SlowExchange, seed=1, delay=0.5)}}
+    callers = make_callers(exchanges, resilience={'retries': 0})
+    # 下单始终晚于查找，查不到时保持状态未知并计入失败
+    runner = BasketRunner(exchanges, callers, {'timeout': 0.2, 'resolve_attempts': 1})
+    exchanges['sim']['slow'].create_limit_order = lambda *args, **kwargs: time.sleep(1.0)
+    legs = [Leg('sim', 'slow', 'BTC/USDT', 'buy', 90.0, 0.1)]
+    result = runner.execute(legs)
+    assert not result['ok'] and result['unknown'] == 1 and result['failed'] == 1
+    assert legs[0].status == 'unknown' and '未在挂单中找到' in legs[0].message
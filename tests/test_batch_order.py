@@ -0,0 +1,30 @@
+import io
+import json
+
+from batch_order import BatchOrderRunner
+from conftest import SlowExchange
+
+
+def order(exchange_id, price):
+    return {'exchange': exchange_id, 'account': 'demo', 'symbol': 'BTC/USDT', 'side': 'buy',
+            'price': price, 'amount': 0.1}
+
+
+def test_slow_exchange_does_not_block_others(make_exchange):
+    exchanges = {'slow': {'demo': make_exchange(SlowExchange, seed=1)}, 'fast': {'demo': make_exchange(seed=2)}}
+    output = io.StringIO()
+    runner = BatchOrderRunner(exchanges, concurrency=1, output=output)
+    # 慢交易所的订单排在前面，快交易所的订单不应该等它们全部完成
+    orders = [order('slow', 90.0 + i) for i in range(5)] + [order('fast', 90.0 + i) for i in range(5)]
+    stats = runner.run(enumerate(orders, 1))
+    assert stats == {'ok': 10, 'rejected': 0, 'error': 0}
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [r['exchange'] for r in results[:5]].count('fast') == 5
+    assert len(exchanges['slow']['demo'].fetch_open_orders('BTC/USDT')) == 5
+
+
+def test_unknown_account_is_rejected_without_blocking(make_exchange):
+    output = io.StringIO()
+    runner = BatchOrderRunner({'fast': {'demo': make_exchange(seed=2)}}, output=output)
+    stats = runner.run(enumerate([order('missing', 90.0), order('fast', 90.0)], 1))
+    assert stats == {'ok': 1, 'rejected': 1, 'error': 0}
@@ -0,0 +1,29 @@
+import os
+import sys
+import time
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 在子进程中运行: DNS解析卡住时检查仍按时给出结果，进程也能立即退出
+SCRIPT = """
+import socket, time
+import config_manager
+socket.getaddrinfo = lambda *args, **kwargs: time.sleep(30)
+config = {'exchanges': {'binance': {'main': {'apiKey': 'k', 'secret': 's'}, 'backup': {'apiKey': 'k', 'secret': 's'}}}}
+started = time.monotonic()
+results = config_manager.test_all_accounts(config, timeout=0.5)
+print(sorted(r['status'] for r in results), round(time.monotonic() - started, 1))
+"""
+
+
+def test_hung_dns_times_out_and_process_exits():
+    started = time.monotonic()
+    output = subprocess.run([sys.executable, '-c', SCRIPT], cwd=ROOT, capture_output=True, text=True, timeout=20)
+    elapsed = time.monotonic() - started
+    assert output.returncode == 0, output.stderr
+    statuses, seconds = output.stdout.rsplit(' ', 1)
+    assert statuses == "['timeout', 'timeout']"
+    assert float(seconds) <= 1.0
+    # 卡住的解析线程是守护线程，退出时不等待它
+    assert elapsed < 10
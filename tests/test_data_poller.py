@@ -0,0 +1,47 @@
+import ccxt
+
+from data_poller import DataPoller, ORDER_GONE
+from event_bus import EventBus, ORDER
+
+
+class OrderCaller:
+    def __init__(self, open_orders, final=None):
+        self.open_orders = open_orders
+        self.final = final or {}
+
+    def call(self, method, *args, **kwargs):
+        if method == 'fetch_open_orders':
+            return list(self.open_orders)
+        if method == 'fetch_order':
+            if args[0] not in self.final:
+                raise ccxt.OrderNotFound(args[0])
+            return self.final[args[0]]
+        raise AssertionError(method)
+
+
+class Callers:
+    def __init__(self, caller):
+        self.caller = caller
+
+    def get(self, exchange_id, key_id):
+        return self.caller
+
+
+def order(order_id, status='open'):
+    return {'id': order_id, 'symbol': 'BTC/USDT', 'status': status, 'filled': 0.0, 'timestamp': 0}
+
+
+def test_orders_leaving_open_list_get_their_final_status():
+    caller = OrderCaller([order('1'), order('2')], final={'1': dict(order('1', 'canceled'))})
+    bus = EventBus()
+    poller = DataPoller(bus, Callers(caller))
+    poller.set_target('sim', 'demo', 'BTC/USDT')
+    events = bus.subscribe('test', (ORDER,))
+    poller.refresh(ORDER)
+    events.poll()
+
+    caller.open_orders = []
+    poller.refresh(ORDER)
+    statuses = {event.data['id']: event.data['status'] for event in events.poll()}
+    # 查到最终状态的用真实状态，查不到的不再假定为已成交
+    assert statuses == {'1': 'canceled', '2': ORDER_GONE}
@@ -0,0 +1,76 @@
+import time
+import threading
+
+import ccxt
+
+from exchange_factory import DeferredExchange
+from exchange_worker import ExchangeWorker, guard_rate_limit
+from traffic_capture import TrafficRecorder, wrap_exchanges
+
+
+def run_threads(target, count):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_concurrent_throttle_keeps_rate_limit():
+    exchange = guard_rate_limit(ccxt.binance({'rateLimit': 50}))
+    sent = []
+
+    def request():
+        for _ in range(3):
+            exchange.throttle(1)
+            exchange.set_last_rest_request_timestamp()
+            sent.append(time.monotonic())
+
+    run_threads(request, 4)
+    sent.sort()
+    gaps = [b - a for a, b in zip(sent, sent[1:])]
+    # 12 个请求至少间隔一个限频周期(留出计时误差)
+    assert min(gaps) > 0.04
+    assert sent[-1] - sent[0] > 11 * 0.045
+
+
+def test_concurrent_nonce_is_strictly_increasing():
+    exchange = guard_rate_limit(ccxt.binance())
+    nonces = []
+
+    def sign():
+        for _ in range(200):
+            nonces.append(exchange.nonce())
+
+    run_threads(sign, 4)
+    assert len(set(nonces)) == len(nonces)
+
+
+def test_worker_guards_shared_instance():
+    exchange = ccxt.binance()
+    worker = ExchangeWorker('binance', 'demo', exchange, threads=2)
+    worker.stop()
+    assert worker.exchange is exchange and exchange._worker_lock
+    assert guard_rate_limit(exchange).throttle is exchange.throttle
+
+
+def test_deferred_instance_is_guarded_when_created():
+    deferred = DeferredExchange('binance', 'demo', {'apiKey': 'key', 'secret': 'secret'}, {})
+    worker = ExchangeWorker('binance', 'demo', deferred, threads=2)
+    worker.stop()
+    # 创建工作线程不会提前创建实例
+    assert deferred.__dict__['_exchange'] is None
+    exchange = deferred._load()
+    assert isinstance(exchange, ccxt.binance) and exchange._worker_lock
+
+
+def test_captured_instance_is_guarded(tmp_path):
+    exchange = ccxt.binance()
+    recorder = TrafficRecorder(str(tmp_path / 'capture.jsonl.gz'))
+    try:
+        wrapped = wrap_exchanges({'binance': {'demo': exchange}}, recorder)['binance']['demo']
+        worker = ExchangeWorker('binance', 'demo', wrapped, threads=2)
+        worker.stop()
+    finally:
+        recorder.close()
+    assert wrapped._exchange is exchange and exchange._worker_lock
@@ -0,0 +1,44 @@
+import time
+
+import pytest
+
+from execution_engine import ExecutionEngine, ParentOrder
+from exchange_worker import WorkerPool
+from resilience import ResilientPool
+from trade_client import create_remote_exchanges
+
+OPTIONS = {'twap': {'duration': 1.0, 'slices': 3}, 'iceberg': {'visible': 0.2}, 'chase': {'interval': 0.1}}
+
+
+def test_parent_order_requires_run():
+    with pytest.raises(TypeError):
+        ParentOrder('A1', 'sim', 'demo', 'BTC/USDT', 'buy', 1.0, 100.0, {})
+
+
+@pytest.mark.parametrize('kind', sorted(OPTIONS))
+def test_parent_order_through_remote_exchange(remote_server, sim, kind):
+    """瘦客户端模式下，母单的精度取整、子单下单和成交跟踪都经过守护进程"""
+    url, _ = remote_server
+    exchanges = create_remote_exchanges(url, {'sim/demo': 'secret'})
+    workers = WorkerPool(exchanges, threads=1, timeout=5)
+    callers = ResilientPool(workers, {'hedge': False})
+    engine = ExecutionEngine(exchanges, callers, {'tick': 0.02, 'poll_interval': 0.1})
+    engine.start()
+    try:
+        last = sim.fetch_ticker('BTC/USDT')['last']
+        # 追价单挂在买一，其他算法的限价高于卖价，子单都能在模拟交易所成交
+        price = last * 1.01 if kind != 'chase' else None
+        parent = engine.submit(kind, 'sim', 'demo', 'BTC/USDT', 'buy', 0.6, price, **OPTIONS[kind])
+        deadline = time.monotonic() + 20
+        while parent.status == 'running' and time.monotonic() < deadline:
+            # 推动模拟行情，挂单在价格穿越时成交
+            sim.fetch_ticker('BTC/USDT')
+            time.sleep(0.05)
+    finally:
+        engine.stop()
+        workers.stop()
+
+    assert parent.status == 'done', parent.message
+    assert parent.filled == pytest.approx(0.6)
+    assert parent.children
+    assert all(order['status'] != 'open' for order in sim.fetch_open_orders('BTC/USDT'))
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from fee_cache import FeeCache, estimate_order
+
+TICKER = {'bid': 99.0, 'ask': 101.0}
+
+
+@pytest.fixture
+def fees(tmp_path):
+    path = tmp_path / 'fees.json'
+    path.write_text(json.dumps({'sim/demo': {'fetched_at': 0, 'source': 'fetch_trading_fees', 'fees': {
+        'BTC/USDT': {'maker': 0.0002, 'taker': 0.0005},
+        'ETH/USDT': {'maker': None, 'taker': 0.0007},
+        'SOL/USDT': {'maker': 0.0001, 'taker': None},
+    }}}))
+    cache = FeeCache({}, None, {'default_maker': 0.002, 'default_taker': 0.003}, path=str(path))
+    yield cache
+    cache.stop()
+
+
+def test_rates_fall_back_from_account_to_market_to_default(fees):
+    market = {'maker': 0.001, 'taker': 0.0015}
+    # 账户的缓存费率优先于市场信息
+    assert fees.rates('sim', 'demo', 'BTC/USDT', market) == (0.0002, 0.0005, 'fetch_trading_fees')
+    assert fees.rates('sim', 'demo', 'XRP/USDT', market) == (0.001, 0.0015, 'market')
+    assert fees.rates('sim', 'other', 'BTC/USDT', market) == (0.001, 0.0015, 'market')
+    assert fees.rates('sim', 'demo', 'XRP/USDT', {'maker': None, 'taker': None}) == (0.002, 0.003, 'default')
+    assert fees.rates('sim', 'demo', 'XRP/USDT') == (0.002, 0.003, 'default')
+
+
+def test_one_sided_entries_use_the_other_rate(fees):
+    assert fees.rates('sim', 'demo', 'ETH/USDT') == (0.0007, 0.0007, 'fetch_trading_fees')
+    assert fees.rates('sim', 'demo', 'SOL/USDT') == (0.0001, 0.0001, 'fetch_trading_fees')
+    assert fees.rates('sim', 'demo', 'XRP/USDT', {'taker': 0.004}) == (0.004, 0.004, 'market')
+
+
+@pytest.mark.parametrize('side, price, taker', [
+    ('buy', 101.0, True), ('buy', 102.0, True), ('buy', 100.0, False),
+    ('sell', 99.0, True), ('sell', 98.0, True), ('sell', 100.0, False),
+])
+def test_crossing_the_book_uses_the_taker_rate(side, price, taker):
+    estimate = estimate_order(side, price, 2.0, 0.001, 0.002, TICKER)
+    assert estimate['taker'] is taker
+    assert estimate['rate'] == (0.002 if taker else 0.001)
+    assert estimate['fee'] == pytest.approx(price * 2.0 * estimate['rate'])
+
+
+def test_without_ticker_orders_are_priced_as_maker():
+    assert not estimate_order('buy', 1e9, 1.0, 0.001, 0.002)['taker']
+
+
+def test_sufficient_checks_quote_for_buys_and_base_for_sells():
+    # 买入需要金额加手续费: 100 * 1 * 1.001 = 100.1
+    buy = estimate_order('buy', 100.0, 1.0, 0.001, 0.002, TICKER, base_free=0.0, quote_free=100.2)
+    assert buy['sufficient'] and buy['base_after'] == 1.0 and buy['quote_after'] == pytest.approx(0.1)
+    assert not estimate_order('buy', 100.0, 1.0, 0.001, 0.002, TICKER, quote_free=100.0)['sufficient']
+
+    sell = estimate_order('sell', 100.0, 1.0, 0.001, 0.002, TICKER, base_free=1.0, quote_free=0.0)
+    assert sell['sufficient'] and sell['base_after'] == 0.0 and sell['quote_after'] == pytest.approx(99.9)
+    assert not estimate_order('sell', 100.0, 1.5, 0.001, 0.002, TICKER, base_free=1.0,
+                              quote_free=1e6)['sufficient']
@@ -0,0 +1,60 @@
+import curses
+
+import simple_trade
+from simple_trade import UI_POLL_MS, SimpleTradeApp
+
+
+class BufferedScreen:
+    """按顺序返回已缓冲的按键，读完后返回 -1，记录设置的超时"""
+
+    def __init__(self, keys):
+        self.keys = list(keys)
+        self.timeouts = []
+
+    def getch(self):
+        return self.keys.pop(0) if self.keys else -1
+
+    def timeout(self, ms):
+        self.timeouts.append(ms)
+
+
+class NoFetchPoller:
+    def __init__(self):
+        self.refreshed = []
+
+    def refresh(self, kind):
+        self.refreshed.append(kind)
+
+
+def make_app(keys):
+    app = SimpleTradeApp.__new__(SimpleTradeApp)
+    app.stdscr = BufferedScreen(keys)
+    app.poller = NoFetchPoller()
+    app.frame_interval = 0.05
+    app.price, app.price_precision = 100.0, 0.01
+    app.amount, app.amount_precision, app.min_amount = 1.0, 0.001, 0.001
+    return app
+
+
+def test_burst_of_keys_is_applied_as_one_change(monkeypatch):
+    burst = [curses.KEY_UP] * 30 + [ord('a')] * 5 + [curses.KEY_DOWN] * 10 + [ord('z')]
+    app = make_app(burst + [ord('q'), curses.KEY_UP])
+    changes = []
+    monkeypatch.setattr(simple_trade.log, 'debug', changes.append)
+
+    steps, key = app.read_keys(simple_trade.time.monotonic())
+    assert steps == {'price': 20, 'amount': 4} and key == ord('q')
+    app.apply_steps(steps)
+    # 一帧只调整一次价格和一次数量，不请求数据
+    assert len(changes) == 2 and app.poller.refreshed == []
+    assert round(app.price, 2) == 100.2 and round(app.amount, 3) == 1.04
+    # 停止处的按键之后的按键留到下一帧，读取结束后恢复界面的轮询超时
+    assert app.stdscr.keys == [curses.KEY_UP] and app.stdscr.timeouts[-1] == UI_POLL_MS
+
+
+def test_past_the_frame_deadline_only_buffered_keys_are_read():
+    app = make_app([curses.KEY_UP, curses.KEY_UP])
+    steps, key = app.read_keys(simple_trade.time.monotonic() - 1.0)
+    # 帧时间已过，后续按键只等待已缓冲的(超时为0)
+    assert app.stdscr.timeouts[0] == 0
+    assert steps == {'price': 2, 'amount': 0} and key == -1
@@ -0,0 +1,47 @@
+import curses
+
+from list_view import ListView, PagedSource
+
+
+class FakeScreen:
+    def getmaxyx(self):
+        return 30, 120
+
+    def addstr(self, *args):
+        pass
+
+
+def make_view(pages):
+    loaded = []
+
+    def loader(page):
+        loaded.append(page)
+        return [f"{page}-{i}" for i in range(10)]
+
+    source = PagedSource(loader, max_pages=pages)
+    source.load_more()
+    return ListView(source, [(0, "行", str)]), loaded
+
+
+def test_end_loads_one_page_per_frame():
+    view, loaded = make_view(5)
+    screen = FakeScreen()
+    view.draw(screen, 0, 20)
+    assert view.handle_key(curses.KEY_END)
+    # 按键本身只加载一页，剩下的页在之后的帧里逐页加载
+    assert len(loaded) == 2 and view.busy
+    frames = 0
+    while view.busy:
+        view.draw(screen, 0, 20)
+        frames += 1
+    assert loaded == [0, 1, 2, 3, 4] and frames >= 3
+    assert view.selected_row() == "4-9"
+
+
+def test_any_key_cancels_seeking_end():
+    view, loaded = make_view(30)
+    view.draw(FakeScreen(), 0, 20)
+    view.handle_key(ord('G'))
+    view.handle_key(curses.KEY_UP)
+    view.draw(FakeScreen(), 0, 20)
+    assert not view.busy and len(loaded) < 30
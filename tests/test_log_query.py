@@ -0,0 +1,110 @@
+import fcntl
+import gzip
+import json
+import logging
+import os
+
+import pytest
+
+import logger
+from log_query import LogQuery, list_segments
+from logger import ARCHIVE_SUFFIX, INDEX_SUFFIX, JSON_SUFFIX, JsonFormatter, compress_segment, sweep_segments
+
+START = 1.7e9
+ORDERS = ['1001', '1002', '1003']
+
+
+def make_lines(first, count):
+    """每秒一行，每10行一条订单日志，少数行只带 parent_id"""
+    formatter = JsonFormatter()
+    lines = []
+    for i in range(first, first + count):
+        fields = {'exchange': 'sim', 'account': 'demo', 'symbol': 'BTC/USDT'}
+        if i % 10 == 0:
+            fields['order_id'] = ORDERS[(i // 10) % len(ORDERS)]
+        elif i % 37 == 0:
+            fields['parent_id'] = ORDERS[0]
+        record = logging.LogRecord('test', logging.INFO, 'simple_trade.py', 1, f"line {i}", None, None)
+        record.created = START + i
+        record.__dict__.update(fields)
+        lines.append(formatter.format(record) + '\n')
+    return lines
+
+
+def write_segment(log_dir, name, lines, tail=''):
+    path = os.path.join(log_dir, f"trade_{name}.0001{JSON_SUFFIX}")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+        f.write(tail)
+    return path
+
+
+@pytest.fixture
+def segments(tmp_path, monkeypatch):
+    """两个已压缩的分段(第二个最后一行被截断)和一个仍在写入的分段"""
+    monkeypatch.setattr(logger, 'BLOCK_BYTES', 4096)
+    log_dir = str(tmp_path)
+    lines = make_lines(0, 1500)
+    write_segment(log_dir, 'a', lines[:600])
+    crashed = write_segment(log_dir, 'b', lines[600:1000], tail='{"ts": 1700009999.0, "msg": "写到一半')
+    with open(crashed, 'rb') as f:
+        crashed_bytes = f.read()
+    live = write_segment(log_dir, 'c', lines[1000:])
+    writer = open(live, 'a')
+    fcntl.flock(writer, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    sweep_segments(log_dir, retention_days=0)
+    yield log_dir, [json.loads(line) for line in lines], crashed_bytes
+    writer.close()
+
+
+def test_sweep_compresses_finished_segments_and_skips_live(segments):
+    log_dir, _, crashed_bytes = segments
+    archived, live = list_segments(log_dir)
+    assert sorted(os.path.basename(path) for path, _ in archived) == [
+        f"trade_a.0001{ARCHIVE_SUFFIX}", f"trade_b.0001{ARCHIVE_SUFFIX}"]
+    assert [os.path.basename(path) for path in live] == [f"trade_c.0001{JSON_SUFFIX}"]
+    index = dict((os.path.basename(path), index) for path, index in archived)[f"trade_b.0001{ARCHIVE_SUFFIX}"]
+    assert len(index['blocks']) > 1 and index['lines'] == 401
+    # 压缩文件整体是合法的 gzip，截断的最后一行原样保留但不建索引
+    with gzip.open(os.path.join(log_dir, f"trade_b.0001{ARCHIVE_SUFFIX}"), 'rb') as f:
+        assert f.read() == crashed_bytes
+    assert index['last'] == START + 999
+
+
+def test_order_id_query_returns_exactly_the_matching_lines(segments):
+    log_dir, entries, _ = segments
+    query = LogQuery(order_id=ORDERS[0])
+    found = query.run(log_dir)
+    expected = [e['msg'] for e in entries if ORDERS[0] in (e.get('order_id'), e.get('parent_id'))]
+    assert [e['msg'] for e in found] == expected
+    assert any(e.get('parent_id') == ORDERS[0] for e in found) and found[-1]['ts'] >= START + 1000
+    # 不含该订单的块不解压
+    assert query.stats['live_segments'] == 1 and query.stats['skipped_blocks'] > 0
+
+    # 索引中没有的订单只扫描仍在写入的分段
+    query = LogQuery(order_id='missing')
+    assert query.run(log_dir) == [] and query.stats['blocks'] == 0
+
+
+def test_time_range_query_prunes_blocks_and_segments(segments):
+    log_dir, entries, _ = segments
+    since, until = START + 200, START + 260
+    query = LogQuery(since=since, until=until)
+    found = query.run(log_dir)
+    assert [e['msg'] for e in found] == [e['msg'] for e in entries if since <= e['ts'] <= until]
+    # 只解压时间范围内的块，第二个分段整个跳过
+    total = sum(len(index['blocks']) for _, index in list_segments(log_dir)[0])
+    assert query.stats['skipped_segments'] == 1 and query.stats['blocks'] * 10 < total
+    assert query.stats['blocks'] + query.stats['skipped_blocks'] == total
+
+    query = LogQuery(order_id=ORDERS[1], since=START + 1200, until=START + 1300)
+    assert [e['msg'] for e in query.run(log_dir)] == [
+        e['msg'] for e in entries if e.get('order_id') == ORDERS[1] and START + 1200 <= e['ts'] <= START + 1300]
+
+
+def test_sweep_removes_expired_archives(tmp_path):
+    log_dir = str(tmp_path)
+    index_path = compress_segment(write_segment(log_dir, 'old', make_lines(0, 20)))
+    assert index_path.endswith(INDEX_SUFFIX)
+    sweep_segments(log_dir, retention_days=1)
+    assert os.listdir(log_dir) == []
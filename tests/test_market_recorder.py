@@ -0,0 +1,101 @@
+import threading
+import time
+
+import market_recorder
+from market_recorder import HOUR_MS, TICKER, TRADES, MarketRecorder, PartitionBuffer, read_market_data
+
+
+class ScriptedCaller:
+    """按顺序返回预设的成交列表，记录每次请求的 since"""
+
+    def __init__(self, *batches):
+        self.batches = list(batches)
+        self.since = []
+
+    def call(self, method, symbol, since=None):
+        self.since.append(since)
+        return self.batches.pop(0)
+
+
+def trade(trade_id, timestamp):
+    return {'id': trade_id, 'timestamp': timestamp, 'side': 'buy', 'price': 100.0, 'amount': 0.1, 'cost': 10.0}
+
+
+def ticker_row(symbol, timestamp):
+    return ['sim', symbol, timestamp, timestamp, 100.0, 99.9, 100.1, 1.0, 1.0, 101.0, 99.0, 10.0, 1000.0]
+
+
+def make_recorder(tmp_path, **config):
+    return MarketRecorder({'sim': {'demo': None}}, None,
+                          dict({'symbols': {'sim': ['BTC/USDT']}, 'directory': str(tmp_path)}, **config))
+
+
+def test_full_buffer_blocks_until_released_and_then_drops():
+    buffer = PartitionBuffer(max_rows=3, block_timeout=2.0)
+    assert buffer.append(TICKER, 'sim', 'BTC/USDT', [ticker_row('BTC/USDT', HOUR_MS)] * 3)
+    results = []
+    thread = threading.Thread(target=lambda: results.append(
+        buffer.append(TICKER, 'sim', 'BTC/USDT', [ticker_row('BTC/USDT', HOUR_MS)] * 2)))
+    thread.start()
+    time.sleep(0.2)
+    # 缓冲区满，采集线程等待写入
+    assert thread.is_alive() and results == []
+    taken = buffer.take(flush_rows=10, flush_interval=60, force=True)
+    buffer.release(sum(len(rows) for _, rows in taken))
+    thread.join(2)
+    assert results == [True] and buffer.rows == 2
+
+    buffer.block_timeout = 0.1
+    assert not buffer.append(TICKER, 'sim', 'BTC/USDT', [ticker_row('BTC/USDT', HOUR_MS)] * 2)
+    assert buffer.dropped == 2 and buffer.rows == 2
+
+
+def test_trades_are_fetched_incrementally_without_duplicates(tmp_path):
+    recorder = make_recorder(tmp_path)
+    caller = ScriptedCaller([trade('a', 1000), trade('b', 2000), trade('c', 2000)],
+                            [trade('c', 2000), trade('d', 2000), trade('e', 3000)],
+                            [trade('e', 3000)])
+    assert recorder._trades('sim', 'BTC/USDT', caller) == 3
+    # 同一毫秒已收到的成交不再重复写入
+    assert recorder._trades('sim', 'BTC/USDT', caller) == 2
+    assert recorder._trades('sim', 'BTC/USDT', caller) == 0
+    assert caller.since == [None, 2000, 3000]
+    rows = [row for (channel, *_), partition in recorder.buffer.partitions.items() if channel == TRADES
+            for row in partition['rows']]
+    assert [row[4] for row in rows] == ['a', 'b', 'c', 'd', 'e']
+    recorder.executor.shutdown()
+
+
+def test_dropped_trades_are_fetched_again(tmp_path):
+    recorder = make_recorder(tmp_path, max_rows=2, block_timeout=0.05)
+    recorder.buffer.append(TICKER, 'sim', 'BTC/USDT', [ticker_row('BTC/USDT', HOUR_MS)] * 2)
+    batch = [trade('a', 1000), trade('b', 2000)]
+    caller = ScriptedCaller(list(batch), list(batch))
+    assert recorder._trades('sim', 'BTC/USDT', caller) == 0
+    assert recorder.buffer.dropped == 2 and ('sim', 'BTC/USDT') not in recorder.trade_marks
+
+    recorder.flush(force=True)
+    assert recorder._trades('sim', 'BTC/USDT', caller) == 2
+    assert caller.since == [None, None]
+    recorder.executor.shutdown()
+
+
+def test_read_skips_partitions_outside_the_range(tmp_path, monkeypatch):
+    recorder = make_recorder(tmp_path)
+    base = 480000 * HOUR_MS
+    for hour in range(3):
+        recorder.buffer.append(TICKER, 'sim', 'BTC/USDT', [ticker_row('BTC/USDT', base + hour * HOUR_MS + 60000)])
+        recorder.buffer.append(TICKER, 'sim', 'ETH/USDT', [ticker_row('ETH/USDT', base + hour * HOUR_MS)])
+    recorder.flush(force=True)
+    recorder.executor.shutdown()
+
+    opened = []
+    read_parquet = market_recorder.pd.read_parquet
+    monkeypatch.setattr(market_recorder.pd, 'read_parquet', lambda path: opened.append(path) or read_parquet(path))
+    frame = read_market_data(TICKER, 'sim', 'BTC/USDT', start=base + HOUR_MS, end=base + 2 * HOUR_MS,
+                             directory=str(tmp_path))
+    assert frame['timestamp'].tolist() == [base + HOUR_MS + 60000]
+    assert len(opened) == 1 and 'hour=' in opened[0] and 'symbol=BTC-USDT' in opened[0]
+
+    everything = read_market_data(TICKER, start=base, directory=str(tmp_path))
+    assert len(everything) == 6 and everything['timestamp'].is_monotonic_increasing
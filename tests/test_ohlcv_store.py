@@ -0,0 +1,66 @@
+import numpy as np
+
+from ohlcv_store import CANDLE_DTYPE, OhlcvStore, atr, format_stats
+
+MINUTE = 60000
+
+
+def candle(minute, close, volume=1.0):
+    return [minute * MINUTE, close, close + 1, close - 1, close, volume]
+
+
+def test_last_candle_is_overwritten_and_newer_appended(tmp_path):
+    store = OhlcvStore('sim', 'BTC/USDT', '1m', data_dir=str(tmp_path))
+    assert store.merge([candle(0, 100), candle(1, 101)]) == 2
+    # 未收盘的最后一根K线被覆盖，不重复追加
+    assert store.merge([candle(1, 102)]) == 0
+    assert store.merge([candle(1, 103), candle(2, 104)]) == 1
+    candles = store.candles()
+    assert candles['timestamp'].tolist() == [0, MINUTE, 2 * MINUTE]
+    assert candles['close'].tolist() == [100, 103, 104]
+    assert store.fetch_params(500)['since'] == 2 * MINUTE
+
+
+def test_older_and_out_of_order_rows(tmp_path):
+    store = OhlcvStore('sim', 'BTC/USDT', '1m', data_dir=str(tmp_path))
+    store.merge([candle(5, 100)])
+    # 早于最后一根的记录被丢弃，乱序的按时间排序，同一时间戳保留最后一条
+    assert store.merge([candle(3, 1), candle(8, 108), candle(7, 107), candle(8, 109), candle(4, 1)]) == 2
+    candles = store.candles()
+    assert candles['timestamp'].tolist() == [5 * MINUTE, 7 * MINUTE, 8 * MINUTE]
+    assert candles['close'].tolist() == [100, 107, 109]
+    # 只有更早记录的批次不改变文件
+    assert store.merge([candle(1, 1), candle(2, 2)]) == 0 and len(store.candles()) == 3
+    # 交易所没有返回的K线(例如无成交)不补，按返回的时间追加
+    assert store.merge([candle(20, 120)]) == 1
+    assert store.last_timestamp() == 20 * MINUTE
+
+
+def test_reopen_reads_memmap_and_ignores_partial_tail(tmp_path):
+    store = OhlcvStore('sim', 'BTC/USDT', '1m', data_dir=str(tmp_path))
+    store.merge([candle(i, 100 + i) for i in range(10)])
+    with open(store.path, 'ab') as f:
+        f.write(b'\0' * (CANDLE_DTYPE.itemsize // 2))
+
+    reopened = OhlcvStore('sim', 'BTC/USDT', '1m', data_dir=str(tmp_path))
+    candles = reopened.candles()
+    assert isinstance(candles, np.memmap) and len(candles) == 10
+    assert candles['close'].tolist() == [100.0 + i for i in range(10)]
+    # 追加时覆盖残缺的尾部
+    assert reopened.merge([candle(10, 110)]) == 1
+    assert len(OhlcvStore('sim', 'BTC/USDT', '1m', data_dir=str(tmp_path)).candles()) == 11
+
+
+def test_atr_and_stats_with_few_candles(tmp_path):
+    store = OhlcvStore('sim', 'BTC/USDT', '1m', data_dir=str(tmp_path))
+    store.merge([candle(i, 100) for i in range(13)])
+    candles = store.candles()
+    assert np.isnan(atr(candles)).all()
+    assert format_stats(candles, '1m').endswith('| ATR -')
+
+    store.merge([candle(13, 100)])
+    candles = store.candles()
+    # 收盘价不变时真实波幅就是 high - low
+    assert atr(candles)[-1] == 2.0
+    assert format_stats(candles, '1m').endswith('| ATR 2')
+    assert '| VWAP -' in format_stats(np.array([tuple(candle(0, 100, volume=0))], dtype=CANDLE_DTYPE), '1m')
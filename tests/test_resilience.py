@@ -0,0 +1,132 @@
+import time
+import threading
+from collections import defaultdict, deque
+
+import ccxt
+import pytest
+
+import exchange_worker
+from exchange_worker import ExchangeWorker
+from resilience import CircuitOpenError, ResilientCaller
+
+
+class ScriptedExchange:
+    """按脚本注入故障的交易所: 每个接口依次取出预设的动作，异常则抛出，数字则按秒延迟后返回"""
+
+    def __init__(self):
+        self.script = defaultdict(deque)
+        self.calls = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def plan(self, method, *actions):
+        self.script[method].extend(actions)
+
+    def _run(self, method, result):
+        with self.lock:
+            self.calls[method] += 1
+            action = self.script[method].popleft() if self.script[method] else 0.0
+        if isinstance(action, Exception):
+            raise action
+        time.sleep(action)
+        return result
+
+    def fetch_ticker(self, symbol):
+        return self._run('fetch_ticker', {'symbol': symbol, 'last': 100.0})
+
+    def create_limit_order(self, symbol, side, amount, price, params=None):
+        return self._run('create_limit_order', {'id': '1', 'symbol': symbol, 'status': 'open'})
+
+
+@pytest.fixture
+def exchange():
+    return ScriptedExchange()
+
+
+@pytest.fixture
+def make_caller(exchange):
+    workers = []
+
+    def make(**config):
+        worker = ExchangeWorker('fake', 'demo', exchange, threads=2, timeout=5)
+        workers.append(worker)
+        config = dict({'backoff_base': 0.01, 'backoff_max': 0.02, 'hedge': False}, **config)
+        return ResilientCaller('fake/demo', worker.submit, config)
+
+    yield make
+    for worker in workers:
+        worker.stop()
+
+
+def trip(caller, exchange):
+    """用连续网络错误打开熔断器"""
+    exchange.plan('fetch_ticker', *[ccxt.NetworkError("断线")] * caller.config['failure_threshold'])
+    for _ in range(caller.config['failure_threshold']):
+        with pytest.raises(ccxt.NetworkError):
+            caller.call('fetch_ticker', 'BTC/USDT')
+    assert caller.breaker.state == 'open'
+
+
+def test_idempotent_read_retries_with_backoff(exchange, make_caller):
+    caller = make_caller(retries=2)
+    exchange.plan('fetch_ticker', ccxt.NetworkError("断线"), ccxt.RequestTimeout("超时"))
+    assert caller.call('fetch_ticker', 'BTC/USDT')['last'] == 100.0
+    assert exchange.calls['fetch_ticker'] == 3
+    assert caller.snapshot()['retries'] == 2
+    assert caller.breaker.state == 'closed'
+
+
+def test_create_order_is_not_retried(exchange, make_caller):
+    caller = make_caller(retries=2)
+    exchange.plan('create_limit_order', ccxt.NetworkError("断线"))
+    with pytest.raises(ccxt.NetworkError):
+        caller.call('create_limit_order', 'BTC/USDT', 'buy', 1.0, 100.0)
+    assert exchange.calls['create_limit_order'] == 1
+    assert caller.snapshot()['retries'] == 0
+
+
+def test_hedge_wins_after_p95(exchange, make_caller):
+    caller = make_caller(hedge=True, hedge_min_samples=5)
+    for _ in range(5):
+        caller._record_latency('fetch_ticker', 0.02)
+    # 主请求卡住，超过 p95 后发出的对冲请求先返回
+    exchange.plan('fetch_ticker', 1.0, 0.0)
+    started = time.monotonic()
+    assert caller.call('fetch_ticker', 'BTC/USDT')['last'] == 100.0
+    assert time.monotonic() - started < 0.5
+    snapshot = caller.snapshot()
+    assert snapshot['hedges'] == 1 and snapshot['hedge_wins'] == 1
+
+
+def test_breaker_opens_probes_and_closes(exchange, make_caller):
+    caller = make_caller(retries=0, failure_threshold=2, reset_timeout=0.2)
+    trip(caller, exchange)
+    with pytest.raises(CircuitOpenError):
+        caller.call('fetch_ticker', 'BTC/USDT')
+    # 熔断期间的请求不到达交易所
+    assert exchange.calls['fetch_ticker'] == 2
+
+    time.sleep(0.25)
+    assert caller.breaker.allow() and caller.breaker.state == 'half_open'
+    # 试探名额已被占用，其他请求仍被拒绝
+    assert not caller.breaker.allow()
+    caller.breaker.record_success()
+    assert caller.breaker.state == 'closed'
+    assert caller.call('fetch_ticker', 'BTC/USDT')['last'] == 100.0
+
+
+def test_half_open_probe_on_deadline_does_not_stick(exchange, make_caller):
+    caller = make_caller(retries=0, failure_threshold=2, reset_timeout=0.2)
+    trip(caller, exchange)
+    time.sleep(0.25)
+    # 试探请求超过截止时间，熔断器重新打开而不是停在半开
+    exchange.plan('fetch_ticker', 0.5)
+    with pytest.raises(exchange_worker.DeadlineExceeded):
+        caller.call('fetch_ticker', 'BTC/USDT', timeout=0.1)
+    assert caller.breaker.state == 'open'
+
+    time.sleep(0.25)
+    # 截止时间已过的调用不占用试探名额
+    with pytest.raises(exchange_worker.DeadlineExceeded):
+        caller.call('fetch_ticker', 'BTC/USDT', timeout=0)
+    assert caller.call('fetch_ticker', 'BTC/USDT')['last'] == 100.0
+    assert caller.breaker.state == 'closed'
@@ -0,0 +1,58 @@
+import time
+import threading
+
+import ccxt
+import pytest
+
+from conftest import RejectingExchange, SlowExchange
+from risk import RiskManager, RiskRejected
+
+
+@pytest.fixture
+def make_risk(make_exchange, make_callers):
+    def make(cls, config):
+        callers = make_callers({'sim': {'demo': make_exchange(cls)}}, threads=4)
+        return RiskManager(callers, config), callers.get('sim', 'demo')
+    return make
+
+
+def test_concurrent_orders_cannot_all_pass_the_limit(make_risk):
+    risk, caller = make_risk(SlowExchange, {'max_open_notional': 250.0})
+    results = []
+
+    def place():
+        try:
+            results.append(caller.call('create_limit_order', 'BTC/USDT', 'buy', 1.0, 90.0))
+        except RiskRejected as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=place) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 每单 90，上限 250，只有两单能通过
+    assert sum(1 for r in results if isinstance(r, dict)) == 2
+    assert risk.get('sim', 'demo').open_notional == 180.0
+
+
+def test_failed_order_releases_reservation(make_risk):
+    risk, caller = make_risk(RejectingExchange, {'max_open_notional': 100.0})
+    for _ in range(3):
+        with pytest.raises(ccxt.InsufficientFunds):
+            caller.call('create_limit_order', 'BTC/USDT', 'buy', 1.0, 90.0)
+    exposure = risk.get('sim', 'demo')
+    assert exposure.open_notional == 0.0 and not exposure.orders
+
+
+def test_timed_out_order_stays_reserved_until_reconciled(make_risk):
+    risk, caller = make_risk(SlowExchange, {'max_open_notional': 100.0})
+    exposure = risk.get('sim', 'demo')
+    with pytest.raises(ccxt.RequestTimeout):
+        caller.call('create_limit_order', 'BTC/USDT', 'buy', 1.0, 90.0, timeout=0.05)
+    # 订单可能已经挂出，额度仍被占用
+    assert exposure.open_notional == 90.0 and exposure.needs_reconcile
+    time.sleep(0.3)
+    caller.call('fetch_open_orders', 'BTC/USDT')
+    # 挂单列表里没有预留编号，预留按已结束处理，之后由余额对账纠正
+    assert not [key for key in exposure.orders if key.startswith('reserved-')]
@@ -0,0 +1,76 @@
+import time
+
+import numpy as np
+
+import shm_feed
+from event_bus import TICKER, EventBus
+from shm_feed import FIELDS, HEADER_DTYPE, SLOT_DTYPE, WANT_DTYPE, FeedPublisher, SharedFeed, feed_key
+
+
+def test_readers_do_not_write_the_seq_cache_line(tmp_path):
+    feed = SharedFeed(str(tmp_path / 'feed'), slots=4)
+    feed.heartbeat()
+    index = feed.claim(b'sim|BTC/USDT')
+    feed.write(index, np.arange(len(FIELDS), dtype=float) + 1)
+    slot_start = feed._word(index) * 8
+    before = bytes(feed.bytes[slot_start:slot_start + SLOT_DTYPE.itemsize])
+    feed.wanted_at[index] = 0
+
+    ticker = feed.ticker('sim', 'BTC/USDT')
+    assert ticker['last'] == 2.0 and ticker['symbol'] == 'BTC/USDT'
+    # wanted 时间写在槽位之外，每个槽位独占一个缓存行
+    assert bytes(feed.bytes[slot_start:slot_start + SLOT_DTYPE.itemsize]) == before
+    wanted_offset = feed._wanted_word(index) * 8
+    assert wanted_offset % 64 == 0 and wanted_offset >= HEADER_DTYPE.itemsize + 4 * SLOT_DTYPE.itemsize
+    assert feed.wanted() == {('sim', 'BTC/USDT')}
+
+    # 刚标记过的交易对再次读取不重复写入
+    marked = float(feed.wanted_at[index])
+    time.sleep(0.01)
+    feed.ticker('sim', 'BTC/USDT')
+    assert float(feed.wanted_at[index]) == marked
+    feed.close()
+
+
+def test_old_version_segment_is_recreated(tmp_path):
+    path = str(tmp_path / 'feed')
+    with open(path, 'wb') as f:
+        f.write(b'\0' * (HEADER_DTYPE.itemsize + 4 * (SLOT_DTYPE.itemsize - 8)))
+    header = np.memmap(path, dtype=HEADER_DTYPE, mode='r+', shape=(1,))
+    header['magic'], header['version'], header['slots'] = shm_feed.MAGIC, 1, 4
+    header.flush()
+    del header
+
+    feed = SharedFeed(path, slots=4)
+    assert int(feed.header['version'][0]) == shm_feed.FEED_VERSION
+    assert len(feed.raw) == HEADER_DTYPE.itemsize + 4 * (SLOT_DTYPE.itemsize + WANT_DTYPE.itemsize)
+    feed.close()
+
+
+class WatchOnlyPoller:
+    def set_watch(self, watched):
+        self.watched = watched
+
+
+def test_publisher_skips_stale_tickers(tmp_path):
+    feed = SharedFeed(str(tmp_path / 'feed'), slots=4)
+    bus = EventBus()
+    publisher = FeedPublisher(feed, bus, WatchOnlyPoller(), {'sim': 'demo'}, max_age=5.0)
+    publisher.start()
+    try:
+        bus.publish(TICKER, 'sim', 'demo', 'BTC/USDT', {'last': 90.0}, timestamp=time.time() - 3600)
+        time.sleep(1.5)
+        assert feed.find(feed_key('sim', 'BTC/USDT')) is None
+
+        fetched_at = time.time() - 1.0
+        bus.publish(TICKER, 'sim', 'demo', 'BTC/USDT', {'last': 91.0}, timestamp=fetched_at)
+        deadline = time.monotonic() + 5
+        while publisher.published == 0 and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        publisher.stop()
+    # 槽位的更新时间是行情获取的时间，而不是写入共享段的时间
+    index = feed.find(feed_key('sim', 'BTC/USDT'))
+    assert float(feed.updated[index]) == fetched_at
+    assert feed.ticker('sim', 'BTC/USDT')['last'] == 91.0
+    feed.close()
@@ -0,0 +1,55 @@
+import ccxt
+import pytest
+
+from spread_scanner import SpreadScanner
+
+MARKETS = {'BTC/USDT': {'taker': 0.0}, 'ETH/USDT': {'taker': 0.0}}
+
+
+class FakeCaller:
+    def __init__(self, tickers):
+        self.tickers = tickers
+        self.down = False
+
+    def call(self, method):
+        if self.down:
+            raise ccxt.NetworkError("断线")
+        return MARKETS if method == 'load_markets' else self.tickers
+
+
+class FakeCallers:
+    def __init__(self, callers):
+        self.callers = callers
+
+    def get(self, exchange_id, key_id):
+        return self.callers[exchange_id]
+
+
+@pytest.fixture
+def scanner():
+    callers = {
+        'a': FakeCaller({'BTC/USDT': {'bid': 99.0, 'ask': 100.0}, 'ETH/USDT': {'bid': 9.9, 'ask': 10.0}}),
+        'b': FakeCaller({'BTC/USDT': {'bid': 102.0, 'ask': 103.0}, 'ETH/USDT': {'bid': 10.2, 'ask': 10.3}}),
+    }
+    scanner = SpreadScanner({'a': {'demo': None}, 'b': {'demo': None}}, FakeCallers(callers))
+    scanner.refresh()
+    assert [row['symbol'] for row in scanner.top()] == ['BTC/USDT', 'ETH/USDT']
+    return scanner, callers
+
+
+def test_symbol_missing_from_snapshot_is_cleared(scanner):
+    scanner, callers = scanner
+    del callers['b'].tickers['ETH/USDT']
+    stats = scanner.refresh()
+    assert stats['changed'] == 1
+    assert [row['symbol'] for row in scanner.top()] == ['BTC/USDT']
+
+
+def test_failed_exchange_quotes_are_not_reused(scanner):
+    scanner, callers = scanner
+    callers['b'].down = True
+    scanner.refresh()
+    assert scanner.top() == [] and 'b' in scanner.errors
+    callers['b'].down = False
+    scanner.refresh()
+    assert len(scanner.top()) == 2
@@ -0,0 +1,26 @@
+from simple_trade import fetch_trades_between
+
+
+class TradeLog:
+    """按 since/limit 分页返回成交的假交易所"""
+
+    def __init__(self, timestamps):
+        self.trades = [{'id': str(i), 'timestamp': ts} for i, ts in enumerate(timestamps)]
+        self.requests = 0
+
+    def call(self, method, symbol=None, since=None, limit=None):
+        self.requests += 1
+        return [t for t in self.trades if t['timestamp'] >= since][:limit]
+
+
+def test_fetches_every_page_within_the_day():
+    log = TradeLog(list(range(1000, 1250)) + [5000])
+    trades = fetch_trades_between(log.call, 'BTC/USDT', 1000, 2000, limit=100)
+    assert [t['timestamp'] for t in trades] == list(range(1000, 1250))
+    assert log.requests == 3
+
+
+def test_trades_sharing_a_millisecond_are_not_lost_or_duplicated():
+    log = TradeLog([1000] * 2 + [1001] * 3 + [1002] * 2)
+    trades = fetch_trades_between(log.call, 'BTC/USDT', 1000, limit=3)
+    assert sorted(int(t['id']) for t in trades) == list(range(7))
@@ -0,0 +1,97 @@
+import socket
+import threading
+
+import ccxt
+import pytest
+
+from trade_client import TradeServerClient, create_remote_exchanges
+from trade_server import TradeServer
+
+
+def test_private_routes_require_account_token(remote_server):
+    url, _ = remote_server
+    anonymous = create_remote_exchanges(url)['sim']['demo']
+    with pytest.raises(ccxt.AuthenticationError):
+        anonymous.fetch_balance()
+    with pytest.raises(ccxt.AuthenticationError):
+        anonymous.create_limit_order('BTC/USDT', 'buy', 0.1, 90.0)
+
+    wrong = create_remote_exchanges(url, {'sim/demo': 'guess'})['sim']['demo']
+    with pytest.raises(ccxt.AuthenticationError):
+        wrong.cancel_order('1', 'BTC/USDT')
+
+    # 行情等公共数据不需要令牌
+    assert anonymous.fetch_ticker('BTC/USDT')['symbol'] == 'BTC/USDT'
+
+    trader = create_remote_exchanges(url, {'sim/demo': 'secret'})['sim']['demo']
+    assert trader.fetch_balance()['USDT']['free'] == 100000.0
+    order = trader.create_limit_order('BTC/USDT', 'buy', 0.1, 90.0)
+    assert trader.fetch_order(order['id'], 'BTC/USDT')['id'] == order['id']
+
+
+def test_invalid_numbers_are_bad_requests(remote_server):
+    url, server = remote_server
+    client = TradeServerClient(url)
+    with pytest.raises(ccxt.ExchangeError, match='since'):
+        client.request('GET', '/trades', {'exchange': 'sim', 'account': 'demo', 'symbol': 'BTC/USDT',
+                                          'since': 'yesterday'})
+    with pytest.raises(ccxt.ExchangeError, match='amount'):
+        client.request('POST', '/order', body={'exchange': 'sim', 'account': 'demo', 'symbol': 'BTC/USDT',
+                                               'side': 'buy', 'amount': 'lots', 'price': 90},
+                       token='secret')
+    # 参数错误不计入交易所错误
+    assert server.stats['errors'] == 0
+
+
+def test_remote_precision_and_public_data(remote_server):
+    url, _ = remote_server
+    remote = create_remote_exchanges(url)['sim']['demo']
+    assert remote.price_to_precision('BTC/USDT', 100.016) == '100.02'
+    assert remote.amount_to_precision('BTC/USDT', 0.12345) == '0.123'
+    with pytest.raises(ccxt.InvalidOrder):
+        remote.amount_to_precision('BTC/USDT', 0.0001)
+    assert remote.has['fetchOrderBook'] and not remote.has['fetchOHLCV']
+    assert remote.fetch_order_book('BTC/USDT')['bids']
+    assert isinstance(remote.fetch_trades('BTC/USDT'), list)
+
+
+def test_shared_instances_are_guarded():
+    server = TradeServer({'exchanges': {'binance': {'demo': {'apiKey': 'key', 'secret': 'secret'}}},
+                          'server': {'tokens': {'binance/demo': 'secret'}}})
+    assert server.exchanges['binance']['demo']._worker_lock
+
+
+@pytest.fixture
+def hangup_server():
+    """读完请求后不回复直接断开的服务端，返回 (地址, 收到的请求行列表)"""
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen()
+    received = []
+
+    def serve():
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            with conn:
+                data = conn.recv(65536)
+                received.append(data.split(b'\r\n', 1)[0].decode())
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield f"http://127.0.0.1:{listener.getsockname()[1]}", received
+    listener.close()
+
+
+def test_orders_are_not_resent_after_disconnect(hangup_server):
+    url, received = hangup_server
+    client = TradeServerClient(url, timeout=5)
+    with pytest.raises(ccxt.NetworkError):
+        client.request('POST', '/order', body={'exchange': 'sim', 'account': 'demo'}, token='secret')
+    # 请求已经发出，守护进程可能已经下单，不能重发
+    assert received == ['POST /order HTTP/1.1']
+
+    with pytest.raises(ccxt.NetworkError):
+        client.request('GET', '/ticker', {'exchange': 'sim', 'symbol': 'BTC/USDT'})
+    assert len(received) == 3 and received[1] == received[2]
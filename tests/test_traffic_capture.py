@@ -0,0 +1,47 @@
+import shutil
+import time
+
+import traffic_capture
+from traffic_capture import TrafficRecorder, read_records
+
+
+def record(recorder, count):
+    for i in range(count):
+        recorder.record('sim', 'demo', 'fetch_ticker', ('BTC/USDT',), {}, time.monotonic(), 0.01,
+                        result={'last': 100.0 + i})
+
+
+def test_unclosed_capture_is_readable_after_flush_interval(tmp_path):
+    path = tmp_path / 'capture.jsonl.gz'
+    recorder = TrafficRecorder(str(path))
+    try:
+        record(recorder, 5)
+        time.sleep(traffic_capture.FLUSH_INTERVAL + 0.5)
+        # 模拟程序崩溃: 复制尚未关闭的文件读取
+        crashed = tmp_path / 'crashed.jsonl.gz'
+        shutil.copy(path, crashed)
+        header, records = read_records(str(crashed))
+    finally:
+        recorder.close()
+    assert header['type'] == 'header'
+    assert [r['r']['last'] for r in records] == [100.0, 101.0, 102.0, 103.0, 104.0]
+
+
+def test_flushes_every_n_records(tmp_path, monkeypatch):
+    monkeypatch.setattr(traffic_capture, 'FLUSH_INTERVAL', 60.0)
+    monkeypatch.setattr(traffic_capture, 'FLUSH_RECORDS', 10)
+    path = tmp_path / 'capture.jsonl.gz'
+    recorder = TrafficRecorder(str(path))
+    try:
+        record(recorder, 25)
+        deadline = time.monotonic() + 5
+        while recorder.count < 25 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        crashed = tmp_path / 'crashed.jsonl.gz'
+        shutil.copy(path, crashed)
+        _, records = read_records(str(crashed))
+    finally:
+        recorder.close()
+    assert len(records) == 20
+    _, records = read_records(str(path))
+    assert len(records) == 25
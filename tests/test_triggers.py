@@ -0,0 +1,114 @@
+import json
+import time
+
+from conftest import RejectingExchange
+from event_bus import TICKER, EventBus
+from triggers import ABOVE, BELOW, STOP, TAKE_PROFIT, Trigger, TriggerBook, TriggerManager
+
+KEY = ('sim', 'demo', 'BTC/USDT')
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def test_stale_ticker_does_not_fire(tmp_path, sim, make_callers):
+    bus = EventBus()
+    manager = TriggerManager(bus, make_callers({'sim': {'demo': sim}}), path=str(tmp_path / 'triggers.json'))
+    trigger = manager.add('order', 'sim', 'demo', 'BTC/USDT', 95.0, 100.0, side='sell', amount=0.1)
+    manager.start()
+    try:
+        # 例如恢复工作区时保存了一天的行情
+        bus.publish(TICKER, 'sim', 'demo', 'BTC/USDT', {'last': 90.0}, timestamp=time.time() - 86400)
+        time.sleep(1.0)
+        assert trigger.status == 'active' and sim.fetch_open_orders('BTC/USDT') == []
+
+        bus.publish(TICKER, 'sim', 'demo', 'BTC/USDT', {'last': 90.0})
+        assert wait_for(lambda: trigger.status == 'triggered')
+    finally:
+        manager.stop()
+    assert trigger.fired_price == 90.0
+    order = sim.fetch_order(trigger.order_id, 'BTC/USDT')
+    assert (order['side'], order['amount']) == ('sell', 0.1) and order['price'] < 95.0
+
+
+def make_trigger(trigger_id, level, direction):
+    return Trigger(str(trigger_id), 'alert', *KEY, level, direction)
+
+
+def test_kind_and_limit_price_follow_side_and_direction(tmp_path):
+    manager = TriggerManager(EventBus(), None, path=str(tmp_path / 'triggers.json'))
+    cases = [('sell', 95.0, STOP, BELOW), ('sell', 105.0, TAKE_PROFIT, ABOVE),
+             ('buy', 105.0, STOP, ABOVE), ('buy', 95.0, TAKE_PROFIT, BELOW)]
+    for side, level, kind, direction in cases:
+        trigger = manager.add('order', *KEY, level, 100.0, side=side, amount=0.1)
+        assert (trigger.kind, trigger.direction) == (kind, direction)
+        # 触发后的限价向不利方向让价，保证能立即成交
+        assert trigger.price < level if side == 'sell' else trigger.price > level
+
+
+def test_book_fires_only_crossed_levels_in_each_direction():
+    book = TriggerBook()
+    for trigger_id, level, direction in [(1, 101.0, ABOVE), (2, 103.0, ABOVE), (3, 99.0, BELOW), (4, 97.0, BELOW)]:
+        book.add(make_trigger(trigger_id, level, direction))
+    assert book.nearest(KEY) == (101.0, 99.0)
+    assert [t.id for t in book.evaluate(KEY, 100.0)] == []
+    assert [t.id for t in book.evaluate(KEY, 102.0)] == ['1']
+    assert [t.id for t in book.evaluate(KEY, 96.0)] == ['3', '4']
+    # 已触发的条件单不会再次触发
+    assert [t.id for t in book.evaluate(KEY, 104.0)] == ['2']
+    assert len(book) == 0 and book.evaluate(KEY, 200.0) == []
+
+
+def test_canceled_entries_are_skipped_and_compacted():
+    book = TriggerBook()
+    triggers = [make_trigger(i, 100.0 + i, ABOVE) for i in range(100)]
+    for trigger in triggers:
+        book.add(trigger)
+    for trigger in triggers[:70]:
+        book.remove(trigger)
+    # 第65次撤销时失效条目超过一半，重建后只剩之后撤销的5个
+    assert len(book.above[KEY]) == 35 and book.stale[KEY] == 5
+    assert [t.id for t in book.evaluate(KEY, 1000.0)] == [str(i) for i in range(70, 100)]
+    assert book.above[KEY] == [] and book.stale[KEY] == 0
+
+
+def test_reload_marks_firing_triggers_failed(tmp_path):
+    path = str(tmp_path / 'triggers.json')
+    manager = TriggerManager(EventBus(), None, path=path)
+    firing = manager.add('order', *KEY, 95.0, 100.0, side='sell', amount=0.1)
+    active = manager.add('alert', *KEY, 110.0, 100.0)
+    firing.status = 'firing'
+    manager.save()
+
+    reloaded = TriggerManager(EventBus(), None, path=path)
+    assert reloaded.all[firing.id].status == 'failed' and '结果未知' in reloaded.all[firing.id].message
+    assert reloaded.all[active.id].status == 'active' and len(reloaded.book) == 1
+    assert reloaded.next_id == 3
+    with open(path, encoding='utf-8') as f:
+        assert len(json.load(f)['triggers']) == 2
+
+
+def test_failed_order_is_not_fired_again(tmp_path, make_exchange, make_callers):
+    exchange = make_exchange(RejectingExchange)
+    calls = []
+    place = exchange.create_limit_order
+    exchange.create_limit_order = lambda *args, **kwargs: (calls.append(args), place(*args, **kwargs))
+    bus = EventBus()
+    notified = []
+    manager = TriggerManager(bus, make_callers({'sim': {'demo': exchange}}), path=str(tmp_path / 'triggers.json'),
+                             on_fire=notified.append)
+    trigger = manager.add('order', *KEY, 95.0, 100.0, side='sell', amount=0.1)
+    manager.start()
+    try:
+        bus.publish(TICKER, *KEY, {'last': 94.0})
+        assert wait_for(lambda: trigger.status == 'failed')
+        bus.publish(TICKER, *KEY, {'last': 93.0})
+        time.sleep(0.5)
+    finally:
+        manager.stop()
+    assert len(calls) == 1 and 'InsufficientFunds' in trigger.message
+    assert notified == [trigger] and len(manager.book) == 0
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import threading
+import http.client
+from urllib.parse import urlsplit, urlencode
+from lazy_import import lazy_import
+import logger
+
+# 获取日志记录器
+log = logger.get_logger('trade_client')
+
+ccxt = lazy_import('ccxt')
+
+
+class TradeServerClient:
+    """
+    交易守护进程的HTTP客户端。每个线程复用一个keep-alive连接。
+    """
+
+    def __init__(self, base_url, timeout=30):
+        url = urlsplit(base_url if '://' in base_url else f"http://{base_url}")
+        self.host = url.hostname or '127.0.0.1'
+        self.port = url.port or 80
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def _connection(self):
+        """返回本线程的连接和它是否为复用的已有连接"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            return conn, True
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        self.local.conn = conn
+        return conn, False
+
+    def request(self, method, path, params=None, body=None, token=None):
+        """
+        发送请求并解析JSON响应。token 为账户的访问令牌，放在 Authorization 头中。
+        守护进程返回的错误按类型名还原为对应的ccxt异常，便于调用方沿用原有的异常处理。
+        连接中断时只重发读请求，或在复用的空闲连接上发送就失败的请求；
+        下单撤单发出后连接中断，守护进程可能已经执行，抛出 ccxt.NetworkError 由调用方按状态未知处理。
+        """
+        if params:
+            path = f"{path}?{urlencode({k: v for k, v in params.items() if v is not None})}"
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        headers = {'Content-Type': 'application/json'} if data else {}
+        if token:
+            headers['Authorization'] = f"Bearer {token}"
+
+        for attempt in range(2):
+            conn, reused = self._connection()
+            sent = False
+            try:
+                conn.request(method, path, body=data, headers=headers)
+                sent = True
+                response = conn.getresponse()
+                payload = json.loads(response.read() or b'null')
+                break
+            except (http.client.HTTPException, ConnectionError) as e:
+                conn.close()
+                self.local.conn = None
+                # 连接被服务端关闭时重连一次
+                if attempt or not (method == 'GET' or (reused and not sent)):
+                    raise ccxt.NetworkError(f"无法连接交易守护进程: {str(e)}")
+            except OSError as e:
+                conn.close()
+                self.local.conn = None
+                raise ccxt.NetworkError(f"无法连接交易守护进程: {str(e)}")
+
+        if response.status != 200:
+            error_class = getattr(ccxt, payload.get('type', ''), None)
+            if not (isinstance(error_class, type) and issubclass(error_class, Exception)):
+                error_class = ccxt.ExchangeError
+            raise error_class(payload.get('error', f"HTTP {response.status}"))
+        return payload
+
+
+class RemoteExchange:
+    """
+    通过交易守护进程访问的交易所账户。
+    提供与 SimpleTradeApp 用到的ccxt方法相同的接口，界面可以作为守护进程的瘦客户端运行。
+    价格和数量的精度取整使用守护进程提供的市场信息和精度模式在本地计算，不额外请求。
+    """
+
+    def __init__(self, client, exchange_id, key_id, token=None):
+        self.client = client
+        self.id = exchange_id
+        self.key_id = key_id
+        self.token = token
+        self.markets = None
+        self.description = None
+
+    def __str__(self):
+        return f"RemoteExchange({self.id}/{self.key_id})"
+
+    def _params(self, **extra):
+        return dict(extra, exchange=self.id, account=self.key_id)
+
+    def _private(self, method, path, params=None, body=None):
+        return self.client.request(method, path, params, body, token=self.token)
+
+    def describe(self):
+        """守护进程上交易所实例的精度模式和支持的功能，第一次使用时获取"""
+        if self.description is None:
+            self.description = self.client.request('GET', '/describe', self._params())
+        return self.description
+
+    @property
+    def has(self):
+        return self.describe()['has']
+
+    @property
+    def precisionMode(self):
+        return self.describe()['precisionMode']
+
+    def _to_precision(self, symbol, value, field, rounding_mode):
+        from ccxt.base.decimal_to_precision import decimal_to_precision, NO_PADDING
+        if value is None:
+            return None
+        market = self.market(symbol)
+        result = decimal_to_precision(value, rounding_mode, market['precision'][field], self.precisionMode,
+                                      self.describe().get('paddingMode', NO_PADDING))
+        if result == '0':
+            raise ccxt.InvalidOrder(f"{self.id} {symbol} 的{'数量' if field == 'amount' else '价格'}"
+                                    f"必须大于精度 {market['precision'][field]}")
+        return result
+
+    def amount_to_precision(self, symbol, amount):
+        from ccxt.base.decimal_to_precision import TRUNCATE
+        return self._to_precision(symbol, amount, 'amount', TRUNCATE)
+
+    def price_to_precision(self, symbol, price):
+        from ccxt.base.decimal_to_precision import ROUND
+        return self._to_precision(symbol, price, 'price', ROUND)
+
+    def load_markets(self, reload=False):
+        if self.markets is None or reload:
+            self.markets = self.client.request('GET', '/markets', self._params())
+        return self.markets
+
+    def market(self, symbol):
+        markets = self.load_markets()
+        if symbol not in markets:
+            raise ccxt.BadSymbol(f"{self.id} 不存在交易对 {symbol}")
+        return markets[symbol]
+
+    def fetch_ticker(self, symbol):
+        return self.client.request('GET', '/ticker', self._params(symbol=symbol))
+
+    def fetch_tickers(self, symbols=None):
+        return self.client.request('GET', '/tickers', self._params(symbols=','.join(symbols) if symbols else None))
+
+    def fetch_balance(self):
+        return self._private('GET', '/balance', self._params())
+
+    def fetch_open_orders(self, symbol=None):
+        return self._private('GET', '/open_orders', self._params(symbol=symbol))
+
+    def fetch_my_trades(self, symbol=None, since=None, limit=None):
+        return self._private('GET', '/my_trades', self._params(symbol=symbol, since=since, limit=limit))
+
+    def fetch_trades(self, symbol, since=None, limit=None):
+        return self.client.request('GET', '/trades', self._params(symbol=symbol, since=since, limit=limit))
+
+    def fetch_order_book(self, symbol, limit=None):
+        return self.client.request('GET', '/order_book', self._params(symbol=symbol, limit=limit))
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None):
+        return self.client.request('GET', '/ohlcv', self._params(
+            symbol=symbol, timeframe=timeframe, since=since, limit=limit))
+
+    def fetch_order(self, id, symbol=None):
+        return self._private('GET', '/order', self._params(id=id, symbol=symbol))
+
+    def create_limit_order(self, symbol, side, amount, price, params=None):
+        return self._private('POST', '/order', body=self._params(
+            symbol=symbol, side=side, amount=amount, price=price, params=params or {}))
+
+    def cancel_order(self, id, symbol=None):
+        return self._private('POST', '/cancel', body=self._params(id=id, symbol=symbol))
+
+
+def create_remote_exchanges(base_url, tokens=None):
+    """
+    从交易守护进程获取账户列表，创建与 create_exchanges 结构相同的远程账户字典。
+
+    参数:
+        base_url (str): 守护进程地址，例如 http://127.0.0.1:8765。
+        tokens (dict, optional): {"exchange/account": 令牌}，访问账户数据和下单时使用。
+
+    返回:
+        dict: {exchange_id: {key_id: RemoteExchange}}。
+    """
+    tokens = tokens or {}
+    client = TradeServerClient(base_url)
+    accounts = client.request('GET', '/accounts')
+    log.info(f"从交易守护进程 {base_url} 获取到账户: {accounts}")
+    return {exchange_id: {key_id: RemoteExchange(client, exchange_id, key_id, tokens.get(f"{exchange_id}/{key_id}"))
+                          for key_id in keys}
+            for exchange_id, keys in accounts.items()}
@@ -0,0 +1,399 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import hmac
+import json
+import time
+import asyncio
+import argparse
+from urllib.parse import urlsplit, parse_qs
+from config import load_config
+from exchange_factory import create_exchanges
+from exchange_worker import guard_rate_limit
+import logger
+
+# 获取日志记录器
+log = logger.get_logger('trade_server')
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# 各类数据的默认缓存时间(秒)，可通过配置 server.cache_ttl 覆盖
+DEFAULT_CACHE_TTL = {
+    'markets': 3600,
+    'ticker': 1.0,
+    'tickers': 2.0,
+    'balance': 2.0,
+    'open_orders': 1.0,
+    'my_trades': 5.0,
+    'ohlcv': 10.0,
+    'trades': 2.0,
+    'order_book': 1.0,
+}
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found',
+                500: 'Internal Server Error', 502: 'Bad Gateway'}
+
+# 访问账户数据和下单撤单的接口，需要携带该账户的令牌
+PRIVATE_ROUTES = {'handle_balance', 'handle_open_orders', 'handle_my_trades', 'handle_fetch_order',
+                  'handle_order', 'handle_cancel'}
+# 瘦客户端可以使用的交易所功能
+REMOTE_CAPABILITIES = ('fetchTicker', 'fetchTickers', 'fetchOHLCV', 'fetchTrades', 'fetchOrderBook',
+                       'fetchOrder', 'fetchOpenOrders', 'fetchMyTrades')
+
+
+class RequestError(Exception):
+    """请求参数错误，返回给客户端400"""
+
+
+class AuthError(Exception):
+    """缺少或错误的账户令牌，返回给客户端401"""
+
+
+class TradeServer:
+    """
+    本地交易守护进程。
+    统一持有配置中的所有交易所实例，对外提供行情、余额、下单和撤单的HTTP接口。
+    读请求带有共享缓存，相同的并发请求会合并为一次交易所调用。
+    余额、挂单、成交、下单和撤单需要在 Authorization 头中携带配置 server.tokens 里该账户的令牌，
+    没有配置令牌的账户只能访问行情等公共数据。
+    交易所调用在线程池中并发执行，同一账户的实例由 guard_rate_limit 保护限频和 nonce。
+    """
+
+    def __init__(self, config, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.config = config
+        self.host = host
+        self.port = port
+        self.exchanges = {exchange_id: {key_id: guard_rate_limit(exchange) for key_id, exchange in keys.items()}
+                          for exchange_id, keys in create_exchanges(config).items()}
+        self.cache_ttl = dict(DEFAULT_CACHE_TTL)
+        self.cache_ttl.update(config.get('server', {}).get('cache_ttl', {}))
+        # {"exchange/account": 令牌}
+        self.tokens = dict(config.get('server', {}).get('tokens', {}))
+        missing = [f"{exchange_id}/{key_id}" for exchange_id, keys in self.exchanges.items() for key_id in keys
+                   if f"{exchange_id}/{key_id}" not in self.tokens]
+        if missing:
+            log.warning(f"以下账户没有配置 server.tokens，不能通过守护进程查询账户或下单: {missing}")
+        self.cache = {}
+        self.inflight = {}
+        self.stats = {'requests': 0, 'cache_hits': 0, 'coalesced': 0, 'exchange_calls': 0, 'errors': 0}
+
+    def _exchange(self, params):
+        exchange_id = params.get('exchange')
+        key_id = params.get('account')
+        if exchange_id not in self.exchanges or key_id not in self.exchanges[exchange_id]:
+            raise RequestError(f"未配置的交易所账户: {exchange_id} - {key_id}")
+        return self.exchanges[exchange_id][key_id]
+
+    def _authorize(self, params, headers):
+        """校验请求携带的令牌与账户配置的令牌一致"""
+        account = f"{params.get('exchange')}/{params.get('account')}"
+        expected = self.tokens.get(account)
+        if not expected:
+            raise AuthError(f"账户 {account} 没有配置访问令牌")
+        scheme, _, token = headers.get('authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not hmac.compare_digest(token.strip().encode('utf-8'),
+                                                                  str(expected).encode('utf-8')):
+            raise AuthError(f"账户 {account} 的访问令牌无效")
+
+    async def _call(self, func, *args, **kwargs):
+        """在线程池中执行同步的ccxt调用，避免阻塞事件循环"""
+        self.stats['exchange_calls'] += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: func(*args, **kwargs))
+
+    async def _cached(self, kind, key, func, *args, **kwargs):
+        """
+        带缓存和请求合并的读取。
+        缓存未过期直接返回；已有相同请求在执行时等待其结果，不重复调用交易所。
+        """
+        cache_key = (kind,) + key
+        entry = self.cache.get(cache_key)
+        now = time.monotonic()
+        if entry and entry[0] > now:
+            self.stats['cache_hits'] += 1
+            return entry[1]
+
+        if cache_key in self.inflight:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(self.inflight[cache_key])
+
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[cache_key] = future
+        try:
+            result = await self._call(func, *args, **kwargs)
+            self.cache[cache_key] = (time.monotonic() + self.cache_ttl.get(kind, 0), result)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            # 标记异常已被获取，避免没有其他等待者时产生警告
+            future.exception()
+            raise
+        finally:
+            del self.inflight[cache_key]
+
+    def _invalidate(self, exchange_id, key_id, kinds=('balance', 'open_orders')):
+        """下单或撤单后清除该账户相关的缓存"""
+        for cache_key in list(self.cache):
+            if cache_key[0] in kinds and cache_key[1:3] == (exchange_id, key_id):
+                del self.cache[cache_key]
+
+    async def _markets(self, params):
+        exchange = self._exchange(params)
+        # 市场信息按交易所共享，同一交易所的其他账户直接复用
+        markets = await self._cached('markets', (params['exchange'],), exchange.load_markets)
+        if not exchange.markets:
+            exchange.set_markets(list(markets.values()))
+        return markets
+
+    async def handle_accounts(self, params, body):
+        return {exchange_id: list(keys) for exchange_id, keys in self.exchanges.items()}
+
+    async def handle_markets(self, params, body):
+        return await self._markets(params)
+
+    async def handle_describe(self, params, body):
+        """瘦客户端在本地按精度取整需要的信息"""
+        exchange = self._exchange(params)
+        return {'precisionMode': exchange.precisionMode, 'paddingMode': exchange.paddingMode,
+                'has': {name: bool(exchange.has.get(name)) for name in REMOTE_CAPABILITIES}}
+
+    async def handle_ticker(self, params, body):
+        exchange = self._exchange(params)
+        symbol = _required(params, 'symbol')
+        # 行情与账户无关，按交易所和交易对共享
+        return await self._cached('ticker', (params['exchange'], symbol), exchange.fetch_ticker, symbol)
+
+    async def handle_tickers(self, params, body):
+        exchange = self._exchange(params)
+        symbols = params.get('symbols')
+        symbols = symbols.split(',') if symbols else None
+        # 全部行情快照按交易所共享，用于跨交易所价差扫描
+        return await self._cached('tickers', (params['exchange'], params.get('symbols')),
+                                  exchange.fetch_tickers, symbols)
+
+    async def handle_balance(self, params, body):
+        exchange = self._exchange(params)
+        return await self._cached('balance', (params['exchange'], params['account']), exchange.fetch_balance)
+
+    async def handle_open_orders(self, params, body):
+        exchange = self._exchange(params)
+        symbol = params.get('symbol')
+        return await self._cached('open_orders', (params['exchange'], params['account'], symbol),
+                                  exchange.fetch_open_orders, symbol)
+
+    async def handle_my_trades(self, params, body):
+        exchange = self._exchange(params)
+        symbol = params.get('symbol')
+        since = _int(params, 'since')
+        limit = _int(params, 'limit')
+        return await self._cached('my_trades', (params['exchange'], params['account'], symbol, since, limit),
+                                  exchange.fetch_my_trades, symbol=symbol, since=since, limit=limit)
+
+    async def handle_ohlcv(self, params, body):
+        exchange = self._exchange(params)
+        symbol = _required(params, 'symbol')
+        timeframe = params.get('timeframe', '1m')
+        since = _int(params, 'since')
+        limit = _int(params, 'limit')
+        return await self._cached('ohlcv', (params['exchange'], symbol, timeframe, since, limit),
+                                  exchange.fetch_ohlcv, symbol, timeframe, since, limit)
+
+    async def handle_trades(self, params, body):
+        exchange = self._exchange(params)
+        symbol = _required(params, 'symbol')
+        since = _int(params, 'since')
+        limit = _int(params, 'limit')
+        return await self._cached('trades', (params['exchange'], symbol, since, limit),
+                                  exchange.fetch_trades, symbol, since, limit)
+
+    async def handle_order_book(self, params, body):
+        exchange = self._exchange(params)
+        symbol = _required(params, 'symbol')
+        limit = _int(params, 'limit')
+        return await self._cached('order_book', (params['exchange'], symbol, limit),
+                                  exchange.fetch_order_book, symbol, limit)
+
+    async def handle_order(self, params, body):
+        exchange = self._exchange(body)
+        await self._markets(body)
+        order = await self._call(exchange.create_limit_order,
+                                 symbol=_required(body, 'symbol'),
+                                 side=_required(body, 'side'),
+                                 amount=_float(body, 'amount'),
+                                 price=_float(body, 'price'),
+                                 params=body.get('params') or {})
+        log.info(f"代理下单成功: {body['exchange']} {body['account']} 订单ID={order['id']}",
+                 extra={'exchange': body['exchange'], 'account': body['account'], 'symbol': body.get('symbol'),
+                        'order_id': order['id']})
+        self._invalidate(body['exchange'], body['account'])
+        return order
+
+    async def handle_fetch_order(self, params, body):
+        exchange = self._exchange(params)
+        await self._markets(params)
+        # 订单状态用于跟踪成交，不缓存
+        return await self._call(exchange.fetch_order, _required(params, 'id'), params.get('symbol'))
+
+    async def handle_cancel(self, params, body):
+        exchange = self._exchange(body)
+        await self._markets(body)
+        result = await self._call(exchange.cancel_order, _required(body, 'id'), body.get('symbol'))
+        log.info(f"代理撤单成功: {body['exchange']} {body['account']} 订单ID={body['id']}",
+                 extra={'exchange': body['exchange'], 'account': body['account'], 'symbol': body.get('symbol'),
+                        'order_id': body['id']})
+        self._invalidate(body['exchange'], body['account'])
+        return result
+
+    async def handle_stats(self, params, body):
+        return dict(self.stats, cache_entries=len(self.cache), inflight=len(self.inflight))
+
+    ROUTES = {
+        ('GET', '/accounts'): 'handle_accounts',
+        ('GET', '/markets'): 'handle_markets',
+        ('GET', '/describe'): 'handle_describe',
+        ('GET', '/trades'): 'handle_trades',
+        ('GET', '/order_book'): 'handle_order_book',
+        ('GET', '/ticker'): 'handle_ticker',
+        ('GET', '/tickers'): 'handle_tickers',
+        ('GET', '/balance'): 'handle_balance',
+        ('GET', '/open_orders'): 'handle_open_orders',
+        ('GET', '/my_trades'): 'handle_my_trades',
+        ('GET', '/ohlcv'): 'handle_ohlcv',
+        ('GET', '/stats'): 'handle_stats',
+        ('GET', '/order'): 'handle_fetch_order',
+        ('POST', '/order'): 'handle_order',
+        ('POST', '/cancel'): 'handle_cancel',
+    }
+
+    async def dispatch(self, method, target, body, headers=None):
+        """根据路由调用对应的处理函数，返回 (状态码, 响应对象)"""
+        self.stats['requests'] += 1
+        url = urlsplit(target)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        handler_name = self.ROUTES.get((method, url.path))
+        if handler_name is None:
+            return 404, {'error': f"未知接口: {method} {url.path}", 'type': 'NotFound'}
+        try:
+            if handler_name in PRIVATE_ROUTES:
+                self._authorize((body or {}) if method == 'POST' else params, headers or {})
+            return 200, await getattr(self, handler_name)(params, body or {})
+        except RequestError as e:
+            return 400, {'error': str(e), 'type': 'BadRequest'}
+        except AuthError as e:
+            log.warning(f"拒绝请求 {method} {url.path}: {str(e)}")
+            return 401, {'error': str(e), 'type': 'AuthenticationError'}
+        except Exception as e:
+            self.stats['errors'] += 1
+            log.error(f"处理请求 {method} {url.path} 失败: {str(e)}", exc_info=True)
+            return 502, {'error': str(e), 'type': type(e).__name__}
+
+    async def handle_connection(self, reader, writer):
+        """处理一个HTTP连接，支持keep-alive"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, _version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, 400, {'error': '无效的请求行', 'type': 'BadRequest'}, False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                body = None
+                length = int(headers.get('content-length', 0) or 0)
+                if length:
+                    try:
+                        body = json.loads(await reader.readexactly(length))
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        await self._respond(writer, 400, {'error': '请求体不是有效的JSON', 'type': 'BadRequest'}, False)
+                        break
+
+                status, payload = await self.dispatch(method.upper(), target, body, headers)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        data = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        head = (f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(data)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + data)
+        await writer.drain()
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        log.info(f"交易守护进程已启动: http://{self.host}:{self.port}")
+        print(f"交易守护进程已启动: http://{self.host}:{self.port}")
+        async with server:
+            await server.serve_forever()
+
+
+def _required(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        raise RequestError(f"缺少参数: {name}")
+    return value
+
+
+def _float(params, name):
+    value = _required(params, name)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise RequestError(f"参数 {name} 不是有效的数字: {value}")
+
+
+def _int(params, name):
+    """可选的整数参数，没有时返回 None"""
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise RequestError(f"参数 {name} 不是有效的整数: {value}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="简易加密货币交易系统 - 本地交易守护进程")
+    parser.add_argument('--host', help=f"监听地址，默认 {DEFAULT_HOST}")
+    parser.add_argument('--port', type=int, help=f"监听端口，默认 {DEFAULT_PORT}")
+    args = parser.parse_args(argv)
+
+    config = load_config()
+    if not config:
+        print("错误: 无法加载配置文件!", file=sys.stderr)
+        return 2
+    logger.configure(config.get('logging'))
+    server_config = config.get('server', {})
+    server = TradeServer(config,
+                         host=args.host or server_config.get('host', DEFAULT_HOST),
+                         port=args.port or server_config.get('port', DEFAULT_PORT))
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        log.info("交易守护进程已停止")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import gzip
+import json
+import time
+import zlib
+import queue
+import argparse
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from lazy_import import lazy_import
+from exchange_worker import guard_rate_limit
+import logger
+
+# 获取日志记录器
+log = logger.get_logger('traffic_capture')
+
+ccxt = lazy_import('ccxt')
+
+FORMAT_VERSION = 1
+# 后台线程每隔多少秒或多少条记录把压缩数据刷到文件，程序崩溃时已刷出的记录仍可读取
+FLUSH_INTERVAL = 1.0
+FLUSH_RECORDS = 1000
+# 属性访问记录的方法名前缀，与方法调用共用一种记录
+ATTRIBUTE_PREFIX = '@'
+
+
+def _dumps(record):
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def _call_key(method, args, kwargs):
+    """按方法名和参数匹配回放记录的键，参数先经过JSON往返，保证录制和回放时一致"""
+    return method, _dumps([args, kwargs])
+
+
+class TrafficRecorder:
+    """
+    交易所调用录制器，写入gzip压缩的JSONL文件。
+    第一行是文件头，之后每行一次调用: 相对开始时间 t、交易所 x、账户 k、方法 m、参数 a/kw、
+    返回值 r 或异常 e、耗时 l(秒)。
+    调用线程只序列化记录，压缩和写文件在后台线程进行，不增加交易所调用的延迟。
+    后台线程定期刷新压缩流，异常退出时文件缺少gzip结尾，但已刷出的记录可以被 read_records 读取。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = gzip.open(path, 'wt', encoding='utf-8', compresslevel=6)
+        self.started = time.monotonic()
+        self.count = 0
+        self.queue = queue.Queue()
+        self.file.write(_dumps({'type': 'header', 'version': FORMAT_VERSION, 'created': time.time()}) + '\n')
+        self.thread = threading.Thread(target=self._write_loop, name='traffic-capture', daemon=True)
+        self.thread.start()
+        log.info(f"开始录制交易所调用到 {path}")
+
+    def record(self, exchange_id, key_id, method, args, kwargs, started, latency, result=None, error=None):
+        record = {'t': round(started - self.started, 6), 'x': exchange_id, 'k': key_id, 'm': method,
+                  'a': list(args), 'kw': kwargs, 'l': round(latency, 6)}
+        if error is not None:
+            record['e'] = [type(error).__name__, str(error)]
+        else:
+            record['r'] = result
+        try:
+            # 在调用线程序列化，调用方之后修改返回的对象不会影响记录
+            line = _dumps(record)
+        except (TypeError, ValueError) as e:
+            log.warning(f"无法序列化 {method} 的记录: {str(e)}")
+            return
+        self.queue.put(line)
+
+    def _write_loop(self):
+        # pending 为上次刷新之后写入的记录数，第一条未刷新的记录最多等待 FLUSH_INTERVAL 秒
+        pending = 0
+        flush_at = None
+        while True:
+            try:
+                line = self.queue.get(timeout=max(0.0, flush_at - time.monotonic()) if pending else None)
+            except queue.Empty:
+                line = ''
+            if line is None:
+                break
+            if line:
+                self.file.write(line + '\n')
+                self.count += 1
+                if not pending:
+                    flush_at = time.monotonic() + FLUSH_INTERVAL
+                pending += 1
+            if pending and (pending >= FLUSH_RECORDS or time.monotonic() >= flush_at):
+                # 同步刷新压缩流，之前的数据成为可以独立解压的完整块
+                self.file.flush()
+                pending = 0
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+        log.info(f"录制结束，共 {self.count} 条记录，文件 {self.path}")
+
+
+class CapturingExchange:
+    """
+    包装交易所实例，所有方法调用和属性读取都经过录制器，其余行为与原实例相同。
+    """
+
+    def __init__(self, exchange, recorder, exchange_id, key_id):
+        self._exchange = exchange
+        self._recorder = recorder
+        self._exchange_id = exchange_id
+        self._key_id = key_id
+        self._attributes = {}
+
+    def __str__(self):
+        return str(self._exchange)
+
+    def __getattr__(self, name):
+        value = getattr(self._exchange, name)
+        if callable(value):
+            return self._wrap(name, value)
+        # 属性值变化时(例如 load_markets 后的 markets)才再次记录
+        if self._attributes.get(name) is not value:
+            self._attributes[name] = value
+            self._recorder.record(self._exchange_id, self._key_id, ATTRIBUTE_PREFIX + name, (), {},
+                                  time.monotonic(), 0.0, result=value)
+        return value
+
+    def _wrap(self, name, method):
+        def call(*args, **kwargs):
+            started = time.monotonic()
+            try:
+                result = method(*args, **kwargs)
+            except Exception as e:
+                self._recorder.record(self._exchange_id, self._key_id, name, args, kwargs,
+                                      started, time.monotonic() - started, error=e)
+                raise
+            self._recorder.record(self._exchange_id, self._key_id, name, args, kwargs,
+                                  started, time.monotonic() - started, result=result)
+            return result
+        return call
+
+
+def wrap_exchanges(exchanges, recorder):
+    """
+    把 {exchange_id: {key_id: exchange}} 中的每个实例包装为录制实例。
+    工作线程只看到包装后的实例，限频和 nonce 的保护加在被包装的实例上。
+    """
+    return {exchange_id: {key_id: CapturingExchange(guard_rate_limit(exchange), recorder, exchange_id, key_id)
+                          for key_id, exchange in accounts.items()}
+            for exchange_id, accounts in exchanges.items()}
+
+
+def read_records(path):
+    """读取录制文件，返回 (文件头, 调用记录列表)"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        if header.get('type') != 'header' or header.get('version') != FORMAT_VERSION:
+            raise ValueError(f"{path} 不是支持的录制文件")
+        records = []
+        try:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # 程序异常退出时最后一行可能不完整
+                        log.warning(f"跳过无法解析的记录: {line[:80]}")
+        except (EOFError, zlib.error) as e:
+            # 录制没有正常结束，文件缺少gzip结尾，保留最后一次刷新之前的记录
+            log.warning(f"{path} 没有正常结束，读取到 {len(records)} 条记录: {str(e)}")
+        return header, records
+
+
+class ReplayedError(Exception):
+    """录制时的异常类型在ccxt中不存在时，回放使用该异常"""
+
+
+class ReplayExchange:
+    """
+    按录制文件回放的交易所实例。
+    调用优先匹配方法名和参数完全相同的下一条记录，参数不同(例如以当前时间计算的 since)时按方法名取下一条；
+    记录用完后，参数相同的调用重复最后一条结果，例如 market、amount_to_precision 等本地计算。
+    speed 为 1 时按录制的耗时等待，大于 1 时加速，为 0 时不等待。
+    """
+
+    def __init__(self, exchange_id, key_id, records, speed=1.0):
+        self.id = exchange_id
+        self._key_id = key_id
+        self._records = records
+        self._speed = speed
+        self._used = [False] * len(records)
+        self._exact = defaultdict(deque)
+        self._by_method = defaultdict(deque)
+        self._last = {}
+        self._lock = threading.Lock()
+        for index, record in enumerate(records):
+            self._exact[_call_key(record['m'], record['a'], record['kw'])].append(index)
+            self._by_method[record['m']].append(index)
+
+    def __str__(self):
+        return f"ReplayExchange({self.id}/{self._key_id})"
+
+    def _take(self, method, args, kwargs):
+        key = _call_key(method, list(args), kwargs)
+        with self._lock:
+            for candidates in (self._exact.get(key), self._by_method.get(method)):
+                while candidates:
+                    index = candidates.popleft()
+                    if not self._used[index]:
+                        self._used[index] = True
+                        self._last[key] = self._records[index]
+                        return self._records[index]
+            return self._last.get(key)
+
+    def _replay(self, record):
+        if self._speed and record['l']:
+            time.sleep(record['l'] / self._speed)
+        if 'e' in record:
+            name, message = record['e']
+            error_class = getattr(ccxt, name, None)
+            if not (isinstance(error_class, type) and issubclass(error_class, Exception)):
+                error_class = ReplayedError
+            raise error_class(message)
+        return record['r']
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if ATTRIBUTE_PREFIX + name in self._by_method:
+            return self._replay(self._take(ATTRIBUTE_PREFIX + name, (), {}))
+        if name not in self._by_method:
+            raise AttributeError(f"回放记录中没有 {self.id}/{self._key_id} 的 {name}")
+
+        def call(*args, **kwargs):
+            record = self._take(name, args, kwargs)
+            if record is None:
+                raise ReplayedError(f"回放记录中 {name} 的记录已用完")
+            return self._replay(record)
+        return call
+
+    def remaining(self):
+        """尚未回放的记录数"""
+        with self._lock:
+            return self._used.count(False)
+
+
+def create_replay_exchanges(path, speed=1.0):
+    """
+    从录制文件创建回放交易所实例。
+
+    返回:
+        dict: {exchange_id: {key_id: ReplayExchange}}，与 create_exchanges 的结构相同。
+    """
+    _, records = read_records(path)
+    grouped = defaultdict(list)
+    for record in records:
+        grouped[(record['x'], record['k'])].append(record)
+    exchanges = {}
+    for (exchange_id, key_id), account_records in grouped.items():
+        exchanges.setdefault(exchange_id, {})[key_id] = ReplayExchange(exchange_id, key_id, account_records, speed)
+    log.info(f"从 {path} 加载 {len(records)} 条记录，回放速度 {speed}")
+    return exchanges
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def format_latency_table(latencies, errors=None):
+    """按方法汇总次数和耗时(毫秒)"""
+    errors = errors or {}
+    lines = [f"{'方法':<24}{'次数':>8}{'错误':>6}{'p50':>10}{'p99':>10}{'最大':>10}{'合计':>10}"]
+    for method, values in sorted(latencies.items(), key=lambda item: -sum(item[1])):
+        lines.append(f"{method:<26}{len(values):>8}{errors.get(method, 0):>6}"
+                     f"{_percentile(values, 0.5) * 1000:>10.1f}{_percentile(values, 0.99) * 1000:>10.1f}"
+                     f"{max(values) * 1000:>10.1f}{sum(values) * 1000:>10.0f}")
+    return '\n'.join(lines)
+
+
+def summarize(path):
+    """输出录制文件的调用统计"""
+    header, records = read_records(path)
+    calls = [r for r in records if not r['m'].startswith(ATTRIBUTE_PREFIX)]
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    for record in calls:
+        latencies[record['m']].append(record['l'])
+        if 'e' in record:
+            errors[record['m']] += 1
+    duration = max((r['t'] + r['l'] for r in records), default=0)
+    accounts = sorted({f"{r['x']}/{r['k']}" for r in records})
+    print(f"录制时间 {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(header['created']))}"
+          f"，时长 {duration:.1f}s，{len(calls)} 次调用，账户: {', '.join(accounts)}")
+    print(format_latency_table(latencies, errors))
+    return 0
+
+
+def _start_profiling():
+    """
+    分析当前线程和之后创建的所有线程(工作线程、回放线程)，返回各线程的分析器，
+    结束后合并为一份统计。
+    """
+    import cProfile
+    profilers = []
+
+    def start_thread_profiler(*_):
+        sys.setprofile(None)
+        profiler = cProfile.Profile()
+        profilers.append(profiler)
+        profiler.enable()
+
+    threading.setprofile(start_thread_profiler)
+    start_thread_profiler()
+    return profilers
+
+
+def replay(path, speed=0.0, threads=8, profile=None):
+    """
+    不进入界面，按录制的调用顺序和间隔(按 speed 缩放)经过工作线程和重试层回放整个会话，
+    统计客户端调用栈的耗时；speed 为 0 时不等待，连续回放全部调用。
+    profile 为文件名时用 cProfile 记录回放过程，'-' 表示直接输出最耗时的函数。
+    """
+    from exchange_worker import WorkerPool
+    from resilience import ResilientPool
+
+    _, records = read_records(path)
+    calls = [r for r in records if not r['m'].startswith(ATTRIBUTE_PREFIX)]
+    profilers = _start_profiling() if profile else None
+    exchanges = create_replay_exchanges(path, speed)
+    workers = WorkerPool(exchanges, threads=threads)
+    # 回放的结果是确定的，不需要对冲请求
+    callers = ResilientPool(workers, {'hedge': False})
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+
+    def issue(record):
+        started = time.perf_counter()
+        failed = False
+        try:
+            callers.get(record['x'], record['k']).call(record['m'], *record['a'], **record['kw'])
+        except Exception:
+            failed = True
+        with lock:
+            latencies[record['m']].append(time.perf_counter() - started)
+            errors[record['m']] += failed
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='replay') as executor:
+        for record in calls:
+            if speed:
+                delay = started + record['t'] / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            executor.submit(issue, record)
+    elapsed = time.monotonic() - started
+    workers.stop()
+
+    print(f"回放 {len(calls)} 次调用，速度 {speed or '不等待'}，耗时 {elapsed:.2f}s")
+    print(format_latency_table(latencies, errors))
+    if profilers is not None:
+        import pstats
+        threading.setprofile(None)
+        for profiler in profilers:
+            profiler.disable()
+        stats = pstats.Stats(*profilers)
+        if profile == '-':
+            stats.sort_stats('cumulative').print_stats(25)
+        else:
+            stats.dump_stats(profile)
+            print(f"性能分析结果已保存到 {profile}，可用 python -m pstats {profile} 查看")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="查看或回放录制的交易所调用")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    summary_parser = subparsers.add_parser('summary', help="按方法统计录制文件中的调用次数和耗时")
+    summary_parser.add_argument('file')
+    replay_parser = subparsers.add_parser('replay', help="不进入界面回放整个会话")
+    replay_parser.add_argument('file')
+    replay_parser.add_argument('--speed', type=float, default=0.0,
+                               help="回放速度，1为原速，10为10倍速，0为不等待(默认)")
+    replay_parser.add_argument('--threads', type=int, default=8, help="回放线程数")
+    replay_parser.add_argument('--profile', metavar='FILE',
+                               help="用cProfile分析回放过程并保存到文件，'-' 表示直接输出")
+    args = parser.parse_args(argv)
+    if args.command == 'summary':
+        return summarize(args.file)
+    return replay(args.file, args.speed, args.threads, args.profile)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
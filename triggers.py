@@ -0,0 +1,465 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import heapq
+import random
+import argparse
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from event_bus import TICKER
+import logger
+
+# 获取日志记录器
+log = logger.get_logger('triggers')
+
+TRIGGERS_FILE = os.path.join('data', 'triggers.json')
+
+# 默认参数，可通过配置 triggers 覆盖
+DEFAULT_TRIGGER_CONFIG = {
+    # 触发后限价单相对触发价的让价比例，保证单子能立即成交
+    'slippage': 0.005,
+    # 保留的已结束条件单条数
+    'keep_finished': 500,
+    # 下单线程数
+    'threads': 2,
+    # 只用该时间(秒)内的行情检查条件单，更旧的行情(例如恢复的缓存)不会触发下单
+    'max_age': 10.0,
+}
+
+STOP = 'stop'
+TAKE_PROFIT = 'take_profit'
+ALERT = 'alert'
+KIND_LABELS = {STOP: '止损', TAKE_PROFIT: '止盈', ALERT: '价格提醒'}
+STATUS_LABELS = {'active': '等待触发', 'firing': '下单中', 'triggered': '已触发', 'canceled': '已撤销',
+                 'failed': '失败'}
+
+# 价格向上穿越(>=)或向下穿越(<=)触发价时触发
+ABOVE = 'above'
+BELOW = 'below'
+
+
+def order_kind(side, direction):
+    """
+    条件单的类型: 卖出在下方触发、买入在上方触发是止损，反之是止盈。
+    """
+    if side == 'sell':
+        return STOP if direction == BELOW else TAKE_PROFIT
+    return STOP if direction == ABOVE else TAKE_PROFIT
+
+
+class Trigger:
+    """一个止损、止盈或价格提醒"""
+
+    __slots__ = ('id', 'kind', 'exchange', 'account', 'symbol', 'side', 'amount', 'price', 'level', 'direction',
+                 'status', 'created', 'fired_at', 'fired_price', 'order_id', 'message')
+
+    def __init__(self, trigger_id, kind, exchange, account, symbol, level, direction,
+                 side=None, amount=None, price=None):
+        self.id = trigger_id
+        self.kind = kind
+        self.exchange = exchange
+        self.account = account
+        self.symbol = symbol
+        self.side = side
+        self.amount = amount
+        self.price = price
+        self.level = level
+        self.direction = direction
+        self.status = 'active'
+        self.created = time.time()
+        self.fired_at = None
+        self.fired_price = None
+        self.order_id = None
+        self.message = ''
+
+    @property
+    def key(self):
+        return self.exchange, self.account, self.symbol
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        trigger = cls(data['id'], data['kind'], data['exchange'], data['account'], data['symbol'],
+                      data['level'], data['direction'], data.get('side'), data.get('amount'), data.get('price'))
+        for name in ('status', 'created', 'fired_at', 'fired_price', 'order_id', 'message'):
+            if name in data:
+                setattr(trigger, name, data[name])
+        return trigger
+
+    def describe(self):
+        arrow = '≥' if self.direction == ABOVE else '≤'
+        text = f"{KIND_LABELS[self.kind]} {self.symbol} {arrow} {self.level:.8g}"
+        if self.kind != ALERT:
+            text += f" {self.side} {self.amount:g} @ {self.price:.8g}"
+        return text
+
+
+class TriggerBook:
+    """
+    按交易对索引的触发价堆。
+    每个交易对有两个堆: 向上触发的按触发价升序，向下触发的按触发价降序，
+    每次价格更新只比较堆顶，弹出已穿越的触发价，开销只与触发的数量有关，与条件单总数无关。
+    撤销的条件单不从堆中删除，弹出时跳过，失效条目过多时重建该交易对的堆。
+    """
+
+    def __init__(self):
+        self.above = {}
+        self.below = {}
+        self.triggers = {}
+        self.stale = {}
+        self.seq = itertools.count()
+
+    def add(self, trigger):
+        self.triggers[trigger.id] = trigger
+        if trigger.direction == ABOVE:
+            heapq.heappush(self.above.setdefault(trigger.key, []), (trigger.level, next(self.seq), trigger))
+        else:
+            heapq.heappush(self.below.setdefault(trigger.key, []), (-trigger.level, next(self.seq), trigger))
+
+    def remove(self, trigger):
+        """从索引中移除(撤销)，堆中的条目在弹出或重建时清理"""
+        if self.triggers.pop(trigger.id, None) is None:
+            return
+        stale = self.stale[trigger.key] = self.stale.get(trigger.key, 0) + 1
+        size = len(self.above.get(trigger.key, ())) + len(self.below.get(trigger.key, ()))
+        if stale > 64 and stale * 2 > size:
+            self._rebuild(trigger.key)
+
+    def _rebuild(self, key):
+        for heaps in (self.above, self.below):
+            heap = [entry for entry in heaps.get(key, ()) if entry[2].id in self.triggers]
+            heapq.heapify(heap)
+            heaps[key] = heap
+        self.stale[key] = 0
+
+    def evaluate(self, key, price):
+        """
+        用最新价格检查一个交易对，返回被触发的条件单并从索引中移除。
+        """
+        fired = []
+        heap = self.above.get(key)
+        while heap and heap[0][0] <= price:
+            trigger = heapq.heappop(heap)[2]
+            if self.triggers.pop(trigger.id, None) is not None:
+                fired.append(trigger)
+            else:
+                self.stale[key] -= 1
+        heap = self.below.get(key)
+        while heap and -heap[0][0] >= price:
+            trigger = heapq.heappop(heap)[2]
+            if self.triggers.pop(trigger.id, None) is not None:
+                fired.append(trigger)
+            else:
+                self.stale[key] -= 1
+        return fired
+
+    def nearest(self, key):
+        """返回该交易对上方最近和下方最近的有效触发价，没有时为 None"""
+        result = []
+        for heaps, sign in ((self.above, 1), (self.below, -1)):
+            heap = heaps.get(key)
+            while heap and heap[0][2].id not in self.triggers:
+                heapq.heappop(heap)
+                self.stale[key] -= 1
+            result.append(sign * heap[0][0] if heap else None)
+        return tuple(result)
+
+    def keys(self):
+        """有等待触发的条件单的交易对"""
+        return {trigger.key for trigger in self.triggers.values()}
+
+    def __len__(self):
+        return len(self.triggers)
+
+
+class TriggerManager:
+    """
+    本地保存的止损、止盈和价格提醒。
+    订阅事件总线上的行情，价格穿越触发价时通过账户的调用器下限价单(价格提醒只投递消息)，
+    全部条件单保存在 data/triggers.json 中，重启后继续生效。
+    交易所不参与，程序未运行或行情中断期间不会触发。
+    """
+
+    def __init__(self, bus, callers, config=None, path=TRIGGERS_FILE, on_fire=None):
+        self.bus = bus
+        self.callers = callers
+        self.config = dict(DEFAULT_TRIGGER_CONFIG, **(config or {}))
+        self.path = path
+        self.on_fire = on_fire
+        self.book = TriggerBook()
+        self.all = {}
+        self.next_id = 1
+        self.lock = threading.RLock()
+        self.save_lock = threading.Lock()
+        self.executor = None
+        self.events = None
+        self.thread = None
+        self.stopped = False
+        self.load()
+
+    # 持久化
+
+    def load(self):
+        """读取保存的条件单，上次退出时正在下单的条件单结果未知，标记为失败"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            log.error(f"读取条件单文件 {self.path} 失败: {str(e)}")
+            return
+        with self.lock:
+            for data in saved.get('triggers', []):
+                trigger = Trigger.from_dict(data)
+                if trigger.status == 'firing':
+                    trigger.status = 'failed'
+                    trigger.message = "程序退出时下单结果未知，请检查挂单"
+                self.all[trigger.id] = trigger
+                if trigger.status == 'active':
+                    self.book.add(trigger)
+            self.next_id = saved.get('next_id', len(self.all) + 1)
+        log.info(f"已加载 {len(self.all)} 个条件单，其中 {len(self.book)} 个等待触发")
+
+    def save(self):
+        # 多个线程都会保存，快照和写文件一起串行，避免旧快照覆盖新快照
+        with self.save_lock:
+            with self.lock:
+                finished = sorted((t for t in self.all.values() if t.status not in ('active', 'firing')),
+                                  key=lambda t: t.fired_at or t.created)
+                # 已结束的条件单只保留最近的 keep_finished 条
+                for trigger in finished[:max(0, len(finished) - self.config['keep_finished'])]:
+                    del self.all[trigger.id]
+                data = {'next_id': self.next_id, 'triggers': [t.to_dict() for t in self.all.values()]}
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                tmp_file = f"{self.path}.tmp"
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, indent=1)
+                os.replace(tmp_file, self.path)
+            except OSError as e:
+                log.error(f"保存条件单失败: {str(e)}")
+
+    # 条件单操作
+
+    def add(self, kind, exchange_id, key_id, symbol, level, last_price, side=None, amount=None, price=None):
+        """
+        添加条件单。触发方向由触发价与当前价格的位置决定。
+
+        参数:
+            kind (str): 'order' 表示止损/止盈条件单(按方向自动区分)，'alert' 表示价格提醒。
+            level (float): 触发价。
+            last_price (float): 当前价格。
+            price (float, optional): 触发后的限价，默认按 slippage 在触发价基础上让价。
+
+        返回:
+            Trigger: 新的条件单。
+        """
+        if level <= 0:
+            raise ValueError("触发价必须大于0")
+        if level == last_price:
+            raise ValueError("触发价不能等于当前价格")
+        direction = ABOVE if level > last_price else BELOW
+        if kind != ALERT:
+            if side not in ('buy', 'sell') or not amount or amount <= 0:
+                raise ValueError("条件单需要交易方向和数量")
+            kind = order_kind(side, direction)
+            if price is None:
+                slippage = self.config['slippage']
+                price = level * (1 + slippage if side == 'buy' else 1 - slippage)
+        with self.lock:
+            trigger = Trigger(str(self.next_id), kind, exchange_id, key_id, symbol, level, direction,
+                              side, amount, price)
+            self.next_id += 1
+            self.all[trigger.id] = trigger
+            self.book.add(trigger)
+        log.info(f"添加条件单 {trigger.id}: {trigger.describe()}")
+        self.save()
+        return trigger
+
+    def cancel(self, trigger_id):
+        with self.lock:
+            trigger = self.all.get(trigger_id)
+            if trigger is None or trigger.status != 'active':
+                return False
+            self.book.remove(trigger)
+            trigger.status = 'canceled'
+            trigger.fired_at = time.time()
+        log.info(f"撤销条件单 {trigger_id}")
+        self.save()
+        return True
+
+    def triggers(self):
+        """全部条件单，从新到旧排列"""
+        with self.lock:
+            return sorted(self.all.values(), key=lambda t: int(t.id), reverse=True)
+
+    def active_count(self, exchange_id=None, key_id=None):
+        with self.lock:
+            return sum(1 for t in self.book.triggers.values()
+                       if exchange_id is None or (t.exchange, t.account) == (exchange_id, key_id))
+
+    def watched(self):
+        """需要获取行情的交易对 (exchange, account, symbol)"""
+        with self.lock:
+            return self.book.keys()
+
+    # 触发
+
+    def start(self):
+        self.executor = ThreadPoolExecutor(max_workers=self.config['threads'], thread_name_prefix='trigger')
+        self.events = self.bus.subscribe('triggers', (TICKER,))
+        self.thread = threading.Thread(target=self._run, name='triggers', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped = True
+        if self.events is not None:
+            self.events.close()
+        if self.executor is not None:
+            # 等待正在提交的订单完成，结果写入文件
+            self.executor.shutdown(wait=True)
+        self.save()
+
+    def evaluate(self, key, price):
+        """检查一个交易对的最新价格，处理触发的条件单，返回触发的条件单"""
+        with self.lock:
+            fired = self.book.evaluate(key, price)
+            for trigger in fired:
+                trigger.status = 'firing' if trigger.kind != ALERT else 'triggered'
+                trigger.fired_at = time.time()
+                trigger.fired_price = price
+        if not fired:
+            return fired
+        self.save()
+        for trigger in fired:
+            log.info(f"条件单 {trigger.id} 触发: {trigger.describe()}，最新价 {price}")
+            if trigger.kind == ALERT:
+                self._notify(trigger)
+            else:
+                self.executor.submit(self._place, trigger)
+        return fired
+
+    def _place(self, trigger):
+        try:
+            caller = self.callers.get(trigger.exchange, trigger.account)
+            order = caller.call('create_limit_order', symbol=trigger.symbol, side=trigger.side,
+                                amount=trigger.amount, price=trigger.price)
+            with self.lock:
+                trigger.status = 'triggered'
+                trigger.order_id = order['id']
+            log.info(f"条件单 {trigger.id} 下单成功: 订单ID={order['id']}",
+                     extra={'exchange': trigger.exchange, 'account': trigger.account, 'symbol': trigger.symbol,
+                            'order_id': order['id']})
+        except Exception as e:
+            log.error(f"条件单 {trigger.id} 下单失败: {type(e).__name__}: {str(e)}",
+                      extra={'exchange': trigger.exchange, 'account': trigger.account, 'symbol': trigger.symbol})
+            with self.lock:
+                trigger.status = 'failed'
+                trigger.message = f"{type(e).__name__}: {str(e)}"
+        self.save()
+        self._notify(trigger)
+
+    def _notify(self, trigger):
+        if self.on_fire is not None:
+            try:
+                self.on_fire(trigger)
+            except Exception as e:
+                log.error(f"条件单回调失败: {str(e)}", exc_info=True)
+
+    def _run(self):
+        log.info("条件单线程启动")
+        while not self.stopped:
+            for event in self.events.get(timeout=0.5):
+                price = (event.data or {}).get('last')
+                if price is None:
+                    continue
+                if event.age() > self.config['max_age']:
+                    log.warning(f"忽略 {event.age():.0f}s 前的行情 {event.exchange} {event.symbol}，不用于检查条件单")
+                    continue
+                try:
+                    self.evaluate((event.exchange, event.account, event.symbol), price)
+                except Exception as e:
+                    log.error(f"检查条件单失败: {str(e)}", exc_info=True)
+        log.info("条件单线程已停止")
+
+
+def format_trigger(trigger):
+    """一行文字描述条件单和状态"""
+    text = f"#{trigger.id} {trigger.describe()} {STATUS_LABELS.get(trigger.status, trigger.status)}"
+    if trigger.fired_price is not None and trigger.status != 'canceled':
+        text += f" 触发价格 {trigger.fired_price:.8g}"
+    if trigger.order_id:
+        text += f" 订单 {trigger.order_id}"
+    if trigger.message:
+        text += f" {trigger.message}"
+    return text
+
+
+def bench(count, symbols, ticks, seed=None):
+    """在随机游走价格上测量每次行情更新检查条件单的耗时"""
+    rng = random.Random(seed)
+    book = TriggerBook()
+    keys = [('bench', 'main', f"S{i}/USDT") for i in range(symbols)]
+    prices = {key: 100.0 for key in keys}
+    ids = itertools.count(1)
+
+    def add_random(key):
+        level = prices[key] * (1 + rng.uniform(-0.05, 0.05))
+        direction = ABOVE if level > prices[key] else BELOW
+        book.add(Trigger(str(next(ids)), STOP, *key, level, direction, 'sell', 1.0, level))
+
+    for i in range(count):
+        add_random(keys[i % symbols])
+
+    fired = 0
+    timings = []
+    for _ in range(ticks):
+        key = keys[rng.randrange(symbols)]
+        prices[key] *= 1 + rng.gauss(0, 0.002)
+        started = time.perf_counter()
+        triggered = book.evaluate(key, prices[key])
+        timings.append(time.perf_counter() - started)
+        fired += len(triggered)
+        # 补充新的条件单，保持总数不变
+        for _ in triggered:
+            add_random(key)
+
+    timings.sort()
+    mean = sum(timings) / len(timings)
+    print(f"{count} 个条件单，{symbols} 个交易对，{ticks} 次行情更新，共触发 {fired} 次")
+    print(f"每次更新检查耗时: 平均 {mean * 1e6:.2f}us | p50 {timings[len(timings) // 2] * 1e6:.2f}us"
+          f" | p99 {timings[int(len(timings) * 0.99)] * 1e6:.2f}us | 最大 {timings[-1] * 1e6:.2f}us")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="条件单索引性能测试，或列出保存的条件单")
+    parser.add_argument('--list', action='store_true', help="列出保存的条件单")
+    parser.add_argument('--triggers', type=int, default=10000, help="条件单数量")
+    parser.add_argument('--symbols', type=int, default=50, help="交易对数量")
+    parser.add_argument('--ticks', type=int, default=200000, help="行情更新次数")
+    parser.add_argument('--seed', type=int, help="随机种子")
+    args = parser.parse_args(argv)
+    if args.list:
+        try:
+            with open(TRIGGERS_FILE, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            print("没有保存的条件单")
+            return 0
+        for data in saved.get('triggers', []):
+            print(format_trigger(Trigger.from_dict(data)))
+        return 0
+    return bench(args.triggers, args.symbols, args.ticks, args.seed)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import logger
+
+# 获取日志记录器
+log = logger.get_logger('workspace')
+
+WORKSPACE_FILE = os.path.join('data', 'workspace.json')
+WORKSPACE_VERSION = 1
+# 每个账户记住的最近交易对数量
+RECENT_SYMBOLS = 10
+
+# 恢复交易界面需要的字段
+REQUIRED_FIELDS = ('exchange', 'account', 'symbol', 'market', 'price', 'amount', 'price_precision',
+                   'min_price_precision', 'amount_precision', 'min_amount_precision', 'min_amount')
+
+
+def load_workspace(path=WORKSPACE_FILE):
+    """
+    读取上次退出时保存的工作区，文件不存在、损坏或缺少字段时返回 None。
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            workspace = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        log.warning(f"读取工作区 {path} 失败: {str(e)}")
+        return None
+    if workspace.get('version') != WORKSPACE_VERSION:
+        return None
+    missing = [field for field in REQUIRED_FIELDS if workspace.get(field) is None]
+    if missing:
+        log.info(f"工作区缺少字段 {missing}，不恢复交易界面")
+        workspace['resumable'] = False
+    else:
+        workspace['resumable'] = True
+    return workspace
+
+
+def save_workspace(workspace, path=WORKSPACE_FILE):
+    """原子地保存工作区"""
+    data = dict(workspace, version=WORKSPACE_VERSION, saved_at=time.time())
+    data.pop('resumable', None)
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_file = f"{path}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=1, default=str)
+        os.replace(tmp_file, path)
+        log.info(f"已保存工作区: {data.get('exchange')}/{data.get('account')} {data.get('symbol')}")
+    except OSError as e:
+        log.error(f"保存工作区失败: {str(e)}")
+
+
+def remember_symbol(recent, exchange_id, key_id, symbol, limit=RECENT_SYMBOLS):
+    """把交易对放到该账户最近使用列表的最前面"""
+    account = f"{exchange_id}/{key_id}"
+    symbols = [s for s in recent.get(account, []) if s != symbol]
+    recent[account] = [symbol] + symbols[:limit - 1]
+    return recent
+
+
+def recent_symbols(recent, exchange_id, key_id):
+    return list(recent.get(f"{exchange_id}/{key_id}", []))